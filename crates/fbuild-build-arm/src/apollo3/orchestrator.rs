@@ -54,7 +54,8 @@ impl BuildOrchestrator for Apollo3Orchestrator {
 
         // 3. Ensure ARM GCC 8 toolchain (Apollo3/mbed-os requires GCC 8)
         let toolchain = fbuild_packages::toolchain::ArmGcc8Toolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("arm-gcc8 toolchain at {}", toolchain_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -62,6 +63,7 @@ impl BuildOrchestrator for Apollo3Orchestrator {
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -83,7 +85,8 @@ impl BuildOrchestrator for Apollo3Orchestrator {
             }
             None => fbuild_packages::library::Apollo3Cores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("Apollo3 cores at {}", framework_dir.display());
 
         let build_dir = &ctx.build_dir;
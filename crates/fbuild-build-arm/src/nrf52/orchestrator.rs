@@ -72,7 +72,8 @@ impl BuildOrchestrator for Nrf52Orchestrator {
 
         // 3. Ensure ARM GCC toolchain
         let toolchain = fbuild_packages::toolchain::ArmToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("arm-none-eabi toolchain at {}", toolchain_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -80,6 +81,7 @@ impl BuildOrchestrator for Nrf52Orchestrator {
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -96,7 +98,8 @@ impl BuildOrchestrator for Nrf52Orchestrator {
             Some(o) => fbuild_packages::library::Nrf52Cores::with_override(&params.project_dir, o),
             None => fbuild_packages::library::Nrf52Cores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("NRF52 cores at {}", framework_dir.display());
 
         let build_dir = &ctx.build_dir;
@@ -245,7 +248,8 @@ impl BuildOrchestrator for Nrf52Orchestrator {
         include_dirs.extend(toolchain.get_include_dirs());
         // CMSIS Core includes (core_cm4.h, etc.)
         let cmsis = fbuild_packages::library::CmsisFramework::new(&params.project_dir);
-        let _cmsis_dir = fbuild_packages::Package::ensure_installed(&cmsis).await?;
+        let _cmsis_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &cmsis).await?;
         tracing::info!("CMSIS framework installed");
         include_dirs.push(cmsis.get_core_include_dir());
         include_dirs.push(cmsis.get_dsp_include_dir());
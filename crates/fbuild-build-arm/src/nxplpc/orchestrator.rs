@@ -112,11 +112,13 @@ impl BuildOrchestrator for NxpLpcOrchestrator {
         // the platform is dispatched, but ensure_installed is idempotent
         // and cheap when the toolchain is already on disk.
         let toolchain = fbuild_packages::toolchain::ArmToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("arm-none-eabi-gcc toolchain at {}", toolchain_dir.display());
 
         let cmsis = fbuild_packages::library::CmsisFramework::new(&params.project_dir);
-        let cmsis_dir = fbuild_packages::Package::ensure_installed(&cmsis).await?;
+        let cmsis_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &cmsis).await?;
         tracing::info!("CMSIS framework at {}", cmsis_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -124,6 +126,7 @@ impl BuildOrchestrator for NxpLpcOrchestrator {
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -157,7 +160,8 @@ impl BuildOrchestrator for NxpLpcOrchestrator {
             }
             None => fbuild_packages::library::ArduinoCoreLpc8xx::new(&params.project_dir),
         };
-        let core_root = fbuild_packages::Package::ensure_installed(&core).await?;
+        let core_root =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &core).await?;
         tracing::info!("ArduinoCore-LPC8xx at {}", core_root.display());
 
         // 5. Family + linker script. The board's `ldscript` is relative to
@@ -73,7 +73,8 @@ impl BuildOrchestrator for RenesasOrchestrator {
 
         // 3. Ensure ARM GCC toolchain
         let toolchain = fbuild_packages::toolchain::ArmToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("arm-gcc toolchain at {}", toolchain_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -81,6 +82,7 @@ impl BuildOrchestrator for RenesasOrchestrator {
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -99,7 +101,8 @@ impl BuildOrchestrator for RenesasOrchestrator {
             }
             None => fbuild_packages::library::RenesasCores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("Renesas cores at {}", framework_dir.display());
 
         // 5. Scan sources
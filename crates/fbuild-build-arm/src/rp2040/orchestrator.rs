@@ -84,14 +84,16 @@ impl BuildOrchestrator for Rp2040Orchestrator {
 
         // 3. Ensure the arduino-pico-matched pqt-gcc toolchain
         let toolchain = fbuild_packages::toolchain::Rp2040PqtToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("rp2040 pqt-gcc toolchain at {}", toolchain_dir.display());
 
         // Arduino-Pico generates its canonical UF2 from the linked ELF with
         // the managed pqt-picotool package. Do the same here rather than
         // flattening ELF segments in an fbuild-specific encoder.
         let picotool = fbuild_packages::toolchain::Rp2040Picotool::new(&params.project_dir);
-        let picotool_dir = fbuild_packages::Package::ensure_installed(&picotool).await?;
+        let picotool_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &picotool).await?;
         tracing::info!("managed picotool at {}", picotool_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -99,6 +101,7 @@ impl BuildOrchestrator for Rp2040Orchestrator {
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -115,7 +118,8 @@ impl BuildOrchestrator for Rp2040Orchestrator {
             Some(o) => fbuild_packages::library::Rp2040Cores::with_override(&params.project_dir, o),
             None => fbuild_packages::library::Rp2040Cores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("RP2040 cores at {}", framework_dir.display());
         let board_id = ctx
             .config
@@ -228,7 +232,13 @@ impl BuildOrchestrator for Rp2040Orchestrator {
         // Arduino-Pico ships framework libraries (WiFi, SPI, Wire, ...) under
         // `libraries/`. Mirror PlatformIO's LDF so their headers are visible
         // and only the sources required by the project are compiled.
-        let framework_libs = framework.get_framework_libraries();
+        let framework_libs = crate::env_session::shared(
+            params.env_session.as_deref(),
+            "framework-libraries",
+            framework_dir.to_string_lossy(),
+            || async { Ok(framework.get_framework_libraries()) },
+        )
+        .await?;
         let framework_info = fbuild_packages::Package::get_info(&framework);
         let declared_deps = ctx
             .config
@@ -130,13 +130,16 @@ impl BuildOrchestrator for SamOrchestrator {
                 &params.project_dir,
             ))
         };
-        let toolchain_dir = toolchain.ensure_installed().await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), toolchain.as_ref())
+                .await?;
         tracing::info!("arm-none-eabi toolchain at {}", toolchain_dir.display());
 
         pipeline::log_toolchain_version(
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -449,7 +452,8 @@ async fn install_sam_core(
         Some(o) => fbuild_packages::library::SamCores::with_override(&params.project_dir, o),
         None => fbuild_packages::library::SamCores::new(&params.project_dir),
     };
-    let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+    let framework_dir =
+        crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
     tracing::info!("SAM cores at {}", framework_dir.display());
 
     let core_dir = framework.get_core_dir(core_name);
@@ -488,7 +492,8 @@ async fn install_samd_core(
         Some(o) => fbuild_packages::library::SamdCores::with_override(&params.project_dir, o),
         None => fbuild_packages::library::SamdCores::new(&params.project_dir),
     };
-    let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+    let framework_dir =
+        crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
     tracing::info!("SAMD cores at {}", framework_dir.display());
 
     let core_dir = framework.get_core_dir(core_name);
@@ -497,11 +502,13 @@ async fn install_samd_core(
 
     // SAMD core needs external CMSIS and CMSIS-Atmel packages for device headers
     let cmsis = fbuild_packages::library::CmsisFramework::new(&params.project_dir);
-    let cmsis_dir = fbuild_packages::Package::ensure_installed(&cmsis).await?;
+    let cmsis_dir =
+        crate::pipeline::ensure_installed(params.env_session.as_deref(), &cmsis).await?;
     tracing::info!("CMSIS at {}", cmsis_dir.display());
 
     let cmsis_atmel = fbuild_packages::library::CmsisAtmel::new(&params.project_dir);
-    let _cmsis_atmel_dir = fbuild_packages::Package::ensure_installed(&cmsis_atmel).await?;
+    let _cmsis_atmel_dir =
+        crate::pipeline::ensure_installed(params.env_session.as_deref(), &cmsis_atmel).await?;
     tracing::info!("CMSIS-Atmel installed");
 
     let mut includes = vec![
@@ -552,7 +559,8 @@ async fn install_clearcore_core(
         Some(o) => fbuild_packages::library::ClearCoreCores::with_override(&params.project_dir, o),
         None => fbuild_packages::library::ClearCoreCores::new(&params.project_dir),
     };
-    let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+    let framework_dir =
+        crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
     tracing::info!("ClearCore Arduino core at {}", framework_dir.display());
 
     let core_dir = framework.get_core_dir(core_name);
@@ -560,7 +568,8 @@ async fn install_clearcore_core(
     let linker_script = framework.get_linker_script(variant_name);
 
     let cmsis = fbuild_packages::library::CmsisFramework::new(&params.project_dir);
-    let cmsis_dir = fbuild_packages::Package::ensure_installed(&cmsis).await?;
+    let cmsis_dir =
+        crate::pipeline::ensure_installed(params.env_session.as_deref(), &cmsis).await?;
     tracing::info!("CMSIS at {}", cmsis_dir.display());
 
     let mut includes = framework.get_system_include_dirs(&core_dir, &variant_dir);
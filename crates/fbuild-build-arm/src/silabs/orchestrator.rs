@@ -37,7 +37,8 @@ impl BuildOrchestrator for SilabsOrchestrator {
         let mut ctx = pipeline::BuildContext::new(params).await?;
 
         let toolchain = fbuild_packages::toolchain::ArmToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("arm-gcc toolchain at {}", toolchain_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -45,6 +46,7 @@ impl BuildOrchestrator for SilabsOrchestrator {
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -60,7 +62,8 @@ impl BuildOrchestrator for SilabsOrchestrator {
             Some(o) => fbuild_packages::library::SilabsCores::with_override(&params.project_dir, o),
             None => fbuild_packages::library::SilabsCores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("Silicon Labs cores at {}", framework_dir.display());
 
         let core_dir = framework.get_core_dir(&ctx.board.core);
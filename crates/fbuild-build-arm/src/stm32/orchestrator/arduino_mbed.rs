@@ -49,7 +49,8 @@ pub(super) async fn build_arduino_mbed_stm32(
         Some(o) => fbuild_packages::library::ArduinoMbedCore::with_override(&params.project_dir, o),
         None => fbuild_packages::library::ArduinoMbedCore::new(&params.project_dir),
     };
-    let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+    let framework_dir =
+        crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
     tracing::info!("Arduino mbed core at {}", framework_dir.display());
 
     let core_dir = framework.get_core_dir("arduino");
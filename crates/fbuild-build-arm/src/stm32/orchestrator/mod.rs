@@ -77,13 +77,15 @@ impl BuildOrchestrator for Stm32Orchestrator {
 
         // 3. Ensure ARM GCC toolchain
         let toolchain = fbuild_packages::toolchain::ArmToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("arm-gcc toolchain at {}", toolchain_dir.display());
 
         pipeline::log_toolchain_version(
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -104,7 +106,8 @@ impl BuildOrchestrator for Stm32Orchestrator {
             Some(o) => fbuild_packages::library::Stm32Cores::with_override(&params.project_dir, o),
             None => fbuild_packages::library::Stm32Cores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("STM32 cores at {}", framework_dir.display());
 
         let build_dir = &ctx.build_dir;
@@ -215,7 +218,13 @@ impl BuildOrchestrator for Stm32Orchestrator {
         // that include <SPI.h> fail with "No such file or directory" because
         // STM32duino only exposes bundled libraries via this framework-level
         // discovery (PlatformIO's LDF does the same for `framework = arduino`).
-        let framework_libs = framework.get_framework_libraries();
+        let framework_libs = crate::env_session::shared(
+            params.env_session.as_deref(),
+            "framework-libraries",
+            framework_dir.to_string_lossy(),
+            || async { Ok(framework.get_framework_libraries()) },
+        )
+        .await?;
         let mut mcu_config =
             super::mcu_config::get_stm32_config_for_mcu(&ctx.board.mcu.to_lowercase())?;
         // Extract MCU family from variant path (e.g. "STM32F1xx" from
@@ -345,7 +354,8 @@ impl BuildOrchestrator for Stm32Orchestrator {
 
         // CMSIS Core includes (core_cm3.h, core_cm4.h, etc.) â€” not bundled in STM32duino
         let cmsis = fbuild_packages::library::CmsisFramework::new(&params.project_dir);
-        let _cmsis_dir = fbuild_packages::Package::ensure_installed(&cmsis).await?;
+        let _cmsis_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &cmsis).await?;
         tracing::info!("CMSIS framework installed");
         include_dirs.push(cmsis.get_core_include_dir());
 
@@ -26,6 +26,31 @@ impl crate::PlatformSupport for TeensyPlatformSupport {
         Ok(())
     }
 
+    async fn prefetch(
+        &self,
+        project_dir: &std::path::Path,
+        board: &fbuild_config::BoardConfig,
+        env_config: &std::collections::HashMap<String, String>,
+        session: Option<&crate::env_session::EnvSession>,
+    ) -> fbuild_core::Result<()> {
+        // The orchestrator builds with the Teensy toolchain, not the generic
+        // ARM one `install_deps` installs.
+        let tc = fbuild_packages::toolchain::TeensyArmToolchain::new(project_dir);
+        let ovr = crate::package_override::resolve_override(env_config, "framework-arduinoteensy");
+        let framework = match ovr {
+            Some(o) => fbuild_packages::library::TeensyCores::with_override(project_dir, o),
+            None => fbuild_packages::library::TeensyCores::new(project_dir),
+        };
+        let (toolchain, cores) = tokio::join!(
+            crate::pipeline::ensure_installed(session, &tc),
+            crate::pipeline::ensure_installed(session, &framework),
+        );
+        toolchain?;
+        cores?;
+        tracing::info!("Teensy packages for {} installed", board.mcu);
+        Ok(())
+    }
+
     fn default_board_id(&self) -> &str {
         "teensy41"
     }
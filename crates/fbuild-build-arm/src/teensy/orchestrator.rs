@@ -88,7 +88,8 @@ impl BuildOrchestrator for TeensyOrchestrator {
 
         // 3. Ensure Teensy-compatible ARM GCC toolchain
         let toolchain = fbuild_packages::toolchain::TeensyArmToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("Teensy ARM GCC toolchain at {}", toolchain_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -96,6 +97,7 @@ impl BuildOrchestrator for TeensyOrchestrator {
             &toolchain.get_gcc_path(),
             "arm-none-eabi-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -112,7 +114,8 @@ impl BuildOrchestrator for TeensyOrchestrator {
             Some(o) => fbuild_packages::library::TeensyCores::with_override(&params.project_dir, o),
             None => fbuild_packages::library::TeensyCores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("Teensy cores at {}", framework_dir.display());
 
         let core_dir = framework.get_core_dir(&ctx.board.core);
@@ -180,7 +183,13 @@ impl BuildOrchestrator for TeensyOrchestrator {
             .core_sources
             .retain(|p| p.file_name().map(|f| f != "Blink.cc").unwrap_or(true));
 
-        let framework_libs = framework.get_framework_libraries();
+        let framework_libs = crate::env_session::shared(
+            params.env_session.as_deref(),
+            "framework-libraries",
+            framework_dir.to_string_lossy(),
+            || async { Ok(framework.get_framework_libraries()) },
+        )
+        .await?;
         let ldf_mcu_config =
             super::mcu_config::get_teensy_config_for_mcu(&ctx.board.mcu.to_lowercase())?;
         let mut ldf_defines = ctx.board.get_defines();
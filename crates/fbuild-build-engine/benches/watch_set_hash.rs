@@ -0,0 +1,148 @@
+//! Criterion benchmark for `build_fingerprint::hash_watch_set` and
+//! `hash_files` on an ESP-IDF-sized tree.
+//!
+//! The `synthetic` group generates a tree shaped like the ESP32 Arduino
+//! framework's `esp32-arduino-libs`: thousands of small headers spread over
+//! component directories plus a few dozen multi-megabyte static archives,
+//! which take the memory-mapped path. Each case runs on one rayon thread
+//! and on the default pool, so the speedup from hashing files in parallel
+//! shows up side by side.
+//!
+//! The `esp_idf` group hashes a real SDK tree taken from
+//! `FBUILD_BENCH_ESP_IDF`, otherwise the first one found in the fbuild
+//! package cache, and is skipped with a printed reason when neither exists.
+
+use std::path::Path;
+
+use criterion::{BenchmarkId, Criterion, Throughput, black_box, criterion_group, criterion_main};
+use fbuild_build_engine::build_fingerprint::{fast_path_watch, hash_files, hash_watch_set};
+
+/// Component directories in the synthetic tree.
+const COMPONENTS: usize = 120;
+/// Headers per component (ESP-IDF ships roughly 12k headers).
+const HEADERS_PER_COMPONENT: usize = 100;
+/// Static archives in the synthetic tree, one per component up to this count.
+const ARCHIVES: usize = 40;
+const HEADER_BYTES: usize = 4 * 1024;
+const ARCHIVE_BYTES: usize = 2 * 1024 * 1024;
+
+/// Directory depth searched below the package cache for an SDK tree: covers
+/// `platforms/<pkg>/<hash>/<version>/tools/esp32-arduino-libs`.
+const CACHE_SEARCH_DEPTH: usize = 7;
+
+/// Write the synthetic tree under `root`; returns its total size in bytes.
+fn build_tree(root: &Path) -> u64 {
+    let header: Vec<u8> = (0..HEADER_BYTES).map(|i| b'a' + (i % 26) as u8).collect();
+    let archive: Vec<u8> = (0..ARCHIVE_BYTES).map(|i| (i % 251) as u8).collect();
+    let mut total = 0u64;
+    for c in 0..COMPONENTS {
+        let include = root.join(format!("component_{c}")).join("include");
+        std::fs::create_dir_all(&include).unwrap();
+        for h in 0..HEADERS_PER_COMPONENT {
+            std::fs::write(include.join(format!("header_{h}.h")), &header).unwrap();
+            total += header.len() as u64;
+        }
+        if c < ARCHIVES {
+            let lib = root.join(format!("component_{c}")).join("lib");
+            std::fs::create_dir_all(&lib).unwrap();
+            std::fs::write(lib.join(format!("libcomponent_{c}.a")), &archive).unwrap();
+            total += archive.len() as u64;
+        }
+    }
+    total
+}
+
+/// Every regular file below `root`, in walk order.
+macro_rules! files_under {
+    ($root:expr) => {
+        walkdir::WalkDir::new($root)
+            .into_iter()
+            .flatten()
+            .filter(|e| e.file_type().is_file())
+            .map(|e| e.into_path())
+            .collect::<Vec<_>>()
+    };
+}
+
+fn rayon_pools() -> Vec<(&'static str, rayon::ThreadPool)> {
+    let single = rayon::ThreadPoolBuilder::new()
+        .num_threads(1)
+        .build()
+        .unwrap();
+    let all = rayon::ThreadPoolBuilder::new().build().unwrap();
+    vec![("threads_1", single), ("threads_all", all)]
+}
+
+fn bench_synthetic(c: &mut Criterion) {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let root = tmp.path().join("esp32-arduino-libs");
+    let total = build_tree(&root);
+    let watch = fast_path_watch("bench", tmp.path(), &root);
+    let files = files_under!(&root);
+
+    let mut group = c.benchmark_group("synthetic");
+    group.throughput(Throughput::BytesDecimal(total));
+    group.sample_size(10);
+    for (name, pool) in rayon_pools() {
+        group.bench_function(BenchmarkId::new("hash_watch_set", name), |b| {
+            b.iter(|| pool.install(|| black_box(hash_watch_set(std::slice::from_ref(&watch)))));
+        });
+        group.bench_function(BenchmarkId::new("hash_files", name), |b| {
+            b.iter(|| pool.install(|| black_box(hash_files(&files))));
+        });
+    }
+    group.finish();
+}
+
+fn bench_esp_idf(c: &mut Criterion) {
+    // The tree comes from the env var, else the first `esp32-arduino-libs`
+    // directory below the package cache.
+    let root = match std::env::var_os("FBUILD_BENCH_ESP_IDF") {
+        Some(dir) => Some(Path::new(&dir).to_path_buf()),
+        None => std::env::var_os("USERPROFILE")
+            .or_else(|| std::env::var_os("HOME"))
+            .and_then(|home| {
+                walkdir::WalkDir::new(Path::new(&home).join(".fbuild/prod/cache/platforms"))
+                    .max_depth(CACHE_SEARCH_DEPTH)
+                    .sort_by_file_name()
+                    .into_iter()
+                    .flatten()
+                    .find(|e| e.file_type().is_dir() && e.file_name() == "esp32-arduino-libs")
+                    .map(|e| e.into_path())
+            }),
+    };
+    let Some(root) = root else {
+        eprintln!(
+            "esp_idf: skipped — set FBUILD_BENCH_ESP_IDF or install an ESP32 \
+             Arduino framework into the fbuild cache"
+        );
+        return;
+    };
+    let tmp = tempfile::TempDir::new().unwrap();
+    let watch = fast_path_watch("bench", tmp.path(), &root);
+    let files = files_under!(&root);
+    let total: u64 = files
+        .iter()
+        .filter_map(|f| std::fs::metadata(f).ok())
+        .map(|m| m.len())
+        .sum();
+    eprintln!(
+        "esp_idf: {} files, {:.1} MB under {}",
+        files.len(),
+        total as f64 / 1e6,
+        root.display()
+    );
+
+    let mut group = c.benchmark_group("esp_idf");
+    group.throughput(Throughput::BytesDecimal(total));
+    group.sample_size(10);
+    for (name, pool) in rayon_pools() {
+        group.bench_function(BenchmarkId::new("hash_watch_set", name), |b| {
+            b.iter(|| pool.install(|| black_box(hash_watch_set(std::slice::from_ref(&watch)))));
+        });
+    }
+    group.finish();
+}
+
+criterion_group!(benches, bench_synthetic, bench_esp_idf);
+criterion_main!(benches);
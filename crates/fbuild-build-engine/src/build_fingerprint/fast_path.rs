@@ -256,15 +256,25 @@ pub fn fast_path_check(
     contract: &FastPathContract,
     inputs: &FastPathCheckInputs<'_>,
 ) -> Result<Option<FastPathHit>> {
-    // Load the persisted fingerprint. A parse error falls back to a
-    // full build (matches the pre-extraction ESP32 behaviour).
+    // Load the persisted fingerprint, preferring the daemon's in-memory
+    // copy; the file is the cold-start fallback. A parse error falls
+    // back to a full build (matches the pre-extraction ESP32 behaviour).
+    let path = contract.fingerprint_path();
     let persisted: Option<PersistedBuildFingerprint> =
-        match load_json::<PersistedBuildFingerprint>(contract.fingerprint_path()) {
-            Ok(value) => value,
-            Err(e) => {
-                tracing::warn!("ignoring invalid build fingerprint: {}", e);
-                None
-            }
+        match inputs.watch_set_cache.and_then(|c| c.get_fingerprint(path)) {
+            Some(value) => Some(value),
+            None => match load_json::<PersistedBuildFingerprint>(path) {
+                Ok(value) => {
+                    if let (Some(cache), Some(value)) = (inputs.watch_set_cache, &value) {
+                        cache.put_fingerprint(path, value);
+                    }
+                    value
+                }
+                Err(e) => {
+                    tracing::warn!("ignoring invalid build fingerprint: {}", e);
+                    None
+                }
+            },
         };
 
     let Some(previous) = persisted else {
@@ -334,8 +344,13 @@ pub fn persist_fast_path_success(contract: &FastPathContract, inputs: &FastPathP
         },
         size_info: inputs.size_info.clone(),
     };
-    if let Err(e) = save_json(contract.fingerprint_path(), &persisted_fingerprint) {
-        tracing::warn!("failed to write build fingerprint: {}", e);
+    match save_json(contract.fingerprint_path(), &persisted_fingerprint) {
+        Ok(()) => {
+            if let Some(cache) = inputs.watch_set_cache {
+                cache.put_fingerprint(contract.fingerprint_path(), &persisted_fingerprint);
+            }
+        }
+        Err(e) => tracing::warn!("failed to write build fingerprint: {}", e),
     }
     // Same gating as `fast_path_check`: only mark zccache success
     // when the caller opted into the embedded zccache path. The
@@ -519,6 +534,7 @@ mod tests {
     #[derive(Default)]
     struct RecordingCache {
         entries: Mutex<Vec<(Vec<PathBuf>, String)>>,
+        fingerprints: Mutex<Vec<(PathBuf, PersistedBuildFingerprint)>>,
     }
 
     impl WatchSetStampCache for RecordingCache {
@@ -538,6 +554,21 @@ mod tests {
             entries.retain(|(k, _)| k != &key);
             entries.push((key, hash));
         }
+
+        fn get_fingerprint(&self, path: &Path) -> Option<PersistedBuildFingerprint> {
+            self.fingerprints
+                .lock()
+                .unwrap()
+                .iter()
+                .find(|(p, _)| p == path)
+                .map(|(_, fp)| fp.clone())
+        }
+
+        fn put_fingerprint(&self, path: &Path, fingerprint: &PersistedBuildFingerprint) {
+            let mut fingerprints = self.fingerprints.lock().unwrap();
+            fingerprints.retain(|(p, _)| p != path);
+            fingerprints.push((path.to_path_buf(), fingerprint.clone()));
+        }
     }
 
     fn key_for(watches: &[FingerprintWatch]) -> Vec<PathBuf> {
@@ -783,4 +814,44 @@ mod tests {
             "persisted contract should produce a fast-path hit"
         );
     }
+
+    #[test]
+    fn fingerprint_memo_is_read_before_the_file_and_filled_from_it() {
+        let fx = Fixture::new();
+        fx.write_fingerprint("meta-abc");
+        let cache = RecordingCache::default();
+        let inputs = FastPathCheckInputs {
+            metadata_hash: "meta-abc",
+            extra_artifact_ok: None,
+            watch_set_cache: Some(&cache),
+            compiler_cache: None,
+        };
+
+        // Cold start: the file is read and its contents memoised.
+        assert!(fast_path_check(&fx.contract, &inputs).unwrap().is_some());
+        assert_eq!(cache.fingerprints.lock().unwrap().len(), 1);
+
+        // Warm: the memo answers without touching the file.
+        fs::remove_file(fx.contract.fingerprint_path()).unwrap();
+        assert!(fast_path_check(&fx.contract, &inputs).unwrap().is_some());
+    }
+
+    #[test]
+    fn persist_success_refreshes_fingerprint_memo() {
+        let fx = Fixture::new();
+        let cache = RecordingCache::default();
+
+        persist_fast_path_success(
+            &fx.contract,
+            &FastPathPersistInputs {
+                metadata_hash: "meta-new",
+                size_info: None,
+                watch_set_cache: Some(&cache),
+                compiler_cache: None,
+            },
+        );
+
+        let memo = cache.get_fingerprint(fx.contract.fingerprint_path());
+        assert_eq!(memo.map(|fp| fp.metadata_hash).as_deref(), Some("meta-new"));
+    }
 }
@@ -9,11 +9,13 @@ pub use fast_path::{
 };
 
 use std::collections::HashMap;
+use std::io::Read as _;
 use std::path::{Path, PathBuf};
 use std::time::UNIX_EPOCH;
 
 use fbuild_core::path::NormalizedPath;
 use fbuild_core::{Result, SizeInfo};
+use rayon::prelude::*;
 use serde::{Deserialize, Serialize, de::DeserializeOwned};
 use sha2::{Digest, Sha256};
 use walkdir::WalkDir;
@@ -23,6 +25,12 @@ use crate::zccache::FingerprintWatch;
 pub const BUILD_FINGERPRINT_VERSION: u32 = 2;
 const WATCH_STAMP_CACHE_VERSION: u32 = 2;
 
+/// Files at least this large are memory-mapped and hashed with blake3's
+/// multithreaded update. Smaller files are read whole: the mapping setup
+/// costs more than it saves, and the per-file parallelism already keeps
+/// every core busy on trees of headers.
+const MMAP_HASH_MIN_BYTES: u64 = 1 << 20;
+
 #[derive(Debug, Clone, Serialize, Deserialize)]
 pub struct PersistedBuildFingerprint {
     pub version: u32,
@@ -126,6 +134,11 @@ pub fn stable_hash_json<T: Serialize>(value: &T) -> Result<String> {
     Ok(sha256_hex(&bytes))
 }
 
+/// Hash `paths` by content, independent of where the common parent lives.
+///
+/// Files are hashed in parallel and their blake3 digests combined in
+/// sorted path order, so the value is deterministic for a given set of
+/// paths and contents.
 pub fn hash_files(paths: &[PathBuf]) -> Result<String> {
     let root = common_parent_for_hash(paths);
     let mut sorted: Vec<(String, &PathBuf)> = paths
@@ -133,24 +146,38 @@ pub fn hash_files(paths: &[PathBuf]) -> Result<String> {
         .map(|path| (path_for_hash(root.as_deref(), path), path))
         .collect();
     sorted.sort_by(|a, b| a.0.cmp(&b.0).then_with(|| a.1.cmp(b.1)));
+    let digests = sorted
+        .par_iter()
+        .map(|(_, path)| {
+            if path.exists() {
+                file_digest(path).map(Some)
+            } else {
+                Ok(None)
+            }
+        })
+        .collect::<Result<Vec<_>>>()?;
+
     let mut hasher = Sha256::new();
-    for (path_for_hash, path) in sorted {
-        if !path.exists() {
+    for ((path_for_hash, _), digest) in sorted.iter().zip(digests) {
+        let Some((len, digest)) = digest else {
             hasher.update(b"missing\0");
             hasher.update(path_for_hash);
             hasher.update(b"\0");
             continue;
-        }
+        };
         hasher.update(b"path\0");
         hasher.update(path_for_hash);
         hasher.update(b"\0");
-        let bytes = std::fs::read(path)?;
-        hasher.update((bytes.len() as u64).to_le_bytes());
-        hasher.update(&bytes);
+        hasher.update(len.to_le_bytes());
+        hasher.update(digest.as_bytes());
     }
     Ok(format!("{:x}", hasher.finalize()))
 }
 
+/// Content hash of every file under `watches`.
+///
+/// The walk is sequential; the files it finds are hashed in parallel and
+/// folded in sorted order, so the value matches a sequential hash.
 pub fn hash_watch_set(watches: &[FingerprintWatch]) -> Result<String> {
     let mut ordered = watches.to_vec();
     ordered.sort_by_key(watch_identity);
@@ -165,48 +192,69 @@ pub fn hash_watch_set(watches: &[FingerprintWatch]) -> Result<String> {
             continue;
         }
 
-        let mut files = Vec::new();
-        for entry in WalkDir::new(&watch.root)
-            .into_iter()
-            .filter_entry(|entry| should_descend(entry.path(), &watch.root, &watch.excludes))
-            .flatten()
-        {
-            if !entry.file_type().is_file() {
-                continue;
-            }
-            if !matches_extension(entry.path(), &watch.extensions) {
-                continue;
-            }
-            files.push(entry.into_path());
-        }
-        files.sort();
+        let files = collect_watch_files(watch);
+        let digests = files
+            .par_iter()
+            .map(|file| file_digest(file))
+            .collect::<Result<Vec<_>>>()?;
 
-        for file in files {
+        for (file, (len, digest)) in files.iter().zip(digests) {
             hasher.update(b"file\0");
-            hasher.update(relative_path_for_hash(&watch.root, &file));
+            hasher.update(relative_path_for_hash(&watch.root, file));
             hasher.update(b"\0");
-            let bytes = std::fs::read(&file)?;
-            hasher.update((bytes.len() as u64).to_le_bytes());
-            hasher.update(blake3::hash(&bytes).as_bytes());
+            hasher.update(len.to_le_bytes());
+            hasher.update(digest.as_bytes());
         }
     }
 
     Ok(format!("{:x}", hasher.finalize()))
 }
 
+/// Sorted files under `watch.root` the watch covers.
+fn collect_watch_files(watch: &FingerprintWatch) -> Vec<PathBuf> {
+    let mut files = Vec::new();
+    for entry in WalkDir::new(&watch.root)
+        .into_iter()
+        .filter_entry(|entry| should_descend(entry.path(), &watch.root, &watch.excludes))
+        .flatten()
+    {
+        if !entry.file_type().is_file() {
+            continue;
+        }
+        if !matches_extension(entry.path(), &watch.extensions) {
+            continue;
+        }
+        files.push(entry.into_path());
+    }
+    files.sort();
+    files
+}
+
 /// In-memory cache for [`hash_watch_set_stamps`] results across
 /// invocations within the same daemon lifetime. The daemon implements
-/// this so warm rebuilds within a few seconds of each other can skip
-/// the per-build walk over thousands of watched files.
+/// this so warm rebuilds can skip the per-build walk over thousands of
+/// watched files.
 ///
 /// The cache key is derived by the implementor from the watch set's
 /// root paths; the orchestrator just hands the slice in. Callers must
 /// expect `get` to return `None` whenever the implementation considers
-/// the entry stale (typically a 2–5 s freshness window since the last
-/// `put`), so correctness is unaffected by an absent or evicted entry.
+/// the entry stale (a filesystem event under a watched root, or an
+/// expired freshness window when no watcher is available), so
+/// correctness is unaffected by an absent or evicted entry.
 pub trait WatchSetStampCache: Send + Sync {
     fn get(&self, watches: &[FingerprintWatch]) -> Option<String>;
     fn put(&self, watches: &[FingerprintWatch], hash: String);
+
+    /// In-memory copy of the [`PersistedBuildFingerprint`] stored at
+    /// `path`, if the implementation holds one that still matches the
+    /// file. `None` makes the fast path read the file (the cold-start
+    /// behaviour).
+    fn get_fingerprint(&self, _path: &Path) -> Option<PersistedBuildFingerprint> {
+        None
+    }
+
+    /// Record the fingerprint just read from or written to `path`.
+    fn put_fingerprint(&self, _path: &Path, _fingerprint: &PersistedBuildFingerprint) {}
 }
 
 /// [`hash_watch_set_stamps`] with an optional in-memory short-circuit.
@@ -239,12 +287,9 @@ pub fn hash_watch_set_stamps(watches: &[FingerprintWatch]) -> Result<String> {
     hash_watch_set_stamps_inner(watches, content_hash_hex)
 }
 
-fn hash_watch_set_stamps_inner<F>(
-    watches: &[FingerprintWatch],
-    mut content_hash: F,
-) -> Result<String>
+fn hash_watch_set_stamps_inner<F>(watches: &[FingerprintWatch], content_hash: F) -> Result<String>
 where
-    F: FnMut(&Path) -> Result<String>,
+    F: Fn(&Path) -> Result<String> + Sync,
 {
     let mut ordered = watches.to_vec();
     ordered.sort_by_key(watch_identity);
@@ -265,43 +310,31 @@ where
             .into_iter()
             .map(|file| (file.relative_path.clone(), file))
             .collect();
-        let mut next_files = Vec::new();
-
-        let mut files = Vec::new();
-        for entry in WalkDir::new(&watch.root)
-            .into_iter()
-            .filter_entry(|entry| should_descend(entry.path(), &watch.root, &watch.excludes))
-            .flatten()
-        {
-            if !entry.file_type().is_file() {
-                continue;
-            }
-            if !matches_extension(entry.path(), &watch.extensions) {
-                continue;
-            }
-            files.push(entry.into_path());
-        }
-        files.sort();
-
-        for file in files {
-            let relative_path = relative_path_for_hash(&watch.root, &file);
-            let stamp = FileStamp::from_path(&file)?;
-            let content_hash = match previous_files.get(&relative_path) {
-                Some(previous) if previous.stamp == stamp => previous.content_hash.clone(),
-                _ => content_hash(&file)?,
-            };
-
+        // Stat and (re)hash in parallel; only files whose stamp moved
+        // are read. Folding below stays in sorted order.
+        let next_files = collect_watch_files(watch)
+            .par_iter()
+            .map(|file| {
+                let relative_path = relative_path_for_hash(&watch.root, file);
+                let stamp = FileStamp::from_path(file)?;
+                let content_hash = match previous_files.get(&relative_path) {
+                    Some(previous) if previous.stamp == stamp => previous.content_hash.clone(),
+                    _ => content_hash(file)?,
+                };
+                Ok(WatchFileStamp {
+                    relative_path,
+                    stamp,
+                    content_hash,
+                })
+            })
+            .collect::<Result<Vec<_>>>()?;
+
+        for file in &next_files {
             hasher.update(b"file\0");
-            hasher.update(&relative_path);
+            hasher.update(&file.relative_path);
             hasher.update(b"\0");
-            hasher.update(stamp.len.to_le_bytes());
-            hasher.update(content_hash.as_bytes());
-
-            next_files.push(WatchFileStamp {
-                relative_path,
-                stamp,
-                content_hash,
-            });
+            hasher.update(file.stamp.len.to_le_bytes());
+            hasher.update(file.content_hash.as_bytes());
         }
 
         save_json(
@@ -358,8 +391,28 @@ fn sha256_hex(bytes: &[u8]) -> String {
 }
 
 fn content_hash_hex(path: &Path) -> Result<String> {
-    let bytes = std::fs::read(path)?;
-    Ok(blake3::hash(&bytes).to_hex().to_string())
+    Ok(file_digest(path)?.1.to_hex().to_string())
+}
+
+/// Length and blake3 digest of the file at `path`.
+fn file_digest(path: &Path) -> Result<(u64, blake3::Hash)> {
+    let file = std::fs::File::open(path)?;
+    let len = file.metadata()?.len();
+    // Windows would refuse to let an editor save over a mapped file, so
+    // large files are only mapped elsewhere.
+    if len >= MMAP_HASH_MIN_BYTES && !cfg!(windows) {
+        // SAFETY: the map lives only for this hash. A concurrent
+        // truncation can fault the reader, the contract every
+        // mmap-backed hasher accepts; an edit racing the hash is caught
+        // by the next stamp or watcher check either way.
+        let map = unsafe { memmap2::Mmap::map(&file)? };
+        let mut hasher = blake3::Hasher::new();
+        hasher.update_rayon(&map);
+        return Ok((map.len() as u64, hasher.finalize()));
+    }
+    let mut bytes = Vec::with_capacity(len as usize);
+    (&file).read_to_end(&mut bytes)?;
+    Ok((bytes.len() as u64, blake3::hash(&bytes)))
 }
 
 fn relative_path_for_hash(root: &Path, path: &Path) -> String {
@@ -451,470 +504,4 @@ fn should_descend(path: &Path, root: &Path, excludes: &[String]) -> bool {
 }
 
 #[cfg(test)]
-mod tests {
-    use super::*;
-    use std::cell::Cell;
-    use std::fs;
-
-    fn make_watch(root: &Path, cache_file: &Path) -> FingerprintWatch {
-        FingerprintWatch {
-            cache_file: cache_file.to_path_buf(),
-            root: root.to_path_buf(),
-            extensions: vec!["cpp".to_string(), "h".to_string()],
-            excludes: vec!["build".to_string()],
-        }
-    }
-
-    fn hash_watch_with_counter(watch: &FingerprintWatch, hash_count: &Cell<usize>) -> String {
-        hash_watch_set_stamps_inner(std::slice::from_ref(watch), |path| {
-            hash_count.set(hash_count.get() + 1);
-            content_hash_hex(path)
-        })
-        .unwrap()
-    }
-
-    fn set_file_mtime(path: &Path, secs: i64) {
-        filetime::set_file_mtime(path, filetime::FileTime::from_unix_time(secs, 0)).unwrap();
-    }
-
-    #[test]
-    fn test_hash_files_changes_when_contents_change() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let path = tmp.path().join("a.txt");
-        fs::write(&path, "one").unwrap();
-        let first = hash_files(std::slice::from_ref(&path)).unwrap();
-        fs::write(&path, "two").unwrap();
-        let second = hash_files(std::slice::from_ref(&path)).unwrap();
-        assert_ne!(first, second);
-    }
-
-    #[test]
-    fn test_hash_files_ignores_workspace_root() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let a_root = tmp.path().join("workspace-a").join("project");
-        let b_root = tmp.path().join("workspace-b").join("project");
-        fs::create_dir_all(a_root.join("include")).unwrap();
-        fs::create_dir_all(b_root.join("include")).unwrap();
-        fs::write(a_root.join("main.cpp"), "int main() { return 0; }\n").unwrap();
-        fs::write(b_root.join("main.cpp"), "int main() { return 0; }\n").unwrap();
-        fs::write(a_root.join("include").join("app.h"), "#pragma once\n").unwrap();
-        fs::write(b_root.join("include").join("app.h"), "#pragma once\n").unwrap();
-
-        let a_paths = vec![
-            a_root.join("main.cpp"),
-            a_root.join("include").join("app.h"),
-        ];
-        let b_paths = vec![
-            b_root.join("main.cpp"),
-            b_root.join("include").join("app.h"),
-        ];
-
-        let a_hash = hash_files(&a_paths).unwrap();
-        let b_hash = hash_files(&b_paths).unwrap();
-
-        assert_eq!(a_hash, b_hash);
-    }
-
-    #[test]
-    fn test_hash_watch_set_changes_when_watched_source_changes() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 1; }\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join("watch.json"));
-
-        let first = hash_watch_set(std::slice::from_ref(&watch)).unwrap();
-        fs::write(&main, "int main() { return 2; }\n").unwrap();
-        let second = hash_watch_set(std::slice::from_ref(&watch)).unwrap();
-
-        assert_ne!(first, second);
-    }
-
-    #[test]
-    fn test_save_json_does_not_rewrite_unchanged_file() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let path = tmp.path().join("fingerprint.json");
-        let value = PersistedBuildFingerprint {
-            version: BUILD_FINGERPRINT_VERSION,
-            metadata_hash: "abc".to_string(),
-            file_set_hash: Some("def".to_string()),
-            size_info: None,
-        };
-
-        save_json(&path, &value).unwrap();
-        let first_mtime = fs::metadata(&path).unwrap().modified().unwrap();
-        std::thread::sleep(std::time::Duration::from_millis(20));
-        save_json(&path, &value).unwrap();
-        let second_mtime = fs::metadata(&path).unwrap().modified().unwrap();
-
-        assert_eq!(first_mtime, second_mtime);
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_changes_when_contents_change() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 1; }\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join("watch.json"));
-
-        let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-        std::thread::sleep(std::time::Duration::from_millis(20));
-        fs::write(&main, "int main() { return 1; }\n// touch\n").unwrap();
-        let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-
-        assert_ne!(first, second);
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_ignores_mtime_only_change() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        let contents = "int main() { return 1; }\n";
-        fs::write(&main, contents).unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-
-        let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-        std::thread::sleep(std::time::Duration::from_millis(20));
-        fs::write(&main, contents).unwrap();
-        let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-
-        assert_eq!(first, second);
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_survives_mtime_reset_without_rewrite() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 1; }\n").unwrap();
-        set_file_mtime(&main, 1_700_000_000);
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let hash_count = Cell::new(0usize);
-
-        let first = hash_watch_with_counter(&watch, &hash_count);
-        set_file_mtime(&main, 1_700_000_123);
-        let second = hash_watch_with_counter(&watch, &hash_count);
-        let after_second = hash_count.get();
-        let third = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_eq!(first, second);
-        assert_eq!(second, third);
-        assert_eq!(
-            after_second, 2,
-            "mtime reset should rehash once to prove byte identity"
-        );
-        assert_eq!(
-            hash_count.get(),
-            after_second,
-            "updated stamp cache should restore the stat-only fast path"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_detects_same_length_content_change_after_mtime_reset() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 1; }\n").unwrap();
-        set_file_mtime(&main, 1_700_000_000);
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-
-        let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-        fs::write(&main, "int main() { return 2; }\n").unwrap();
-        set_file_mtime(&main, 1_700_000_123);
-        let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-
-        assert_eq!(
-            fs::metadata(&main).unwrap().len(),
-            "int main() { return 1; }\n".len() as u64
-        );
-        assert_ne!(first, second);
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_skips_rehash_when_stamp_unchanged() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 1; }\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-
-        let hash_count = Cell::new(0usize);
-        let first = hash_watch_with_counter(&watch, &hash_count);
-        let after_first = hash_count.get();
-        let second = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_eq!(first, second);
-        assert_eq!(
-            after_first, 1,
-            "initial pass should hash file contents once"
-        );
-        assert_eq!(
-            hash_count.get(),
-            after_first,
-            "unchanged mtime/size should reuse cached content hash"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_rehashes_only_changed_file() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        let header = src.join("pins.h");
-        fs::write(&main, "int main() { return LED_PIN; }\n").unwrap();
-        fs::write(&header, "#define LED_PIN 1\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let hash_count = Cell::new(0usize);
-
-        let first = hash_watch_with_counter(&watch, &hash_count);
-        let after_first = hash_count.get();
-        std::thread::sleep(std::time::Duration::from_millis(20));
-        fs::write(&header, "#define LED_PIN 2\n").unwrap();
-        let second = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_ne!(first, second);
-        assert_eq!(after_first, 2, "first pass should hash both tracked files");
-        assert_eq!(
-            hash_count.get(),
-            after_first + 1,
-            "only the file whose stamp changed should be rehashed"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_rehashes_once_for_mtime_change_then_updates_cache() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        let contents = "int main() { return 1; }\n";
-        fs::write(&main, contents).unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let hash_count = Cell::new(0usize);
-
-        let first = hash_watch_with_counter(&watch, &hash_count);
-        let after_first = hash_count.get();
-        std::thread::sleep(std::time::Duration::from_millis(20));
-        fs::write(&main, contents).unwrap();
-        let second = hash_watch_with_counter(&watch, &hash_count);
-        let after_second = hash_count.get();
-        let third = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_eq!(first, second);
-        assert_eq!(second, third);
-        assert_eq!(after_first, 1, "initial pass should hash contents once");
-        assert_eq!(
-            after_second,
-            after_first + 1,
-            "mtime-only change should trigger exactly one rehash"
-        );
-        assert_eq!(
-            hash_count.get(),
-            after_second,
-            "subsequent unchanged run should reuse the updated stamp cache"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_adds_new_file_without_rehashing_unchanged_files() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 0; }\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let hash_count = Cell::new(0usize);
-
-        let first = hash_watch_with_counter(&watch, &hash_count);
-        let after_first = hash_count.get();
-        std::thread::sleep(std::time::Duration::from_millis(20));
-        fs::write(src.join("config.h"), "#define VALUE 42\n").unwrap();
-        let second = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_ne!(first, second);
-        assert_eq!(after_first, 1, "initial pass should hash the existing file");
-        assert_eq!(
-            hash_count.get(),
-            after_first + 1,
-            "adding a file should hash only the new entry"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_removes_deleted_file_without_rehashing_unchanged_files() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        let header = src.join("pins.h");
-        fs::write(&main, "int main() { return LED_PIN; }\n").unwrap();
-        fs::write(&header, "#define LED_PIN 1\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let hash_count = Cell::new(0usize);
-
-        let first = hash_watch_with_counter(&watch, &hash_count);
-        let after_first = hash_count.get();
-        fs::remove_file(&header).unwrap();
-        let second = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_ne!(first, second);
-        assert_eq!(after_first, 2, "initial pass should hash both files");
-        assert_eq!(
-            hash_count.get(),
-            after_first,
-            "deleting a file should not force rehashing unchanged survivors"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_ignores_corrupt_stamp_cache_and_rebuilds() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 0; }\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-        fs::write(watch_stamp_cache_path(&watch), "{ not valid json").unwrap();
-
-        let hash_count = Cell::new(0usize);
-        let second = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_eq!(first, second);
-        assert_eq!(
-            hash_count.get(),
-            1,
-            "corrupt sidecar cache should be ignored and rebuilt from content"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_ignores_unknown_stamp_cache_version() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        fs::create_dir_all(&src).unwrap();
-        let main = src.join("main.cpp");
-        fs::write(&main, "int main() { return 0; }\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-        save_json(
-            &watch_stamp_cache_path(&watch),
-            &PersistedWatchStampCache {
-                version: WATCH_STAMP_CACHE_VERSION + 1,
-                files: Vec::new(),
-            },
-        )
-        .unwrap();
-
-        let hash_count = Cell::new(0usize);
-        let second = hash_watch_with_counter(&watch, &hash_count);
-
-        assert_eq!(first, second);
-        assert_eq!(
-            hash_count.get(),
-            1,
-            "unknown sidecar cache version should be treated as cold and rebuilt"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_excludes_filtered_directories_adversarially() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let src = tmp.path().join("src");
-        let build_dir = src.join("build");
-        fs::create_dir_all(&build_dir).unwrap();
-        fs::write(src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
-        fs::write(build_dir.join("generated.h"), "#define GENERATED 1\n").unwrap();
-
-        let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
-        let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-        std::thread::sleep(std::time::Duration::from_millis(20));
-        fs::write(build_dir.join("generated.h"), "#define GENERATED 2\n").unwrap();
-        let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
-
-        assert_eq!(
-            first, second,
-            "changes under excluded directories must not poison the watch fingerprint"
-        );
-    }
-
-    #[test]
-    fn test_hash_watch_set_ignores_workspace_root() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let a_src = tmp.path().join("workspace-a").join("project");
-        let b_src = tmp.path().join("workspace-b").join("project");
-        fs::create_dir_all(&a_src).unwrap();
-        fs::create_dir_all(&b_src).unwrap();
-        fs::write(a_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
-        fs::write(b_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
-
-        let a_watch = make_watch(
-            &a_src,
-            &tmp.path()
-                .join("workspace-a")
-                .join(".project.zccache_fp.json"),
-        );
-        let b_watch = make_watch(
-            &b_src,
-            &tmp.path()
-                .join("workspace-b")
-                .join(".project.zccache_fp.json"),
-        );
-
-        let a_hash = hash_watch_set(std::slice::from_ref(&a_watch)).unwrap();
-        let b_hash = hash_watch_set(std::slice::from_ref(&b_watch)).unwrap();
-
-        assert_eq!(a_hash, b_hash);
-    }
-
-    #[test]
-    fn test_hash_watch_set_stamps_ignores_workspace_root() {
-        let tmp = tempfile::TempDir::new().unwrap();
-        let a_src = tmp.path().join("workspace-a").join("project");
-        let b_src = tmp.path().join("workspace-b").join("project");
-        fs::create_dir_all(&a_src).unwrap();
-        fs::create_dir_all(&b_src).unwrap();
-        fs::write(a_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
-        fs::write(b_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
-
-        let a_watch = make_watch(
-            &a_src,
-            &tmp.path()
-                .join("workspace-a")
-                .join(".project.zccache_fp.json"),
-        );
-        let b_watch = make_watch(
-            &b_src,
-            &tmp.path()
-                .join("workspace-b")
-                .join(".project.zccache_fp.json"),
-        );
-
-        let a_hash = hash_watch_set_stamps(std::slice::from_ref(&a_watch)).unwrap();
-        let b_hash = hash_watch_set_stamps(std::slice::from_ref(&b_watch)).unwrap();
-
-        assert_eq!(a_hash, b_hash);
-    }
-}
+mod tests;
@@ -0,0 +1,506 @@
+//! Unit tests for the parent `build_fingerprint` module. Extracted to keep
+//! the parent file under the 1000-LOC gate (see ci.yml LOC Gate workflow).
+
+use super::*;
+use std::cell::Cell;
+use std::fs;
+use std::sync::atomic::{AtomicUsize, Ordering};
+
+fn make_watch(root: &Path, cache_file: &Path) -> FingerprintWatch {
+    FingerprintWatch {
+        cache_file: cache_file.to_path_buf(),
+        root: root.to_path_buf(),
+        extensions: vec!["cpp".to_string(), "h".to_string()],
+        excludes: vec!["build".to_string()],
+    }
+}
+
+fn hash_watch_with_counter(watch: &FingerprintWatch, hash_count: &Cell<usize>) -> String {
+    // Files hash in parallel, so count atomically and fold in after.
+    let calls = AtomicUsize::new(0);
+    let hash = hash_watch_set_stamps_inner(std::slice::from_ref(watch), |path| {
+        calls.fetch_add(1, Ordering::Relaxed);
+        content_hash_hex(path)
+    })
+    .unwrap();
+    hash_count.set(hash_count.get() + calls.into_inner());
+    hash
+}
+
+fn set_file_mtime(path: &Path, secs: i64) {
+    filetime::set_file_mtime(path, filetime::FileTime::from_unix_time(secs, 0)).unwrap();
+}
+
+#[test]
+fn test_hash_files_changes_when_contents_change() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let path = tmp.path().join("a.txt");
+    fs::write(&path, "one").unwrap();
+    let first = hash_files(std::slice::from_ref(&path)).unwrap();
+    fs::write(&path, "two").unwrap();
+    let second = hash_files(std::slice::from_ref(&path)).unwrap();
+    assert_ne!(first, second);
+}
+
+#[test]
+fn test_hash_files_ignores_workspace_root() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let a_root = tmp.path().join("workspace-a").join("project");
+    let b_root = tmp.path().join("workspace-b").join("project");
+    fs::create_dir_all(a_root.join("include")).unwrap();
+    fs::create_dir_all(b_root.join("include")).unwrap();
+    fs::write(a_root.join("main.cpp"), "int main() { return 0; }\n").unwrap();
+    fs::write(b_root.join("main.cpp"), "int main() { return 0; }\n").unwrap();
+    fs::write(a_root.join("include").join("app.h"), "#pragma once\n").unwrap();
+    fs::write(b_root.join("include").join("app.h"), "#pragma once\n").unwrap();
+
+    let a_paths = vec![
+        a_root.join("main.cpp"),
+        a_root.join("include").join("app.h"),
+    ];
+    let b_paths = vec![
+        b_root.join("main.cpp"),
+        b_root.join("include").join("app.h"),
+    ];
+
+    let a_hash = hash_files(&a_paths).unwrap();
+    let b_hash = hash_files(&b_paths).unwrap();
+
+    assert_eq!(a_hash, b_hash);
+}
+
+#[test]
+fn test_hash_watch_set_changes_when_watched_source_changes() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 1; }\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join("watch.json"));
+
+    let first = hash_watch_set(std::slice::from_ref(&watch)).unwrap();
+    fs::write(&main, "int main() { return 2; }\n").unwrap();
+    let second = hash_watch_set(std::slice::from_ref(&watch)).unwrap();
+
+    assert_ne!(first, second);
+}
+
+#[test]
+fn test_file_digest_matches_whole_file_hash_above_mmap_threshold() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let path = tmp.path().join("libbig.a");
+    let bytes: Vec<u8> = (0..MMAP_HASH_MIN_BYTES as usize + 4099)
+        .map(|i| (i % 251) as u8)
+        .collect();
+    fs::write(&path, &bytes).unwrap();
+
+    let (len, digest) = file_digest(&path).unwrap();
+    assert_eq!(len, bytes.len() as u64);
+    assert_eq!(digest, blake3::hash(&bytes));
+}
+
+#[test]
+fn test_hash_watch_set_is_deterministic_across_parallel_runs() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    for dir in 0..8 {
+        let sub = src.join(format!("d{dir}"));
+        fs::create_dir_all(&sub).unwrap();
+        for file in 0..32 {
+            fs::write(sub.join(format!("f{file}.h")), format!("// {dir}/{file}\n")).unwrap();
+        }
+    }
+    let watch = make_watch(&src, &tmp.path().join("watch.json"));
+
+    let first = hash_watch_set(std::slice::from_ref(&watch)).unwrap();
+    for _ in 0..4 {
+        assert_eq!(hash_watch_set(std::slice::from_ref(&watch)).unwrap(), first);
+    }
+}
+
+#[test]
+fn test_save_json_does_not_rewrite_unchanged_file() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let path = tmp.path().join("fingerprint.json");
+    let value = PersistedBuildFingerprint {
+        version: BUILD_FINGERPRINT_VERSION,
+        metadata_hash: "abc".to_string(),
+        file_set_hash: Some("def".to_string()),
+        size_info: None,
+    };
+
+    save_json(&path, &value).unwrap();
+    let first_mtime = fs::metadata(&path).unwrap().modified().unwrap();
+    std::thread::sleep(std::time::Duration::from_millis(20));
+    save_json(&path, &value).unwrap();
+    let second_mtime = fs::metadata(&path).unwrap().modified().unwrap();
+
+    assert_eq!(first_mtime, second_mtime);
+}
+
+#[test]
+fn test_hash_watch_set_stamps_changes_when_contents_change() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 1; }\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join("watch.json"));
+
+    let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+    std::thread::sleep(std::time::Duration::from_millis(20));
+    fs::write(&main, "int main() { return 1; }\n// touch\n").unwrap();
+    let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+
+    assert_ne!(first, second);
+}
+
+#[test]
+fn test_hash_watch_set_stamps_ignores_mtime_only_change() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    let contents = "int main() { return 1; }\n";
+    fs::write(&main, contents).unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+
+    let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+    std::thread::sleep(std::time::Duration::from_millis(20));
+    fs::write(&main, contents).unwrap();
+    let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+
+    assert_eq!(first, second);
+}
+
+#[test]
+fn test_hash_watch_set_stamps_survives_mtime_reset_without_rewrite() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 1; }\n").unwrap();
+    set_file_mtime(&main, 1_700_000_000);
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let hash_count = Cell::new(0usize);
+
+    let first = hash_watch_with_counter(&watch, &hash_count);
+    set_file_mtime(&main, 1_700_000_123);
+    let second = hash_watch_with_counter(&watch, &hash_count);
+    let after_second = hash_count.get();
+    let third = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_eq!(first, second);
+    assert_eq!(second, third);
+    assert_eq!(
+        after_second, 2,
+        "mtime reset should rehash once to prove byte identity"
+    );
+    assert_eq!(
+        hash_count.get(),
+        after_second,
+        "updated stamp cache should restore the stat-only fast path"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_detects_same_length_content_change_after_mtime_reset() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 1; }\n").unwrap();
+    set_file_mtime(&main, 1_700_000_000);
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+
+    let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+    fs::write(&main, "int main() { return 2; }\n").unwrap();
+    set_file_mtime(&main, 1_700_000_123);
+    let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+
+    assert_eq!(
+        fs::metadata(&main).unwrap().len(),
+        "int main() { return 1; }\n".len() as u64
+    );
+    assert_ne!(first, second);
+}
+
+#[test]
+fn test_hash_watch_set_stamps_skips_rehash_when_stamp_unchanged() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 1; }\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+
+    let hash_count = Cell::new(0usize);
+    let first = hash_watch_with_counter(&watch, &hash_count);
+    let after_first = hash_count.get();
+    let second = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_eq!(first, second);
+    assert_eq!(
+        after_first, 1,
+        "initial pass should hash file contents once"
+    );
+    assert_eq!(
+        hash_count.get(),
+        after_first,
+        "unchanged mtime/size should reuse cached content hash"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_rehashes_only_changed_file() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    let header = src.join("pins.h");
+    fs::write(&main, "int main() { return LED_PIN; }\n").unwrap();
+    fs::write(&header, "#define LED_PIN 1\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let hash_count = Cell::new(0usize);
+
+    let first = hash_watch_with_counter(&watch, &hash_count);
+    let after_first = hash_count.get();
+    std::thread::sleep(std::time::Duration::from_millis(20));
+    fs::write(&header, "#define LED_PIN 2\n").unwrap();
+    let second = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_ne!(first, second);
+    assert_eq!(after_first, 2, "first pass should hash both tracked files");
+    assert_eq!(
+        hash_count.get(),
+        after_first + 1,
+        "only the file whose stamp changed should be rehashed"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_rehashes_once_for_mtime_change_then_updates_cache() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    let contents = "int main() { return 1; }\n";
+    fs::write(&main, contents).unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let hash_count = Cell::new(0usize);
+
+    let first = hash_watch_with_counter(&watch, &hash_count);
+    let after_first = hash_count.get();
+    std::thread::sleep(std::time::Duration::from_millis(20));
+    fs::write(&main, contents).unwrap();
+    let second = hash_watch_with_counter(&watch, &hash_count);
+    let after_second = hash_count.get();
+    let third = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_eq!(first, second);
+    assert_eq!(second, third);
+    assert_eq!(after_first, 1, "initial pass should hash contents once");
+    assert_eq!(
+        after_second,
+        after_first + 1,
+        "mtime-only change should trigger exactly one rehash"
+    );
+    assert_eq!(
+        hash_count.get(),
+        after_second,
+        "subsequent unchanged run should reuse the updated stamp cache"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_adds_new_file_without_rehashing_unchanged_files() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 0; }\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let hash_count = Cell::new(0usize);
+
+    let first = hash_watch_with_counter(&watch, &hash_count);
+    let after_first = hash_count.get();
+    std::thread::sleep(std::time::Duration::from_millis(20));
+    fs::write(src.join("config.h"), "#define VALUE 42\n").unwrap();
+    let second = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_ne!(first, second);
+    assert_eq!(after_first, 1, "initial pass should hash the existing file");
+    assert_eq!(
+        hash_count.get(),
+        after_first + 1,
+        "adding a file should hash only the new entry"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_removes_deleted_file_without_rehashing_unchanged_files() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    let header = src.join("pins.h");
+    fs::write(&main, "int main() { return LED_PIN; }\n").unwrap();
+    fs::write(&header, "#define LED_PIN 1\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let hash_count = Cell::new(0usize);
+
+    let first = hash_watch_with_counter(&watch, &hash_count);
+    let after_first = hash_count.get();
+    fs::remove_file(&header).unwrap();
+    let second = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_ne!(first, second);
+    assert_eq!(after_first, 2, "initial pass should hash both files");
+    assert_eq!(
+        hash_count.get(),
+        after_first,
+        "deleting a file should not force rehashing unchanged survivors"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_ignores_corrupt_stamp_cache_and_rebuilds() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 0; }\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+    fs::write(watch_stamp_cache_path(&watch), "{ not valid json").unwrap();
+
+    let hash_count = Cell::new(0usize);
+    let second = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_eq!(first, second);
+    assert_eq!(
+        hash_count.get(),
+        1,
+        "corrupt sidecar cache should be ignored and rebuilt from content"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_ignores_unknown_stamp_cache_version() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    fs::create_dir_all(&src).unwrap();
+    let main = src.join("main.cpp");
+    fs::write(&main, "int main() { return 0; }\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+    save_json(
+        &watch_stamp_cache_path(&watch),
+        &PersistedWatchStampCache {
+            version: WATCH_STAMP_CACHE_VERSION + 1,
+            files: Vec::new(),
+        },
+    )
+    .unwrap();
+
+    let hash_count = Cell::new(0usize);
+    let second = hash_watch_with_counter(&watch, &hash_count);
+
+    assert_eq!(first, second);
+    assert_eq!(
+        hash_count.get(),
+        1,
+        "unknown sidecar cache version should be treated as cold and rebuilt"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_stamps_excludes_filtered_directories_adversarially() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let src = tmp.path().join("src");
+    let build_dir = src.join("build");
+    fs::create_dir_all(&build_dir).unwrap();
+    fs::write(src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
+    fs::write(build_dir.join("generated.h"), "#define GENERATED 1\n").unwrap();
+
+    let watch = make_watch(&src, &tmp.path().join(".project.zccache_fp.json"));
+    let first = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+    std::thread::sleep(std::time::Duration::from_millis(20));
+    fs::write(build_dir.join("generated.h"), "#define GENERATED 2\n").unwrap();
+    let second = hash_watch_set_stamps(std::slice::from_ref(&watch)).unwrap();
+
+    assert_eq!(
+        first, second,
+        "changes under excluded directories must not poison the watch fingerprint"
+    );
+}
+
+#[test]
+fn test_hash_watch_set_ignores_workspace_root() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let a_src = tmp.path().join("workspace-a").join("project");
+    let b_src = tmp.path().join("workspace-b").join("project");
+    fs::create_dir_all(&a_src).unwrap();
+    fs::create_dir_all(&b_src).unwrap();
+    fs::write(a_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
+    fs::write(b_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
+
+    let a_watch = make_watch(
+        &a_src,
+        &tmp.path()
+            .join("workspace-a")
+            .join(".project.zccache_fp.json"),
+    );
+    let b_watch = make_watch(
+        &b_src,
+        &tmp.path()
+            .join("workspace-b")
+            .join(".project.zccache_fp.json"),
+    );
+
+    let a_hash = hash_watch_set(std::slice::from_ref(&a_watch)).unwrap();
+    let b_hash = hash_watch_set(std::slice::from_ref(&b_watch)).unwrap();
+
+    assert_eq!(a_hash, b_hash);
+}
+
+#[test]
+fn test_hash_watch_set_stamps_ignores_workspace_root() {
+    let tmp = tempfile::TempDir::new().unwrap();
+    let a_src = tmp.path().join("workspace-a").join("project");
+    let b_src = tmp.path().join("workspace-b").join("project");
+    fs::create_dir_all(&a_src).unwrap();
+    fs::create_dir_all(&b_src).unwrap();
+    fs::write(a_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
+    fs::write(b_src.join("main.cpp"), "int main() { return 0; }\n").unwrap();
+
+    let a_watch = make_watch(
+        &a_src,
+        &tmp.path()
+            .join("workspace-a")
+            .join(".project.zccache_fp.json"),
+    );
+    let b_watch = make_watch(
+        &b_src,
+        &tmp.path()
+            .join("workspace-b")
+            .join(".project.zccache_fp.json"),
+    );
+
+    let a_hash = hash_watch_set_stamps(std::slice::from_ref(&a_watch)).unwrap();
+    let b_hash = hash_watch_set_stamps(std::slice::from_ref(&b_watch)).unwrap();
+
+    assert_eq!(a_hash, b_hash);
+}
@@ -12,9 +12,14 @@
 //! installed backend lives in a process-wide `OnceLock` set by the
 //! daemon's `#[tokio::main]` before any compile fires. Reads
 //! ([`get_global`]) are lock-free.
+//!
+//! The backend also owns the opt-in [`CompileBatcher`]
+//! (`FBUILD_COMPILE_BATCH`), which coalesces small same-flag TUs into one
+//! compiler invocation ahead of the per-TU zccache dispatch.
 
 use std::sync::{Arc, OnceLock};
 
+use crate::compile_batch::CompileBatcher;
 use crate::zccache_embedded::FbuildZccacheService;
 
 /// The active embedded zccache backend.
@@ -27,6 +32,7 @@ use crate::zccache_embedded::FbuildZccacheService;
 pub struct CompileBackend {
     service: Arc<FbuildZccacheService>,
     runtime: tokio::runtime::Handle,
+    batcher: Arc<CompileBatcher>,
 }
 
 impl std::fmt::Debug for CompileBackend {
@@ -45,15 +51,31 @@ impl CompileBackend {
     /// captured here is the one synchronous per-compile dispatches
     /// will later `block_on(...)` against.
     pub async fn start() -> Result<Self, crate::zccache_embedded::EmbeddedServiceError> {
-        let service = Arc::new(FbuildZccacheService::start().await?);
+        Ok(Self::from_service(FbuildZccacheService::start().await?))
+    }
+
+    /// Like [`Self::start`], but with an explicit zccache cache root.
+    ///
+    /// Benchmarks use this to measure against a guaranteed-cold cache.
+    pub async fn start_in(
+        cache_root: &std::path::Path,
+    ) -> Result<Self, crate::zccache_embedded::EmbeddedServiceError> {
+        Ok(Self::from_service(
+            FbuildZccacheService::start_in(cache_root.to_path_buf()).await?,
+        ))
+    }
+
+    fn from_service(service: FbuildZccacheService) -> Self {
+        let service = Arc::new(service);
         tracing::info!(
             "zccache backend ready (embedded, cache_root={})",
             service.cache_root().display()
         );
-        Ok(Self {
+        Self {
             service,
             runtime: tokio::runtime::Handle::current(),
-        })
+            batcher: Arc::new(CompileBatcher::from_env()),
+        }
     }
 
     /// Handle to the embedded service. Cheap to clone (Arc).
@@ -65,6 +87,12 @@ impl CompileBackend {
     pub fn runtime(&self) -> &tokio::runtime::Handle {
         &self.runtime
     }
+
+    /// Small-TU batcher consulted by `compile_source` before the per-TU
+    /// zccache dispatch. Disabled unless `FBUILD_COMPILE_BATCH` is set.
+    pub fn batcher(&self) -> &Arc<CompileBatcher> {
+        &self.batcher
+    }
 }
 
 static GLOBAL: OnceLock<CompileBackend> = OnceLock::new();
@@ -0,0 +1,636 @@
+//! Opt-in batched compiler invocations for small translation units.
+//!
+//! Every TU normally reaches [`crate::compiler::compile_source`] as its own
+//! `gcc`/`g++` process through the embedded zccache service. On small
+//! sketches (the `tests/platform/uno` blink, most of the AVR core) the
+//! driver's own startup — process spawn, spec parsing, sysroot probing —
+//! costs as much as the compile itself. gcc has no resident server mode, so
+//! the closest thing to a warm worker is amortizing the driver: TUs that
+//! share a compiler AND an identical flag list are coalesced into ONE
+//! `g++ @batch.rsp -c a.cpp b.cpp …` invocation, and the driver fans the
+//! sources out to `cc1plus` internally.
+//!
+//! ## Enabling
+//!
+//! `FBUILD_COMPILE_BATCH=<n>` on the daemon process, where `n` is the maximum
+//! number of TUs per invocation (unset, `0` or `1` disables). Off by default:
+//! batched invocations bypass the zccache object cache, so they pay off on
+//! cold one-shot builds (fresh CI runners) and lose on warm caches.
+//!
+//! ## Safety valves
+//!
+//! Anything the batch cannot reproduce exactly falls back to the regular
+//! per-TU zccache path ([`BatchReply::Fallback`]):
+//! - sources that are not `.c`/`.cpp`/`.cc`/`.cxx`, or larger than
+//!   [`MAX_SOURCE_BYTES`] (big TUs are compile-bound; batching buys nothing);
+//! - flag lists that pin a single output (`-o`, `-MF`, `-E`, …) or carry
+//!   relative paths (the batch runs in a private scratch cwd);
+//! - two TUs in one batch whose object stems collide;
+//! - a batch of one;
+//! - any non-zero exit — every member is retried individually so the
+//!   diagnostics stay attributed to the TU that produced them.
+
+use std::collections::{HashMap, HashSet};
+use std::path::Path;
+use std::sync::atomic::{AtomicU64, AtomicUsize, Ordering};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+
+use fbuild_core::path::NormalizedPath;
+use sha2::{Digest, Sha256};
+use tokio::sync::oneshot;
+
+use crate::compile_backend::CompileBackend;
+use crate::compiler::CompileResult;
+
+/// Env var enabling batching; the value is the per-invocation TU cap.
+pub const COMPILE_BATCH_ENV: &str = "FBUILD_COMPILE_BATCH";
+
+/// Sources larger than this are compile-bound and always run per-TU.
+pub const MAX_SOURCE_BYTES: u64 = 64 * 1024;
+
+/// How long the first submitter of a batch waits for siblings to join.
+/// Sized against `compile_sources_parallel`'s spawn loop, which submits a
+/// whole sketch's TUs within a millisecond or two.
+const COALESCE_WINDOW: Duration = Duration::from_millis(5);
+
+/// Upper bound for a whole batched invocation (mirrors the 300 s per-TU
+/// bound in `compile_source`; a batch is capped at a handful of small TUs).
+const BATCH_TIMEOUT: Duration = Duration::from_secs(300);
+
+const BATCHABLE_EXTENSIONS: &[&str] = &["c", "cpp", "cc", "cxx"];
+
+/// Flags that pin a single output (or a non-object output) per invocation.
+const SINGLE_TU_FLAGS: &[&str] = &["-o", "-MF", "-MT", "-MQ", "-E", "-S"];
+const SINGLE_TU_PREFIXES: &[&str] = &["-MF", "-MT", "-MQ", "-save-temps"];
+
+/// Path-valued flags: the value (split or joined) must be absolute because
+/// the batch runs with its scratch dir as cwd.
+const PATH_FLAGS: &[&str] = &[
+    "-isystem",
+    "-iquote",
+    "-idirafter",
+    "-include",
+    "-imacros",
+    "-I",
+];
+
+/// Whether `flags` can be shared verbatim by several TUs compiled from a
+/// scratch cwd.
+pub fn flags_are_batchable(flags: &[String]) -> bool {
+    let mut expects_path = false;
+    for flag in flags {
+        if expects_path {
+            expects_path = false;
+            if !Path::new(flag).is_absolute() {
+                return false;
+            }
+            continue;
+        }
+        if SINGLE_TU_FLAGS.contains(&flag.as_str())
+            || SINGLE_TU_PREFIXES.iter().any(|p| flag.starts_with(p))
+        {
+            return false;
+        }
+        if let Some(file) = flag.strip_prefix('@') {
+            if !Path::new(file).is_absolute() {
+                return false;
+            }
+            continue;
+        }
+        if PATH_FLAGS.contains(&flag.as_str()) {
+            expects_path = true;
+            continue;
+        }
+        if let Some(value) = PATH_FLAGS.iter().find_map(|p| flag.strip_prefix(p)) {
+            if !value.is_empty() && !Path::new(value).is_absolute() {
+                return false;
+            }
+        }
+    }
+    !expects_path
+}
+
+/// Whether `source` is small and of a kind the batch driver handles.
+pub fn source_is_batchable(source: &Path) -> bool {
+    let ext_ok = source
+        .extension()
+        .and_then(|e| e.to_str())
+        .is_some_and(|e| BATCHABLE_EXTENSIONS.contains(&e.to_ascii_lowercase().as_str()));
+    ext_ok
+        && std::fs::metadata(source)
+            .map(|m| m.len() <= MAX_SOURCE_BYTES)
+            .unwrap_or(false)
+}
+
+/// Identity of a batch: one compiler binary plus one exact flag list.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub struct BatchKey {
+    id: String,
+    compiler: NormalizedPath,
+    flags: Vec<String>,
+}
+
+impl BatchKey {
+    /// Build the key for one TU, or `None` when the TU must run per-TU.
+    ///
+    /// `flags` is the sanitized (`prepare_flags_for_exec`) flag list
+    /// WITHOUT the `-c <src> -o <obj>` tail.
+    pub fn for_invocation(compiler: &Path, flags: &[String], source: &Path) -> Option<Self> {
+        if !source_is_batchable(source) || !flags_are_batchable(flags) {
+            return None;
+        }
+        let mut hasher = Sha256::new();
+        hasher.update(compiler.to_string_lossy().as_bytes());
+        for flag in flags {
+            hasher.update([0]);
+            hasher.update(flag.as_bytes());
+        }
+        Some(Self {
+            id: short_hex(&hasher.finalize()[..8]),
+            compiler: NormalizedPath::new(compiler),
+            flags: flags.to_vec(),
+        })
+    }
+
+    /// Stable short id (hex) used for grouping and scratch-dir naming.
+    pub fn id(&self) -> &str {
+        &self.id
+    }
+}
+
+/// Outcome of [`CompileBatcher::submit`].
+#[derive(Debug)]
+pub enum BatchReply {
+    /// The TU was compiled inside a batch; object, depfile and command hash
+    /// are in place.
+    Compiled(CompileResult),
+    /// The caller must compile this TU through the regular per-TU path.
+    Fallback,
+}
+
+/// Snapshot of [`CompileBatcher`] counters.
+#[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
+pub struct BatchStats {
+    /// Batched compiler invocations that succeeded.
+    pub batches: u64,
+    /// TUs compiled inside those invocations.
+    pub batched_tus: u64,
+    /// TUs handed back to the per-TU path after being submitted.
+    pub fallbacks: u64,
+}
+
+struct BatchJob {
+    source: NormalizedPath,
+    output: NormalizedPath,
+    signature: String,
+    reply: oneshot::Sender<BatchReply>,
+}
+
+struct PendingBatch {
+    key: BatchKey,
+    scratch_parent: NormalizedPath,
+    jobs: Vec<BatchJob>,
+}
+
+/// Coalesces concurrent same-key compiles into shared driver invocations.
+pub struct CompileBatcher {
+    max_batch: AtomicUsize,
+    pending: Mutex<HashMap<String, PendingBatch>>,
+    batches: AtomicU64,
+    batched_tus: AtomicU64,
+    fallbacks: AtomicU64,
+}
+
+impl Default for CompileBatcher {
+    fn default() -> Self {
+        Self::new(0)
+    }
+}
+
+impl CompileBatcher {
+    /// Batcher capped at `max_batch` TUs per invocation (`< 2` disables).
+    pub fn new(max_batch: usize) -> Self {
+        Self {
+            max_batch: AtomicUsize::new(max_batch),
+            pending: Mutex::new(HashMap::new()),
+            batches: AtomicU64::new(0),
+            batched_tus: AtomicU64::new(0),
+            fallbacks: AtomicU64::new(0),
+        }
+    }
+
+    /// Batcher configured from [`COMPILE_BATCH_ENV`].
+    pub fn from_env() -> Self {
+        let max_batch = std::env::var(COMPILE_BATCH_ENV)
+            .ok()
+            .and_then(|v| v.trim().parse::<usize>().ok())
+            .unwrap_or(0);
+        if max_batch >= 2 {
+            tracing::info!("compile batching enabled: up to {max_batch} TUs per invocation");
+        }
+        Self::new(max_batch)
+    }
+
+    /// Whether batching is currently on.
+    pub fn is_enabled(&self) -> bool {
+        self.max_batch.load(Ordering::Relaxed) >= 2
+    }
+
+    /// Change the per-invocation cap at runtime (`< 2` disables). Used by
+    /// the batching benchmark to compare both modes in one daemon.
+    pub fn set_max_batch(&self, max_batch: usize) {
+        self.max_batch.store(max_batch, Ordering::Relaxed);
+    }
+
+    /// Counter snapshot.
+    pub fn stats(&self) -> BatchStats {
+        BatchStats {
+            batches: self.batches.load(Ordering::Relaxed),
+            batched_tus: self.batched_tus.load(Ordering::Relaxed),
+            fallbacks: self.fallbacks.load(Ordering::Relaxed),
+        }
+    }
+
+    /// Queue one TU and wait for its batch to run.
+    ///
+    /// `scratch_parent` hosts the per-batch scratch dir and response file
+    /// (the caller's `response_file_dir`); `signature` is the rebuild
+    /// signature written to the `.cmdhash` sidecar on success. The flush
+    /// runs on a spawned task so a cancelled caller can't strand siblings
+    /// that joined its batch.
+    pub async fn submit(
+        self: &Arc<Self>,
+        key: BatchKey,
+        source: &Path,
+        output: &Path,
+        scratch_parent: &Path,
+        signature: String,
+    ) -> BatchReply {
+        let max_batch = self.max_batch.load(Ordering::Relaxed);
+        if max_batch < 2 {
+            return BatchReply::Fallback;
+        }
+        let (tx, rx) = oneshot::channel();
+        let job = BatchJob {
+            source: NormalizedPath::new(source),
+            output: NormalizedPath::new(output),
+            signature,
+            reply: tx,
+        };
+        let id = key.id.clone();
+        let (leader, full) = {
+            let mut pending = self.pending.lock().unwrap_or_else(|e| e.into_inner());
+            let entry = pending.entry(id.clone()).or_insert_with(|| PendingBatch {
+                key,
+                scratch_parent: NormalizedPath::new(scratch_parent),
+                jobs: Vec::new(),
+            });
+            entry.jobs.push(job);
+            let leader = entry.jobs.len() == 1;
+            let full = if entry.jobs.len() >= max_batch {
+                pending.remove(&id)
+            } else {
+                None
+            };
+            (leader, full)
+        };
+        if let Some(batch) = full {
+            tokio::spawn(Arc::clone(self).run(batch));
+        } else if leader {
+            let this = Arc::clone(self);
+            tokio::spawn(async move {
+                tokio::time::sleep(COALESCE_WINDOW).await;
+                let batch = this
+                    .pending
+                    .lock()
+                    .unwrap_or_else(|e| e.into_inner())
+                    .remove(&id);
+                if let Some(batch) = batch {
+                    this.run(batch).await;
+                }
+            });
+        }
+        rx.await.unwrap_or(BatchReply::Fallback)
+    }
+
+    async fn run(self: Arc<Self>, batch: PendingBatch) {
+        let PendingBatch {
+            key,
+            scratch_parent,
+            jobs,
+        } = batch;
+        let (jobs, solo) = split_colliding_stems(jobs);
+        self.fall_back(solo);
+        if jobs.len() < 2 {
+            self.fall_back(jobs);
+            return;
+        }
+
+        let started = Instant::now();
+        match run_invocation(&key, scratch_parent.as_path(), &jobs).await {
+            Ok(stderr) => {
+                self.batches.fetch_add(1, Ordering::Relaxed);
+                self.batched_tus
+                    .fetch_add(jobs.len() as u64, Ordering::Relaxed);
+                tracing::debug!(
+                    "compile batch {}: {} TUs in one invocation ({} ms)",
+                    key.id,
+                    jobs.len(),
+                    started.elapsed().as_millis()
+                );
+                // Warnings are attributed to the first TU only so they are
+                // surfaced once instead of once per batch member.
+                let mut stderr = Some(stderr);
+                for job in jobs {
+                    let result = CompileResult {
+                        success: true,
+                        object_file: job.output.as_path().to_path_buf(),
+                        stdout: String::new(),
+                        stderr: stderr.take().unwrap_or_default(),
+                        exit_code: 0,
+                    };
+                    let _ = job.reply.send(BatchReply::Compiled(result));
+                }
+            }
+            Err(reason) => {
+                tracing::debug!(
+                    "compile batch {} fell back to per-TU compiles: {reason}",
+                    key.id
+                );
+                self.fall_back(jobs);
+            }
+        }
+    }
+
+    fn fall_back(&self, jobs: Vec<BatchJob>) {
+        self.fallbacks
+            .fetch_add(jobs.len() as u64, Ordering::Relaxed);
+        for job in jobs {
+            let _ = job.reply.send(BatchReply::Fallback);
+        }
+    }
+}
+
+/// One TU as `compile_source` sees it: compiler, source, output and the
+/// caller's fallback temp dir.
+pub type BatchTu<'a> = (&'a Path, &'a Path, &'a Path, &'a Path);
+
+/// Route one TU through the backend's batcher when batching is enabled.
+///
+/// `flag_sets` are the un-normalized `flags`, `extra_pre_flags` and
+/// `extra_flags` of `compile_source` (the batch runs from a scratch cwd, so
+/// the compile-cwd-relative spelling does not apply). `None` means the caller
+/// must compile the TU through the regular per-TU path.
+pub async fn try_batched(
+    backend: &CompileBackend,
+    tu: BatchTu<'_>,
+    flag_sets: &[&[String]],
+    signature: &str,
+) -> Option<CompileResult> {
+    let batcher = backend.batcher();
+    if !batcher.is_enabled() {
+        return None;
+    }
+    let (compiler, source, output, temp_dir) = tu;
+    let flags = crate::compiler::prepare_flags_for_exec(flag_sets.concat());
+    let key = BatchKey::for_invocation(compiler, &flags, source)?;
+    let scratch_parent = crate::compiler::response_file_dir(output, temp_dir);
+    let reply = batcher
+        .submit(key, source, output, &scratch_parent, signature.to_string())
+        .await;
+    match reply {
+        BatchReply::Compiled(result) => Some(result),
+        BatchReply::Fallback => None,
+    }
+}
+
+fn short_hex(bytes: &[u8]) -> String {
+    bytes.iter().map(|b| format!("{b:02x}")).collect()
+}
+
+/// Object file the driver writes for `source` when no `-o` is given.
+fn object_name(source: &Path) -> String {
+    let stem = source
+        .file_stem()
+        .map(|s| s.to_string_lossy().into_owned())
+        .unwrap_or_default();
+    format!("{stem}.o")
+}
+
+/// Split off every job whose driver-chosen object name collides with an
+/// earlier job's (case-insensitively, for Windows hosts).
+fn split_colliding_stems(jobs: Vec<BatchJob>) -> (Vec<BatchJob>, Vec<BatchJob>) {
+    let mut seen = HashSet::new();
+    jobs.into_iter()
+        .partition(|job| seen.insert(object_name(job.source.as_path()).to_ascii_lowercase()))
+}
+
+async fn run_invocation(
+    key: &BatchKey,
+    scratch_parent: &Path,
+    jobs: &[BatchJob],
+) -> std::result::Result<String, String> {
+    let mut hasher = Sha256::new();
+    for job in jobs {
+        hasher.update(job.output.as_path().to_string_lossy().as_bytes());
+    }
+    let scratch = scratch_parent.join(format!(
+        "batch-{}-{}",
+        key.id,
+        short_hex(&hasher.finalize()[..4])
+    ));
+    let _ = std::fs::remove_dir_all(&scratch);
+    std::fs::create_dir_all(&scratch).map_err(|e| format!("scratch dir: {e}"))?;
+    let result = run_in_scratch(key, &scratch, jobs).await;
+    let _ = std::fs::remove_dir_all(&scratch);
+    result
+}
+
+async fn run_in_scratch(
+    key: &BatchKey,
+    scratch: &Path,
+    jobs: &[BatchJob],
+) -> std::result::Result<String, String> {
+    let mut args = key.flags.clone();
+    args.push("-c".to_string());
+    args.extend(jobs.iter().map(|job| job.source.display_slash()));
+    let rsp = fbuild_core::response_file::write_response_file(&args, scratch, "batch")
+        .await
+        .map_err(|e| format!("response file: {e}"))?;
+
+    let program = key.compiler.display_slash();
+    let rsp_arg = format!("@{}", NormalizedPath::new(&rsp).display_slash());
+    let env = fbuild_core::subprocess::compile_env_for_build(scratch).unwrap_or_default();
+    let env_refs: Vec<(&str, &str)> = env.iter().map(|(k, v)| (k.as_str(), v.as_str())).collect();
+    let output = fbuild_core::subprocess::run_command(
+        &[program.as_str(), rsp_arg.as_str()],
+        Some(scratch),
+        Some(&env_refs),
+        Some(BATCH_TIMEOUT),
+    )
+    .await
+    .map_err(|e| format!("spawn: {e}"))?;
+    if output.exit_code != 0 {
+        return Err(format!("exit code {}", output.exit_code));
+    }
+
+    for job in jobs {
+        let output = job.output.as_path();
+        let produced = scratch.join(object_name(job.source.as_path()));
+        std::fs::rename(&produced, output)
+            .map_err(|e| format!("move {}: {e}", produced.display()))?;
+        let depfile = produced.with_extension("d");
+        if depfile.is_file() {
+            std::fs::rename(&depfile, output.with_extension("d"))
+                .map_err(|e| format!("move {}: {e}", depfile.display()))?;
+        }
+        std::fs::write(output.with_extension("cmdhash"), &job.signature)
+            .map_err(|e| format!("write command hash: {e}"))?;
+    }
+    Ok(output.stderr)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn s(v: &[&str]) -> Vec<String> {
+        v.iter().map(|f| f.to_string()).collect()
+    }
+
+    fn abs(p: &str) -> String {
+        if cfg!(windows) {
+            format!("C:{p}")
+        } else {
+            p.to_string()
+        }
+    }
+
+    #[test]
+    fn plain_define_and_absolute_include_flags_batch() {
+        let inc = abs("/sdk/include");
+        let flags = vec![
+            "-Os".to_string(),
+            "-DF_CPU=16000000L".to_string(),
+            format!("-I{inc}"),
+            "-isystem".to_string(),
+            inc.clone(),
+            "-MMD".to_string(),
+        ];
+        assert!(flags_are_batchable(&flags));
+    }
+
+    #[test]
+    fn relative_paths_and_single_output_flags_do_not_batch() {
+        assert!(!flags_are_batchable(&s(&["-Iinclude"])));
+        assert!(!flags_are_batchable(&s(&["-isystem", "rel/sys"])));
+        assert!(!flags_are_batchable(&s(&["-include", "cfg.h"])));
+        assert!(!flags_are_batchable(&s(&["@flags.rsp"])));
+        assert!(!flags_are_batchable(&s(&["-MF", "/x/a.d"])));
+        assert!(!flags_are_batchable(&s(&["-save-temps=obj"])));
+        assert!(!flags_are_batchable(&s(&["-E"])));
+        // Dangling path flag.
+        assert!(!flags_are_batchable(&s(&["-isystem"])));
+    }
+
+    #[test]
+    fn key_requires_small_c_family_source() {
+        let dir = tempfile::TempDir::new().unwrap();
+        let small = dir.path().join("a.cpp");
+        std::fs::write(&small, "int a;\n").unwrap();
+        let asm = dir.path().join("b.S");
+        std::fs::write(&asm, "nop\n").unwrap();
+        let big = dir.path().join("c.c");
+        std::fs::write(&big, vec![b' '; MAX_SOURCE_BYTES as usize + 1]).unwrap();
+
+        let gxx = Path::new("/tc/bin/g++");
+        let flags = s(&["-Os"]);
+        assert!(BatchKey::for_invocation(gxx, &flags, &small).is_some());
+        assert!(BatchKey::for_invocation(gxx, &flags, &asm).is_none());
+        assert!(BatchKey::for_invocation(gxx, &flags, &big).is_none());
+        assert!(BatchKey::for_invocation(gxx, &flags, &dir.path().join("gone.cpp")).is_none());
+    }
+
+    #[test]
+    fn key_groups_by_compiler_and_exact_flags() {
+        let dir = tempfile::TempDir::new().unwrap();
+        let a = dir.path().join("a.cpp");
+        let b = dir.path().join("b.cpp");
+        std::fs::write(&a, "int a;\n").unwrap();
+        std::fs::write(&b, "int b;\n").unwrap();
+        let gxx = Path::new("/tc/bin/g++");
+
+        let ka = BatchKey::for_invocation(gxx, &s(&["-Os"]), &a).unwrap();
+        let kb = BatchKey::for_invocation(gxx, &s(&["-Os"]), &b).unwrap();
+        let kc = BatchKey::for_invocation(gxx, &s(&["-O2"]), &b).unwrap();
+        let kd = BatchKey::for_invocation(Path::new("/tc/bin/gcc"), &s(&["-Os"]), &b).unwrap();
+        assert_eq!(ka.id(), kb.id());
+        assert_ne!(ka.id(), kc.id());
+        assert_ne!(ka.id(), kd.id());
+        // Flag boundaries are part of the key: ["-a", "b"] != ["-ab"].
+        let ke = BatchKey::for_invocation(gxx, &s(&["-D", "X"]), &a).unwrap();
+        let kf = BatchKey::for_invocation(gxx, &s(&["-DX"]), &a).unwrap();
+        assert_ne!(ke.id(), kf.id());
+    }
+
+    #[test]
+    fn colliding_object_stems_are_split_off() {
+        let job = |src: &str| {
+            let (tx, _rx) = oneshot::channel();
+            BatchJob {
+                source: NormalizedPath::new(src),
+                output: NormalizedPath::new(format!("{src}.o")),
+                signature: String::new(),
+                reply: tx,
+            }
+        };
+        let jobs = vec![job("/a/util.cpp"), job("/b/util.c"), job("/a/main.cpp")];
+        let (batched, solo) = split_colliding_stems(jobs);
+        assert_eq!(batched.len(), 2);
+        assert_eq!(solo.len(), 1);
+        assert_eq!(solo[0].source.as_path(), Path::new("/b/util.c"));
+    }
+
+    #[tokio::test]
+    async fn disabled_batcher_always_falls_back() {
+        let batcher = Arc::new(CompileBatcher::new(0));
+        assert!(!batcher.is_enabled());
+        let dir = tempfile::TempDir::new().unwrap();
+        let src = dir.path().join("a.cpp");
+        std::fs::write(&src, "int a;\n").unwrap();
+        let key = BatchKey::for_invocation(Path::new("/tc/g++"), &[], &src).unwrap();
+        let reply = batcher
+            .submit(
+                key,
+                &src,
+                &src.with_extension("o"),
+                dir.path(),
+                String::new(),
+            )
+            .await;
+        assert!(matches!(reply, BatchReply::Fallback));
+        assert_eq!(batcher.stats(), BatchStats::default());
+    }
+
+    #[tokio::test]
+    async fn lone_submission_falls_back_after_window() {
+        let batcher = Arc::new(CompileBatcher::new(8));
+        let dir = tempfile::TempDir::new().unwrap();
+        let src = dir.path().join("a.cpp");
+        std::fs::write(&src, "int a;\n").unwrap();
+        let key = BatchKey::for_invocation(Path::new("/tc/g++"), &[], &src).unwrap();
+        let reply = batcher
+            .submit(
+                key,
+                &src,
+                &src.with_extension("o"),
+                dir.path(),
+                String::new(),
+            )
+            .await;
+        assert!(matches!(reply, BatchReply::Fallback));
+        assert_eq!(batcher.stats().fallbacks, 1);
+        assert_eq!(batcher.stats().batches, 0);
+    }
+}
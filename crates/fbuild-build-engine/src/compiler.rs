@@ -736,14 +736,8 @@ pub async fn write_response_file(
     fbuild_core::response_file::write_response_file(flags, temp_dir, prefix).await
 }
 
-/// Response-file directory for a given output object. Used by the
-/// per-platform compilers when they construct response files for
-/// out-of-band invocation; the embedded `compile_source` path no
-/// longer routes through here. Retained because the compiler-tests
-/// module exercises it directly and `fbuild-packages` has its own
-/// copy for library compiles.
-#[allow(dead_code)]
-fn response_file_dir(output: &Path, fallback_temp_dir: &Path) -> PathBuf {
+/// Scratch directory for `output`'s response files ([`crate::compile_batch`]).
+pub(crate) fn response_file_dir(output: &Path, fallback_temp_dir: &Path) -> PathBuf {
     output
         .parent()
         .filter(|parent| !parent.as_os_str().is_empty())
@@ -813,7 +807,7 @@ pub async fn compile_source(
     output: &Path,
     flags: &[String],
     extra_flags: &[String],
-    _temp_dir: &Path,
+    temp_dir: &Path,
     _response_file_prefix: &str,
     verbose: bool,
     _compiler_cache: Option<&Path>,
@@ -890,6 +884,12 @@ pub async fn compile_source(
                 .to_string(),
         )
     })?;
+    let tu = (compiler, source, output, temp_dir);
+    let batch_flags = [flags, extra_pre_flags, extra_flags];
+    let batched = crate::compile_batch::try_batched(global, tu, &batch_flags, &rebuild_signature);
+    if let Some(result) = batched.await {
+        return Ok(result);
+    }
     let svc = global.service();
     let cwd = compile_cwd
         .clone()
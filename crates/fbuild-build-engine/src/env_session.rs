@@ -0,0 +1,232 @@
+//! In-process env context shared by the sketches of one `compile-many` batch.
+//!
+//! `compile-many` builds N sketches against the same board, and every
+//! sketch's orchestrator used to redo the env-level work on its own: ensure
+//! each package is installed, probe the toolchain version, list the
+//! framework's bundled libraries. An [`EnvSession`] threaded through
+//! [`BuildParams::env_session`](crate::BuildParams::env_session) memoizes that
+//! work for the batch. The first sketch to need a value computes it, sketches
+//! asking concurrently wait for that one computation, and later sketches reuse
+//! the result.
+//!
+//! Keys are the *inputs* of a step (a package's install path, a compiler
+//! path), never the sketch, so sketches staged in distinct project dirs share
+//! as long as they resolve to the same env. A session lives for one batch and
+//! is dropped with it; it is not a cross-build cache, so nothing in it is ever
+//! invalidated. Failed steps are not memoized — the next sketch retries.
+//!
+//! The session also collects the per-phase wall clock of every sketch's
+//! [`PerfTimer`](crate::perf_log::PerfTimer), which `compile-many` reports as
+//! its per-stage timings.
+
+use std::any::{Any, TypeId};
+use std::collections::{BTreeMap, HashMap};
+use std::future::Future;
+use std::sync::{Arc, Mutex, PoisonError};
+use std::time::{Duration, Instant};
+
+use fbuild_core::{FbuildError, Result};
+use tokio::sync::OnceCell;
+
+type Slot = Arc<OnceCell<Arc<dyn Any + Send + Sync>>>;
+
+/// Accumulated wall clock of one stage across a batch.
+#[derive(Debug, Clone, Copy, Default, PartialEq, serde::Serialize, serde::Deserialize)]
+pub struct StageTiming {
+    /// Seconds spent running the stage, summed over every run.
+    pub secs: f64,
+    /// Times the stage actually ran.
+    pub runs: usize,
+    /// Times a memoized env step was served from the session instead.
+    pub reused: usize,
+}
+
+/// Memo of env-level build steps plus per-stage timings. See the module docs.
+#[derive(Default)]
+pub struct EnvSession {
+    slots: Mutex<HashMap<(TypeId, &'static str, String), Slot>>,
+    stages: Mutex<BTreeMap<&'static str, StageTiming>>,
+}
+
+impl std::fmt::Debug for EnvSession {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        let slots = self.slots.lock().unwrap_or_else(PoisonError::into_inner);
+        f.debug_struct("EnvSession")
+            .field("memoized", &slots.len())
+            .finish_non_exhaustive()
+    }
+}
+
+impl EnvSession {
+    pub fn new() -> Self {
+        Self::default()
+    }
+
+    /// Return the value memoized for `(stage, key)`, running `init` if no
+    /// sketch has produced it yet. Concurrent callers with the same key wait
+    /// for a single `init`; an `Err` is returned to its caller and leaves
+    /// the slot empty.
+    pub async fn get_or_try_init<T, F, Fut>(
+        &self,
+        stage: &'static str,
+        key: impl Into<String>,
+        init: F,
+    ) -> Result<T>
+    where
+        T: Clone + Send + Sync + 'static,
+        F: FnOnce() -> Fut + Send,
+        Fut: Future<Output = Result<T>> + Send,
+    {
+        let slot = {
+            let mut slots = self.slots.lock().unwrap_or_else(PoisonError::into_inner);
+            slots
+                .entry((TypeId::of::<T>(), stage, key.into()))
+                .or_default()
+                .clone()
+        };
+        let mut ran = false;
+        let ran_flag = &mut ran;
+        let value = slot
+            .get_or_try_init(move || async move {
+                *ran_flag = true;
+                let started = Instant::now();
+                let value = init().await?;
+                self.record(stage, started.elapsed());
+                Ok::<_, FbuildError>(Arc::new(value) as Arc<dyn Any + Send + Sync>)
+            })
+            .await?;
+        if !ran {
+            self.stages
+                .lock()
+                .unwrap_or_else(PoisonError::into_inner)
+                .entry(stage)
+                .or_default()
+                .reused += 1;
+        }
+        // The slot key carries `TypeId::of::<T>()`, so this cannot miss.
+        value.downcast_ref::<T>().cloned().ok_or_else(|| {
+            FbuildError::Other(format!("env session: type mismatch for stage {stage}"))
+        })
+    }
+
+    /// Add one run of `stage` taking `elapsed`.
+    pub fn record(&self, stage: &'static str, elapsed: Duration) {
+        let mut stages = self.stages.lock().unwrap_or_else(PoisonError::into_inner);
+        let timing = stages.entry(stage).or_default();
+        timing.secs += elapsed.as_secs_f64();
+        timing.runs += 1;
+    }
+
+    /// Every stage seen so far, sorted by name.
+    pub fn stage_timings(&self) -> Vec<(String, StageTiming)> {
+        self.stages
+            .lock()
+            .unwrap_or_else(PoisonError::into_inner)
+            .iter()
+            .map(|(name, timing)| (name.to_string(), *timing))
+            .collect()
+    }
+}
+
+/// [`EnvSession::get_or_try_init`] when a session is in scope, `init`
+/// directly otherwise — so orchestrators call this unconditionally and plain
+/// `fbuild build` keeps its existing behaviour.
+pub async fn shared<T, F, Fut>(
+    session: Option<&EnvSession>,
+    stage: &'static str,
+    key: impl Into<String>,
+    init: F,
+) -> Result<T>
+where
+    T: Clone + Send + Sync + 'static,
+    F: FnOnce() -> Fut + Send,
+    Fut: Future<Output = Result<T>> + Send,
+{
+    match session {
+        Some(session) => session.get_or_try_init(stage, key, init).await,
+        None => init().await,
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::sync::atomic::{AtomicUsize, Ordering};
+
+    #[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+    async fn concurrent_callers_share_one_init() {
+        let session = Arc::new(EnvSession::new());
+        let inits = Arc::new(AtomicUsize::new(0));
+        let mut tasks = tokio::task::JoinSet::new();
+        for _ in 0..8 {
+            let session = Arc::clone(&session);
+            let inits = Arc::clone(&inits);
+            tasks.spawn(async move {
+                session
+                    .get_or_try_init("install", "pkg@1", || async {
+                        inits.fetch_add(1, Ordering::SeqCst);
+                        tokio::time::sleep(Duration::from_millis(20)).await;
+                        Ok("/cache/pkg".to_string())
+                    })
+                    .await
+                    .unwrap()
+            });
+        }
+        while let Some(joined) = tasks.join_next().await {
+            assert_eq!(joined.unwrap(), "/cache/pkg");
+        }
+        assert_eq!(inits.load(Ordering::SeqCst), 1);
+        let timings = session.stage_timings();
+        assert_eq!(timings.len(), 1);
+        assert_eq!((timings[0].1.runs, timings[0].1.reused), (1, 7));
+    }
+
+    #[tokio::test]
+    async fn keys_and_types_are_distinct_slots() {
+        let session = EnvSession::new();
+        let a: String = session
+            .get_or_try_init("probe", "a", || async { Ok("a".to_string()) })
+            .await
+            .unwrap();
+        let b: String = session
+            .get_or_try_init("probe", "b", || async { Ok("b".to_string()) })
+            .await
+            .unwrap();
+        let n: u32 = session
+            .get_or_try_init("probe", "a", || async { Ok(7) })
+            .await
+            .unwrap();
+        assert_eq!((a.as_str(), b.as_str(), n), ("a", "b", 7));
+        assert_eq!(session.stage_timings()[0].1.runs, 3);
+    }
+
+    #[tokio::test]
+    async fn errors_are_not_memoized() {
+        let session = EnvSession::new();
+        let failed: Result<u32> = session
+            .get_or_try_init("install", "pkg", || async {
+                Err(FbuildError::Other("offline".to_string()))
+            })
+            .await;
+        assert!(failed.is_err());
+        let retried: u32 = session
+            .get_or_try_init("install", "pkg", || async { Ok(3) })
+            .await
+            .unwrap();
+        assert_eq!(retried, 3);
+    }
+
+    #[tokio::test]
+    async fn no_session_runs_init_every_time() {
+        let inits = AtomicUsize::new(0);
+        for _ in 0..3 {
+            let v: usize = shared(None, "install", "pkg", || async {
+                Ok(inits.fetch_add(1, Ordering::SeqCst))
+            })
+            .await
+            .unwrap();
+            assert!(v < 3);
+        }
+        assert_eq!(inits.load(Ordering::SeqCst), 3);
+    }
+}
@@ -15,10 +15,12 @@ pub mod build_fingerprint;
 pub mod build_info;
 pub mod build_output;
 pub mod compile_backend;
+pub mod compile_batch;
 pub mod compile_database;
 pub mod compiler;
 pub mod eh_frame_policy;
 pub mod eh_frame_policy_compute;
+pub mod env_session;
 pub mod flag_overlay;
 pub mod framework_core_cache;
 pub mod framework_libs;
@@ -26,6 +28,7 @@ pub mod linker;
 pub mod mcu_config;
 pub mod package_override;
 pub mod parallel;
+pub mod pch;
 pub mod perf_log;
 pub mod pipeline;
 pub mod resolution;
@@ -58,6 +61,26 @@ pub trait PlatformSupport: Send + Sync {
     /// Install platform-specific dependencies (toolchain, framework).
     async fn install_deps(&self, project_dir: &Path) -> Result<()>;
 
+    /// Install every package a build of one env will ask for, so the build
+    /// finds them warm (`fbuild prefetch`). `board` and `env_config` are the
+    /// env's resolved board and `[env:<name>]` section, for board-dependent
+    /// packages and `platform_packages` overrides; `session` shares installs
+    /// across the envs of one prefetch.
+    ///
+    /// Defaults to [`install_deps`](Self::install_deps). Platforms whose
+    /// orchestrator resolves more than the toolchain override it with the
+    /// same package resolution the build uses.
+    async fn prefetch(
+        &self,
+        project_dir: &Path,
+        board: &fbuild_config::BoardConfig,
+        env_config: &std::collections::HashMap<String, String>,
+        session: Option<&env_session::EnvSession>,
+    ) -> Result<()> {
+        let _ = (board, env_config, session);
+        self.install_deps(project_dir).await
+    }
+
     /// Default board ID used as fallback when none is specified.
     fn default_board_id(&self) -> &str;
 }
@@ -171,6 +194,12 @@ pub struct BuildParams {
     /// the orchestrator falls back to walking on every call, which is
     /// the pre-existing behaviour.
     pub watch_set_cache: Option<std::sync::Arc<dyn build_fingerprint::WatchSetStampCache>>,
+    /// Env context shared with the other sketches of a `compile-many`
+    /// batch: package installs, the toolchain version probe and the
+    /// framework library index are computed once per batch instead of once
+    /// per sketch, and phase timings are collected for the batch summary.
+    /// `None` outside `compile-many`; see [`env_session`].
+    pub env_session: Option<std::sync::Arc<env_session::EnvSession>>,
     /// When true, append `-Wl,--noinhibit-exec` to the linker command line so
     /// GNU `ld` writes `firmware.elf` even when a memory region overflows, and
     /// treat post-link "failure" as success-with-warning when an ELF was
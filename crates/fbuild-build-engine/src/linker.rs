@@ -164,7 +164,18 @@ pub trait Linker: Send + Sync {
         None
     }
 
-    /// Full link pipeline: archive core → link → convert → size → optional symbol analysis.
+    /// Archiver (and its label for errors) for platforms whose `link` bundles
+    /// loose framework objects into an archive linked inside a
+    /// `--start-group`. When `Some`, the sequential pipeline archives core +
+    /// variant objects in the background while the sketch compiles and hands
+    /// `link` the finished `.a` instead. Default: `None` (objects are passed
+    /// to `link` as-is).
+    fn core_archiver(&self) -> Option<(&Path, &'static str)> {
+        None
+    }
+
+    /// Full link pipeline: archive core → link → {convert, size, optional
+    /// symbol analysis}.
     ///
     /// Skips relinking when the existing firmware.elf is newer than all input
     /// objects and archives, saving ~10-14s on incremental builds where only
@@ -185,30 +196,9 @@ pub trait Linker: Send + Sync {
             );
             if can_skip {
                 tracing::info!("link: firmware.elf is up-to-date, skipping relink");
-                let firmware_path = self.convert_firmware(&candidate_elf, output_dir).await?;
-                let size_info = self.report_size(&candidate_elf).await.ok();
-                let symbol_map = if symbol_analysis {
-                    LinkerBase::analyze_symbols(self.size_tool_path(), &candidate_elf)
-                        .await
-                        .ok()
-                } else {
-                    None
-                };
-                let is_hex = firmware_path.extension().is_some_and(|e| e == "hex");
-                return Ok(LinkResult {
-                    success: true,
-                    elf_path: Some(candidate_elf),
-                    hex_path: if is_hex {
-                        Some(firmware_path.clone())
-                    } else {
-                        None
-                    },
-                    bin_path: if !is_hex { Some(firmware_path) } else { None },
-                    size_info,
-                    symbol_map,
-                    stdout: String::new(),
-                    stderr: String::new(),
-                });
+                return self
+                    .finish_link(candidate_elf, output_dir, symbol_analysis)
+                    .await;
             }
         }
 
@@ -217,21 +207,39 @@ pub trait Linker: Send + Sync {
         let elf_path = self
             .link(sketch_objects, core_objects, output_dir, extra)
             .await?;
+        self.finish_link(elf_path, output_dir, symbol_analysis)
+            .await
+    }
 
-        // Convert
-        let firmware_path = self.convert_firmware(&elf_path, output_dir).await?;
-
-        // Size
-        let size_info = self.report_size(&elf_path).await.ok();
-
-        // Symbol analysis
-        let symbol_map = if symbol_analysis {
-            LinkerBase::analyze_symbols(self.size_tool_path(), &elf_path)
-                .await
-                .ok()
-        } else {
-            None
-        };
+    /// Post-link steps for a linked `elf_path`. Firmware conversion, the size
+    /// report and symbol analysis each only read the ELF, so they run as
+    /// concurrent subprocesses; wall time is the slowest of them rather than
+    /// their sum.
+    async fn finish_link(
+        &self,
+        elf_path: PathBuf,
+        output_dir: &Path,
+        symbol_analysis: bool,
+    ) -> Result<LinkResult> {
+        let started = std::time::Instant::now();
+        let (firmware_path, size_info, symbol_map) = tokio::join!(
+            self.convert_firmware(&elf_path, output_dir),
+            async { self.report_size(&elf_path).await.ok() },
+            async {
+                if symbol_analysis {
+                    LinkerBase::analyze_symbols(self.size_tool_path(), &elf_path)
+                        .await
+                        .ok()
+                } else {
+                    None
+                }
+            },
+        );
+        let firmware_path = firmware_path?;
+        tracing::debug!(
+            "post-link convert/size/symbols in {:.3}s",
+            started.elapsed().as_secs_f64()
+        );
 
         let is_hex = firmware_path.extension().is_some_and(|e| e == "hex");
         Ok(LinkResult {
@@ -363,53 +371,37 @@ impl LinkerBase {
         objects
     }
 
-    /// Create a static archive (.a) from object files using `ar rcs`.
+    /// Create or incrementally update a static archive (.a) from object
+    /// files (see [`fbuild_core::archive`]). Link-time archives live next to
+    /// their objects, so they may be written thin when enabled.
     pub async fn archive(
         ar_path: &Path,
         objects: &[PathBuf],
         output: &Path,
         tool_label: &str,
     ) -> Result<()> {
-        use fbuild_core::subprocess::run_command;
-
         if let Some(parent) = output.parent() {
             std::fs::create_dir_all(parent)?;
         }
 
-        // Remove existing archive to avoid stale objects
-        if output.exists() {
-            std::fs::remove_file(output)?;
-        }
-
-        let mut args: Vec<String> = vec![
-            ar_path.to_string_lossy().to_string(),
-            "rcs".to_string(),
-            output.to_string_lossy().to_string(),
-        ];
-
-        for obj in objects {
-            args.push(obj.to_string_lossy().to_string());
-        }
-
-        let args_ref: Vec<&str> = args.iter().map(|s| s.as_str()).collect();
         // FastLED/fbuild#809: `ar rcs` can have very large arg lists on
         // teensy41 / NRF52 builds; bound at 2 min so a wedged `ar` does
         // not block the build pipeline.
-        let result = run_command(
-            &args_ref,
-            None,
-            None,
-            Some(std::time::Duration::from_secs(120)),
-        )
-        .await?;
-
-        if !result.success() {
-            return Err(fbuild_core::FbuildError::BuildFailed(format!(
-                "{} failed: {}",
-                tool_label, result.stderr
-            )));
-        }
-
+        let options = fbuild_core::archive::ArchiveOptions {
+            label: tool_label,
+            timeout: std::time::Duration::from_secs(120),
+            allow_thin: true,
+        };
+        let started = std::time::Instant::now();
+        let update =
+            fbuild_core::archive::update_archive(ar_path, objects, output, &options).await?;
+        tracing::debug!(
+            "archive {}: {:?} ({} objects) in {:.3}s",
+            output.display(),
+            update,
+            objects.len(),
+            started.elapsed().as_secs_f64()
+        );
         Ok(())
     }
 
@@ -745,4 +737,68 @@ mod tests {
         let nm = LinkerBase::nm_path_from_size_path(&size);
         assert_eq!(nm, PathBuf::from("C:/toolchain/bin/arm-none-eabi-nm.exe"));
     }
+
+    /// Fake toolchain whose convert and size steps each take `STEP`.
+    struct SlowPostLink;
+
+    const STEP: std::time::Duration = std::time::Duration::from_millis(300);
+
+    #[async_trait::async_trait]
+    impl Linker for SlowPostLink {
+        async fn archive(&self, _objects: &[PathBuf], _output: &Path) -> Result<()> {
+            Ok(())
+        }
+
+        async fn link(
+            &self,
+            _objects: &[PathBuf],
+            _archives: &[PathBuf],
+            output: &Path,
+            _extra: &LinkExtraArgs,
+        ) -> Result<PathBuf> {
+            Ok(output.join("firmware.elf"))
+        }
+
+        async fn convert_firmware(&self, _elf: &Path, output_dir: &Path) -> Result<PathBuf> {
+            tokio::time::sleep(STEP).await;
+            Ok(output_dir.join("firmware.bin"))
+        }
+
+        async fn report_size(&self, _elf: &Path) -> Result<SizeInfo> {
+            tokio::time::sleep(STEP).await;
+            Ok(SizeInfo {
+                text: 1,
+                data: 0,
+                bss: 0,
+                total_flash: 1,
+                total_ram: 0,
+                max_flash: None,
+                max_ram: None,
+            })
+        }
+
+        fn size_tool_path(&self) -> &Path {
+            Path::new("size")
+        }
+    }
+
+    /// Convert and size only read the ELF, so they overlap instead of
+    /// running back to back.
+    #[tokio::test]
+    async fn finish_link_runs_post_link_steps_concurrently() {
+        let out = abs("proj/build");
+        let started = std::time::Instant::now();
+        let result = SlowPostLink
+            .finish_link(out.join("firmware.elf"), &out, false)
+            .await
+            .unwrap();
+        let elapsed = started.elapsed();
+        assert!(
+            elapsed < STEP * 2,
+            "post-link steps serialized: {elapsed:?}"
+        );
+        assert_eq!(result.bin_path, Some(out.join("firmware.bin")));
+        assert!(result.size_info.is_some());
+        assert!(result.symbol_map.is_none());
+    }
 }
@@ -0,0 +1,426 @@
+//! Opt-in precompiled framework umbrella header (`build_pch = auto`).
+//!
+//! Every sketch TU re-parses `Arduino.h` — on ESP32 that drags in a deep
+//! ESP-IDF header tree, which dominates the front-end time of small TUs. With
+//! `build_pch = auto` in `[env:*]`, the build generates a tiny umbrella
+//! header (`fbuild_pch.h`, a single `#include <Arduino.h>`), precompiles it to
+//! `fbuild_pch.h.gch` with the exact sketch C++ flags, and injects
+//! `-include <dir>/fbuild_pch.h` into the sketch TUs that can take it.
+//!
+//! `-include` processes the header ahead of the TU's first line, and it does
+//! so whether gcc loads the `.gch` or falls back to parsing the plain header
+//! (incompatible or stale PCH). A TU whose own `#define`s or includes precede
+//! `Arduino.h` would therefore preprocess differently. The PCH is only
+//! injected into C++ TUs whose first directive (after comments, blank lines
+//! and `#line`) is already `#include <Arduino.h>` — the generated `.ino.cpp`
+//! and sketch sources written the same way. For those the forced include is
+//! exactly what the TU does anyway, so a stale or mismatched PCH costs time
+//! only. Every other sketch TU is compiled without it.
+//!
+//! ## Caching and invalidation
+//!
+//! PCHs live in the global cache under `pch/<key>/`, where `<key>` hashes the
+//! compiler's rebuild signature for the header compile — toolchain identity
+//! (`-dumpversion`) plus every flag, including the versioned framework
+//! include dirs, so a framework upgrade lands in a new key. Within a key the
+//! regular `.cmdhash` + `-MMD` depfile check
+//! ([`CompilerBase::needs_rebuild_with_signature`]) catches in-place header
+//! edits. Because the injected `-include` path embeds the key, consumers'
+//! own rebuild signatures change whenever the PCH identity does.
+//!
+//! Scope: Arduino-framework envs, eligible sketch TUs only (core, variant and
+//! library TUs keep their flags — and their framework core cache keys —
+//! unchanged). Any failure to build the PCH logs a warning and the build
+//! proceeds without it.
+
+use std::collections::HashMap;
+use std::path::{Path, PathBuf};
+
+use fbuild_core::path::NormalizedPath;
+use fbuild_core::{BuildLog, Result};
+use sha2::{Digest, Sha256};
+
+use crate::compiler::{Compiler, CompilerBase};
+use crate::flag_overlay::LanguageExtraFlags;
+use crate::parallel::ParallelCompileResult;
+
+/// Bumped whenever the umbrella header content or PCH flag recipe changes.
+const PCH_FORMAT_VERSION: &str = "fbuild-pch-v1";
+
+/// Generated umbrella header file name; the PCH is `<name>.gch` beside it.
+pub const PCH_HEADER_NAME: &str = "fbuild_pch.h";
+
+/// Framework umbrella header precompiled for Arduino envs.
+pub const ARDUINO_UMBRELLA_HEADER: &str = "Arduino.h";
+
+/// Serializes PCH generation: concurrent builds of the same env would
+/// otherwise race on the shared `pch/<key>/` output.
+static PCH_LOCK: tokio::sync::Mutex<()> = tokio::sync::Mutex::const_new(());
+
+/// `build_pch` setting for one env.
+#[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
+pub enum PchMode {
+    /// No PCH (default).
+    #[default]
+    Off,
+    /// Generate, cache and inject the framework umbrella PCH.
+    Auto,
+}
+
+impl PchMode {
+    /// Parse a raw `build_pch` value. Unknown values are treated as `Off`
+    /// with a warning rather than failing the build.
+    pub fn parse(value: Option<&str>) -> Self {
+        match value.map(|v| v.trim().to_ascii_lowercase()).as_deref() {
+            None | Some("") | Some("off") | Some("no") | Some("false") => Self::Off,
+            Some("auto") | Some("on") | Some("yes") | Some("true") => Self::Auto,
+            Some(other) => {
+                tracing::warn!(build_pch = %other, "unknown build_pch value; PCH disabled");
+                Self::Off
+            }
+        }
+    }
+
+    /// Resolve the mode for `env_name`, honoring it only for Arduino envs.
+    pub fn for_env(config: &fbuild_config::PlatformIOConfig, env_name: &str) -> Self {
+        let mode = Self::parse(config.get_build_pch(env_name).ok().flatten().as_deref());
+        let is_arduino = config
+            .get_env_config(env_name)
+            .ok()
+            .and_then(|env| env.get("framework"))
+            .is_some_and(|fw| fw.split(',').any(|f| f.trim() == "arduino"));
+        if mode == Self::Auto && !is_arduino {
+            tracing::debug!("build_pch = auto ignored for non-Arduino env {env_name}");
+            return Self::Off;
+        }
+        mode
+    }
+}
+
+/// A ready-to-use precompiled umbrella header.
+#[derive(Debug, Clone)]
+pub struct FrameworkPch {
+    header: NormalizedPath,
+    key: String,
+    rebuilt: bool,
+}
+
+impl FrameworkPch {
+    /// Flags that make a TU consume the PCH.
+    pub fn include_flags(&self) -> Vec<String> {
+        vec!["-include".to_string(), self.header.display_slash()]
+    }
+
+    /// Cache key (directory name under `pch/`).
+    pub fn key(&self) -> &str {
+        &self.key
+    }
+
+    /// `true` when this call had to (re)generate the `.gch`.
+    pub fn rebuilt(&self) -> bool {
+        self.rebuilt
+    }
+
+    /// `src_overlay` with the PCH injected for C++ TUs.
+    pub fn apply(&self, overlay: &LanguageExtraFlags) -> LanguageExtraFlags {
+        let mut out = overlay.clone();
+        out.cxx.extend(self.include_flags());
+        out
+    }
+}
+
+/// Extra flags used to compile the umbrella header itself.
+fn header_compile_flags(overlay: &LanguageExtraFlags) -> Vec<String> {
+    let mut flags = overlay.for_source(Path::new(PCH_HEADER_NAME));
+    flags.extend(["-x".to_string(), "c++-header".to_string()]);
+    flags
+}
+
+fn umbrella_contents(umbrella: &str) -> String {
+    format!("// Generated by fbuild ({PCH_FORMAT_VERSION}); do not edit.\n#include <{umbrella}>\n")
+}
+
+/// Cache key for a header compile with `signature` (toolchain + flags).
+fn pch_key(signature: &str, umbrella: &str) -> String {
+    let mut hasher = Sha256::new();
+    hasher.update(PCH_FORMAT_VERSION.as_bytes());
+    hasher.update([0]);
+    hasher.update(umbrella.as_bytes());
+    hasher.update([0]);
+    hasher.update(signature.as_bytes());
+    let digest = hasher.finalize();
+    digest[..8].iter().map(|b| format!("{b:02x}")).collect()
+}
+
+/// Ensure the PCH for (`compiler`, `overlay`) exists under `cache_dir` and
+/// return it, or `None` when it could not be built.
+pub async fn ensure_framework_pch(
+    compiler: &dyn Compiler,
+    overlay: &LanguageExtraFlags,
+    cache_dir: &Path,
+) -> Option<FrameworkPch> {
+    let umbrella = ARDUINO_UMBRELLA_HEADER;
+    let flags = header_compile_flags(overlay);
+    let header_name = Path::new(PCH_HEADER_NAME);
+    let key = pch_key(&compiler.rebuild_signature(header_name, &flags), umbrella);
+    let dir = cache_dir.join(&key);
+    let header = dir.join(PCH_HEADER_NAME);
+    let gch = dir.join(format!("{PCH_HEADER_NAME}.gch"));
+
+    let _guard = PCH_LOCK.lock().await;
+    let contents = umbrella_contents(umbrella);
+    if std::fs::read_to_string(&header).ok().as_deref() != Some(contents.as_str()) {
+        if let Err(e) =
+            std::fs::create_dir_all(&dir).and_then(|_| std::fs::write(&header, &contents))
+        {
+            tracing::warn!("PCH: cannot write {}: {e}", header.display());
+            return None;
+        }
+    }
+
+    let signature = compiler.rebuild_signature(&header, &flags);
+    let rebuilt = CompilerBase::needs_rebuild_with_signature(&header, &gch, Some(&signature));
+    if rebuilt {
+        let started = std::time::Instant::now();
+        let result = compiler.compile_cpp(&header, &gch, &flags).await;
+        match result {
+            Ok(r) if r.success && gch.is_file() => tracing::info!(
+                "PCH: precompiled {umbrella} key={key} in {:.2}s",
+                started.elapsed().as_secs_f64()
+            ),
+            Ok(r) => {
+                tracing::warn!(
+                    "PCH: precompiling {umbrella} failed (exit {}); building without PCH\n{}",
+                    r.exit_code,
+                    r.stderr.trim()
+                );
+                let _ = std::fs::remove_file(&gch);
+                return None;
+            }
+            Err(e) => {
+                tracing::warn!("PCH: precompiling {umbrella} failed: {e}; building without PCH");
+                let _ = std::fs::remove_file(&gch);
+                return None;
+            }
+        }
+    } else {
+        tracing::debug!("PCH: reusing {umbrella} key={key}");
+    }
+
+    Some(FrameworkPch {
+        header: NormalizedPath::new(&header),
+        key,
+        rebuilt,
+    })
+}
+
+/// The framework PCH for the sketch TUs of `env_name`, when `build_pch =
+/// auto` is set and the PCH could be built.
+pub async fn sketch_pch(
+    config: &fbuild_config::PlatformIOConfig,
+    env_name: &str,
+    project_dir: &Path,
+    compiler: &dyn Compiler,
+    src_overlay: &LanguageExtraFlags,
+) -> Option<FrameworkPch> {
+    if PchMode::for_env(config, env_name) != PchMode::Auto {
+        return None;
+    }
+    let cache_dir = fbuild_packages::Cache::new(project_dir).pch_artifacts_dir();
+    ensure_framework_pch(compiler, src_overlay, &cache_dir).await
+}
+
+/// `true` when `text` starts, after comments, blank lines and `#line`
+/// markers, with `#include <umbrella>` (or `"umbrella"`).
+fn leads_with_umbrella_include(text: &str, umbrella: &str) -> bool {
+    let mut in_block_comment = false;
+    for line in text.lines() {
+        let mut rest = line.trim();
+        loop {
+            if in_block_comment {
+                match rest.find("*/") {
+                    Some(end) => {
+                        in_block_comment = false;
+                        rest = rest[end + 2..].trim_start();
+                    }
+                    None => break,
+                }
+            } else if let Some(after) = rest.strip_prefix("/*") {
+                in_block_comment = true;
+                rest = after;
+            } else {
+                break;
+            }
+        }
+        if in_block_comment || rest.is_empty() || rest.starts_with("//") {
+            continue;
+        }
+        let Some(directive) = rest.strip_prefix('#') else {
+            return false;
+        };
+        let directive = directive.trim_start();
+        if directive.starts_with("line") {
+            continue;
+        }
+        let Some(target) = directive.strip_prefix("include") else {
+            return false;
+        };
+        let target = target.trim_start();
+        return target.starts_with(&format!("<{umbrella}>"))
+            || target.starts_with(&format!("\"{umbrella}\""));
+    }
+    false
+}
+
+/// `true` when forcing the umbrella header into `source` cannot change how
+/// it preprocesses: a C++ TU that includes the umbrella header before
+/// anything else.
+pub fn takes_pch(source: &Path) -> bool {
+    let ext = source
+        .extension()
+        .unwrap_or_default()
+        .to_string_lossy()
+        .to_lowercase();
+    matches!(ext.as_str(), "cpp" | "cc" | "cxx")
+        && std::fs::read_to_string(source)
+            .is_ok_and(|text| leads_with_umbrella_include(&text, ARDUINO_UMBRELLA_HEADER))
+}
+
+/// Compile the sketch `sources` with `overlay`, adding `pch` to the TUs that
+/// [`takes_pch`] accepts. Objects come back in source order.
+pub async fn compile_sketch_sources(
+    compiler: &dyn Compiler,
+    sources: &[PathBuf],
+    build_dir: &Path,
+    overlay: &LanguageExtraFlags,
+    pch: Option<&FrameworkPch>,
+    jobs: usize,
+    build_log: Option<&std::sync::Mutex<BuildLog>>,
+) -> Result<ParallelCompileResult> {
+    let (with_pch, plain): (Vec<PathBuf>, Vec<PathBuf>) = match pch {
+        Some(_) => sources.iter().cloned().partition(|s| takes_pch(s)),
+        None => (Vec::new(), sources.to_vec()),
+    };
+    if with_pch.is_empty() {
+        return crate::parallel::compile_sources_parallel(
+            compiler, sources, build_dir, overlay, jobs, build_log,
+        )
+        .await;
+    }
+    let pch_overlay = pch.map(|p| p.apply(overlay)).unwrap_or_default();
+    let mut warnings = Vec::new();
+    let mut object_of = HashMap::new();
+    for (group, flags) in [(&with_pch, &pch_overlay), (&plain, overlay)] {
+        if group.is_empty() {
+            continue;
+        }
+        let result = crate::parallel::compile_sources_parallel(
+            compiler, group, build_dir, flags, jobs, build_log,
+        )
+        .await?;
+        warnings.extend(result.warnings);
+        object_of.extend(group.iter().cloned().zip(result.objects));
+    }
+    let objects = sources.iter().filter_map(|s| object_of.remove(s)).collect();
+    Ok(ParallelCompileResult { objects, warnings })
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn parse_build_pch_values() {
+        assert_eq!(PchMode::parse(None), PchMode::Off);
+        assert_eq!(PchMode::parse(Some("auto")), PchMode::Auto);
+        assert_eq!(PchMode::parse(Some(" AUTO ")), PchMode::Auto);
+        assert_eq!(PchMode::parse(Some("off")), PchMode::Off);
+        assert_eq!(PchMode::parse(Some("bogus")), PchMode::Off);
+    }
+
+    #[test]
+    fn key_tracks_signature_and_umbrella() {
+        let a = pch_key("sig-a", ARDUINO_UMBRELLA_HEADER);
+        assert_eq!(a, pch_key("sig-a", ARDUINO_UMBRELLA_HEADER));
+        assert_ne!(a, pch_key("sig-b", ARDUINO_UMBRELLA_HEADER));
+        assert_ne!(a, pch_key("sig-a", "Other.h"));
+        assert_eq!(a.len(), 16);
+    }
+
+    #[test]
+    fn header_compile_uses_cxx_overlay_and_header_language() {
+        let overlay = LanguageExtraFlags {
+            common: vec!["-DCOMMON".to_string()],
+            c: vec!["-DC_ONLY".to_string()],
+            cxx: vec!["-DCXX_ONLY".to_string()],
+            asm: Vec::new(),
+        };
+        let flags = header_compile_flags(&overlay);
+        assert!(flags.contains(&"-DCOMMON".to_string()));
+        assert!(flags.contains(&"-DCXX_ONLY".to_string()));
+        assert!(!flags.contains(&"-DC_ONLY".to_string()));
+        assert!(flags.ends_with(&["-x".to_string(), "c++-header".to_string()]));
+    }
+
+    #[test]
+    fn apply_injects_include_for_cxx_only() {
+        let pch = FrameworkPch {
+            header: NormalizedPath::new("/cache/pch/abc/fbuild_pch.h"),
+            key: "abc".to_string(),
+            rebuilt: false,
+        };
+        let overlay = pch.apply(&LanguageExtraFlags::default());
+        assert_eq!(overlay.cxx, pch.include_flags());
+        assert!(overlay.c.is_empty() && overlay.common.is_empty());
+        let cpp = overlay.for_source(Path::new("sketch.ino.cpp"));
+        assert!(cpp.contains(&"-include".to_string()));
+        assert!(overlay.for_source(Path::new("util.c")).is_empty());
+    }
+
+    #[test]
+    fn umbrella_include_must_come_first() {
+        let lead = |text: &str| leads_with_umbrella_include(text, ARDUINO_UMBRELLA_HEADER);
+        assert!(lead("#include <Arduino.h>\nvoid setup() {}\n"));
+        assert!(lead(
+            "// sketch\n/* multi\n   line */\n\n#line 1 \"a.ino\"\n#  include \"Arduino.h\"\n"
+        ));
+        assert!(!lead("#define LED_PIN 5\n#include <Arduino.h>\n"));
+        assert!(!lead("#include <FastLED.h>\n#include <Arduino.h>\n"));
+        assert!(!lead("int x;\n#include <Arduino.h>\n"));
+        assert!(!lead("#include <Arduino.hpp>\n"));
+        assert!(!lead("// empty\n"));
+    }
+
+    #[test]
+    fn only_cxx_tus_led_by_arduino_take_the_pch() {
+        let dir = tempfile::TempDir::new().unwrap();
+        let write = |name: &str, text: &str| {
+            let path = dir.path().join(name);
+            std::fs::write(&path, text).unwrap();
+            path
+        };
+        assert!(takes_pch(&write("a.ino.cpp", "#include <Arduino.h>\n")));
+        assert!(!takes_pch(&write(
+            "b.ino.cpp",
+            "#define FASTLED_RMT5 0\n#include <Arduino.h>\n"
+        )));
+        assert!(takes_pch(&write("util.cpp", "#include <Arduino.h>\n")));
+        assert!(!takes_pch(&write("util.c", "#include <Arduino.h>\n")));
+        assert!(!takes_pch(&dir.path().join("missing.ino.cpp")));
+    }
+
+    #[test]
+    fn arduino_only() {
+        let dir = tempfile::TempDir::new().unwrap();
+        let ini = dir.path().join("platformio.ini");
+        std::fs::write(
+            &ini,
+            "[env]\nbuild_pch = auto\n\n[env:uno]\nframework = arduino\n\n\
+             [env:idf]\nframework = espidf\n",
+        )
+        .unwrap();
+        let config = fbuild_config::PlatformIOConfig::from_path(&ini).unwrap();
+        assert_eq!(PchMode::for_env(&config, "uno"), PchMode::Auto);
+        assert_eq!(PchMode::for_env(&config, "idf"), PchMode::Off);
+    }
+}
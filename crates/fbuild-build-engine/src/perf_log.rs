@@ -24,9 +24,12 @@
 //! // auto-summary on drop
 //! ```
 
+use std::sync::Arc;
 use std::sync::atomic::{AtomicBool, Ordering};
 use std::time::{Duration, Instant};
 
+use crate::env_session::EnvSession;
+
 /// Returns `true` when `FBUILD_PERF_LOG=1` (or any non-empty, non-`0` value).
 ///
 /// Cached after the first call so repeated checks are O(1).
@@ -51,13 +54,15 @@ struct Phase {
 
 /// Collects phase durations and emits a summary on drop.
 ///
-/// Cheap no-op when `FBUILD_PERF_LOG` is not set — all phase guards become
-/// zero-work RAII objects.
+/// Cheap no-op when `FBUILD_PERF_LOG` is not set and no [`EnvSession`] sink
+/// is attached — all phase guards become zero-work RAII objects.
 pub struct PerfTimer {
     label: &'static str,
     start: Instant,
     phases: Vec<Phase>,
     active: bool,
+    /// Session that receives the phase totals on drop (compile-many).
+    sink: Option<Arc<EnvSession>>,
 }
 
 impl PerfTimer {
@@ -68,9 +73,22 @@ impl PerfTimer {
             start: Instant::now(),
             phases: Vec::new(),
             active: enabled(),
+            sink: None,
         }
     }
 
+    /// Also hand every phase total to `session` on drop, whether or not
+    /// `FBUILD_PERF_LOG` is set. `None` leaves the timer unchanged.
+    pub fn with_env_session(mut self, session: Option<Arc<EnvSession>>) -> Self {
+        self.sink = session;
+        self
+    }
+
+    /// Whether phases are being measured at all (logged or collected).
+    fn recording(&self) -> bool {
+        self.active || self.sink.is_some()
+    }
+
     /// Return whether this timer is actively emitting/recording diagnostics.
     pub fn is_active(&self) -> bool {
         self.active
@@ -99,7 +117,7 @@ impl PerfTimer {
     /// Add a manually-measured duration (e.g. when a phase is split across
     /// closures that can't share a `&mut PerfTimer`).
     pub fn record(&mut self, name: &'static str, dur: Duration) {
-        if !self.active {
+        if !self.recording() {
             return;
         }
         if let Some(p) = self.phases.iter_mut().find(|p| p.name == name) {
@@ -123,6 +141,11 @@ impl PerfTimer {
 
 impl Drop for PerfTimer {
     fn drop(&mut self) {
+        if let Some(session) = &self.sink {
+            for p in &self.phases {
+                session.record(p.name, p.total);
+            }
+        }
         if !self.active {
             return;
         }
@@ -148,7 +171,7 @@ pub struct PhaseGuard<'a> {
 
 impl<'a> Drop for PhaseGuard<'a> {
     fn drop(&mut self) {
-        if !self.owner.active {
+        if !self.owner.recording() {
             return;
         }
         let dur = self.start.elapsed();
@@ -160,7 +183,9 @@ impl<'a> Drop for PhaseGuard<'a> {
                 total: dur,
             });
         }
-        self.owner.emit_event("phase-finish", self.name, dur);
+        if self.owner.active {
+            self.owner.emit_event("phase-finish", self.name, dur);
+        }
     }
 }
 
@@ -176,6 +201,7 @@ mod tests {
             start: Instant::now(),
             phases: Vec::new(),
             active: true,
+            sink: None,
         };
         {
             let _g = t.phase("phase-a");
@@ -193,6 +219,7 @@ mod tests {
             start: Instant::now(),
             phases: Vec::new(),
             active: false,
+            sink: None,
         };
         {
             let _g = t.phase("phase-a");
@@ -209,10 +236,31 @@ mod tests {
             start: Instant::now(),
             phases: Vec::new(),
             active: true,
+            sink: None,
         };
         t.record("x", Duration::from_millis(3));
         t.record("x", Duration::from_millis(4));
         assert_eq!(t.phases.len(), 1);
         assert_eq!(t.phases[0].total.as_millis(), 7);
     }
+
+    #[test]
+    fn session_sink_collects_phases_without_logging() {
+        let session = Arc::new(EnvSession::new());
+        let mut t = PerfTimer {
+            label: "test",
+            start: Instant::now(),
+            phases: Vec::new(),
+            active: false,
+            sink: None,
+        }
+        .with_env_session(Some(Arc::clone(&session)));
+        t.record("compile", Duration::from_millis(3));
+        t.record("link", Duration::from_millis(1));
+        drop(t);
+        let timings = session.stage_timings();
+        let names: Vec<_> = timings.iter().map(|(n, _)| n.as_str()).collect();
+        assert_eq!(names, ["compile", "link"]);
+        assert!(timings.iter().all(|(_, t)| t.runs == 1));
+    }
 }
@@ -6,6 +6,7 @@ use fbuild_core::{BuildLog, Result};
 
 use crate::compile_database::{self, CompileDatabase, TargetArchitecture};
 use crate::compiler::Compiler;
+use crate::env_session::EnvSession;
 use crate::flag_overlay::LanguageExtraFlags;
 
 /// Compile a list of sources in parallel with incremental rebuild detection.
@@ -174,20 +175,53 @@ pub fn generate_compile_db(
 }
 
 /// Log the version of a GCC toolchain by running `gcc -dumpversion`.
-pub async fn log_toolchain_version(gcc_path: &Path, label: &str, build_log: &mut BuildLog) {
-    // FastLED/fbuild#809: `gcc -dumpversion` is a trivial probe; bound
-    // it tightly so a wedged toolchain binary cannot stall build init.
-    if let Ok(ver_out) = fbuild_core::subprocess::run_command(
-        &[gcc_path.to_string_lossy().as_ref(), "-dumpversion"],
-        None,
-        None,
-        Some(std::time::Duration::from_secs(5)),
-    )
-    .await
-    {
-        let version = ver_out.stdout.trim().to_string();
+///
+/// Inside a `compile-many` batch the probe runs once per compiler path.
+pub async fn log_toolchain_version(
+    gcc_path: &Path,
+    label: &str,
+    build_log: &mut BuildLog,
+    session: Option<&EnvSession>,
+) {
+    let key = gcc_path.to_string_lossy().into_owned();
+    let probe = crate::env_session::shared(session, "toolchain-version", key, || async {
+        // FastLED/fbuild#809: `gcc -dumpversion` is a trivial probe; bound
+        // it tightly so a wedged toolchain binary cannot stall build init.
+        let ver_out = fbuild_core::subprocess::run_command(
+            &[gcc_path.to_string_lossy().as_ref(), "-dumpversion"],
+            None,
+            None,
+            Some(std::time::Duration::from_secs(5)),
+        )
+        .await?;
+        Ok(ver_out.stdout.trim().to_string())
+    })
+    .await;
+    if let Ok(version) = probe {
         if !version.is_empty() {
             crate::build_output::log_toolchain_version(build_log, label, &version);
         }
     }
 }
+
+/// [`fbuild_packages::Package::ensure_installed`], run once per package
+/// install location inside a `compile-many` batch.
+pub async fn ensure_installed<P>(session: Option<&EnvSession>, package: &P) -> Result<PathBuf>
+where
+    P: fbuild_packages::Package + ?Sized,
+{
+    let Some(session) = session else {
+        return package.ensure_installed().await;
+    };
+    let info = package.get_info();
+    let key = format!(
+        "{}@{} {} {}",
+        info.name,
+        info.version,
+        info.url,
+        info.install_path.display()
+    );
+    session
+        .get_or_try_init("ensure-installed", key, || package.ensure_installed())
+        .await
+}
@@ -180,6 +180,7 @@ pub async fn compile_extra_libraries(
             env.compiler_cache,
             None,
             None,
+            None,
         )
         .await
         {
@@ -286,6 +287,7 @@ pub async fn compile_project_as_library(
         env.compiler_cache,
         None,
         None,
+        None,
     )
     .await
     {
@@ -366,6 +368,7 @@ pub async fn ensure_lib_deps(
         verbose,
         jobs,
         compiler_cache,
+        None,
     )
     .await?;
 
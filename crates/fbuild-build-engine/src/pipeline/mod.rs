@@ -17,7 +17,8 @@ mod sequential;
 
 pub use build_unflags::remove_unflagged_tokens;
 pub use compile::{
-    compile_local_libraries, compile_sources, generate_compile_db, log_toolchain_version,
+    compile_local_libraries, compile_sources, ensure_installed, generate_compile_db,
+    log_toolchain_version,
 };
 pub use context::BuildContext;
 pub use library::{
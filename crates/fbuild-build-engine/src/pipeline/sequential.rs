@@ -46,7 +46,8 @@ pub async fn run_sequential_build_with_libs(
 ) -> Result<BuildResult> {
     // Env-gated per-phase timer (FBUILD_PERF_LOG=1). Emits summary on drop.
     // Zero-overhead when the env var is unset — phase guards become no-ops.
-    let mut perf = crate::perf_log::PerfTimer::new("pipeline");
+    let mut perf =
+        crate::perf_log::PerfTimer::new("pipeline").with_env_session(params.env_session.clone());
     let core_and_variant: Vec<PathBuf> = sources
         .core_sources
         .iter()
@@ -221,18 +222,56 @@ pub async fn run_sequential_build_with_libs(
         }
     }
 
+    // Platforms that link the framework as an archive (AVR, ESP8266) get it
+    // built in the background while the sketch and libraries compile. It
+    // lives in `build_dir`, not `core_build_dir`, so the framework core cache
+    // never snapshots it.
+    let core_archive_task = linker.core_archiver().map(|(ar, label)| {
+        let ar = ar.to_path_buf();
+        let objects = core_objects.clone();
+        let output = ctx.build_dir.join("libfbuild_framework_core.a");
+        tokio::spawn(async move {
+            let started = Instant::now();
+            crate::linker::LinkerBase::archive(&ar, &objects, &output, label)
+                .await
+                .map(|()| (output, started.elapsed()))
+        })
+    });
+
+    // `build_pch = auto`: precompile the framework umbrella header and inject
+    // it into the sketch TUs that lead with it (no-op otherwise).
+    let sketch_pch = {
+        let _g = perf.phase("pch");
+        crate::pch::sketch_pch(
+            &ctx.config,
+            &params.env_name,
+            &params.project_dir,
+            compiler,
+            &src_overlay,
+        )
+        .await
+    };
+
     // Compile sketch
     let sketch_objects = {
         let _g = perf.phase("compile-sketch");
-        compile_sources(
+        let result = crate::pch::compile_sketch_sources(
             compiler,
             &sources.sketch_sources,
             &ctx.src_build_dir,
             &src_overlay,
+            sketch_pch.as_ref(),
             jobs,
-            &build_log_mutex,
+            Some(&build_log_mutex),
         )
-        .await?
+        .await?;
+        if !result.warnings.is_empty() {
+            let mut log = build_log_mutex.lock().unwrap_or_else(|e| e.into_inner());
+            for w in &result.warnings {
+                crate::build_output::collect_warnings(w, &mut log);
+            }
+        }
+        result.objects
     };
 
     // Compile local libraries (lib/* — loose objects, LTO-safe; per-lib parallel)
@@ -289,27 +328,18 @@ pub async fn run_sequential_build_with_libs(
         }
     };
 
-    // Generate compile_commands.json
-    let compile_database_path = {
-        let _g = perf.phase("compile-db");
-        generate_compile_db(
-            compiler.gcc_path(),
-            compiler.gxx_path(),
-            &compiler.c_flags(),
-            &compiler.cpp_flags(),
-            &[],
-            &user_overlay,
-            &src_overlay,
-            &core_and_variant,
-            &sources.sketch_sources,
-            &sources.ino_preludes,
-            &ctx.core_build_dir,
-            &ctx.src_build_dir,
-            &ctx.build_dir,
-            &params.project_dir,
-            arch,
-        )?
-    };
+    // `link-prep` is how long the link waited on the core archive;
+    // `archive-core` is the archive's own (overlapped) duration.
+    if let Some(task) = core_archive_task {
+        let (archive, elapsed) = {
+            let _g = perf.phase("link-prep");
+            task.await.map_err(|e| {
+                fbuild_core::FbuildError::BuildFailed(format!("core archive task failed: {e}"))
+            })??
+        };
+        perf.record("archive-core", elapsed);
+        core_objects = vec![archive];
+    }
 
     // Link
     crate::build_output::log_linking(&mut ctx.build_log, "Linking firmware.elf");
@@ -319,22 +349,55 @@ pub async fn run_sequential_build_with_libs(
         // GCC accepts .a in the same positional slot as .o files.
         core_objects.push(archive);
     }
-    let link_result = {
-        let _g = perf.phase("link");
-        crate::linker::Linker::link_all(
-            linker,
-            &sketch_objects,
-            &core_objects,
-            &ctx.build_dir,
-            &crate::linker::LinkExtraArgs {
-                flags: ctx.overlay_link_flags.clone(),
-                libs: ctx.overlay_link_libs.clone(),
-                bloat_analysis: params.bloat_analysis,
-            },
-            params.symbol_analysis,
-        )
-        .await?
-    };
+    // Link (→ convert/size/symbols, see `Linker::finish_link`) and
+    // compile_commands.json generation are independent; run them together.
+    // The sync compile-db step is polled second, after the link subprocess
+    // has been spawned. Each branch is timed on its own so `link` and
+    // `compile-db` stay separate phases in the perf report.
+    let link_started = Instant::now();
+    let ((link_result, link_elapsed), (compile_database_path, compile_db_elapsed)) = tokio::join!(
+        async {
+            let result = crate::linker::Linker::link_all(
+                linker,
+                &sketch_objects,
+                &core_objects,
+                &ctx.build_dir,
+                &crate::linker::LinkExtraArgs {
+                    flags: ctx.overlay_link_flags.clone(),
+                    libs: ctx.overlay_link_libs.clone(),
+                    bloat_analysis: params.bloat_analysis,
+                },
+                params.symbol_analysis,
+            )
+            .await;
+            (result, link_started.elapsed())
+        },
+        async {
+            let started = Instant::now();
+            let result = generate_compile_db(
+                compiler.gcc_path(),
+                compiler.gxx_path(),
+                &compiler.c_flags(),
+                &compiler.cpp_flags(),
+                &[],
+                &user_overlay,
+                &src_overlay,
+                &core_and_variant,
+                &sources.sketch_sources,
+                &sources.ino_preludes,
+                &ctx.core_build_dir,
+                &ctx.src_build_dir,
+                &ctx.build_dir,
+                &params.project_dir,
+                arch,
+            );
+            (result, started.elapsed())
+        },
+    );
+    perf.record("link", link_elapsed);
+    perf.record("compile-db", compile_db_elapsed);
+    let link_result = link_result?;
+    let compile_database_path = compile_database_path?;
 
     // Emit build_info_<env>.json (and the generic fallback) so downstream
     // tools (FastLED `ci/compiled_size.py`, etc.) can find the toolchain
@@ -32,6 +32,20 @@ impl crate::PlatformSupport for Esp32PlatformSupport {
         Ok(())
     }
 
+    async fn prefetch(
+        &self,
+        project_dir: &std::path::Path,
+        board: &fbuild_config::BoardConfig,
+        env_config: &std::collections::HashMap<String, String>,
+        session: Option<&crate::env_session::EnvSession>,
+    ) -> fbuild_core::Result<()> {
+        // Platform, toolchain, framework + SDK libs and esptool, resolved
+        // exactly as the orchestrator resolves them.
+        orchestrator::prefetch_packages(project_dir, &board.mcu, env_config, session).await?;
+        tracing::info!("ESP32 packages for {} installed", board.mcu);
+        Ok(())
+    }
+
     fn default_board_id(&self) -> &str {
         "esp32dev"
     }
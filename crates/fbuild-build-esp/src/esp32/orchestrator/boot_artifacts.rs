@@ -1,7 +1,6 @@
 //! Prepare bootloader.bin, partitions.bin and boot_app0.bin for deployment / emulation.
 
 use std::path::Path;
-use std::time::Instant;
 
 use fbuild_core::Result;
 use fbuild_core::path::NormalizedPath;
@@ -24,14 +23,11 @@ pub(super) async fn prepare_boot_artifacts(
     flash_freq: &str,
     esptool_bin: Option<&Path>,
     caller_path: Option<&str>,
-    perf: &mut crate::perf_log::PerfTimer,
 ) -> Result<()> {
     // FastLED/fbuild#1219: bare-name tool spawns below (`esptool` fallback,
     // python interpreter) resolve against the CLI caller's PATH when it was
     // forwarded; `None` keeps the daemon's spawn-time env.
     let spawn_env: Option<Vec<(&str, &str)>> = caller_path.map(|p| vec![("PATH", p)]);
-    let boot_artifacts_started = Instant::now();
-    perf.checkpoint("boot-artifacts-start");
     // SDK directory selector matching the chip's ROM revision (e.g. `esp32p4_es`
     // for ESP32-P4 eco0–eco2). The bootloader ELF must come from the same SDK
     // variant the app is linked against, or the ROM jumps into an illegal
@@ -192,8 +188,6 @@ pub(super) async fn prepare_boot_artifacts(
         std::fs::copy(&boot_app0_src, &boot_app0_dst)?;
         tracing::info!("copied boot_app0.bin");
     }
-    perf.record("boot-artifacts", boot_artifacts_started.elapsed());
-    perf.checkpoint("boot-artifacts-finish");
     Ok(())
 }
 
@@ -39,7 +39,8 @@ impl BuildOrchestrator for Esp32Orchestrator {
     async fn build(&self, params: &BuildParams) -> Result<BuildResult> {
         let start = Instant::now();
         // Env-gated per-phase timer (FBUILD_PERF_LOG=1); zero overhead when unset.
-        let mut perf = crate::perf_log::PerfTimer::new("esp32-orchestrator");
+        let mut perf = crate::perf_log::PerfTimer::new("esp32-orchestrator")
+            .with_env_session(params.env_session.clone());
 
         // Wrapper-binary discovery removed in FastLED/fbuild#800 â€” every
         // compile dispatches through the embedded zccache service.
@@ -58,6 +59,8 @@ impl BuildOrchestrator for Esp32Orchestrator {
             params.profile,
             Some(&sdkconfig),
         );
+        // Opt-in jumbo TUs for library archives (`unity_build = N`).
+        let unity = fbuild_packages::library::UnityBuild::for_env(&ctx.config, &params.env_name);
 
         // 3. Load MCU config from embedded JSON
         let mut mcu_config = get_mcu_config(&ctx.board.mcu)?;
@@ -80,6 +83,7 @@ impl BuildOrchestrator for Esp32Orchestrator {
             &ctx.board.mcu,
             &mcu_config,
             env_config,
+            params.env_session.as_deref(),
         )
         .await?;
         drop(_resolve_phase);
@@ -220,7 +224,8 @@ impl BuildOrchestrator for Esp32Orchestrator {
 
         // FastLED/fbuild#800: the `zccache start` daemon-spawn was deleted.
         // The embedded service is part of fbuild-daemon's own lifecycle.
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!(
             "ESP32 {} toolchain at {}",
             if mcu_config.is_riscv() {
@@ -231,7 +236,8 @@ impl BuildOrchestrator for Esp32Orchestrator {
             toolchain_dir.display()
         );
 
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("ESP32 framework at {}", framework_dir.display());
 
         let tc_label = if mcu_config.is_riscv() {
@@ -243,6 +249,7 @@ impl BuildOrchestrator for Esp32Orchestrator {
             &toolchain.get_gcc_path(),
             tc_label,
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -370,6 +377,7 @@ impl BuildOrchestrator for Esp32Orchestrator {
                 params.verbose,
                 jobs,
                 compiler_cache.as_deref(),
+                unity,
             )
             .await?;
 
@@ -486,6 +494,7 @@ impl BuildOrchestrator for Esp32Orchestrator {
                 &user_overlay,
                 build_dir,
                 compiler_cache.as_deref(),
+                unity,
                 &mut library_archives,
             )
             .await?;
@@ -701,14 +710,29 @@ impl BuildOrchestrator for Esp32Orchestrator {
             }
         }
 
+        // `build_pch = auto`: precompiled Arduino.h (+ ESP-IDF tree) for the
+        // sketch TUs that lead with it.
+        let sketch_pch = {
+            let _g = perf.phase("pch");
+            crate::pch::sketch_pch(
+                &ctx.config,
+                &params.env_name,
+                &params.project_dir,
+                &compiler,
+                &src_overlay,
+            )
+            .await
+        };
+
         // Compile sketch sources in parallel
         let sketch_result = {
             let _g = perf.phase("compile-sketch");
-            crate::parallel::compile_sources_parallel(
+            crate::pch::compile_sketch_sources(
                 &compiler,
                 &sources.sketch_sources,
                 src_build_dir,
                 &src_overlay,
+                sketch_pch.as_ref(),
                 jobs,
                 Some(&build_log_mutex),
             )
@@ -740,6 +764,7 @@ impl BuildOrchestrator for Esp32Orchestrator {
                 jobs,
                 params.verbose,
                 compiler_cache.as_deref(),
+                unity,
                 &mut library_archives,
             )
             .await?;
@@ -768,28 +793,6 @@ impl BuildOrchestrator for Esp32Orchestrator {
             sketch_objects.extend(embed_objects);
         }
 
-        // 11.6. Generate compile_commands.json
-        let compile_database_path = {
-            let _g = perf.phase("compile-db");
-            crate::pipeline::generate_compile_db(
-                compiler.gcc_path(),
-                compiler.gxx_path(),
-                &compiler.c_flags(),
-                &compiler.cpp_flags(),
-                &include_flags,
-                &user_overlay,
-                &src_overlay,
-                &all_core_sources,
-                &sources.sketch_sources,
-                &sources.ino_preludes,
-                core_build_dir,
-                src_build_dir,
-                build_dir,
-                &params.project_dir,
-                arch,
-            )?
-        };
-
         // 12-13. Link + convert
         // Library archives join core_objects in the archives parameter
         let mut all_archives: Vec<std::path::PathBuf> = core_objects;
@@ -814,36 +817,74 @@ impl BuildOrchestrator for Esp32Orchestrator {
         )
         .with_caller_path(params.caller_path.clone());
 
-        let link_result = {
-            let _g = perf.phase("link-convert-size");
-            crate::linker::Linker::link_all(
-                &linker,
-                &sketch_objects,
-                &all_archives,
-                build_dir,
-                &crate::linker::LinkExtraArgs {
-                    flags: ctx.overlay_link_flags.clone(),
-                    libs: ctx.overlay_link_libs.clone(),
-                    bloat_analysis: false,
-                },
-                params.symbol_analysis,
-            )
-            .await?
-        };
-
-        // 14. Prepare boot artifacts for deployment / emulation
-        prepare_boot_artifacts(
-            build_dir,
-            &params.project_dir,
-            &framework,
-            &ctx.board,
-            &mcu_config,
-            &flash_freq,
-            esptool_bin.as_ref().map(|path| path.as_path()),
-            params.caller_path.as_deref(),
-            &mut perf,
-        )
-        .await?;
+        // 12-14. Post-compile DAG: link → {convert, size, symbols} runs
+        // alongside boot-artifact staging and compile_commands.json
+        // generation, none of which depend on each other. The sync
+        // compile-db step is polled last so the link and boot subprocesses
+        // are already running while it writes.
+        perf.checkpoint("post-compile-start");
+        let link_started = Instant::now();
+        let (link_result, boot_result, compile_database_path) = tokio::join!(
+            async {
+                let result = crate::linker::Linker::link_all(
+                    &linker,
+                    &sketch_objects,
+                    &all_archives,
+                    build_dir,
+                    &crate::linker::LinkExtraArgs {
+                        flags: ctx.overlay_link_flags.clone(),
+                        libs: ctx.overlay_link_libs.clone(),
+                        bloat_analysis: false,
+                    },
+                    params.symbol_analysis,
+                )
+                .await;
+                (result, link_started.elapsed())
+            },
+            async {
+                let started = Instant::now();
+                let result = prepare_boot_artifacts(
+                    build_dir,
+                    &params.project_dir,
+                    &framework,
+                    &ctx.board,
+                    &mcu_config,
+                    &flash_freq,
+                    esptool_bin.as_ref().map(|path| path.as_path()),
+                    params.caller_path.as_deref(),
+                )
+                .await;
+                (result, started.elapsed())
+            },
+            async {
+                let started = Instant::now();
+                let result = crate::pipeline::generate_compile_db(
+                    compiler.gcc_path(),
+                    compiler.gxx_path(),
+                    &compiler.c_flags(),
+                    &compiler.cpp_flags(),
+                    &include_flags,
+                    &user_overlay,
+                    &src_overlay,
+                    &all_core_sources,
+                    &sources.sketch_sources,
+                    &sources.ino_preludes,
+                    core_build_dir,
+                    src_build_dir,
+                    build_dir,
+                    &params.project_dir,
+                    arch,
+                );
+                (result, started.elapsed())
+            },
+        );
+        perf.record("link-convert-size", link_result.1);
+        perf.record("boot-artifacts", boot_result.1);
+        perf.record("compile-db", compile_database_path.1);
+        perf.checkpoint("post-compile-finish");
+        let link_result = link_result.0?;
+        boot_result.0?;
+        let compile_database_path = compile_database_path.0?;
 
         // 15. Size reporting + result assembly
         let fingerprint_started = Instant::now();
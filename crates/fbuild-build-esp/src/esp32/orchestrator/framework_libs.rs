@@ -35,6 +35,7 @@ pub(super) async fn compile_framework_builtin_libs(
     user_overlay: &LanguageExtraFlags,
     build_dir: &Path,
     compiler_cache: Option<&Path>,
+    unity: Option<fbuild_packages::library::UnityBuild>,
     library_archives: &mut Vec<PathBuf>,
 ) -> Result<()> {
     use fbuild_packages::Toolchain;
@@ -227,6 +228,7 @@ pub(super) async fn compile_framework_builtin_libs(
                 compiler_cache,
                 fw_compile_cwd.clone(),
                 Some(lib_backend.clone()),
+                unity,
             )
             .await
             {
@@ -21,6 +21,7 @@ pub(super) async fn compile_local_libraries(
     jobs: usize,
     verbose: bool,
     compiler_cache: Option<&Path>,
+    unity: Option<fbuild_packages::library::UnityBuild>,
     library_archives: &mut Vec<PathBuf>,
 ) -> Result<()> {
     use fbuild_packages::Toolchain;
@@ -85,6 +86,7 @@ pub(super) async fn compile_local_libraries(
             compiler_cache,
             None,
             None,
+            unity,
         )
         .await
         {
@@ -41,3 +41,4 @@ mod tests;
 pub struct Esp32Orchestrator;
 
 pub use cdc::{cdc_on_boot_enabled, create, is_esp32_project, warn_if_cdc_on_boot};
+pub use packages::prefetch_packages;
@@ -6,6 +6,19 @@ use std::path::Path;
 use fbuild_core::Result;
 use fbuild_core::path::NormalizedPath;
 
+/// Install everything [`resolve_pioarduino_packages`] resolves for `mcu`
+/// without building: the `fbuild prefetch` path for ESP32 envs.
+pub async fn prefetch_packages(
+    project_dir: &Path,
+    mcu: &str,
+    env_config: &HashMap<String, String>,
+    session: Option<&crate::env_session::EnvSession>,
+) -> Result<()> {
+    let mcu_config = super::super::mcu_config::get_mcu_config(mcu)?;
+    resolve_pioarduino_packages(project_dir, mcu, &mcu_config, Some(env_config), session).await?;
+    Ok(())
+}
+
 /// Resolve framework + toolchain for pioarduino mode (GCC 14 + ESP-IDF 5.x).
 ///
 /// Downloads pioarduino platform.json, resolves toolchain via metadata,
@@ -16,11 +29,15 @@ use fbuild_core::path::NormalizedPath;
 /// `platform-espressif32` and `framework-arduinoespressif32`
 /// (FastLED/fbuild#672). Pass `None` if no env is in scope (cold-cache /
 /// diagnostic paths) — both packages will fall back to their pinned defaults.
+///
+/// `session` shares the installs with the other sketches of a `compile-many`
+/// batch (see [`crate::env_session`]).
 pub(super) async fn resolve_pioarduino_packages(
     project_dir: &Path,
     mcu: &str,
     mcu_config: &super::super::mcu_config::Esp32McuConfig,
     env_config: Option<&HashMap<String, String>>,
+    session: Option<&crate::env_session::EnvSession>,
 ) -> Result<(
     fbuild_packages::toolchain::Esp32Toolchain,
     fbuild_packages::library::Esp32Framework,
@@ -37,7 +54,7 @@ pub(super) async fn resolve_pioarduino_packages(
         Some(o) => fbuild_packages::library::Esp32Platform::with_override(project_dir, o),
         None => fbuild_packages::library::Esp32Platform::new(project_dir),
     };
-    fbuild_packages::Package::ensure_installed(&platform).await?;
+    crate::pipeline::ensure_installed(session, &platform).await?;
 
     // Resolve toolchain via metadata
     let toolchain = resolve_and_create_toolchain(&platform, project_dir, mcu_config)?;
@@ -96,9 +113,9 @@ pub(super) async fn resolve_pioarduino_packages(
             .ok()
     };
 
-    let toolchain_fut = fbuild_packages::Package::ensure_installed(&toolchain);
+    let toolchain_fut = crate::pipeline::ensure_installed(session, &toolchain);
     let framework_fut = async {
-        fbuild_packages::Package::ensure_installed(&framework).await?;
+        crate::pipeline::ensure_installed(session, &framework).await?;
         // Ensure SDK libs (split package in pioarduino 3.3.7+).
         if let Some(url) = &libs_url {
             framework.ensure_libs(url, mcu).await?;
@@ -336,6 +336,10 @@ impl Linker for Esp8266Linker {
         &self.size_path
     }
 
+    fn core_archiver(&self) -> Option<(&Path, &'static str)> {
+        Some((&self.ar_path, "xtensa-lx106-elf-ar"))
+    }
+
     fn ar_tool_path(&self) -> Option<&Path> {
         Some(&self.ar_path)
     }
@@ -58,7 +58,8 @@ impl BuildOrchestrator for Esp8266Orchestrator {
 
         // 3. Ensure toolchain
         let toolchain = fbuild_packages::toolchain::Esp8266Toolchain::new(&params.project_dir);
-        let _toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let _toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("ESP8266 toolchain ready");
 
         use fbuild_packages::Toolchain as _;
@@ -66,6 +67,7 @@ impl BuildOrchestrator for Esp8266Orchestrator {
             &toolchain.get_gcc_path(),
             "xtensa-lx106-elf-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -84,7 +86,8 @@ impl BuildOrchestrator for Esp8266Orchestrator {
             }
             None => fbuild_packages::library::Esp8266Framework::new(&params.project_dir),
         };
-        let _framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let _framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("ESP8266 framework ready");
         let board_id = ctx
             .config
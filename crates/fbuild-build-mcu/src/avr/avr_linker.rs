@@ -118,15 +118,18 @@ impl AvrLinker {
 
         // Archives (already partitioned by `link()`): the framework archive
         // synthesised from raw `.o` framework objects + any real `.a` files
-        // passed in. Archive-member selection drops unreferenced members so
-        // unused-but-not-eliminable ISRs (e.g. Tone.cpp __vector_1/3 on AVR)
-        // no longer get pulled in. See FastLED/fbuild#304.
+        // passed in (including the core archive the pipeline prebuilds, see
+        // `Linker::core_archiver`). Archive-member selection drops
+        // unreferenced members so unused-but-not-eliminable ISRs (e.g.
+        // Tone.cpp __vector_1/3 on AVR) no longer get pulled in. See
+        // FastLED/fbuild#304. They sit inside the group so cross-archive
+        // references resolve regardless of order, as in a single archive.
+        args.push("-Wl,--start-group".to_string());
         for archive in archives {
             args.push(archive.to_string_lossy().to_string());
         }
 
-        // Group for circular deps + libraries from config
-        args.push("-Wl,--start-group".to_string());
+        // Libraries from config, in the same group for circular deps
         args.extend(self.mcu_config.linker_libs.iter().cloned());
         args.extend(extra.libs.iter().cloned());
         args.push("-Wl,--end-group".to_string());
@@ -221,6 +224,10 @@ impl Linker for AvrLinker {
         &self.size_path
     }
 
+    fn core_archiver(&self) -> Option<(&Path, &'static str)> {
+        Some((&self.gcc_ar_path, "avr-gcc-ar"))
+    }
+
     fn ar_tool_path(&self) -> Option<&Path> {
         Some(&self.ar_path)
     }
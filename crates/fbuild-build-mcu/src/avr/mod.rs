@@ -26,6 +26,24 @@ impl crate::PlatformSupport for AvrPlatformSupport {
         Ok(())
     }
 
+    async fn prefetch(
+        &self,
+        project_dir: &std::path::Path,
+        board: &fbuild_config::BoardConfig,
+        env_config: &std::collections::HashMap<String, String>,
+        session: Option<&crate::env_session::EnvSession>,
+    ) -> fbuild_core::Result<()> {
+        let tc = fbuild_packages::toolchain::AvrToolchain::new(project_dir);
+        let (toolchain, framework) = tokio::join!(
+            crate::pipeline::ensure_installed(session, &tc),
+            orchestrator::prefetch_framework(project_dir, board, env_config, session),
+        );
+        toolchain?;
+        framework?;
+        tracing::info!("AVR packages for {} installed", board.mcu);
+        Ok(())
+    }
+
     fn default_board_id(&self) -> &str {
         "uno"
     }
@@ -76,7 +76,8 @@ impl BuildOrchestrator for AvrOrchestrator {
     async fn build(&self, params: &BuildParams) -> Result<BuildResult> {
         let start = Instant::now();
         // Env-gated per-phase timer (FBUILD_PERF_LOG=1); zero-overhead when unset.
-        let mut perf = crate::perf_log::PerfTimer::new("avr-orchestrator");
+        let mut perf = crate::perf_log::PerfTimer::new("avr-orchestrator")
+            .with_env_session(params.env_session.clone());
 
         // Wrapper-binary discovery removed in FastLED/fbuild#800 â€” every
         // compile dispatches through the embedded zccache service. The
@@ -100,14 +101,21 @@ impl BuildOrchestrator for AvrOrchestrator {
         let (toolchain, toolchain_dir) = {
             let _g = perf.phase("toolchain-ensure");
             let toolchain = fbuild_packages::toolchain::AvrToolchain::new(&params.project_dir);
-            let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+            let toolchain_dir =
+                crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain)
+                    .await?;
             (toolchain, toolchain_dir)
         };
         tracing::info!("avr-gcc toolchain at {}", toolchain_dir.display());
 
         use fbuild_packages::Toolchain as _;
-        pipeline::log_toolchain_version(&toolchain.get_gcc_path(), "avr-gcc", &mut ctx.build_log)
-            .await;
+        pipeline::log_toolchain_version(
+            &toolchain.get_gcc_path(),
+            "avr-gcc",
+            &mut ctx.build_log,
+            params.env_session.as_deref(),
+        )
+        .await;
 
         // 4. Ensure Arduino core
         //
@@ -139,6 +147,7 @@ impl BuildOrchestrator for AvrOrchestrator {
                 ctx.board.platform(),
                 __avr_ovr,
                 __attiny_ovr,
+                params.env_session.as_deref(),
             )
             .await?
         };
@@ -387,6 +396,27 @@ pub fn create() -> Box<dyn BuildOrchestrator> {
     Box::new(AvrOrchestrator)
 }
 
+/// Install the Arduino core a build of `board` uses, honoring the env's
+/// `platform_packages` overrides: the `fbuild prefetch` path for AVR envs.
+pub async fn prefetch_framework(
+    project_dir: &Path,
+    board: &fbuild_config::BoardConfig,
+    env_config: &std::collections::HashMap<String, String>,
+    session: Option<&crate::env_session::EnvSession>,
+) -> Result<()> {
+    ensure_avr_framework(
+        project_dir,
+        &board.core,
+        &board.variant,
+        board.platform(),
+        crate::package_override::resolve_override(env_config, "framework-arduino-avr"),
+        crate::package_override::resolve_override(env_config, "framework-arduino-avr-attiny"),
+        session,
+    )
+    .await?;
+    Ok(())
+}
+
 /// Select and install the correct AVR Arduino framework based on the board's core name.
 ///
 /// Uses the data-driven `avr_frameworks.json` registry to resolve the correct
@@ -410,9 +440,8 @@ async fn ensure_avr_framework(
     platform: Option<fbuild_core::Platform>,
     avr_override: Option<fbuild_config::PackageOverride>,
     attiny_override: Option<fbuild_config::PackageOverride>,
+    session: Option<&crate::env_session::EnvSession>,
 ) -> fbuild_core::Result<(PathBuf, PathBuf, PathBuf)> {
-    use fbuild_packages::Package;
-
     // megaAVR boards (e.g. nano_every) share core name "arduino" with standard AVR
     // but need ArduinoCore-megaavr instead of ArduinoCore-avr.
     let lookup_key =
@@ -443,7 +472,7 @@ async fn ensure_avr_framework(
         )?,
         None => fbuild_packages::library::AvrFramework::for_core(lookup_key, project_dir)?,
     };
-    let framework_dir = framework.ensure_installed().await?;
+    let framework_dir = pipeline::ensure_installed(session, &framework).await?;
     tracing::info!(
         "AVR framework for core '{}' (lookup '{}') at {}",
         core_name,
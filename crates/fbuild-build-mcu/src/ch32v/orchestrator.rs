@@ -59,7 +59,8 @@ impl BuildOrchestrator for Ch32vOrchestrator {
 
         // 3. Ensure RISC-V GCC toolchain
         let toolchain = fbuild_packages::toolchain::RiscvToolchain::new(&params.project_dir);
-        let toolchain_dir = fbuild_packages::Package::ensure_installed(&toolchain).await?;
+        let toolchain_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &toolchain).await?;
         tracing::info!("riscv-gcc toolchain at {}", toolchain_dir.display());
 
         use fbuild_packages::Toolchain;
@@ -67,6 +68,7 @@ impl BuildOrchestrator for Ch32vOrchestrator {
             &toolchain.get_gcc_path(),
             "riscv-none-elf-gcc",
             &mut ctx.build_log,
+            params.env_session.as_deref(),
         )
         .await;
 
@@ -83,7 +85,8 @@ impl BuildOrchestrator for Ch32vOrchestrator {
             Some(o) => fbuild_packages::library::Ch32vCores::with_override(&params.project_dir, o),
             None => fbuild_packages::library::Ch32vCores::new(&params.project_dir),
         };
-        let framework_dir = fbuild_packages::Package::ensure_installed(&framework).await?;
+        let framework_dir =
+            crate::pipeline::ensure_installed(params.env_session.as_deref(), &framework).await?;
         tracing::info!("CH32V cores at {}", framework_dir.display());
 
         // 5. Resolve series/variant selection used by both scanning and compile flags.
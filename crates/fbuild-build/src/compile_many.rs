@@ -50,15 +50,33 @@
 //! installation, LDF, link flags, size reporting) lives in one place and
 //! `compile-many` automatically picks up future per-platform work without
 //! re-implementing it.
+//!
+//! Every sketch of one call shares a single [`EnvSession`] through
+//! `BuildParams::env_session`, so env-level steps the orchestrators repeat
+//! per sketch (package installs, the toolchain version probe, the framework
+//! library index) run once per batch in-process. The session also collects
+//! the orchestrators' phase timings, reported as
+//! [`CompileManyResult::stage_timings`].
+//!
+//! Stage 2 dispatches sketches grouped by a pre-build library signature
+//! (see `schedule`), so sketches with the same libraries build one after
+//! another against a warm zccache instead of missing it side by side.
+//! [`compile_many_streaming`] hands each result to the caller as it lands,
+//! and [`CompileManyRequest::fail_fast`] aborts the batch at the first
+//! failure.
 
 use std::collections::HashMap;
 use std::path::{Path, PathBuf};
+use std::sync::Arc;
 use std::time::Instant;
 
 use fbuild_core::{BuildProfile, FbuildError, Platform, Result};
 
+use crate::env_session::{EnvSession, StageTiming};
 use crate::{BuildParams, BuildResult, get_orchestrator};
 
+mod schedule;
+
 /// Default for `--framework-jobs` when not specified: `min(cores, 2)`.
 ///
 /// Framework compilation is memory-heavy; a 2-core `ubuntu-latest` runner
@@ -193,7 +211,7 @@ pub fn stage2_jobs_per_worker(sketch_jobs: usize) -> usize {
 }
 
 /// Request parameters for [`compile_many`].
-#[derive(Debug, Clone)]
+#[derive(Debug, Clone, serde::Serialize, serde::Deserialize)]
 pub struct CompileManyRequest {
     /// Board id (e.g. "uno", "teensy41"). Used to pick the matching
     /// environment within each sketch's `platformio.ini` and to dispatch
@@ -219,10 +237,14 @@ pub struct CompileManyRequest {
     pub pio_env: HashMap<String, String>,
     /// Emit per-stage-2 worker diagnostics in the final result.
     pub diag_stage2: bool,
+    /// Stop at the first failed sketch: queued stage-2 sketches never start
+    /// and in-flight ones are aborted, each reported as cancelled.
+    #[serde(default)]
+    pub fail_fast: bool,
 }
 
 /// Result for a single sketch.
-#[derive(Debug, Clone)]
+#[derive(Debug, Clone, serde::Serialize, serde::Deserialize)]
 pub struct SketchResult {
     /// Sketch project directory (matches the request entry).
     pub sketch: PathBuf,
@@ -252,7 +274,7 @@ pub struct SketchResult {
 }
 
 /// Which stage compiled a sketch.
-#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+#[derive(Debug, Clone, Copy, PartialEq, Eq, serde::Serialize, serde::Deserialize)]
 pub enum Stage {
     /// First sketch: built sequentially to warm framework/library archives.
     Stage1Framework,
@@ -261,7 +283,7 @@ pub enum Stage {
 }
 
 /// Final result of a `compile-many` invocation.
-#[derive(Debug, Clone)]
+#[derive(Debug, Clone, serde::Serialize, serde::Deserialize)]
 pub struct CompileManyResult {
     /// One entry per requested sketch, in input order.
     pub results: Vec<SketchResult>,
@@ -277,6 +299,9 @@ pub struct CompileManyResult {
     pub stage2_secs: f64,
     /// Wall-clock for the entire `compile-many` call.
     pub total_secs: f64,
+    /// Per-stage wall clock summed over every sketch, from the batch's
+    /// shared [`EnvSession`], sorted by stage name.
+    pub stage_timings: Vec<(String, StageTiming)>,
 }
 
 impl CompileManyResult {
@@ -349,6 +374,7 @@ async fn build_one_sketch(inputs: SketchBuildInputs) -> SketchResult {
         verbose,
         stage,
         pio_env,
+        env_session,
     } = inputs;
     let start = Instant::now();
     let build_dir = fbuild_packages::Cache::new(&sketch).get_build_dir(&env_name, profile);
@@ -372,6 +398,7 @@ async fn build_one_sketch(inputs: SketchBuildInputs) -> SketchResult {
         pio_env: pio_env.into_iter().collect(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -458,6 +485,8 @@ pub struct SketchBuildInputs {
     pub stage: Stage,
     /// `PLATFORMIO_*` env-var overlay forwarded to `BuildParams.pio_env`.
     pub pio_env: HashMap<String, String>,
+    /// The batch's shared env context, forwarded to `BuildParams.env_session`.
+    pub env_session: Option<Arc<EnvSession>>,
 }
 
 /// Trait used by [`compile_many_with`] to run a single sketch. Tests
@@ -486,7 +515,8 @@ impl SketchBuilder for OrchestratorBuilder {
 /// Run the two-stage `compile-many` flow.
 ///
 /// Returns once every sketch has been attempted. Individual sketch failures
-/// do not short-circuit subsequent sketches â€” the caller inspects
+/// do not short-circuit subsequent sketches unless
+/// [`CompileManyRequest::fail_fast`] is set â€” the caller inspects
 /// [`CompileManyResult::all_success`] / [`CompileManyResult::results`].
 pub async fn compile_many(req: CompileManyRequest) -> Result<CompileManyResult> {
     compile_many_with(req, &OrchestratorBuilder).await
@@ -498,6 +528,19 @@ pub async fn compile_many(req: CompileManyRequest) -> Result<CompileManyResult>
 pub async fn compile_many_with(
     req: CompileManyRequest,
     builder: &(dyn SketchBuilder + Send + Sync),
+) -> Result<CompileManyResult> {
+    compile_many_streaming(req, builder, &|_| {}).await
+}
+
+/// Like [`compile_many_with`], additionally handing each sketch's result to
+/// `on_result` as soon as it finishes, in completion order rather than input
+/// order.
+/// Sketches cancelled by `fail_fast` are reported too, so `on_result` sees
+/// every sketch the returned result contains.
+pub async fn compile_many_streaming(
+    req: CompileManyRequest,
+    builder: &(dyn SketchBuilder + Send + Sync),
+    on_result: &(dyn Fn(&SketchResult) + Send + Sync),
 ) -> Result<CompileManyResult> {
     if req.sketches.is_empty() {
         return Err(FbuildError::Other(
@@ -535,6 +578,7 @@ pub async fn compile_many_with(
     }
 
     let total_start = Instant::now();
+    let session = Arc::new(EnvSession::new());
 
     // -------- Stage 1: build the first sketch sequentially. --------
     //
@@ -558,9 +602,11 @@ pub async fn compile_many_with(
             verbose: req.verbose,
             stage: Stage::Stage1Framework,
             pio_env: req.pio_env.clone(),
+            env_session: Some(Arc::clone(&session)),
         })
         .await;
     let stage1_secs = stage1_start.elapsed().as_secs_f64();
+    on_result(&first_result);
 
     // If stage 1 failed there is no point fanning out â€” every stage-2
     // worker would re-run the framework build (which we just proved
@@ -575,6 +621,7 @@ pub async fn compile_many_with(
             stage1_secs,
             stage2_secs: 0.0,
             total_secs,
+            stage_timings: report_stage_timings(&session),
         });
     }
 
@@ -593,17 +640,18 @@ pub async fn compile_many_with(
     let stage2_results = if rest.is_empty() {
         Vec::new()
     } else {
+        let stage1_signature = schedule::library_signature(&stage1_sketch, &stage1_env);
         run_stage2(
             &rest,
             platform,
-            req.profile,
             sketch_jobs,
-            req.verbose,
             builder,
-            &req.pio_env,
+            &req,
             stage1_core_seed.as_deref(),
             &stage1_env,
-            req.diag_stage2,
+            &stage1_signature,
+            &session,
+            on_result,
         )
         .await
     };
@@ -625,39 +673,85 @@ pub async fn compile_many_with(
         stage1_secs,
         stage2_secs,
         total_secs,
+        stage_timings: report_stage_timings(&session),
     })
 }
 
+/// Snapshot the session's stage timings and log them at debug level.
+fn report_stage_timings(session: &EnvSession) -> Vec<(String, StageTiming)> {
+    let timings = session.stage_timings();
+    for (stage, t) in &timings {
+        tracing::debug!(
+            "compile-many stage {}: {:.3}s over {} runs, {} reused",
+            stage,
+            t.secs,
+            t.runs,
+            t.reused
+        );
+    }
+    timings
+}
+
 /// Run stage-2 workers across `rest` with up to `sketch_jobs` concurrent
 /// threads. Preserves input order in the returned `Vec`.
 ///
+/// Sketches are dispatched in [`schedule::plan`] order: those sharing stage
+/// 1's library signature first, then one leader per other library group,
+/// then the rest of each group once its leader has finished. Every result
+/// goes to `on_result` as it completes; with `req.fail_fast` the first
+/// failure aborts every queued and in-flight worker.
+///
 /// `stage1_core_seed` is the path to stage 1's framework `core/` dir; when
 /// `Some` and the worker's resolved env matches `stage1_env`, the worker
 /// hardlinks every framework artifact into its own per-sketch `core/`
 /// before calling the orchestrator, so the framework recompile is skipped
 /// (FastLED/fbuild#335). Pass `None` to disable seeding (e.g. stage 1
-/// failed).
+/// failed). Every worker shares `session` with stage 1.
 #[allow(clippy::too_many_arguments)]
 async fn run_stage2(
     rest: &[(PathBuf, String)],
     platform: Platform,
-    profile: BuildProfile,
     sketch_jobs: usize,
-    verbose: bool,
     builder: &(dyn SketchBuilder + Send + Sync),
-    pio_env: &HashMap<String, String>,
+    req: &CompileManyRequest,
     stage1_core_seed: Option<&Path>,
     stage1_env: &str,
-    diag_stage2: bool,
+    stage1_signature: &str,
+    session: &Arc<EnvSession>,
+    on_result: &(dyn Fn(&SketchResult) + Send + Sync),
 ) -> Vec<SketchResult> {
     let total = rest.len();
     let cap = sketch_jobs.min(total).max(1);
+    let signatures: Vec<String> = rest
+        .iter()
+        .map(|(sketch, env)| schedule::library_signature(sketch, env))
+        .collect();
+    let order = schedule::plan(&signatures, stage1_signature);
+    let groups = signatures
+        .iter()
+        .collect::<std::collections::BTreeSet<_>>()
+        .len();
     tracing::info!(
-        "compile-many stage 2: {} sketches across {} workers",
+        "compile-many stage 2: {} sketches in {} library groups across {} workers",
         total,
+        groups,
         cap
     );
 
+    // A group leader publishes `true` once its build returns; the rest of
+    // its group waits for that before taking a worker slot. An aborted
+    // leader drops its sender, which releases the waiters as well.
+    let mut leader_done: HashMap<usize, tokio::sync::watch::Sender<bool>> = HashMap::new();
+    let mut wait_for_leader: HashMap<usize, tokio::sync::watch::Receiver<bool>> = HashMap::new();
+    for slot in &order {
+        if let Some(leader) = slot.after {
+            let done = leader_done
+                .entry(leader)
+                .or_insert_with(|| tokio::sync::watch::channel(false).0);
+            wait_for_leader.insert(slot.index, done.subscribe());
+        }
+    }
+
     // FastLED/fbuild#820 (Phase B of #813): replaces the old
     // `std::thread::scope` worker-pool with a `tokio::task::JoinSet`
     // gated by a semaphore. Each per-sketch task `.await`s the async
@@ -674,16 +768,24 @@ async fn run_stage2(
         unsafe { std::mem::transmute(builder) };
     let stage1_env_owned = stage1_env.to_string();
     let stage1_core_seed_owned: Option<PathBuf> = stage1_core_seed.map(|p| p.to_path_buf());
+    let (profile, verbose, diag_stage2) = (req.profile, req.verbose, req.diag_stage2);
 
-    for (idx, entry) in rest.iter().enumerate() {
-        let sketch = entry.0.clone();
-        let env_name = entry.1.clone();
-        let pio_env = pio_env.clone();
+    for (position, slot) in order.iter().enumerate() {
+        let idx = slot.index;
+        let sketch = rest[idx].0.clone();
+        let env_name = rest[idx].1.clone();
+        let pio_env = req.pio_env.clone();
         let sem = semaphore.clone();
         let seed = stage1_core_seed_owned.clone();
         let stage1_env_cloned = stage1_env_owned.clone();
-        let worker_index = idx % cap;
+        let env_session = Some(Arc::clone(session));
+        let worker_index = position % cap;
+        let wait = wait_for_leader.remove(&idx);
+        let done = leader_done.remove(&idx);
         joinset.spawn(async move {
+            if let Some(mut wait) = wait {
+                let _ = wait.wait_for(|finished| *finished).await;
+            }
             let _permit = sem.acquire().await.expect("compile-many semaphore closed");
             let seed_started = Instant::now();
             let mut seed_applied = false;
@@ -714,8 +816,12 @@ async fn run_stage2(
                     verbose,
                     stage: Stage::Stage2Sketch,
                     pio_env,
+                    env_session,
                 })
                 .await;
+            if let Some(done) = done {
+                done.send_replace(true);
+            }
             res.worker_index = Some(worker_index);
             res.seed_time_secs = seed_time_secs;
             res.seed_applied = seed_applied;
@@ -737,9 +843,25 @@ async fn run_stage2(
     }
 
     let mut results: Vec<Option<SketchResult>> = (0..total).map(|_| None).collect();
+    let mut failed_first: Option<String> = None;
     while let Some(joined) = joinset.join_next().await {
         match joined {
-            Ok((idx, res)) => results[idx] = Some(res),
+            Ok((idx, res)) => {
+                on_result(&res);
+                if req.fail_fast && !res.success && failed_first.is_none() {
+                    tracing::warn!(
+                        "compile-many stage 2: {} failed; cancelling the remaining sketches",
+                        res.sketch.display()
+                    );
+                    failed_first = Some(res.sketch.display().to_string());
+                    // Same teardown as the single-build cancel path
+                    // (FastLED/fbuild#853): abort, then keep draining so each
+                    // task's drops run and kill its in-flight compilers.
+                    joinset.abort_all();
+                }
+                results[idx] = Some(res);
+            }
+            Err(e) if e.is_cancelled() => {}
             Err(e) => {
                 tracing::error!("compile-many stage 2 worker join error: {e}");
             }
@@ -747,214 +869,38 @@ async fn run_stage2(
     }
     results
         .into_iter()
-        .map(|slot| slot.expect("stage-2 worker filled every slot"))
+        .zip(rest)
+        .map(|(slot, (sketch, env_name))| {
+            slot.unwrap_or_else(|| {
+                let message = match &failed_first {
+                    Some(failed) => format!("cancelled: {failed} failed (fail-fast)"),
+                    None => "stage-2 worker exited without a result".to_string(),
+                };
+                let res = unbuilt_result(sketch, env_name, message);
+                on_result(&res);
+                res
+            })
+        })
         .collect()
 }
 
-#[cfg(test)]
-mod tests {
-    use super::*;
-
-    #[test]
-    fn default_framework_jobs_is_at_least_one_and_at_most_two() {
-        let n = default_framework_jobs();
-        assert!(n >= 1, "framework jobs must be >= 1");
-        assert!(
-            n <= 2,
-            "framework jobs default must be capped at 2 (got {n})"
-        );
-    }
-
-    #[test]
-    fn default_sketch_jobs_is_at_least_one() {
-        assert!(default_sketch_jobs() >= 1);
-    }
-
-    /// `seed_stage2_core_from_stage1` is the foundation of the
-    /// framework-archive-sharing fix for FastLED/fbuild#335. It must
-    /// (a) be a no-op when the source dir is missing, (b) populate the
-    /// target dir from the source, and (c) skip files that already
-    /// exist at the target so a pre-existing partial stage-2 build
-    /// isn't clobbered.
-    #[test]
-    fn seed_stage2_core_no_op_when_source_missing() {
-        let tmp = tempfile::tempdir().unwrap();
-        let absent_source = tmp.path().join("missing");
-        let target = tmp.path().join("target");
-        assert!(seed_stage2_core_from_stage1(&absent_source, &target).is_ok());
-        // Must not create the target dir for an absent source â€” otherwise
-        // we'd leave litter on disk for envs that don't match.
-        assert!(!target.exists());
-    }
-
-    #[test]
-    fn seed_stage2_core_copies_or_links_each_file() {
-        let tmp = tempfile::tempdir().unwrap();
-        let stage1 = tmp.path().join("stage1");
-        let stage2 = tmp.path().join("stage2");
-        std::fs::create_dir_all(&stage1).unwrap();
-        for (name, body) in [
-            ("CDC.cpp.o", b"OBJ"),
-            ("CDC.cpp.d", b"DEP"),
-            ("CDC.cpp.cmdhash", b"HSH"),
-        ] {
-            std::fs::write(stage1.join(name), body).unwrap();
-        }
-        seed_stage2_core_from_stage1(&stage1, &stage2).unwrap();
-        for name in ["CDC.cpp.o", "CDC.cpp.d", "CDC.cpp.cmdhash"] {
-            let dst = stage2.join(name);
-            assert!(dst.exists(), "expected seeded {name} at {}", dst.display());
-            // Same content, regardless of whether we hardlinked or copied.
-            assert_eq!(
-                std::fs::read(stage1.join(name)).unwrap(),
-                std::fs::read(&dst).unwrap(),
-            );
-        }
-    }
-
-    #[test]
-    fn seed_stage2_core_skips_files_already_present_at_target() {
-        // Mirrors the worker-restart case: a previous stage-2 attempt
-        // partially populated the target before crashing. The seed must
-        // not overwrite, because the existing file may already encode
-        // local progress (e.g. the orchestrator wrote a fresher
-        // `.cmdhash` while computing the same artifact).
-        let tmp = tempfile::tempdir().unwrap();
-        let stage1 = tmp.path().join("stage1");
-        let stage2 = tmp.path().join("stage2");
-        std::fs::create_dir_all(&stage1).unwrap();
-        std::fs::create_dir_all(&stage2).unwrap();
-        std::fs::write(stage1.join("CDC.cpp.o"), b"FROM_STAGE_1").unwrap();
-        std::fs::write(stage2.join("CDC.cpp.o"), b"FROM_STAGE_2_PARTIAL").unwrap();
-        seed_stage2_core_from_stage1(&stage1, &stage2).unwrap();
-        assert_eq!(
-            std::fs::read(stage2.join("CDC.cpp.o")).unwrap(),
-            b"FROM_STAGE_2_PARTIAL"
-        );
-    }
-
-    #[test]
-    fn project_build_dir_matches_orchestrator_convention() {
-        // Locks the on-disk convention the AVR/ESP32/etc. orchestrators
-        // all derive their per-(env,profile) build root from. Any change
-        // here that doesn't also update the orchestrators will silently
-        // break the stage-1â†’stage-2 core/ handoff in FastLED/fbuild#335.
-        let p = project_build_dir(Path::new("/tmp/sketch"), "uno", BuildProfile::Release);
-        assert!(p.ends_with("sketch/.fbuild/build/uno/release"));
-        let q = project_build_dir(Path::new("/tmp/sketch"), "esp32s3", BuildProfile::Quick);
-        assert!(q.ends_with("sketch/.fbuild/build/esp32s3/quick"));
-    }
-
-    /// FastLED stages each board's project at
-    /// `<repo>/.build/pio/<board>/` and asks fbuild to build with
-    /// `env == board`. `project_build_dir` must collapse the duplicate
-    /// `<board>` segment (via `BuildLayout`'s auto-detect rule) so the
-    /// resulting tree fits under Windows' 260-char `MAX_PATH` limit and
-    /// matches what `find_firmware` looks for. See FastLED/fbuild#432.
-    #[test]
-    fn project_build_dir_collapses_when_sketch_basename_matches_env() {
-        let sketch = Path::new("/repo/.build/pio/teensy40");
-        let p = project_build_dir(sketch, "teensy40", BuildProfile::Release);
-        let s = p.to_string_lossy().to_string();
-        assert!(
-            !s.contains("build/teensy40/release") && !s.contains("build\\teensy40\\release"),
-            "stage-2 build dir kept duplicated env segment: {s}"
-        );
-        assert!(p.ends_with("release"));
-    }
-
-    #[test]
-    fn resolve_env_picks_literal_env_name() {
-        let tmp = tempfile::tempdir().unwrap();
-        std::fs::write(
-            tmp.path().join("platformio.ini"),
-            "[env:uno]\nplatform = atmelavr\nboard = uno\nframework = arduino\n",
-        )
-        .unwrap();
-        assert_eq!(resolve_env_for_board(tmp.path(), "uno").unwrap(), "uno");
-    }
-
-    #[test]
-    fn resolve_env_falls_back_to_board_match() {
-        let tmp = tempfile::tempdir().unwrap();
-        std::fs::write(
-            tmp.path().join("platformio.ini"),
-            "[env:my_custom]\nplatform = atmelavr\nboard = uno\nframework = arduino\n",
-        )
-        .unwrap();
-        assert_eq!(
-            resolve_env_for_board(tmp.path(), "uno").unwrap(),
-            "my_custom"
-        );
-    }
-
-    #[test]
-    fn resolve_env_errors_on_no_match() {
-        let tmp = tempfile::tempdir().unwrap();
-        std::fs::write(
-            tmp.path().join("platformio.ini"),
-            "[env:uno]\nplatform = atmelavr\nboard = uno\nframework = arduino\n",
-        )
-        .unwrap();
-        assert!(resolve_env_for_board(tmp.path(), "teensy41").is_err());
-    }
-
-    #[test]
-    fn platform_for_board_uno_is_avr() {
-        let p = platform_for_board("uno", None).unwrap();
-        assert_eq!(p, Platform::AtmelAvr);
-    }
-
-    #[tokio::test]
-    async fn empty_sketch_list_errors_out() {
-        let req = CompileManyRequest {
-            board: "uno".to_string(),
-            sketches: Vec::new(),
-            framework_jobs: None,
-            sketch_jobs: None,
-            profile: BuildProfile::Release,
-            verbose: false,
-            pio_env: HashMap::new(),
-            diag_stage2: false,
-        };
-        assert!(compile_many(req).await.is_err());
-    }
-
-    #[tokio::test]
-    async fn missing_sketch_dir_errors_out() {
-        let tmp = tempfile::tempdir().unwrap();
-        let missing = tmp.path().join("nope");
-        let req = CompileManyRequest {
-            board: "uno".to_string(),
-            sketches: vec![missing],
-            framework_jobs: None,
-            sketch_jobs: None,
-            profile: BuildProfile::Release,
-            verbose: false,
-            pio_env: HashMap::new(),
-            diag_stage2: false,
-        };
-        assert!(compile_many(req).await.is_err());
-    }
-
-    #[tokio::test]
-    async fn sketch_without_matching_board_errors_out() {
-        let tmp = tempfile::tempdir().unwrap();
-        std::fs::write(
-            tmp.path().join("platformio.ini"),
-            "[env:uno]\nplatform = atmelavr\nboard = uno\nframework = arduino\n",
-        )
-        .unwrap();
-        let req = CompileManyRequest {
-            board: "esp32dev".to_string(),
-            sketches: vec![tmp.path().to_path_buf()],
-            framework_jobs: None,
-            sketch_jobs: None,
-            profile: BuildProfile::Release,
-            verbose: false,
-            pio_env: HashMap::new(),
-            diag_stage2: false,
-        };
-        assert!(compile_many(req).await.is_err());
+/// Failed stage-2 result for a sketch whose build never returned.
+fn unbuilt_result(sketch: &Path, env_name: &str, message: String) -> SketchResult {
+    SketchResult {
+        sketch: sketch.to_path_buf(),
+        env_name: env_name.to_string(),
+        success: false,
+        firmware_path: None,
+        elf_path: None,
+        build_time_secs: 0.0,
+        log_path: None,
+        message,
+        stage: Stage::Stage2Sketch,
+        worker_index: None,
+        seed_time_secs: 0.0,
+        seed_applied: false,
     }
 }
+
+#[cfg(test)]
+mod tests;
@@ -0,0 +1,248 @@
+//! Stage-2 dispatch order for `compile-many`.
+//!
+//! Sketches that pull in the same libraries compile the same library
+//! sources. Built one after another, the first build of a library set fills
+//! zccache and every later sketch with that set hits it; built side by side,
+//! both miss and compile everything. The real LDF selection needs the
+//! framework's library index, which only exists mid-build, so sketches are
+//! grouped by a proxy computed before any build starts: the env's
+//! `lib_deps` plus the `#include`s of the sketch's own sources that do not
+//! name one of its own files ([`library_signature`]).
+//!
+//! [`plan`] turns those signatures into a dispatch order. Sketches sharing
+//! stage 1's signature go first, since stage 1 already warmed their
+//! libraries. Then the first sketch of every other group (its leader), then
+//! the rest of each group, which wait for their leader before building.
+
+use std::collections::BTreeSet;
+use std::path::Path;
+
+use fbuild_core::path::normalize_for_key;
+
+/// Source and header extensions scanned for `#include`s.
+const SOURCE_EXTENSIONS: &[&str] = &[
+    "ino", "pde", "c", "cc", "cpp", "cxx", "h", "hh", "hpp", "hxx",
+];
+
+/// One stage-2 dispatch slot.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub(crate) struct Slot {
+    /// Index into the stage-2 sketch list.
+    pub index: usize,
+    /// Stage-2 index of the group leader this sketch waits for.
+    pub after: Option<usize>,
+}
+
+/// Library-set proxy for `project_dir` built with `env`: sorted `lib_deps`
+/// and sorted external includes. Unreadable projects get an empty
+/// signature; the build itself reports the real error.
+pub(crate) fn library_signature(project_dir: &Path, env: &str) -> String {
+    let Ok(config) =
+        fbuild_config::PlatformIOConfig::from_path(&project_dir.join("platformio.ini"))
+    else {
+        return String::new();
+    };
+    let deps: BTreeSet<String> = config
+        .get_lib_deps(env)
+        .unwrap_or_default()
+        .into_iter()
+        .collect();
+
+    // Same source-dir rule as the pipeline: configured or `src/`, falling
+    // back to the project root (Arduino IDE layout).
+    let src_dir = project_dir.join(
+        config
+            .get_src_dir(env)
+            .ok()
+            .flatten()
+            .unwrap_or_else(|| "src".to_string()),
+    );
+    let src_dir = if src_dir.is_dir() {
+        src_dir
+    } else {
+        project_dir.to_path_buf()
+    };
+    let mut sources = Vec::new();
+    collect_sources(&root_prefix(&src_dir), &src_dir, &mut sources);
+    let include_dir = project_dir.join("include");
+    if include_dir.is_dir() && include_dir != src_dir {
+        collect_sources(&root_prefix(&include_dir), &include_dir, &mut sources);
+    }
+
+    let mut includes = BTreeSet::new();
+    for name in sources.iter().flat_map(|(_, names)| names) {
+        let is_local = sources
+            .iter()
+            .any(|(rel, _)| rel == name || rel.ends_with(&format!("/{name}")));
+        if !is_local {
+            includes.insert(name.clone());
+        }
+    }
+
+    let deps: Vec<String> = deps.into_iter().collect();
+    let includes: Vec<String> = includes.into_iter().collect();
+    format!("{}\n{}", deps.join(","), includes.join(","))
+}
+
+/// Key form of `root` with a trailing `/`, for relativizing the paths
+/// [`collect_sources`] walks under it.
+fn root_prefix(root: &Path) -> String {
+    let key = normalize_for_key(root);
+    if key.ends_with('/') {
+        key
+    } else {
+        format!("{key}/")
+    }
+}
+
+/// Append `(path relative to root, included names)` for every source
+/// under `dir`, skipping hidden directories such as `.fbuild` and `.pio`.
+/// Both sides are in [`normalize_for_key`] form so they compare as equals;
+/// `root` is that form of the walk root plus `/` (see [`root_prefix`]).
+fn collect_sources(root: &str, dir: &Path, out: &mut Vec<(String, Vec<String>)>) {
+    let Ok(entries) = std::fs::read_dir(dir) else {
+        return;
+    };
+    for entry in entries.flatten() {
+        let path = entry.path();
+        if entry.file_name().to_string_lossy().starts_with('.') {
+            continue;
+        }
+        if path.is_dir() {
+            collect_sources(root, &path, out);
+            continue;
+        }
+        let is_source = path
+            .extension()
+            .and_then(|e| e.to_str())
+            .is_some_and(|e| SOURCE_EXTENSIONS.contains(&e.to_ascii_lowercase().as_str()));
+        if !is_source {
+            continue;
+        }
+        let Ok(bytes) = std::fs::read(&path) else {
+            continue;
+        };
+        // Walked paths extend `dir`, so this only fails if a link or
+        // spelling change moved them off the root; such a file has no
+        // relative name to share, so it is left out.
+        let Some(rel) = normalize_for_key(&path)
+            .strip_prefix(root)
+            .map(str::to_string)
+        else {
+            continue;
+        };
+        let names = fbuild_header_scan::scan(&String::from_utf8_lossy(&bytes))
+            .into_iter()
+            .map(|inc| normalize_for_key(Path::new(&inc.path)))
+            .collect();
+        out.push((rel, names));
+    }
+}
+
+/// Dispatch order for stage-2 sketches with `signatures`, given stage 1's
+/// signature. Every index appears exactly once.
+pub(crate) fn plan(signatures: &[String], stage1: &str) -> Vec<Slot> {
+    let mut order = Vec::with_capacity(signatures.len());
+    let mut groups: Vec<(&str, Vec<usize>)> = Vec::new();
+    for (index, signature) in signatures.iter().enumerate() {
+        if signature == stage1 {
+            order.push(Slot { index, after: None });
+            continue;
+        }
+        match groups.iter_mut().find(|(s, _)| *s == signature.as_str()) {
+            Some((_, members)) => members.push(index),
+            None => groups.push((signature.as_str(), vec![index])),
+        }
+    }
+    order.extend(groups.iter().map(|(_, members)| Slot {
+        index: members[0],
+        after: None,
+    }));
+    for (_, members) in &groups {
+        order.extend(members[1..].iter().map(|&index| Slot {
+            index,
+            after: Some(members[0]),
+        }));
+    }
+    order
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn sig(s: &str) -> String {
+        s.to_string()
+    }
+
+    #[test]
+    fn stage1_group_first_then_leaders_then_followers() {
+        let signatures = [
+            sig("a"),
+            sig("b"),
+            sig("core"),
+            sig("a"),
+            sig("b"),
+            sig("c"),
+        ];
+        let order = plan(&signatures, "core");
+        let slots: Vec<(usize, Option<usize>)> = order.iter().map(|s| (s.index, s.after)).collect();
+        assert_eq!(
+            slots,
+            vec![
+                (2, None),
+                (0, None),
+                (1, None),
+                (5, None),
+                (3, Some(0)),
+                (4, Some(1)),
+            ]
+        );
+    }
+
+    #[test]
+    fn signature_ignores_local_headers_and_sorts() {
+        let tmp = tempfile::tempdir().unwrap();
+        let dir = tmp.path();
+        std::fs::write(
+            dir.join("platformio.ini"),
+            "[env:uno]\nboard = uno\nlib_deps = Wire, FastLED\n",
+        )
+        .unwrap();
+        std::fs::create_dir_all(dir.join("src/util")).unwrap();
+        std::fs::write(
+            dir.join("src/main.ino"),
+            "#include <Wire.h>\n#include \"util/pins.h\"\n#include <FastLED.h>\n",
+        )
+        .unwrap();
+        std::fs::write(dir.join("src/util/pins.h"), "#include <Arduino.h>\n").unwrap();
+        std::fs::create_dir_all(dir.join(".fbuild")).unwrap();
+        std::fs::write(dir.join(".fbuild/stale.cpp"), "#include <SPI.h>\n").unwrap();
+
+        assert_eq!(
+            library_signature(dir, "uno"),
+            "FastLED,Wire\nArduino.h,FastLED.h,Wire.h"
+        );
+    }
+
+    /// Local headers are recognized whatever spelling the project dir
+    /// arrives in, so the signature (the scheduling key) does not change.
+    #[test]
+    fn signature_does_not_depend_on_the_project_dir_spelling() {
+        let tmp = tempfile::tempdir().unwrap();
+        let dir = tmp.path().join("sketch");
+        std::fs::create_dir_all(dir.join("src")).unwrap();
+        std::fs::write(dir.join("platformio.ini"), "[env:uno]\nboard = uno\n").unwrap();
+        std::fs::write(
+            dir.join("src/main.cpp"),
+            "#include \"pins.h\"\n#include <FastLED.h>\n",
+        )
+        .unwrap();
+        std::fs::write(dir.join("src/pins.h"), "").unwrap();
+
+        let plain = library_signature(&dir, "uno");
+        assert_eq!(plain, "\nFastLED.h");
+        let detour = tmp.path().join("sketch/./src/../../sketch");
+        assert_eq!(library_signature(&detour, "uno"), plain);
+    }
+}
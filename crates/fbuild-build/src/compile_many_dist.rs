@@ -0,0 +1,400 @@
+//! Distributed `compile-many`: shard one request across several daemons.
+//!
+//! [`compile_many`](crate::compile_many::compile_many) fans out across the
+//! threads of one host. [`compile_many_distributed`] is the coordinator for
+//! a fleet: it splits the sketch list round-robin into one shard per daemon,
+//! POSTs each shard to that daemon's [`COMPILE_MANY_ROUTE`], and merges the
+//! shards back into a single [`CompileManyResult`] in input order.
+//!
+//! ## Wire protocol
+//!
+//! The request body is a [`ShardRequest`]. The response is NDJSON, one
+//! [`ShardEvent`] per line: a `sketch` event as soon as each sketch's build
+//! returns, then exactly one terminal `done` (the shard's full result) or
+//! `error` (the shard could not run). [`run_shard`] produces that stream
+//! from any [`SketchBuilder`], so the daemon route and the tests share it.
+//!
+//! ## Shared artifacts
+//!
+//! Each daemon runs the ordinary two-stage flow on its shard: stage 1 warms
+//! that daemon's framework archives and zccache store, stage 2 reuses them.
+//! Daemons that share a cache root (one host, one `~/.fbuild`) share the
+//! zccache store directly. Daemons with their own cache roots — other hosts,
+//! or several daemons on one box with distinct `FBUILD_CACHE_DIR`s — can be
+//! pointed at the same `fbuild cache save` archive via
+//! [`ShardRequest::cache_archive`]; each restores it once before building.
+//!
+//! Sketch paths are sent as absolute paths, so every daemon must see the
+//! sketches at the same location (one host, or a shared checkout path).
+
+use std::collections::BTreeMap;
+use std::path::Path;
+use std::time::Instant;
+
+use fbuild_core::channel::{UnboundedSender, unbounded};
+use fbuild_core::{FbuildError, Result};
+use serde::{Deserialize, Serialize};
+
+use crate::compile_many::{
+    CompileManyRequest, CompileManyResult, SketchBuilder, SketchResult, Stage,
+    compile_many_streaming,
+};
+use crate::env_session::StageTiming;
+
+/// Daemon route serving one shard.
+pub const COMPILE_MANY_ROUTE: &str = "/api/compile-many";
+
+/// Body of `POST /api/compile-many`.
+#[derive(Debug, Clone, Serialize, Deserialize)]
+pub struct ShardRequest {
+    /// The shard: the coordinator's request with this daemon's sketches.
+    pub request: CompileManyRequest,
+    /// `fbuild cache save` archive to restore into the daemon's cache root
+    /// before building. Restored once per daemon process.
+    #[serde(default)]
+    pub cache_archive: Option<String>,
+}
+
+/// One NDJSON line of the `/api/compile-many` response.
+#[derive(Debug, Clone, Serialize, Deserialize)]
+#[serde(tag = "type", rename_all = "snake_case")]
+pub enum ShardEvent {
+    /// A sketch finished building.
+    Sketch { result: SketchResult },
+    /// The shard finished; `result` is authoritative.
+    Done { result: CompileManyResult },
+    /// The shard could not run (bad request, unreachable daemon, ...).
+    Error { message: String },
+}
+
+impl ShardEvent {
+    /// Encode as one NDJSON line, trailing newline included.
+    pub fn to_line(&self) -> String {
+        let mut line = serde_json::to_string(self).unwrap_or_else(|e| {
+            format!(r#"{{"type":"error","message":"encode shard event: {e}"}}"#)
+        });
+        line.push('\n');
+        line
+    }
+}
+
+/// Run one shard with `builder`, sending a `sketch` event per finished
+/// sketch and a terminal `done` / `error` event to `events`.
+pub async fn run_shard(
+    request: CompileManyRequest,
+    builder: &(dyn SketchBuilder + Send + Sync),
+    events: &UnboundedSender<ShardEvent>,
+) {
+    let on_result = |result: &SketchResult| {
+        let _ = events.send(ShardEvent::Sketch {
+            result: result.clone(),
+        });
+    };
+    let terminal = match compile_many_streaming(request, builder, &on_result).await {
+        Ok(result) => ShardEvent::Done { result },
+        Err(e) => ShardEvent::Error {
+            message: e.to_string(),
+        },
+    };
+    let _ = events.send(terminal);
+}
+
+/// Normalize a `--daemon` spec to a base URL: URLs pass through,
+/// `host:port` gets `http://`, and a bare port means this host.
+pub fn daemon_url(spec: &str) -> String {
+    let spec = spec.trim().trim_end_matches('/');
+    if spec.starts_with("http://") || spec.starts_with("https://") {
+        spec.to_string()
+    } else if !spec.is_empty() && spec.bytes().all(|b| b.is_ascii_digit()) {
+        format!("http://127.0.0.1:{spec}")
+    } else {
+        format!("http://{spec}")
+    }
+}
+
+/// Split `count` sketches round-robin into at most `daemons` non-empty
+/// shards of input indices.
+pub fn shard_indices(count: usize, daemons: usize) -> Vec<Vec<usize>> {
+    let shards = daemons.min(count);
+    let mut out: Vec<Vec<usize>> = vec![Vec::new(); shards];
+    for idx in 0..count {
+        out[idx % shards].push(idx);
+    }
+    out
+}
+
+/// Run `req` across `daemons` (base URLs such as `http://127.0.0.1:8765`).
+///
+/// `on_sketch` sees every sketch result as its daemon streams it back, with
+/// that daemon's URL. A daemon that fails or is unreachable fails only the
+/// sketches of its shard; the returned result still has one entry per
+/// requested sketch, in input order.
+///
+/// With [`CompileManyRequest::fail_fast`] the first failed sketch from any
+/// daemon cancels every shard; sketches not yet reported are marked
+/// cancelled.
+pub async fn compile_many_distributed(
+    req: CompileManyRequest,
+    daemons: &[String],
+    cache_archive: Option<String>,
+    on_sketch: &mut (dyn FnMut(&str, &SketchResult) + Send),
+) -> Result<CompileManyResult> {
+    if req.sketches.is_empty() {
+        return Err(FbuildError::Other(
+            "compile_many: at least one sketch is required".to_string(),
+        ));
+    }
+    if daemons.is_empty() {
+        return Err(FbuildError::Other(
+            "compile_many: at least one daemon is required".to_string(),
+        ));
+    }
+    let total_start = Instant::now();
+    let cwd = std::env::current_dir()?;
+    let shards = shard_indices(req.sketches.len(), daemons.len());
+
+    let (tx, mut rx) = unbounded::<(usize, ShardEvent)>();
+    let mut tasks = tokio::task::JoinSet::new();
+    for (shard, indices) in shards.iter().enumerate() {
+        let mut request = req.clone();
+        request.sketches = indices
+            .iter()
+            .map(|&i| cwd.join(&req.sketches[i]))
+            .collect();
+        let body = ShardRequest {
+            request,
+            cache_archive: cache_archive.clone(),
+        };
+        let url = format!(
+            "{}{}",
+            daemons[shard].trim_end_matches('/'),
+            COMPILE_MANY_ROUTE
+        );
+        let tx = tx.clone();
+        tasks.spawn(async move {
+            if let Err(e) = post_shard(&url, &body, shard, &tx).await {
+                let _ = tx.send((
+                    shard,
+                    ShardEvent::Error {
+                        message: format!("{url}: {e}"),
+                    },
+                ));
+            }
+        });
+    }
+    drop(tx);
+
+    let mut streamed: Vec<Vec<SketchResult>> = vec![Vec::new(); shards.len()];
+    let mut terminal: Vec<Option<ShardEvent>> = vec![None; shards.len()];
+    let mut cancelled: Option<String> = None;
+    while let Some((shard, event)) = rx.recv().await {
+        match event {
+            ShardEvent::Sketch { result } => {
+                on_sketch(&daemons[shard], &result);
+                if req.fail_fast && !result.success {
+                    cancelled = Some(format!(
+                        "cancelled: {} failed (fail-fast)",
+                        result.sketch.display()
+                    ));
+                    streamed[shard].push(result);
+                    // Dropping a shard's connection aborts its build on the
+                    // daemon, which tears down in-flight compilers.
+                    tasks.abort_all();
+                    break;
+                }
+                streamed[shard].push(result);
+            }
+            done_or_error => {
+                terminal[shard].get_or_insert(done_or_error);
+            }
+        }
+    }
+    while tasks.join_next().await.is_some() {}
+
+    let mut outcomes = Vec::with_capacity(shards.len());
+    for (shard, indices) in shards.iter().enumerate() {
+        let (result, error) = match terminal[shard].take() {
+            Some(ShardEvent::Done { result }) => (result, None),
+            Some(ShardEvent::Error { message }) => {
+                (partial_result(&streamed[shard]), Some(message))
+            }
+            _ => (
+                partial_result(&streamed[shard]),
+                Some(
+                    cancelled
+                        .clone()
+                        .unwrap_or_else(|| "stream ended without a result".to_string()),
+                ),
+            ),
+        };
+        if let (Some(message), None) = (&error, &cancelled) {
+            tracing::warn!(
+                "compile-many: shard on {} failed: {}",
+                daemons[shard],
+                message
+            );
+        }
+        outcomes.push((indices.as_slice(), &daemons[shard], result, error));
+    }
+    Ok(merge_shards(&req, &cwd, outcomes, total_start))
+}
+
+/// POST one shard and forward its NDJSON events tagged with `shard`.
+async fn post_shard(
+    url: &str,
+    body: &ShardRequest,
+    shard: usize,
+    tx: &UnboundedSender<(usize, ShardEvent)>,
+) -> Result<()> {
+    let http = |e: reqwest::Error| FbuildError::Other(e.to_string());
+    let mut resp = fbuild_core::http::client()
+        .post(url)
+        .json(body)
+        .timeout(fbuild_core::time::DAEMON_LONG_OP_TIMEOUT)
+        .send()
+        .await
+        .map_err(http)?;
+    if !resp.status().is_success() {
+        let status = resp.status();
+        let text = resp.text().await.unwrap_or_default();
+        return Err(FbuildError::Other(format!(
+            "daemon returned {status}: {text}"
+        )));
+    }
+    let mut buffer = Vec::new();
+    while let Some(chunk) = resp.chunk().await.map_err(http)? {
+        buffer.extend_from_slice(&chunk);
+        while let Some(newline) = buffer.iter().position(|&b| b == b'\n') {
+            let line: Vec<u8> = buffer.drain(..=newline).collect();
+            let line = String::from_utf8_lossy(&line);
+            let line = line.trim();
+            if line.is_empty() {
+                continue;
+            }
+            match serde_json::from_str::<ShardEvent>(line) {
+                Ok(event) => {
+                    let _ = tx.send((shard, event));
+                }
+                Err(e) => tracing::warn!("compile-many: bad shard event from {url}: {e}"),
+            }
+        }
+    }
+    Ok(())
+}
+
+/// What is known about a shard whose terminal event never arrived.
+fn partial_result(streamed: &[SketchResult]) -> CompileManyResult {
+    CompileManyResult {
+        results: streamed.to_vec(),
+        all_success: false,
+        stage1_count: 0,
+        stage2_count: 0,
+        stage1_secs: 0.0,
+        stage2_secs: 0.0,
+        total_secs: 0.0,
+        stage_timings: Vec::new(),
+    }
+}
+
+/// Stitch per-shard results back into one result in `req`'s input order.
+/// Sketches a shard never reported (stage 1 failed, daemon went away) get a
+/// failed entry naming the daemon.
+fn merge_shards(
+    req: &CompileManyRequest,
+    cwd: &Path,
+    outcomes: Vec<(&[usize], &String, CompileManyResult, Option<String>)>,
+    total_start: Instant,
+) -> CompileManyResult {
+    let mut slots: Vec<Option<SketchResult>> = vec![None; req.sketches.len()];
+    let mut merged = partial_result(&[]);
+    let mut timings: BTreeMap<String, StageTiming> = BTreeMap::new();
+    for (indices, daemon, shard, error) in outcomes {
+        merged.stage1_count += shard.stage1_count;
+        merged.stage2_count += shard.stage2_count;
+        merged.stage1_secs = merged.stage1_secs.max(shard.stage1_secs);
+        merged.stage2_secs = merged.stage2_secs.max(shard.stage2_secs);
+        for (name, t) in shard.stage_timings {
+            let sum = timings.entry(name).or_default();
+            sum.secs += t.secs;
+            sum.runs += t.runs;
+            sum.reused += t.reused;
+        }
+        let mut reported = shard.results;
+        for (pos, &idx) in indices.iter().enumerate() {
+            let sent = cwd.join(&req.sketches[idx]);
+            let mut result = match reported.iter().position(|r| r.sketch == sent) {
+                Some(at) => reported.swap_remove(at),
+                None => SketchResult {
+                    sketch: sent,
+                    env_name: String::new(),
+                    success: false,
+                    firmware_path: None,
+                    elf_path: None,
+                    build_time_secs: 0.0,
+                    log_path: None,
+                    message: format!(
+                        "not built by {daemon}: {}",
+                        error
+                            .as_deref()
+                            .unwrap_or("an earlier sketch in its shard failed")
+                    ),
+                    stage: if pos == 0 {
+                        Stage::Stage1Framework
+                    } else {
+                        Stage::Stage2Sketch
+                    },
+                    worker_index: None,
+                    seed_time_secs: 0.0,
+                    seed_applied: false,
+                },
+            };
+            result.sketch = req.sketches[idx].clone();
+            slots[idx] = Some(result);
+        }
+    }
+    merged.results = slots.into_iter().flatten().collect();
+    merged.all_success = merged.results.iter().all(|r| r.success);
+    merged.total_secs = total_start.elapsed().as_secs_f64();
+    merged.stage_timings = timings.into_iter().collect();
+    merged
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn shards_are_round_robin_and_never_empty() {
+        assert_eq!(
+            shard_indices(5, 2),
+            vec![vec![0, 2, 4], vec![1, 3]],
+            "round-robin keeps shard sizes within one"
+        );
+        assert_eq!(shard_indices(2, 4), vec![vec![0], vec![1]]);
+        assert_eq!(shard_indices(3, 1), vec![vec![0, 1, 2]]);
+    }
+
+    #[test]
+    fn daemon_specs_normalize_to_base_urls() {
+        assert_eq!(daemon_url("8765"), "http://127.0.0.1:8765");
+        assert_eq!(daemon_url("ci-runner-2:8765"), "http://ci-runner-2:8765");
+        assert_eq!(
+            daemon_url("https://builds.example/"),
+            "https://builds.example"
+        );
+    }
+
+    #[test]
+    fn events_round_trip_as_tagged_ndjson() {
+        let line = ShardEvent::Error {
+            message: "offline".to_string(),
+        }
+        .to_line();
+        assert!(line.ends_with('\n'));
+        assert!(line.starts_with(r#"{"type":"error""#));
+        match serde_json::from_str::<ShardEvent>(line.trim()).unwrap() {
+            ShardEvent::Error { message } => assert_eq!(message, "offline"),
+            other => panic!("unexpected event {other:?}"),
+        }
+    }
+}
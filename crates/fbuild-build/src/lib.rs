@@ -19,6 +19,12 @@ pub use fbuild_build_engine::*;
 // the platform factory. It references engine modules as `crate::<mod>`, which
 // resolve through the `pub use fbuild_build_engine::*` re-export above.
 pub mod compile_many;
+// Coordinator that shards a `compile_many` request across several daemons,
+// plus the NDJSON shard protocol the daemon's `/api/compile-many` route serves.
+pub mod compile_many_dist;
+// `fbuild prefetch`: installs every env's packages ahead of a build. Like
+// `compile_many`, it dispatches through `get_platform_support()`.
+pub mod prefetch;
 
 // Platform orchestrators, now in per-family crates that compile in parallel on
 // top of the engine (FastLED/fbuild#1008 A2). Re-exported here so every
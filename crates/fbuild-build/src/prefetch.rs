@@ -0,0 +1,237 @@
+//! Predictive prefetch: install every env's packages before a build asks.
+//!
+//! A cold build discovers its packages one resolution step at a time, so on
+//! a fresh machine the toolchain, framework and tools download serially
+//! inside the build. [`prefetch_project`] parses `platformio.ini` once,
+//! resolves each env's board through the board database, and runs every
+//! env's [`PlatformSupport::prefetch`](crate::PlatformSupport::prefetch)
+//! concurrently. One [`EnvSession`] spans the run, so envs that share a
+//! package install it once, and the process-wide download scheduler
+//! overlaps the transfers. A later build of any of those envs finds its
+//! packages warm.
+//!
+//! Library dependencies (`lib_deps`) are not prefetched: their install is
+//! tied to the per-build flag and source resolution in the orchestrators.
+
+use std::collections::HashMap;
+use std::path::Path;
+use std::sync::Arc;
+
+use fbuild_config::{BoardConfig, PlatformIOConfig};
+use fbuild_core::path::NormalizedPath;
+use fbuild_core::{FbuildError, Platform, Result};
+
+use crate::env_session::EnvSession;
+use crate::resolution::ResolutionContext;
+
+/// One `[env:<name>]` section resolved far enough to know its packages.
+#[derive(Debug, Clone)]
+pub struct PrefetchTarget {
+    pub env_name: String,
+    pub platform: Platform,
+    pub board: BoardConfig,
+    /// The env section, for `platform_packages` overrides.
+    pub env_config: HashMap<String, String>,
+}
+
+/// Outcome of [`prefetch_project`], envs sorted by name.
+#[derive(Debug, Default)]
+pub struct PrefetchReport {
+    /// Envs whose packages are now installed.
+    pub prefetched: Vec<String>,
+    /// Envs that could not be resolved or fetched, with the reason.
+    pub failed: Vec<(String, String)>,
+}
+
+impl PrefetchReport {
+    pub fn is_success(&self) -> bool {
+        self.failed.is_empty()
+    }
+}
+
+/// Resolve one env: board from the board database (honoring `[env]` board
+/// overrides and project-local `boards/<id>.json`), platform from the board,
+/// else from the env's `platform` key.
+pub fn resolve_target(
+    project_dir: &Path,
+    config: &PlatformIOConfig,
+    env_name: &str,
+) -> Result<PrefetchTarget> {
+    let env_config = config.get_env_config(env_name)?.clone();
+    let board = ResolutionContext::new(project_dir, env_name, config).resolve_board()?;
+    let platform_str = env_config.get("platform").cloned().unwrap_or_default();
+    let platform = board
+        .platform()
+        .or_else(|| Platform::from_platform_str(&platform_str))
+        .ok_or_else(|| FbuildError::ConfigError(format!("unsupported platform: {platform_str}")))?;
+    Ok(PrefetchTarget {
+        env_name: env_name.to_string(),
+        platform,
+        board,
+        env_config,
+    })
+}
+
+/// Resolve `envs`, or every env in `config` when `envs` is empty. An env
+/// that does not resolve is reported as a failure instead of failing the
+/// others.
+pub fn plan(
+    project_dir: &Path,
+    config: &PlatformIOConfig,
+    envs: &[String],
+) -> (Vec<PrefetchTarget>, Vec<(String, String)>) {
+    let names: Vec<String> = if envs.is_empty() {
+        config
+            .get_environments()
+            .into_iter()
+            .map(str::to_string)
+            .collect()
+    } else {
+        envs.to_vec()
+    };
+    let mut targets = Vec::new();
+    let mut failed = Vec::new();
+    for name in names {
+        match resolve_target(project_dir, config, &name) {
+            Ok(target) => targets.push(target),
+            Err(e) => failed.push((name, e.to_string())),
+        }
+    }
+    (targets, failed)
+}
+
+/// Install the packages of `envs` (every env when empty) of the project at
+/// `project_dir`, all envs concurrently. Errors only when `platformio.ini`
+/// cannot be read; per-env failures land in the report.
+pub async fn prefetch_project(project_dir: &Path, envs: &[String]) -> Result<PrefetchReport> {
+    let config = PlatformIOConfig::from_path(&project_dir.join("platformio.ini"))?;
+    let (targets, mut failed) = plan(project_dir, &config, envs);
+
+    let session = Arc::new(EnvSession::new());
+    let mut names = HashMap::new();
+    let mut tasks = tokio::task::JoinSet::new();
+    for target in targets {
+        let project_dir = NormalizedPath::new(project_dir);
+        let session = Arc::clone(&session);
+        let env_name = target.env_name.clone();
+        let handle = tasks.spawn(async move {
+            let support = crate::get_platform_support(target.platform)?;
+            support
+                .prefetch(
+                    project_dir.as_path(),
+                    &target.board,
+                    &target.env_config,
+                    Some(session.as_ref()),
+                )
+                .await
+        });
+        names.insert(handle.id(), env_name);
+    }
+
+    let mut prefetched = Vec::new();
+    while let Some(joined) = tasks.join_next_with_id().await {
+        match joined {
+            Ok((id, Ok(()))) => prefetched.extend(names.remove(&id)),
+            Ok((id, Err(e))) => failed.extend(names.remove(&id).map(|env| (env, e.to_string()))),
+            Err(e) => failed.extend(
+                names
+                    .remove(&e.id())
+                    .map(|env| (env, format!("prefetch task failed: {e}"))),
+            ),
+        }
+    }
+    prefetched.sort();
+    failed.sort();
+    for (env, reason) in &failed {
+        tracing::warn!("prefetch: env '{}' failed: {}", env, reason);
+    }
+    Ok(PrefetchReport { prefetched, failed })
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn write_project(ini: &str) -> tempfile::TempDir {
+        let dir = tempfile::tempdir().unwrap();
+        std::fs::write(dir.path().join("platformio.ini"), ini).unwrap();
+        dir
+    }
+
+    fn load(dir: &tempfile::TempDir) -> PlatformIOConfig {
+        PlatformIOConfig::from_path(&dir.path().join("platformio.ini")).unwrap()
+    }
+
+    #[test]
+    fn plan_covers_every_env_by_default() {
+        let dir = write_project(
+            "[env:uno]\nplatform = atmelavr\nboard = uno\n\n\
+             [env:teensy]\nplatform = teensy\nboard = teensy41\n",
+        );
+        let (targets, failed) = plan(dir.path(), &load(&dir), &[]);
+        assert!(failed.is_empty(), "{failed:?}");
+        let mut resolved: Vec<_> = targets
+            .iter()
+            .map(|t| (t.env_name.as_str(), t.platform))
+            .collect();
+        resolved.sort_by_key(|(env, _)| *env);
+        assert_eq!(
+            resolved,
+            [("teensy", Platform::Teensy), ("uno", Platform::AtmelAvr)]
+        );
+        let uno = targets.iter().find(|t| t.env_name == "uno").unwrap();
+        assert_eq!(uno.board.mcu, "atmega328p");
+    }
+
+    #[test]
+    fn plan_reports_unresolvable_envs_without_dropping_the_rest() {
+        let dir = write_project(
+            "[env:uno]\nplatform = atmelavr\nboard = uno\n\n\
+             [env:mystery]\nplatform = atmelavr\nboard = no_such_board\n",
+        );
+        let envs = ["uno", "mystery", "absent"].map(String::from);
+        let (targets, failed) = plan(dir.path(), &load(&dir), &envs);
+        assert_eq!(targets.len(), 1);
+        assert_eq!(targets[0].env_name, "uno");
+        let failed: Vec<_> = failed.iter().map(|(env, _)| env.as_str()).collect();
+        assert_eq!(failed, ["mystery", "absent"]);
+    }
+
+    /// Goes through the env's real `PlatformSupport::prefetch` (ESP32),
+    /// which rejects an MCU it has no config for before downloading
+    /// anything; the report pins the failure on that env.
+    #[tokio::test]
+    async fn prefetch_project_reports_platform_prefetch_failures_per_env() {
+        let dir = write_project("[env:odd]\nplatform = espressif32\nboard = odd_esp32\n");
+        let boards = dir.path().join("boards");
+        std::fs::create_dir_all(&boards).unwrap();
+        std::fs::write(
+            boards.join("odd_esp32.json"),
+            r#"{
+  "build": {
+    "core": "esp32",
+    "f_cpu": "240000000L",
+    "mcu": "esp32zz",
+    "variant": "esp32"
+  },
+  "frameworks": ["arduino"],
+  "name": "Odd ESP32",
+  "upload": { "maximum_ram_size": 327680, "maximum_size": 1310720 }
+}"#,
+        )
+        .unwrap();
+
+        let report = prefetch_project(dir.path(), &[]).await.unwrap();
+        assert!(report.prefetched.is_empty());
+        assert_eq!(report.failed.len(), 1, "{:?}", report.failed);
+        let (env, reason) = &report.failed[0];
+        assert_eq!(env, "odd");
+        assert!(reason.contains("unsupported ESP32 MCU"), "{reason}");
+    }
+
+    #[tokio::test]
+    async fn prefetch_project_requires_platformio_ini() {
+        let dir = tempfile::tempdir().unwrap();
+        assert!(prefetch_project(dir.path(), &[]).await.is_err());
+    }
+}
@@ -144,6 +144,7 @@ async fn build_uno_minimal() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -244,6 +245,7 @@ async fn compare_with_python_output() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -338,6 +340,7 @@ void loop() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -406,6 +409,7 @@ fn uno_build_params(project_dir: &Path, build_dir: PathBuf, clean: bool) -> Buil
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     }
@@ -176,6 +176,7 @@ async fn clangd_check_parity_uno() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
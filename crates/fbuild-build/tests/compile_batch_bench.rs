@@ -0,0 +1,175 @@
+//! Benchmark: per-TU compiles vs. batched compiler invocations
+//! (`compile_batch`, `FBUILD_COMPILE_BATCH`) on the `tests/platform/uno` and
+//! `tests/platform/esp32dev` fixtures.
+//!
+//! Each fixture is built twice from a clean build dir in one process — once
+//! with the batcher disabled, once with it enabled — against a fresh zccache
+//! cache root, so neither run is served from a warm object cache. Both runs
+//! use freshly named envs so the cross-run framework core cache (keyed by env
+//! name) can't hydrate `core/` either. Timings and batcher counters are
+//! printed; the only assertion is that both builds succeed.
+//!
+//! Gated `#[ignore]` because it downloads real toolchains on first run.
+//! Run with:
+//!
+//! ```bash
+//! soldr cargo test -p fbuild-build --test compile_batch_bench \
+//!   -- --ignored --nocapture
+//! ```
+
+use std::fs;
+use std::path::Path;
+use std::time::{Duration, Instant};
+
+use fbuild_build::{BuildParams, compile_backend, get_orchestrator};
+use fbuild_core::{BuildProfile, Platform};
+
+/// 15-min wall-clock cap for `--ignored` real-toolchain tests (FastLED/fbuild#806).
+const REAL_BUILD_TIMEOUT: Duration = Duration::from_secs(900);
+
+/// TUs per batched invocation used for the "batched" run.
+const BENCH_MAX_BATCH: usize = 8;
+
+async fn under_test_timeout<F: std::future::Future>(fut: F) -> F::Output {
+    match tokio::time::timeout(REAL_BUILD_TIMEOUT, fut).await {
+        Ok(v) => v,
+        Err(_) => panic!(
+            "real-toolchain test exceeded {:.0}s budget — see FastLED/fbuild#806",
+            REAL_BUILD_TIMEOUT.as_secs_f64()
+        ),
+    }
+}
+
+/// Install a backend rooted at a throwaway zccache cache so the per-TU run
+/// is a guaranteed cold compile. Once per test process (see `avr_build.rs`).
+async fn install_bench_compile_backend(
+    cache_root: &Path,
+) -> &'static compile_backend::CompileBackend {
+    static INSTALL: tokio::sync::OnceCell<()> = tokio::sync::OnceCell::const_new();
+    INSTALL
+        .get_or_init(|| async {
+            let backend = compile_backend::CompileBackend::start_in(cache_root)
+                .await
+                .expect("compile backend starts for batching bench");
+            compile_backend::install_global(backend);
+        })
+        .await;
+    compile_backend::get_global().expect("backend installed")
+}
+
+fn fixture_dir(name: &str) -> std::path::PathBuf {
+    Path::new(env!("CARGO_MANIFEST_DIR"))
+        .join("../../tests/platform")
+        .join(name)
+}
+
+/// Copy the fixture's sketch sources into `project/src` and write a
+/// platformio.ini holding the fixture env plus two uniquely named children.
+fn scaffold(fixture: &str, project: &Path, envs: &[String]) {
+    let src_out = project.join("src");
+    fs::create_dir_all(&src_out).unwrap();
+    let root = fixture_dir(fixture);
+    let src_in = if root.join("src").is_dir() {
+        root.join("src")
+    } else {
+        root.clone()
+    };
+    for entry in fs::read_dir(&src_in).unwrap() {
+        let path = entry.unwrap().path();
+        let ext = path.extension().and_then(|e| e.to_str()).unwrap_or("");
+        if matches!(ext, "ino" | "cpp" | "c" | "h" | "hpp") {
+            fs::copy(&path, src_out.join(path.file_name().unwrap())).unwrap();
+        }
+    }
+    let mut ini = fs::read_to_string(root.join("platformio.ini")).unwrap();
+    for env in envs {
+        ini.push_str(&format!("\n[env:{env}]\nextends = env:{fixture}\n"));
+    }
+    fs::write(project.join("platformio.ini"), ini).unwrap();
+}
+
+async fn timed_build(platform: Platform, project: &Path, env: &str) -> Duration {
+    let params = BuildParams {
+        project_dir: project.to_path_buf(),
+        env_name: env.to_string(),
+        clean_all: true,
+        clean_only: false,
+        clean: true,
+        profile: BuildProfile::Release,
+        build_dir: project.join(".fbuild/build").join(env).join("release"),
+        verbose: false,
+        jobs: None,
+        generate_compiledb: false,
+        compiledb_only: false,
+        log_sender: None,
+        symbol_analysis: false,
+        symbol_analysis_path: None,
+        no_timestamp: false,
+        src_dir: None,
+        pio_env: Default::default(),
+        extra_build_flags: Vec::new(),
+        watch_set_cache: None,
+        env_session: None,
+        bloat_analysis: false,
+        caller_path: None,
+    };
+    let orchestrator = get_orchestrator(platform).unwrap();
+    let started = Instant::now();
+    let result = under_test_timeout(orchestrator.build(&params))
+        .await
+        .unwrap_or_else(|e| panic!("{env} build failed: {e}"));
+    assert!(
+        result.success,
+        "{env} build reported failure: {}",
+        result.message
+    );
+    started.elapsed()
+}
+
+async fn bench_fixture(scratch: &Path, fixture: &str, platform: Platform) {
+    let backend = install_bench_compile_backend(&scratch.join("zccache")).await;
+    let batcher = backend.batcher();
+
+    let nonce = std::process::id();
+    let per_tu_env = format!("{fixture}_per_tu_{nonce}");
+    let batched_env = format!("{fixture}_batched_{nonce}");
+    let project = scratch.join(fixture);
+    scaffold(
+        fixture,
+        &project,
+        &[per_tu_env.clone(), batched_env.clone()],
+    );
+
+    // Toolchain / framework downloads stay outside the timed region.
+    fbuild_build::install_platform_deps(platform, &project)
+        .await
+        .expect("platform deps install");
+
+    batcher.set_max_batch(0);
+    let per_tu = timed_build(platform, &project, &per_tu_env).await;
+
+    batcher.set_max_batch(BENCH_MAX_BATCH);
+    let before = batcher.stats();
+    let batched = timed_build(platform, &project, &batched_env).await;
+    let after = batcher.stats();
+    batcher.set_max_batch(0);
+
+    println!(
+        "compile_batch_bench {fixture}: per-TU {:.2}s, batched {:.2}s ({:+.1}%), \
+         {} invocations / {} TUs batched, {} fallbacks",
+        per_tu.as_secs_f64(),
+        batched.as_secs_f64(),
+        (batched.as_secs_f64() / per_tu.as_secs_f64() - 1.0) * 100.0,
+        after.batches - before.batches,
+        after.batched_tus - before.batched_tus,
+        after.fallbacks - before.fallbacks,
+    );
+}
+
+#[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+#[ignore = "downloads AVR + ESP32 toolchains and measures wall time; perf oracle"]
+async fn compile_batch_bench_uno_and_esp32dev() {
+    let scratch = tempfile::TempDir::new().unwrap();
+    bench_fixture(scratch.path(), "uno", Platform::AtmelAvr).await;
+    bench_fixture(scratch.path(), "esp32dev", Platform::Espressif32).await;
+}
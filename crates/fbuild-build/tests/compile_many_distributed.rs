@@ -0,0 +1,206 @@
+//! Integration tests for distributed `compile-many`.
+//!
+//! Each "daemon" is a minimal HTTP/1.1 server on its own 127.0.0.1 port
+//! that serves `POST /api/compile-many` through
+//! [`compile_many_dist::run_shard`] with a mock [`SketchBuilder`] — the
+//! same shard runner the real daemon route uses — so the coordinator's
+//! sharding, NDJSON streaming, and merge run end to end on one box without
+//! a toolchain.
+
+use std::sync::{Arc, Mutex};
+
+use fbuild_build::compile_many::{
+    CompileManyRequest, SketchBuildInputs, SketchBuilder, SketchResult, Stage,
+};
+use fbuild_build::compile_many_dist::{
+    ShardEvent, ShardRequest, compile_many_distributed, run_shard,
+};
+use fbuild_core::BuildProfile;
+use fbuild_core::channel::unbounded;
+use tokio::io::{AsyncReadExt, AsyncWriteExt};
+use tokio::net::TcpListener;
+
+/// Records which sketches this daemon built.
+struct RecordingBuilder {
+    built: Mutex<Vec<String>>,
+}
+
+#[async_trait::async_trait]
+impl SketchBuilder for RecordingBuilder {
+    async fn build(&self, inputs: SketchBuildInputs) -> SketchResult {
+        self.built
+            .lock()
+            .unwrap()
+            .push(inputs.sketch.to_string_lossy().into_owned());
+        SketchResult {
+            sketch: inputs.sketch.clone(),
+            env_name: inputs.env_name,
+            success: true,
+            firmware_path: None,
+            elf_path: None,
+            build_time_secs: 0.0,
+            log_path: None,
+            message: "mock build ok".to_string(),
+            stage: inputs.stage,
+            worker_index: None,
+            seed_time_secs: 0.0,
+            seed_applied: false,
+        }
+    }
+}
+
+/// Serve `/api/compile-many` on an ephemeral port until the test ends.
+/// Returns the base URL and the daemon's builder.
+async fn spawn_daemon() -> (String, Arc<RecordingBuilder>) {
+    let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
+    let url = format!("http://{}", listener.local_addr().unwrap());
+    let builder = Arc::new(RecordingBuilder {
+        built: Mutex::new(Vec::new()),
+    });
+    let served = Arc::clone(&builder);
+    tokio::spawn(async move {
+        while let Ok((mut socket, _)) = listener.accept().await {
+            let builder = Arc::clone(&served);
+            tokio::spawn(async move {
+                let body = read_request_body(&mut socket).await;
+                let shard: ShardRequest = serde_json::from_slice(&body).unwrap();
+                socket
+                    .write_all(
+                        b"HTTP/1.1 200 OK\r\ncontent-type: application/x-ndjson\r\n\
+                          connection: close\r\n\r\n",
+                    )
+                    .await
+                    .unwrap();
+                let (tx, mut rx) = unbounded::<ShardEvent>();
+                let run = async {
+                    run_shard(shard.request, builder.as_ref(), &tx).await;
+                    drop(tx);
+                };
+                let forward = async {
+                    while let Some(event) = rx.recv().await {
+                        socket.write_all(event.to_line().as_bytes()).await.unwrap();
+                    }
+                };
+                tokio::join!(run, forward);
+            });
+        }
+    });
+    (url, builder)
+}
+
+/// Read one request and return its `Content-Length` body.
+async fn read_request_body(socket: &mut tokio::net::TcpStream) -> Vec<u8> {
+    let mut buf = Vec::new();
+    let mut chunk = [0u8; 4096];
+    loop {
+        let n = socket.read(&mut chunk).await.unwrap();
+        assert!(n > 0, "client closed before the request was complete");
+        buf.extend_from_slice(&chunk[..n]);
+        let Some(end) = buf.windows(4).position(|w| w == b"\r\n\r\n") else {
+            continue;
+        };
+        let head = String::from_utf8_lossy(&buf[..end]).to_ascii_lowercase();
+        let len: usize = head
+            .lines()
+            .find_map(|l| l.strip_prefix("content-length:"))
+            .map(|v| v.trim().parse().unwrap())
+            .unwrap_or(0);
+        if buf.len() >= end + 4 + len {
+            return buf[end + 4..end + 4 + len].to_vec();
+        }
+    }
+}
+
+fn make_request(tmp: &std::path::Path, count: usize) -> CompileManyRequest {
+    let sketches = (0..count)
+        .map(|i| {
+            let dir = tmp.join(format!("sketch{i}"));
+            std::fs::create_dir_all(&dir).unwrap();
+            std::fs::write(
+                dir.join("platformio.ini"),
+                "[env:uno]\nplatform = atmelavr\nboard = uno\nframework = arduino\n",
+            )
+            .unwrap();
+            dir
+        })
+        .collect();
+    CompileManyRequest {
+        board: "uno".to_string(),
+        sketches,
+        framework_jobs: Some(1),
+        sketch_jobs: Some(2),
+        profile: BuildProfile::Release,
+        verbose: false,
+        pio_env: std::collections::HashMap::new(),
+        diag_stage2: false,
+        fail_fast: false,
+    }
+}
+
+/// AC: a request is split across every daemon, each daemon runs its own
+/// stage 1, every result streams back, and the merged result is in input
+/// order.
+#[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+async fn shards_across_daemons_and_merges_in_input_order() {
+    let tmp = tempfile::tempdir().unwrap();
+    let req = make_request(tmp.path(), 7);
+    let mut daemons = Vec::new();
+    let mut builders = Vec::new();
+    for _ in 0..3 {
+        let (url, builder) = spawn_daemon().await;
+        daemons.push(url);
+        builders.push(builder);
+    }
+
+    let mut streamed = Vec::new();
+    let result = compile_many_distributed(req.clone(), &daemons, None, &mut |daemon, r| {
+        streamed.push((daemon.to_string(), r.sketch.clone()));
+    })
+    .await
+    .expect("distributed compile-many");
+
+    assert!(result.all_success);
+    assert_eq!(result.stage1_count, 3, "one stage 1 per daemon");
+    assert_eq!(result.stage2_count, 4);
+    let order: Vec<_> = result.results.iter().map(|r| r.sketch.clone()).collect();
+    assert_eq!(order, req.sketches, "results follow input order");
+    assert_eq!(streamed.len(), 7, "every sketch streamed back");
+    for (idx, builder) in builders.iter().enumerate() {
+        let built = builder.built.lock().unwrap().len();
+        assert!(built >= 2, "daemon {idx} built only {built} sketches");
+    }
+    let stage1: Vec<_> = result
+        .results
+        .iter()
+        .filter(|r| r.stage == Stage::Stage1Framework)
+        .collect();
+    assert_eq!(stage1.len(), 3);
+}
+
+/// AC: an unreachable daemon fails only its own shard.
+#[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+async fn unreachable_daemon_fails_only_its_shard() {
+    let tmp = tempfile::tempdir().unwrap();
+    let req = make_request(tmp.path(), 4);
+    let (live, _builder) = spawn_daemon().await;
+    let dead = {
+        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
+        format!("http://{}", listener.local_addr().unwrap())
+    };
+
+    let result = compile_many_distributed(req.clone(), &[live, dead.clone()], None, &mut |_, _| {})
+        .await
+        .expect("coordinator returns a result");
+
+    assert!(!result.all_success);
+    assert_eq!(result.results.len(), 4, "one entry per requested sketch");
+    for (idx, r) in result.results.iter().enumerate() {
+        assert_eq!(r.sketch, req.sketches[idx]);
+        if idx % 2 == 0 {
+            assert!(r.success, "live shard sketch {idx} failed: {}", r.message);
+        } else {
+            assert!(!r.success);
+            assert!(r.message.contains(&dead), "message: {}", r.message);
+        }
+    }
+}
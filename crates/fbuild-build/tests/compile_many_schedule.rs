@@ -0,0 +1,182 @@
+//! Integration tests for stage-2 scheduling in `compile-many`: library-group
+//! ordering, streamed results, and `fail_fast` cancellation.
+//!
+//! A scripted [`SketchBuilder`] stands in for the orchestrator; each
+//! sketch's behavior is keyed off its directory name.
+
+use std::path::Path;
+use std::sync::Mutex;
+use std::time::Duration;
+
+use fbuild_build::compile_many::{
+    CompileManyRequest, SketchBuildInputs, SketchBuilder, SketchResult, compile_many_streaming,
+};
+use fbuild_core::BuildProfile;
+
+/// Write sketch project `<parent>/<name>` whose only source includes
+/// `header`.
+fn make_sketch(parent: &Path, name: &str, header: &str) {
+    let dir = parent.join(name);
+    std::fs::create_dir_all(dir.join("src")).unwrap();
+    std::fs::write(
+        dir.join("platformio.ini"),
+        "[env:uno]\nplatform = atmelavr\nboard = uno\nframework = arduino\n",
+    )
+    .unwrap();
+    std::fs::write(
+        dir.join("src").join("main.cpp"),
+        format!("#include <{header}>\nvoid setup() {{}}\nvoid loop() {{}}\n"),
+    )
+    .unwrap();
+}
+
+/// Create `(name, header)` sketches under `parent`, in order.
+fn make_sketches(parent: &Path, specs: &[(&str, &str)]) -> CompileManyRequest {
+    let mut req = CompileManyRequest {
+        board: "uno".to_string(),
+        sketches: Vec::new(),
+        framework_jobs: Some(1),
+        sketch_jobs: Some(4),
+        profile: BuildProfile::Release,
+        verbose: false,
+        pio_env: std::collections::HashMap::new(),
+        diag_stage2: false,
+        fail_fast: false,
+    };
+    for (name, header) in specs {
+        make_sketch(parent, name, header);
+        req.sketches.push(parent.join(name));
+    }
+    req
+}
+
+fn sketch_name(sketch: &Path) -> String {
+    sketch.file_name().unwrap().to_string_lossy().into_owned()
+}
+
+/// Records `start <name>` / `end <name>` per build. Sketches named
+/// `fail*` fail at once, `slow*` take far longer than any test allows,
+/// everything else takes a few milliseconds.
+struct ScriptedBuilder {
+    events: Mutex<Vec<String>>,
+}
+
+impl ScriptedBuilder {
+    fn new() -> Self {
+        Self {
+            events: Mutex::new(Vec::new()),
+        }
+    }
+
+    fn position(&self, event: &str) -> usize {
+        let events = self.events.lock().unwrap();
+        events
+            .iter()
+            .position(|e| e == event)
+            .unwrap_or_else(|| panic!("no `{event}` in {events:?}"))
+    }
+}
+
+#[async_trait::async_trait]
+impl SketchBuilder for ScriptedBuilder {
+    async fn build(&self, inputs: SketchBuildInputs) -> SketchResult {
+        let name = sketch_name(&inputs.sketch);
+        self.events.lock().unwrap().push(format!("start {name}"));
+        let success = !name.starts_with("fail");
+        let delay = if name.starts_with("slow") {
+            Duration::from_secs(600)
+        } else if success {
+            Duration::from_millis(20)
+        } else {
+            Duration::ZERO
+        };
+        tokio::time::sleep(delay).await;
+        self.events.lock().unwrap().push(format!("end {name}"));
+        SketchResult {
+            sketch: inputs.sketch,
+            env_name: inputs.env_name,
+            success,
+            firmware_path: None,
+            elf_path: None,
+            build_time_secs: delay.as_secs_f64(),
+            log_path: None,
+            message: if success { "ok" } else { "scripted failure" }.to_string(),
+            stage: inputs.stage,
+            worker_index: None,
+            seed_time_secs: 0.0,
+            seed_applied: false,
+        }
+    }
+}
+
+/// AC: sketches with the same library set build back to back behind the
+/// group's first sketch, results stream as they finish, and the final
+/// result keeps input order.
+#[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+async fn library_groups_build_behind_their_leader() {
+    let tmp = tempfile::tempdir().unwrap();
+    let req = make_sketches(
+        tmp.path(),
+        &[
+            ("base", "Arduino.h"),
+            ("wire1", "Wire.h"),
+            ("spi1", "SPI.h"),
+            ("wire2", "Wire.h"),
+            ("base2", "Arduino.h"),
+            ("spi2", "SPI.h"),
+        ],
+    );
+    let builder = ScriptedBuilder::new();
+    let streamed = Mutex::new(Vec::new());
+    let result = compile_many_streaming(req.clone(), &builder, &|r| {
+        streamed.lock().unwrap().push(sketch_name(&r.sketch));
+    })
+    .await
+    .expect("compile_many");
+
+    assert!(result.all_success);
+    let order: Vec<_> = result.results.iter().map(|r| r.sketch.clone()).collect();
+    assert_eq!(order, req.sketches, "results follow input order");
+    let streamed = streamed.into_inner().unwrap();
+    assert_eq!(streamed.len(), 6, "every sketch streamed: {streamed:?}");
+    assert_eq!(streamed[0], "base", "stage 1 streams first");
+
+    assert!(builder.position("end wire1") < builder.position("start wire2"));
+    assert!(builder.position("end spi1") < builder.position("start spi2"));
+    // Stage 1's group needs no leader and goes out first.
+    assert!(builder.position("start base2") < builder.position("start wire1"));
+}
+
+/// AC: with `fail_fast`, the first failure cancels queued and in-flight
+/// sketches instead of waiting for them, and each is reported cancelled.
+#[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+async fn fail_fast_cancels_the_rest_of_the_batch() {
+    let tmp = tempfile::tempdir().unwrap();
+    let slow: Vec<String> = (0..5).map(|i| format!("slow{i}")).collect();
+    let mut specs = vec![("base", "Arduino.h"), ("fail", "Arduino.h")];
+    specs.extend(slow.iter().map(|name| (name.as_str(), "Arduino.h")));
+    let mut req = make_sketches(tmp.path(), &specs);
+    req.fail_fast = true;
+    let total = req.sketches.len();
+    let builder = ScriptedBuilder::new();
+    let streamed = Mutex::new(0usize);
+    let count = |_: &SketchResult| *streamed.lock().unwrap() += 1;
+    let run = compile_many_streaming(req, &builder, &count);
+    let result = tokio::time::timeout(Duration::from_secs(30), run)
+        .await
+        .expect("fail-fast must not wait for the slow sketches")
+        .expect("compile_many");
+
+    assert!(!result.all_success);
+    assert_eq!(result.results.len(), total);
+    assert_eq!(*streamed.lock().unwrap(), total);
+    assert_eq!(result.results[1].message, "scripted failure");
+    for r in &result.results[2..] {
+        assert!(!r.success);
+        assert!(
+            r.message.starts_with("cancelled:") && r.message.contains("fail"),
+            "message: {}",
+            r.message
+        );
+    }
+}
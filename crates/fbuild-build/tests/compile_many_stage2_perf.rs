@@ -99,6 +99,7 @@ async fn stage2_per_sketch_wall_is_a_fraction_of_stage1() {
         verbose: false,
         pio_env: Default::default(),
         diag_stage2: true,
+        fail_fast: false,
     };
 
     let result = under_test_timeout(compile_many(req))
@@ -169,6 +169,7 @@ fn make_request(
         verbose: false,
         pio_env: std::collections::HashMap::new(),
         diag_stage2: false,
+        fail_fast: false,
     }
 }
 
@@ -458,3 +459,56 @@ async fn stage2_results_report_worker_and_seed_diagnostics() {
         );
     }
 }
+
+/// AC: every sketch of one call shares a single `EnvSession`, so an
+/// env-level step memoized through it runs once per batch, and the
+/// session's counters surface as `stage_timings`.
+#[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+async fn sketches_share_one_env_session() {
+    struct SessionBuilder {
+        inits: AtomicUsize,
+    }
+    #[async_trait::async_trait]
+    impl SketchBuilder for SessionBuilder {
+        async fn build(&self, inputs: SketchBuildInputs) -> SketchResult {
+            let session = inputs.env_session.expect("compile-many sets a session");
+            let toolchain: String = session
+                .get_or_try_init("ensure-installed", "toolchain-avr@1", || async {
+                    self.inits.fetch_add(1, Ordering::SeqCst);
+                    Ok("/cache/toolchain-avr".to_string())
+                })
+                .await
+                .expect("memoized install");
+            SketchResult {
+                sketch: inputs.sketch.clone(),
+                env_name: inputs.env_name,
+                success: toolchain == "/cache/toolchain-avr",
+                firmware_path: None,
+                elf_path: None,
+                build_time_secs: 0.0,
+                log_path: None,
+                message: "mock build ok".to_string(),
+                stage: inputs.stage,
+                worker_index: None,
+                seed_time_secs: 0.0,
+                seed_applied: false,
+            }
+        }
+    }
+
+    let tmp = tempfile::tempdir().unwrap();
+    let sketches: Vec<PathBuf> = (0..5)
+        .map(|i| make_sketch(tmp.path(), &format!("shared{i}"), "uno"))
+        .collect();
+    let builder = SessionBuilder {
+        inits: AtomicUsize::new(0),
+    };
+    let result = compile_many_with(make_request(sketches, 1, 4), &builder)
+        .await
+        .expect("compile_many");
+    assert!(result.all_success);
+    assert_eq!(builder.inits.load(Ordering::SeqCst), 1);
+    let (name, timing) = &result.stage_timings[0];
+    assert_eq!(name, "ensure-installed");
+    assert_eq!((timing.runs, timing.reused), (1, 4));
+}
@@ -114,6 +114,7 @@ void loop() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -208,6 +209,7 @@ void loop() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -295,6 +297,7 @@ void loop() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -383,6 +386,7 @@ void loop() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -461,6 +465,7 @@ async fn build_esp32s3_fixture() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -531,6 +536,7 @@ async fn build_nightdriverstrip_demo() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -632,6 +638,7 @@ async fn incremental_build_at(project_dir: &std::path::Path, env_name: &str) {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -733,6 +740,7 @@ async fn incremental_nightdriverstrip_one_file_changed() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
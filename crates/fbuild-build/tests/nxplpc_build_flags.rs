@@ -105,6 +105,7 @@ async fn lpc845brk_propagates_build_flags_to_library_compile_587() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
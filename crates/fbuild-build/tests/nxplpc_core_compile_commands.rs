@@ -76,6 +76,7 @@ async fn build_core_repo(repo: &Path, env_name: &str) -> tempfile::TempDir {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
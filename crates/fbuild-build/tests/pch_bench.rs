@@ -0,0 +1,173 @@
+//! Benchmark: sketch compile time with and without `build_pch = auto`
+//! (precompiled `Arduino.h`, see `fbuild_build::pch`) on the uno and
+//! esp32dev fixture boards.
+//!
+//! Each board gets a synthetic sketch of [`SKETCH_TUS`] translation units
+//! that all include `Arduino.h`. After one untimed warm-up build (toolchain
+//! install + core objects into a fresh zccache root), three clean builds are
+//! timed:
+//!
+//! 1. `build_pch` unset,
+//! 2. `build_pch = auto` — includes generating the `.gch` unless an earlier
+//!    bench run already cached one for this toolchain + flag set,
+//! 3. `build_pch = auto` again (PCH reused).
+//!
+//! The sketch sources are rewritten with a fresh comment before every timed
+//! build so zccache can't serve the sketch TUs; the shared core objects are
+//! zccache hits in all three runs, so the deltas isolate sketch front-end
+//! time. Timings are printed; the only assertion is that builds succeed.
+//!
+//! Gated `#[ignore]` because it downloads real toolchains on first run.
+//! Run with:
+//!
+//! ```bash
+//! soldr cargo test -p fbuild-build --test pch_bench -- --ignored --nocapture
+//! ```
+
+use std::fs;
+use std::path::Path;
+use std::time::{Duration, Instant};
+
+use fbuild_build::{BuildParams, compile_backend, get_orchestrator};
+use fbuild_core::{BuildProfile, Platform};
+
+/// 15-min wall-clock cap for `--ignored` real-toolchain tests (FastLED/fbuild#806).
+const REAL_BUILD_TIMEOUT: Duration = Duration::from_secs(900);
+
+/// Sketch translation units per board.
+const SKETCH_TUS: usize = 16;
+
+async fn under_test_timeout<F: std::future::Future>(fut: F) -> F::Output {
+    match tokio::time::timeout(REAL_BUILD_TIMEOUT, fut).await {
+        Ok(v) => v,
+        Err(_) => panic!(
+            "real-toolchain test exceeded {:.0}s budget — see FastLED/fbuild#806",
+            REAL_BUILD_TIMEOUT.as_secs_f64()
+        ),
+    }
+}
+
+/// Once per test process, rooted at a throwaway zccache cache.
+async fn install_bench_compile_backend(cache_root: &Path) {
+    static INSTALL: tokio::sync::OnceCell<()> = tokio::sync::OnceCell::const_new();
+    INSTALL
+        .get_or_init(|| async {
+            let backend = compile_backend::CompileBackend::start_in(cache_root)
+                .await
+                .expect("compile backend starts for PCH bench");
+            compile_backend::install_global(backend);
+        })
+        .await;
+}
+
+/// (Re)write the synthetic sketch; `generation` only changes a comment so
+/// every timed build is a zccache miss for the sketch TUs.
+fn write_sketch(project: &Path, generation: usize) {
+    let src = project.join("src");
+    fs::create_dir_all(&src).unwrap();
+    let mut ino = format!("// generation {generation}\n#include <Arduino.h>\n");
+    for i in 0..SKETCH_TUS {
+        ino.push_str(&format!("int unit_{i}(int);\n"));
+        fs::write(
+            src.join(format!("unit_{i}.cpp")),
+            format!(
+                "// generation {generation}\n#include <Arduino.h>\n\
+                 int unit_{i}(int v) {{ return v * {i} + (int)millis(); }}\n"
+            ),
+        )
+        .unwrap();
+    }
+    ino.push_str("void setup() { pinMode(2, OUTPUT); }\n");
+    ino.push_str("void loop() { digitalWrite(2, unit_0(1) & 1); }\n");
+    fs::write(src.join("main.ino"), ino).unwrap();
+}
+
+fn write_ini(project: &Path, board_env: &str, envs: &[(&str, bool)]) {
+    let fixture_ini = Path::new(env!("CARGO_MANIFEST_DIR"))
+        .join("../../tests/platform")
+        .join(board_env)
+        .join("platformio.ini");
+    let mut ini = fs::read_to_string(fixture_ini).unwrap();
+    for (env, pch) in envs {
+        ini.push_str(&format!("\n[env:{env}]\nextends = env:{board_env}\n"));
+        if *pch {
+            ini.push_str("build_pch = auto\n");
+        }
+    }
+    fs::write(project.join("platformio.ini"), ini).unwrap();
+}
+
+async fn timed_build(platform: Platform, project: &Path, env: &str) -> Duration {
+    let params = BuildParams {
+        project_dir: project.to_path_buf(),
+        env_name: env.to_string(),
+        clean_all: false,
+        clean_only: false,
+        clean: true,
+        profile: BuildProfile::Release,
+        build_dir: project.join(".fbuild/build").join(env).join("release"),
+        verbose: false,
+        jobs: None,
+        generate_compiledb: false,
+        compiledb_only: false,
+        log_sender: None,
+        symbol_analysis: false,
+        symbol_analysis_path: None,
+        no_timestamp: false,
+        src_dir: None,
+        pio_env: Default::default(),
+        extra_build_flags: Vec::new(),
+        watch_set_cache: None,
+        env_session: None,
+        bloat_analysis: false,
+        caller_path: None,
+    };
+    let orchestrator = get_orchestrator(platform).unwrap();
+    let started = Instant::now();
+    let result = under_test_timeout(orchestrator.build(&params))
+        .await
+        .unwrap_or_else(|e| panic!("{env} build failed: {e}"));
+    assert!(
+        result.success,
+        "{env} build reported failure: {}",
+        result.message
+    );
+    started.elapsed()
+}
+
+async fn bench_board(scratch: &Path, board_env: &str, platform: Platform) {
+    install_bench_compile_backend(&scratch.join("zccache")).await;
+    let nonce = std::process::id();
+    let plain = format!("{board_env}_nopch_{nonce}");
+    let pch = format!("{board_env}_pch_{nonce}");
+    let project = scratch.join(board_env);
+    fs::create_dir_all(&project).unwrap();
+    write_ini(&project, board_env, &[(&plain, false), (&pch, true)]);
+
+    write_sketch(&project, 0);
+    let _ = timed_build(platform, &project, &plain).await;
+
+    write_sketch(&project, 1);
+    let without = timed_build(platform, &project, &plain).await;
+    write_sketch(&project, 2);
+    let cold = timed_build(platform, &project, &pch).await;
+    write_sketch(&project, 3);
+    let warm = timed_build(platform, &project, &pch).await;
+
+    println!(
+        "pch_bench {board_env} ({SKETCH_TUS} sketch TUs): no PCH {:.2}s, \
+         PCH cold {:.2}s, PCH warm {:.2}s ({:+.1}% vs no PCH)",
+        without.as_secs_f64(),
+        cold.as_secs_f64(),
+        warm.as_secs_f64(),
+        (warm.as_secs_f64() / without.as_secs_f64() - 1.0) * 100.0,
+    );
+}
+
+#[tokio::test(flavor = "multi_thread", worker_threads = 4)]
+#[ignore = "downloads AVR + ESP32 toolchains and measures wall time; perf oracle"]
+async fn pch_bench_uno_and_esp32dev() {
+    let scratch = tempfile::TempDir::new().unwrap();
+    bench_board(scratch.path(), "uno", Platform::AtmelAvr).await;
+    bench_board(scratch.path(), "esp32dev", Platform::Espressif32).await;
+}
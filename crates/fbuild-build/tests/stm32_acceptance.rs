@@ -103,6 +103,7 @@ async fn stm32f103c8_blink_with_spi_auto_discovers_library_205_ac4() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -121,6 +121,7 @@ async fn teensy30_analog_output_meets_205_ac2() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -73,6 +73,7 @@ async fn teensylc_blink_meets_205_acceptance_criteria() {
         pio_env: Default::default(),
         extra_build_flags: Vec::new(),
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
@@ -452,6 +452,21 @@ pub enum Commands {
         #[arg(long = "upgrade-package")]
         upgrade_package: Option<String>,
     },
+    /// Install the toolchains, frameworks and tools of every environment
+    /// in `platformio.ini` ahead of the first build. The daemon resolves
+    /// each env's board and fetches all envs' packages concurrently, so
+    /// later builds find them warm.
+    Prefetch {
+        /// Project directory.
+        #[arg(default_value = ".")]
+        project_dir: String,
+        /// Prefetch only this environment (repeatable; default: all).
+        #[arg(short = 'e', long = "environment")]
+        environments: Vec<String>,
+        /// Return once the daemon has started the prefetch.
+        #[arg(long)]
+        background: bool,
+    },
     /// Manage the fbuild daemon
     Daemon {
         #[command(subcommand)]
@@ -677,6 +692,18 @@ pub enum Commands {
         /// Emit JSONL per stage-2 worker with seed/build timing.
         #[arg(long)]
         diag_stage2: bool,
+        /// Stop at the first failed sketch, cancelling in-flight builds.
+        #[arg(long)]
+        fail_fast: bool,
+        /// Shard the sketches across fbuild daemons instead of building
+        /// in-process (repeatable). Accepts a URL, `host:port`, or a bare
+        /// local port. Every daemon must see the sketches at the same paths.
+        #[arg(long = "daemon")]
+        daemons: Vec<String>,
+        /// `fbuild cache save` archive each `--daemon` restores before
+        /// building, so daemons with separate cache roots start warm.
+        #[arg(long, requires = "daemons")]
+        cache_archive: Option<String>,
         /// Sketch project directories (each must contain `platformio.ini`).
         #[arg(required = true)]
         sketches: Vec<String>,
@@ -723,6 +750,9 @@ pub enum Commands {
         /// Emit JSONL per stage-2 worker with seed/build timing.
         #[arg(long)]
         diag_stage2: bool,
+        /// Stop at the first failed sketch, cancelling in-flight builds.
+        #[arg(long)]
+        fail_fast: bool,
         /// Sketches to build. Each entry is either a project directory
         /// containing `platformio.ini` or a `.ino` file whose parent
         /// directory is the project. Matches `pio ci` positional args.
@@ -1062,6 +1092,7 @@ pub const KNOWN_SUBCOMMANDS: &[&str] = &[
     "symbols",
     "bloat",
     "sync",
+    "prefetch",
 ];
 
 /// Rewrite `fbuild <dir> <subcommand> ...` → `fbuild <subcommand> <dir> ...`
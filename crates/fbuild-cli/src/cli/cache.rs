@@ -9,6 +9,8 @@
 //! fbuild cache save    ~/fbuild-cache.tar.zst
 //! fbuild build . -e <env>
 //! fbuild cache restore ~/fbuild-cache.tar.zst
+//! fbuild cache save    ~/fbuild-cache-delta.tar.zst --base ~/fbuild-cache.tar.zst
+//! fbuild cache restore ~/fbuild-cache.tar.zst ~/fbuild-cache-delta.tar.zst
 //! fbuild cache list    ~/fbuild-cache.tar.zst
 //! fbuild cache verify  ~/fbuild-cache.tar.zst
 //! ```
@@ -41,14 +43,27 @@ pub enum CacheAction {
         /// zstd compression level (1..=22, default 9).
         #[arg(long, default_value_t = cache_archive::DEFAULT_ZSTD_LEVEL)]
         zstd_level: i32,
+        /// zstd compression threads (0 = one per core, 1 = single-threaded).
+        #[arg(long, default_value_t = 0)]
+        workers: usize,
+        /// Write a delta against this archive: only files whose content
+        /// differs from its manifest are stored. Its payload is not read.
+        #[arg(long)]
+        base: Option<PathBuf>,
         /// Override the cache root (defaults to fbuild's dev/prod cache dir).
         #[arg(long)]
         cache_dir: Option<PathBuf>,
     },
     /// Restore a `.tar.zst` archive back into the fbuild cache.
     Restore {
-        /// Archive to restore.
-        archive: PathBuf,
+        /// Archive to restore. To apply deltas, list the full snapshot first
+        /// and then each delta in the order they were saved.
+        #[arg(required = true)]
+        archives: Vec<PathBuf>,
+        /// File-writer threads (0 = one per core, 1 = write on the
+        /// decompressing thread).
+        #[arg(long, default_value_t = 0)]
+        workers: usize,
         /// Override the cache root (defaults to fbuild's dev/prod cache dir).
         #[arg(long)]
         cache_dir: Option<PathBuf>,
@@ -75,6 +90,8 @@ pub fn run_cache(action: CacheAction) -> Result<()> {
             include,
             exclude,
             zstd_level,
+            workers,
+            base,
             cache_dir,
         } => {
             let root = cache_dir.unwrap_or_else(fbuild_paths::get_cache_root);
@@ -83,13 +100,25 @@ pub fn run_cache(action: CacheAction) -> Result<()> {
             } else {
                 SliceSelection::Explicit(include)
             };
-            let manifest = cache_archive::save(&root, &archive, &selection, &exclude, zstd_level)?;
+            let manifest = cache_archive::save(
+                &root,
+                &archive,
+                &selection,
+                &exclude,
+                zstd_level,
+                workers,
+                base.as_deref(),
+            )?;
             output::result(render_saved(&archive, &manifest));
             Ok(())
         }
-        CacheAction::Restore { archive, cache_dir } => {
+        CacheAction::Restore {
+            archives,
+            workers,
+            cache_dir,
+        } => {
             let root = cache_dir.unwrap_or_else(fbuild_paths::get_cache_root);
-            let manifest = cache_archive::restore(&archive, &root)?;
+            let manifest = cache_archive::restore_chain(&archives, &root, workers)?;
             output::result(format!(
                 "restored {} slice(s), {} file(s), {} into {}",
                 manifest.slices.len(),
@@ -114,6 +143,16 @@ pub fn run_cache(action: CacheAction) -> Result<()> {
 
 fn render_saved(archive: &std::path::Path, m: &cache_archive::CacheManifest) -> String {
     let on_disk = std::fs::metadata(archive).map(|md| md.len()).unwrap_or(0);
+    if m.base.is_some() {
+        let (files, bytes) = m.stored_totals();
+        return format!(
+            "saved delta: {files} of {} file(s) changed, {} → {} ({} compressed)",
+            m.total_files(),
+            human_bytes(bytes),
+            archive.display(),
+            human_bytes(on_disk),
+        );
+    }
     format!(
         "saved {} slice(s), {} file(s), {} → {} ({} compressed)",
         m.slices.len(),
@@ -139,6 +178,15 @@ fn render_manifest(
         m.format_version,
         if verified { " — VERIFIED OK" } else { "" }
     );
+    if let Some(base) = &m.base {
+        let (files, bytes) = m.stored_totals();
+        let _ = writeln!(
+            out,
+            "  delta against manifest {}: {files} file(s), {} stored",
+            &base.manifest_hash[..base.manifest_hash.len().min(12)],
+            human_bytes(bytes)
+        );
+    }
     for s in &m.slices {
         let _ = writeln!(
             out,
@@ -195,7 +243,9 @@ mod tests {
                 file_count: 3,
                 byte_count: 2048,
                 content_hash: "abcdef0123456789".into(),
+                files: vec![],
             }],
+            base: None,
         };
         let s = render_manifest(std::path::Path::new("x.tar.zst"), &m, true);
         assert!(s.contains("VERIFIED OK"));
@@ -217,6 +267,8 @@ mod tests {
             include: vec![],
             exclude: vec![],
             zstd_level: 3,
+            workers: 0,
+            base: None,
             cache_dir: Some(src.path().to_path_buf()),
         })
         .unwrap();
@@ -235,7 +287,8 @@ mod tests {
         // restore into a fresh dir reproduces the file.
         let dst = tempfile::tempdir().unwrap();
         run_cache(CacheAction::Restore {
-            archive,
+            archives: vec![archive],
+            workers: 0,
             cache_dir: Some(dst.path().to_path_buf()),
         })
         .unwrap();
@@ -244,4 +297,44 @@ mod tests {
             b"GCC"
         );
     }
+
+    #[test]
+    fn delta_save_and_chained_restore_through_cli_layer() {
+        let src = tempfile::tempdir().unwrap();
+        std::fs::create_dir_all(src.path().join("toolchains")).unwrap();
+        std::fs::write(src.path().join("toolchains/gcc"), "GCC").unwrap();
+        let out = tempfile::tempdir().unwrap();
+        let base = out.path().join("base.tar.zst");
+        let delta = out.path().join("delta.tar.zst");
+        let save = |archive: &std::path::Path, base: Option<PathBuf>| {
+            run_cache(CacheAction::Save {
+                archive: archive.to_path_buf(),
+                include: vec![],
+                exclude: vec![],
+                zstd_level: 3,
+                workers: 0,
+                base,
+                cache_dir: Some(src.path().to_path_buf()),
+            })
+        };
+        save(&base, None).unwrap();
+        std::fs::write(src.path().join("toolchains/gcc"), "GCC 2").unwrap();
+        save(&delta, Some(base.clone())).unwrap();
+        assert!(
+            render_manifest(&delta, &cache_archive::verify(&delta).unwrap(), true)
+                .contains("delta against manifest")
+        );
+
+        let dst = tempfile::tempdir().unwrap();
+        run_cache(CacheAction::Restore {
+            archives: vec![base, delta],
+            workers: 0,
+            cache_dir: Some(dst.path().to_path_buf()),
+        })
+        .unwrap();
+        assert_eq!(
+            std::fs::read(dst.path().join("toolchains/gcc")).unwrap(),
+            b"GCC 2"
+        );
+    }
 }
@@ -85,6 +85,10 @@ pub async fn build_ci_pio_env(
 /// one framework build" — so all stage-1 + stage-2 work happens in this
 /// process, parallelism is driven by the `compile_many` thread pool, and
 /// no per-sketch daemon round-trip is incurred.
+///
+/// With `--daemon` the process is a coordinator instead: the sketches are
+/// sharded across the listed daemons (`fbuild_build::compile_many_dist`),
+/// each of which runs the same two-stage flow on its shard.
 pub struct CompileManyArgs {
     pub board: String,
     pub framework_jobs: Option<usize>,
@@ -93,12 +97,21 @@ pub struct CompileManyArgs {
     pub release: bool,
     pub verbose: bool,
     pub diag_stage2: bool,
+    /// Cancel the remaining sketches at the first failure.
+    pub fail_fast: bool,
     pub sketches: Vec<String>,
     pub pio_env: std::collections::HashMap<String, String>,
+    /// Daemons to shard across; empty builds in-process.
+    pub daemons: Vec<String>,
+    /// Cache archive each daemon restores before building.
+    pub cache_archive: Option<String>,
 }
 
 pub async fn run_compile_many(args: CompileManyArgs) -> fbuild_core::Result<()> {
-    use fbuild_build::compile_many::{CompileManyRequest, Stage, compile_many};
+    use fbuild_build::compile_many::{
+        CompileManyRequest, OrchestratorBuilder, Stage, compile_many_streaming,
+    };
+    use fbuild_build::compile_many_dist::{compile_many_distributed, daemon_url};
 
     let CompileManyArgs {
         board,
@@ -108,8 +121,11 @@ pub async fn run_compile_many(args: CompileManyArgs) -> fbuild_core::Result<()>
         release,
         verbose,
         diag_stage2,
+        fail_fast,
         sketches,
         pio_env,
+        daemons,
+        cache_archive,
     } = args;
 
     let profile = if release {
@@ -134,6 +150,7 @@ pub async fn run_compile_many(args: CompileManyArgs) -> fbuild_core::Result<()>
         verbose,
         pio_env,
         diag_stage2,
+        fail_fast,
     };
 
     let effective_framework = req
@@ -152,7 +169,25 @@ pub async fn run_compile_many(args: CompileManyArgs) -> fbuild_core::Result<()>
 
     // `compile_many` is async (driving per-stage tokio fanout). Await it
     // directly — the runtime is already multi-threaded.
-    let result = compile_many(req).await?;
+    let result = if daemons.is_empty() {
+        compile_many_streaming(req, &OrchestratorBuilder, &|r| {
+            let status = if r.success { "OK" } else { "FAIL" };
+            output::progress(format!("  {} {}", status, r.sketch.display()));
+        })
+        .await?
+    } else {
+        let daemons: Vec<String> = daemons.iter().map(|d| daemon_url(d)).collect();
+        output::progress(format!(
+            "compile-many: sharding across {} daemon(s): {}",
+            daemons.len(),
+            daemons.join(", ")
+        ));
+        compile_many_distributed(req, &daemons, cache_archive, &mut |daemon, r| {
+            let status = if r.success { "OK" } else { "FAIL" };
+            output::progress(format!("  {} {} ({})", status, r.sketch.display(), daemon));
+        })
+        .await?
+    };
 
     // Per-sketch result map suitable for the bench summary.
     output::result("");
@@ -208,6 +243,18 @@ pub async fn run_compile_many(args: CompileManyArgs) -> fbuild_core::Result<()>
                 .to_string(),
             );
         }
+        for (stage, t) in &result.stage_timings {
+            output::result(
+                serde_json::json!({
+                    "type": "stage",
+                    "stage": stage,
+                    "secs": t.secs,
+                    "runs": t.runs,
+                    "reused": t.reused,
+                })
+                .to_string(),
+            );
+        }
     }
 
     if !result.all_success {
@@ -31,6 +31,7 @@ use super::monitor_parse::parse_monitor_flags;
 use super::pio::{pio_build, pio_deploy, pio_monitor};
 use super::plotter::run_plotter;
 use super::port_scan::run_port;
+use super::prefetch::run_prefetch;
 use super::purge::{run_purge, run_purge_gc};
 use super::reset::run_reset;
 use super::serial_probe::run_serial;
@@ -414,6 +415,11 @@ pub async fn async_main() {
                 std::process::exit(code);
             }
         }
+        Some(Commands::Prefetch {
+            project_dir,
+            environments,
+            background,
+        }) => run_prefetch(project_dir, environments, background).await,
         Some(Commands::Daemon { action }) => run_daemon(action).await,
         Some(Commands::Show {
             target,
@@ -575,6 +581,9 @@ pub async fn async_main() {
             release,
             verbose,
             diag_stage2,
+            fail_fast,
+            daemons,
+            cache_archive,
             sketches,
         }) => {
             run_compile_many(CompileManyArgs {
@@ -585,8 +594,11 @@ pub async fn async_main() {
                 release,
                 verbose,
                 diag_stage2,
+                fail_fast,
                 sketches,
                 pio_env: std::collections::HashMap::new(),
+                daemons,
+                cache_archive,
             })
             .await
         }
@@ -604,6 +616,7 @@ pub async fn async_main() {
             release,
             verbose,
             diag_stage2,
+            fail_fast,
             sketches,
         }) => {
             if let Some(bd) = &build_dir {
@@ -622,8 +635,11 @@ pub async fn async_main() {
                 release,
                 verbose,
                 diag_stage2,
+                fail_fast,
                 sketches: normalized,
                 pio_env,
+                daemons: Vec::new(),
+                cache_archive: None,
             })
             .await
         }
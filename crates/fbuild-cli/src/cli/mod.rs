@@ -36,6 +36,7 @@ pub mod plotter;
 pub mod port_doctor;
 pub mod port_doctor_fix;
 pub mod port_scan;
+pub mod prefetch;
 pub mod purge;
 pub mod reset;
 pub mod serial_probe;
@@ -0,0 +1,48 @@
+//! `fbuild prefetch`: install the toolchains, frameworks and tools of every
+//! env in `platformio.ini` before the first build asks for them
+//! (`POST /api/prefetch`).
+//!
+//! The daemon resolves each env's board and installs all envs' packages
+//! concurrently, so a cold build afterwards finds them warm instead of
+//! downloading them one resolution step at a time. `--background` returns
+//! as soon as the daemon has started, e.g. at the top of a CI job whose
+//! first steps do not need the packages yet.
+
+use crate::daemon_client::{self, DaemonClient, PrefetchRequest};
+use crate::output;
+
+use super::build::normalize_path;
+
+/// `fbuild prefetch [<project_dir>] [-e <environment>]... [--background]`
+pub async fn run_prefetch(
+    project_dir: String,
+    environments: Vec<String>,
+    background: bool,
+) -> fbuild_core::Result<()> {
+    daemon_client::ensure_daemon_running().await?;
+
+    let normalized = normalize_path(&project_dir).await?;
+    let (caller_pid, caller_cwd) = daemon_client::caller_info();
+    let req = PrefetchRequest {
+        project_dir: normalized,
+        environments,
+        background,
+        request_id: None,
+        caller_pid,
+        caller_cwd,
+    };
+    output::progress(if background {
+        "Starting package prefetch in the daemon..."
+    } else {
+        "Prefetching packages..."
+    });
+    let resp = DaemonClient::new().prefetch(&req).await?;
+    if !resp.success {
+        return Err(fbuild_core::FbuildError::BuildFailed(format!(
+            "prefetch failed: {}",
+            resp.message
+        )));
+    }
+    output::result(resp.message);
+    Ok(())
+}
@@ -141,6 +141,52 @@ fn libraries_accepts_project_dir_and_environment_flag() {
     }
 }
 
+// ---------- `fbuild prefetch` CLI shape ----------
+
+#[test]
+fn prefetch_defaults_to_every_env_in_the_foreground() {
+    let cli = Cli::try_parse_from(["fbuild", "prefetch"]).expect("parse");
+    match cli.command {
+        Some(Commands::Prefetch {
+            project_dir,
+            environments,
+            background,
+        }) => {
+            assert_eq!(project_dir, ".");
+            assert!(environments.is_empty());
+            assert!(!background);
+        }
+        _ => panic!("expected Commands::Prefetch"),
+    }
+}
+
+#[test]
+fn prefetch_environment_flag_is_repeatable() {
+    let cli = Cli::try_parse_from([
+        "fbuild",
+        "prefetch",
+        "/tmp/proj",
+        "-e",
+        "uno",
+        "--environment",
+        "esp32dev",
+        "--background",
+    ])
+    .expect("parse");
+    match cli.command {
+        Some(Commands::Prefetch {
+            project_dir,
+            environments,
+            background,
+        }) => {
+            assert_eq!(project_dir, "/tmp/proj");
+            assert_eq!(environments, ["uno", "esp32dev"]);
+            assert!(background);
+        }
+        _ => panic!("expected Commands::Prefetch"),
+    }
+}
+
 #[test]
 fn ide_select_with_no_project_dir_parses_as_select_action() {
     let cli = Cli::try_parse_from(["fbuild", "ide", "select"]).expect("parse");
@@ -376,6 +422,71 @@ fn compile_many_diag_stage2_flag_is_accepted() {
     }
 }
 
+#[test]
+fn compile_many_daemon_flags_are_repeatable() {
+    let argv = [
+        "fbuild",
+        "compile-many",
+        "--board",
+        "uno",
+        "--daemon",
+        "8765",
+        "--daemon",
+        "runner-2:8765",
+        "--cache-archive",
+        "cache.tar.zst",
+        "examples/Blink",
+    ];
+    let cli = Cli::try_parse_from(argv).expect("parse");
+    match cli.command {
+        Some(Commands::CompileMany {
+            daemons,
+            cache_archive,
+            ..
+        }) => {
+            assert_eq!(daemons, ["8765", "runner-2:8765"]);
+            assert_eq!(cache_archive.as_deref(), Some("cache.tar.zst"));
+        }
+        _ => panic!("expected CompileMany subcommand"),
+    }
+}
+
+#[test]
+fn compile_many_cache_archive_requires_daemon() {
+    let argv = [
+        "fbuild",
+        "compile-many",
+        "--board",
+        "uno",
+        "--cache-archive",
+        "cache.tar.zst",
+        "examples/Blink",
+    ];
+    assert!(Cli::try_parse_from(argv).is_err());
+}
+
+#[test]
+fn compile_many_and_ci_accept_fail_fast() {
+    for sub in ["compile-many", "ci"] {
+        let argv = [
+            "fbuild",
+            sub,
+            "--board",
+            "uno",
+            "--fail-fast",
+            "examples/Blink",
+        ];
+        let cli = Cli::try_parse_from(argv).expect("parse");
+        match cli.command {
+            Some(Commands::CompileMany { fail_fast, .. })
+            | Some(Commands::Ci { fail_fast, .. }) => {
+                assert!(fail_fast, "{sub} --fail-fast")
+            }
+            _ => panic!("expected CompileMany or Ci subcommand"),
+        }
+    }
+}
+
 // `--shrink` / `--no-shrink` parsing (FastLED/fbuild#496, part of #493).
 // The flag is plumbed onto the global Cli and every build-adjacent subcommand
 // but is otherwise unused in Phase 1a — these tests just exercise clap's
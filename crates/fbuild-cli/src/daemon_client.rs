@@ -424,6 +424,14 @@ impl DaemonClient {
             .await
     }
 
+    /// Install the packages of every env in a project ahead of its builds
+    /// (`fbuild prefetch`). A background request returns once the daemon
+    /// has started the prefetch.
+    pub async fn prefetch(&self, req: &PrefetchRequest) -> fbuild_core::Result<OperationResponse> {
+        self.post_operation("/api/prefetch", req, Some(LONG_OPERATION_TIMEOUT))
+            .await
+    }
+
     /// Get daemon info (PID, port, uptime, etc.).
     pub async fn daemon_info(&self) -> fbuild_core::Result<DaemonInfoResponse> {
         let resp = self
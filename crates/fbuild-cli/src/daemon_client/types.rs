@@ -76,6 +76,23 @@ pub struct InstallDepsRequest {
     pub caller_cwd: Option<String>,
 }
 
+/// `POST /api/prefetch` request. Mirrors
+/// `fbuild_daemon::models::PrefetchRequest` field-for-field.
+#[derive(Clone, Debug, Serialize)]
+pub struct PrefetchRequest {
+    pub project_dir: String,
+    /// Envs to prefetch; every env in `platformio.ini` when empty.
+    #[serde(skip_serializing_if = "Vec::is_empty")]
+    pub environments: Vec<String>,
+    pub background: bool,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub request_id: Option<String>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub caller_pid: Option<u32>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub caller_cwd: Option<String>,
+}
+
 #[derive(Clone, Debug, Serialize)]
 pub struct DeployRequest {
     pub project_dir: String,
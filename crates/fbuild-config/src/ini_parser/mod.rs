@@ -266,6 +266,28 @@ impl PlatformIOConfig {
         Ok(config.get("lib_ldf_mode").map(|m| m.trim().to_string()))
     }
 
+    /// Get `build_pch` for an environment, if set.
+    ///
+    /// fbuild extension (not a PlatformIO option): `auto` enables the
+    /// precompiled framework umbrella header for sketch TUs; anything else,
+    /// or unset, leaves PCH off. Interpreted by the build engine's `pch`
+    /// module.
+    pub fn get_build_pch(&self, env_name: &str) -> fbuild_core::Result<Option<String>> {
+        let config = self.get_env_config(env_name)?;
+        Ok(config.get("build_pch").map(|m| m.trim().to_string()))
+    }
+
+    /// Get `unity_build` for an environment, if set.
+    ///
+    /// fbuild extension (not a PlatformIO option): a jumbo-TU count (or
+    /// `on`) that groups library sources into unity TUs; unset, `0` or `off`
+    /// compiles one object per source. Interpreted by `fbuild-library`'s
+    /// `unity_build` module.
+    pub fn get_unity_build(&self, env_name: &str) -> fbuild_core::Result<Option<String>> {
+        let config = self.get_env_config(env_name)?;
+        Ok(config.get("unity_build").map(|m| m.trim().to_string()))
+    }
+
     /// Get extra library search directories for an environment.
     pub fn get_lib_extra_dirs(&self, env_name: &str) -> fbuild_core::Result<Vec<String>> {
         if let Some(dirs) = self.overrides.get_lib_extra_dirs() {
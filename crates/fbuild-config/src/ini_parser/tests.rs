@@ -981,3 +981,14 @@ debug_build_flags = -Og -g3
         vec!["-Og", "-g3"]
     );
 }
+
+#[test]
+fn test_build_pch_and_unity_build_inherit_from_env_section() {
+    let ini = "[env]\nbuild_pch = auto ; experimental\nunity_build = 4\n\n[env:uno]\n\n[env:esp]\n";
+    let f = write_ini(ini);
+    let config = PlatformIOConfig::from_path(f.path()).unwrap();
+    for env in ["uno", "esp"] {
+        assert_eq!(config.get_build_pch(env).unwrap().as_deref(), Some("auto"));
+        assert_eq!(config.get_unity_build(env).unwrap().as_deref(), Some("4"));
+    }
+}
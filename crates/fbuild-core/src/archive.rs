@@ -0,0 +1,378 @@
+//! Incremental static-archive updates shared by every `ar` call site.
+//!
+//! Rebuilding a `.a` from scratch after each compile copies every member even
+//! when one object changed. [`update_archive`] keeps a sidecar manifest
+//! (`<archive>.members`) holding the member list plus each object's size and
+//! mtime from the last successful run, and then:
+//!
+//! - skips `ar` entirely when nothing changed, leaving the archive's mtime
+//!   alone so mtime-based relink checks stay warm;
+//! - replaces only the changed members in place (`ar rs`) when the member list
+//!   is unchanged and member basenames are unique (`ar` matches members by
+//!   basename);
+//! - otherwise rebuilds from scratch (`ar rcs`).
+//!
+//! With `FBUILD_THIN_ARCHIVES=1`, and when the archiver's `--help` advertises
+//! thin archives, archives are written as GNU thin archives (`T` modifier):
+//! the `.a` only references its objects, so writing it costs a symbol-table
+//! pass instead of a copy of every member. A thin archive is only valid next
+//! to its objects, so callers that copy archives elsewhere (e.g. into a cache)
+//! pass `allow_thin: false`.
+
+use std::collections::{HashMap, HashSet};
+use std::path::Path;
+use std::sync::Mutex;
+use std::time::{Duration, UNIX_EPOCH};
+
+use serde::{Deserialize, Serialize};
+
+use crate::subprocess::run_command;
+use crate::{FbuildError, Result};
+
+/// Opt-in env knob for GNU thin archives (`1` enables).
+pub const THIN_ARCHIVES_ENV: &str = "FBUILD_THIN_ARCHIVES";
+
+/// Bumped whenever the manifest format changes.
+const MANIFEST_VERSION: u32 = 1;
+
+/// Per-call settings for [`update_archive`].
+#[derive(Debug, Clone, Copy)]
+pub struct ArchiveOptions<'a> {
+    /// Tool name used in error messages (`"<label> failed: ..."`).
+    pub label: &'a str,
+    /// Cap for each `ar` invocation.
+    pub timeout: Duration,
+    /// Whether this archive may be written thin (see module docs).
+    pub allow_thin: bool,
+}
+
+/// How [`update_archive`] brought the archive up to date.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum ArchiveUpdate {
+    /// Every member was current; `ar` did not run.
+    Unchanged,
+    /// This many changed members were replaced in place.
+    Replaced(usize),
+    /// The archive was written from scratch.
+    Rebuilt,
+}
+
+#[derive(Debug, Clone, PartialEq, Eq, Serialize, Deserialize)]
+struct Member {
+    path: String,
+    size: u64,
+    mtime_ns: u64,
+}
+
+#[derive(Debug, Clone, Serialize, Deserialize)]
+struct Manifest {
+    version: u32,
+    archiver: String,
+    thin: bool,
+    members: Vec<Member>,
+}
+
+/// What to do with an archive given its previous and current manifests.
+#[derive(Debug, PartialEq, Eq)]
+enum Plan {
+    Unchanged,
+    Replace(Vec<String>),
+    Rebuild,
+}
+
+fn member(path: &Path) -> Member {
+    let (size, mtime_ns) = std::fs::metadata(path)
+        .map(|meta| {
+            let mtime = meta
+                .modified()
+                .ok()
+                .and_then(|t| t.duration_since(UNIX_EPOCH).ok())
+                .map_or(0, |d| d.as_nanos() as u64);
+            (meta.len(), mtime)
+        })
+        .unwrap_or((0, 0));
+    Member {
+        path: path.to_string_lossy().to_string(),
+        size,
+        mtime_ns,
+    }
+}
+
+fn basenames_unique(members: &[Member]) -> bool {
+    let mut seen = HashSet::new();
+    members.iter().all(|m| {
+        let name = Path::new(&m.path).file_name().map(|n| n.to_os_string());
+        seen.insert(name)
+    })
+}
+
+fn plan(previous: Option<&Manifest>, current: &Manifest) -> Plan {
+    let Some(previous) = previous else {
+        return Plan::Rebuild;
+    };
+    let same_list = previous.members.len() == current.members.len()
+        && previous
+            .members
+            .iter()
+            .zip(&current.members)
+            .all(|(a, b)| a.path == b.path);
+    if previous.version != MANIFEST_VERSION
+        || previous.archiver != current.archiver
+        || previous.thin != current.thin
+        || !same_list
+    {
+        return Plan::Rebuild;
+    }
+    let changed: Vec<String> = previous
+        .members
+        .iter()
+        .zip(&current.members)
+        .filter(|(a, b)| a != b || b.mtime_ns == 0)
+        .map(|(_, b)| b.path.clone())
+        .collect();
+    if changed.is_empty() {
+        Plan::Unchanged
+    } else if current.thin || !basenames_unique(&current.members) {
+        Plan::Rebuild
+    } else {
+        Plan::Replace(changed)
+    }
+}
+
+fn thin_requested() -> bool {
+    std::env::var(THIN_ARCHIVES_ENV).is_ok_and(|v| v == "1")
+}
+
+/// Whether `ar_path` advertises thin-archive support. Probed once per
+/// archiver per process.
+async fn supports_thin(ar_path: &Path) -> bool {
+    static PROBED: Mutex<Option<HashMap<String, bool>>> = Mutex::new(None);
+    let key = ar_path.to_string_lossy().to_string();
+    if let Some(known) = PROBED
+        .lock()
+        .unwrap_or_else(|e| e.into_inner())
+        .as_ref()
+        .and_then(|probed| probed.get(&key).copied())
+    {
+        return known;
+    }
+    let supported = run_command(
+        &[key.as_str(), "--help"],
+        None,
+        None,
+        Some(Duration::from_secs(15)),
+    )
+    .await
+    .is_ok_and(|out| {
+        let help = format!("{}{}", out.stdout, out.stderr).to_ascii_lowercase();
+        help.contains("thin")
+    });
+    PROBED
+        .lock()
+        .unwrap_or_else(|e| e.into_inner())
+        .get_or_insert_with(HashMap::new)
+        .insert(key, supported);
+    supported
+}
+
+fn manifest_file(output: &Path) -> crate::path::NormalizedPath {
+    let name = output.file_name().unwrap_or_default().to_string_lossy();
+    crate::path::NormalizedPath::new(output.with_file_name(format!("{name}.members")))
+}
+
+fn load_manifest(output: &Path) -> Option<Manifest> {
+    if !output.is_file() {
+        return None;
+    }
+    let text = std::fs::read_to_string(manifest_file(output)).ok()?;
+    serde_json::from_str(&text).ok()
+}
+
+async fn run_ar(
+    ar_path: &Path,
+    op: &str,
+    output: &Path,
+    members: &[String],
+    options: &ArchiveOptions<'_>,
+) -> Result<()> {
+    let ar = ar_path.to_string_lossy().to_string();
+    let output = output.to_string_lossy().to_string();
+    let mut args: Vec<&str> = vec![ar.as_str(), op, output.as_str()];
+    args.extend(members.iter().map(String::as_str));
+    let result = run_command(&args, None, None, Some(options.timeout)).await?;
+    if !result.success() {
+        return Err(FbuildError::BuildFailed(format!(
+            "{} failed: {}",
+            options.label, result.stderr
+        )));
+    }
+    Ok(())
+}
+
+/// Bring `output` up to date with `objects`, touching only what changed.
+///
+/// The member order is `objects`' order. The manifest is removed before `ar`
+/// runs and rewritten only after it succeeds, so an interrupted update falls
+/// back to a full rebuild next time.
+pub async fn update_archive(
+    ar_path: &Path,
+    objects: &[impl AsRef<Path>],
+    output: &Path,
+    options: &ArchiveOptions<'_>,
+) -> Result<ArchiveUpdate> {
+    let thin = options.allow_thin && thin_requested() && supports_thin(ar_path).await;
+    let current = Manifest {
+        version: MANIFEST_VERSION,
+        archiver: ar_path.to_string_lossy().to_string(),
+        thin,
+        members: objects.iter().map(|o| member(o.as_ref())).collect(),
+    };
+    let plan = plan(load_manifest(output).as_ref(), &current);
+    if plan == Plan::Unchanged {
+        return Ok(ArchiveUpdate::Unchanged);
+    }
+
+    let manifest = manifest_file(output);
+    let _ = std::fs::remove_file(&manifest);
+    let update = match plan {
+        Plan::Replace(changed) => {
+            run_ar(ar_path, "rs", output, &changed, options).await?;
+            ArchiveUpdate::Replaced(changed.len())
+        }
+        _ => {
+            if output.exists() {
+                std::fs::remove_file(output)?;
+            }
+            let all: Vec<String> = current.members.iter().map(|m| m.path.clone()).collect();
+            let op = if thin { "rcsT" } else { "rcs" };
+            run_ar(ar_path, op, output, &all, options).await?;
+            ArchiveUpdate::Rebuilt
+        }
+    };
+    if let Ok(text) = serde_json::to_string(&current) {
+        if let Err(e) = std::fs::write(&manifest, text) {
+            tracing::debug!("archive manifest {} not written: {e}", manifest);
+        }
+    }
+    Ok(update)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn manifest(members: &[(&str, u64)]) -> Manifest {
+        Manifest {
+            version: MANIFEST_VERSION,
+            archiver: "/bin/ar".to_string(),
+            thin: false,
+            members: members
+                .iter()
+                .map(|(path, mtime_ns)| Member {
+                    path: path.to_string(),
+                    size: 10,
+                    mtime_ns: *mtime_ns,
+                })
+                .collect(),
+        }
+    }
+
+    #[test]
+    fn no_previous_manifest_rebuilds() {
+        assert_eq!(plan(None, &manifest(&[("a.o", 1)])), Plan::Rebuild);
+    }
+
+    #[test]
+    fn identical_members_are_unchanged() {
+        let m = manifest(&[("obj/a.o", 1), ("obj/b.o", 2)]);
+        assert_eq!(plan(Some(&m), &m.clone()), Plan::Unchanged);
+    }
+
+    #[test]
+    fn changed_members_are_replaced_in_place() {
+        let old = manifest(&[("obj/a.o", 1), ("obj/b.o", 2), ("obj/c.o", 3)]);
+        let new = manifest(&[("obj/a.o", 1), ("obj/b.o", 5), ("obj/c.o", 3)]);
+        assert_eq!(
+            plan(Some(&old), &new),
+            Plan::Replace(vec!["obj/b.o".to_string()])
+        );
+    }
+
+    #[test]
+    fn member_list_change_rebuilds() {
+        let old = manifest(&[("obj/a.o", 1), ("obj/b.o", 2)]);
+        let added = manifest(&[("obj/a.o", 1), ("obj/b.o", 2), ("obj/c.o", 3)]);
+        let reordered = manifest(&[("obj/b.o", 2), ("obj/a.o", 1)]);
+        assert_eq!(plan(Some(&old), &added), Plan::Rebuild);
+        assert_eq!(plan(Some(&old), &reordered), Plan::Rebuild);
+    }
+
+    #[test]
+    fn duplicate_basenames_or_thin_rebuild() {
+        let old = manifest(&[("x/a.o", 1), ("y/a.o", 2)]);
+        let new = manifest(&[("x/a.o", 1), ("y/a.o", 9)]);
+        assert_eq!(plan(Some(&old), &new), Plan::Rebuild);
+
+        let mut thin_old = manifest(&[("obj/a.o", 1)]);
+        thin_old.thin = true;
+        let mut thin_new = manifest(&[("obj/a.o", 2)]);
+        thin_new.thin = true;
+        assert_eq!(plan(Some(&thin_old), &thin_new), Plan::Rebuild);
+        assert_eq!(
+            plan(Some(&thin_old), &manifest(&[("obj/a.o", 1)])),
+            Plan::Rebuild
+        );
+    }
+
+    #[cfg(unix)]
+    #[tokio::test]
+    async fn updates_real_archive_incrementally() {
+        let ar = Path::new("ar");
+        let probe = run_command(
+            &["ar", "--version"],
+            None,
+            None,
+            Some(Duration::from_secs(5)),
+        );
+        if !probe.await.is_ok_and(|out| out.success()) {
+            return; // no host binutils
+        }
+        let tmp = tempfile::TempDir::new().unwrap();
+        let objects: Vec<_> = ["a.o", "b.o"].iter().map(|n| tmp.path().join(n)).collect();
+        for (i, object) in objects.iter().enumerate() {
+            std::fs::write(object, format!("object {i}\n")).unwrap();
+        }
+        let output = tmp.path().join("libx.a");
+        let options = ArchiveOptions {
+            label: "ar",
+            timeout: Duration::from_secs(30),
+            allow_thin: false,
+        };
+
+        let first = update_archive(ar, &objects, &output, &options)
+            .await
+            .unwrap();
+        assert_eq!(first, ArchiveUpdate::Rebuilt);
+        let again = update_archive(ar, &objects, &output, &options)
+            .await
+            .unwrap();
+        assert_eq!(again, ArchiveUpdate::Unchanged);
+
+        std::thread::sleep(Duration::from_millis(20));
+        std::fs::write(&objects[1], "object 1, edited\n").unwrap();
+        let replaced = update_archive(ar, &objects, &output, &options)
+            .await
+            .unwrap();
+        assert_eq!(replaced, ArchiveUpdate::Replaced(1));
+
+        let listing = run_command(
+            &["ar", "t", output.to_str().unwrap()],
+            None,
+            None,
+            Some(Duration::from_secs(5)),
+        )
+        .await
+        .unwrap();
+        assert_eq!(listing.stdout.lines().collect::<Vec<_>>(), ["a.o", "b.o"]);
+    }
+}
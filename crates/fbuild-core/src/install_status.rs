@@ -33,6 +33,8 @@ static SUBSCRIBER: OnceLock<RwLock<Option<Subscriber>>> = OnceLock::new();
 #[serde(rename_all = "snake_case")]
 pub enum InstallPhase {
     WaitingForLock,
+    /// Waiting for a free slot in the download scheduler.
+    Queued,
     Downloading,
     Verifying,
     Extracting,
@@ -44,6 +46,7 @@ impl Display for InstallPhase {
     fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
         f.write_str(match self {
             Self::WaitingForLock => "waiting_for_lock",
+            Self::Queued => "queued",
             Self::Downloading => "downloading",
             Self::Verifying => "verifying",
             Self::Extracting => "extracting",
@@ -221,6 +224,7 @@ mod tests {
     #[test]
     fn phase_and_role_display_match_json_names() {
         assert_eq!(InstallPhase::WaitingForLock.to_string(), "waiting_for_lock");
+        assert_eq!(InstallPhase::Queued.to_string(), "queued");
         assert_eq!(InstallPhase::Downloading.to_string(), "downloading");
         assert_eq!(InstallPhase::Verifying.to_string(), "verifying");
         assert_eq!(InstallPhase::Extracting.to_string(), "extracting");
@@ -0,0 +1,964 @@
+//! Single-file, append-only, memory-mapped key/value segment.
+//!
+//! One-file-per-entry caches pay a directory entry, an open and a read per
+//! lookup, and nothing ever evicts them. A [`KvSegment`] keeps a whole
+//! namespace in one file:
+//!
+//! ```text
+//! header (64 B) | compacted records | hash table | appended records ...
+//! ```
+//!
+//! * A write appends one checksummed record with a single `O_APPEND` write,
+//!   so concurrent writers (threads or processes) interleave whole records
+//!   without a lock file.
+//! * A lookup probes the open-addressing hash table the last compaction
+//!   wrote, then an in-memory index of the records appended since, and
+//!   copies the value straight out of the memory map.
+//! * Compaction rewrites the live entries into a fresh file, fsyncs it and
+//!   renames it over the segment, so a crash at any point leaves one intact
+//!   segment and existing maps keep reading the file they mapped. It keeps
+//!   the most recently used entries within [`KvOptions::max_bytes`]; a hit
+//!   refreshes an entry's recency, persisted at most once per
+//!   [`TOUCH_INTERVAL`].
+//! * A torn record left by a crashed writer ends the readable log. The next
+//!   write compacts it away instead of truncating a file others may map.
+//!
+//! The segment is a cache: a record appended to the old file while another
+//! process compacts is lost (a later miss), never corrupts anything. Writes
+//! from other processes become visible to a reader on its next miss.
+
+use std::collections::HashMap;
+use std::fs::{File, OpenOptions};
+use std::io::{self, BufWriter, Read, Seek, SeekFrom, Write};
+use std::path::Path;
+use std::sync::{Mutex, PoisonError, RwLock};
+use std::time::{Duration, SystemTime, UNIX_EPOCH};
+
+const MAGIC: &[u8; 8] = b"FBKVSEG1";
+const FORMAT_VERSION: u32 = 1;
+const HEADER_LEN: usize = 64;
+const RECORD_MAGIC: u32 = 0x4b56_5231;
+const RECORD_HEADER_LEN: usize = 32;
+const SLOT_LEN: usize = 16;
+const FNV_OFFSET: u64 = 0xcbf2_9ce4_8422_2325;
+const FNV_PRIME: u64 = 0x0100_0000_01b3;
+
+const KIND_PUT: u8 = 0;
+const KIND_DELETE: u8 = 1;
+const KIND_TOUCH: u8 = 2;
+
+/// How stale an entry's recorded last use may get before a hit appends a
+/// touch record for it.
+pub const TOUCH_INTERVAL: Duration = Duration::from_secs(60 * 60);
+
+/// Size limits for a [`KvSegment`].
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct KvOptions {
+    /// Upper bound on live record bytes. Exceeding it compacts the segment
+    /// down to three quarters of the bound, least recently used first.
+    pub max_bytes: u64,
+    /// Files smaller than this are never compacted just to drop overwritten
+    /// records.
+    pub min_compact_bytes: u64,
+}
+
+impl Default for KvOptions {
+    fn default() -> Self {
+        Self {
+            max_bytes: 256 << 20,
+            min_compact_bytes: 1 << 20,
+        }
+    }
+}
+
+/// A persistent byte-keyed map in one file. See the module docs.
+pub struct KvSegment {
+    path: Box<Path>,
+    options: KvOptions,
+    view: RwLock<View>,
+    /// Serializes this process's appends and compactions.
+    writer: Mutex<()>,
+}
+
+impl std::fmt::Debug for KvSegment {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        f.debug_struct("KvSegment")
+            .field("path", &self.path)
+            .field("options", &self.options)
+            .finish_non_exhaustive()
+    }
+}
+
+impl KvSegment {
+    /// Map the segment at `path`. A missing file is an empty segment; it is
+    /// created by the first write.
+    pub fn open(path: impl AsRef<Path>, options: KvOptions) -> io::Result<Self> {
+        let path: Box<Path> = path.as_ref().into();
+        let view = View::load(&path)?;
+        Ok(Self {
+            path,
+            options,
+            view: RwLock::new(view),
+            writer: Mutex::new(()),
+        })
+    }
+
+    pub fn path(&self) -> &Path {
+        &self.path
+    }
+
+    /// The value stored under `key`, if any.
+    pub fn get(&self, key: &[u8]) -> io::Result<Option<Vec<u8>>> {
+        let mut hit = self.lookup(key);
+        if hit.is_none() {
+            // Another process may have written or compacted since we mapped.
+            let stale = self.read_view().is_stale(&self.path)?;
+            if stale {
+                let mut view = self.write_view();
+                view.refresh(&self.path)?;
+                hit = view
+                    .lookup(key)
+                    .map(|(value, stamp)| (value.to_vec(), stamp));
+            }
+        }
+        let Some((value, stamp)) = hit else {
+            return Ok(None);
+        };
+        let now = now_secs();
+        if now.saturating_sub(stamp) >= TOUCH_INTERVAL.as_secs() {
+            if let Err(err) = self.append(KIND_TOUCH, key, &[], now) {
+                tracing::debug!(
+                    path = %self.path.display(),
+                    error = %err,
+                    "kv segment: failed to record entry use"
+                );
+            }
+        }
+        Ok(Some(value))
+    }
+
+    /// Store `value` under `key`, replacing any previous value.
+    pub fn put(&self, key: &[u8], value: &[u8]) -> io::Result<()> {
+        self.append(KIND_PUT, key, value, now_secs())
+    }
+
+    /// Drop `key`. Removing an absent key is not an error.
+    pub fn remove(&self, key: &[u8]) -> io::Result<()> {
+        self.append(KIND_DELETE, key, &[], now_secs())
+    }
+
+    /// Rewrite the segment with only its live entries, evicting the least
+    /// recently used ones beyond [`KvOptions::max_bytes`].
+    pub fn compact(&self) -> io::Result<()> {
+        let _writer = self.writer.lock().unwrap_or_else(PoisonError::into_inner);
+        let mut view = self.write_view();
+        view.refresh(&self.path)?;
+        self.compact_locked(&mut view, None)
+    }
+
+    /// Number of live entries in this process's view of the segment.
+    pub fn len(&self) -> usize {
+        self.read_view().live
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.len() == 0
+    }
+
+    /// Total record bytes of the live entries.
+    pub fn live_bytes(&self) -> u64 {
+        self.read_view().live_bytes
+    }
+
+    /// Bytes of the segment file as last mapped, garbage included.
+    pub fn file_len(&self) -> u64 {
+        self.read_view().data.len() as u64
+    }
+
+    fn read_view(&self) -> std::sync::RwLockReadGuard<'_, View> {
+        self.view.read().unwrap_or_else(PoisonError::into_inner)
+    }
+
+    fn write_view(&self) -> std::sync::RwLockWriteGuard<'_, View> {
+        self.view.write().unwrap_or_else(PoisonError::into_inner)
+    }
+
+    fn lookup(&self, key: &[u8]) -> Option<(Vec<u8>, u64)> {
+        self.read_view()
+            .lookup(key)
+            .map(|(value, stamp)| (value.to_vec(), stamp))
+    }
+
+    fn append(&self, kind: u8, key: &[u8], value: &[u8], stamp: u64) -> io::Result<()> {
+        if u32::try_from(key.len()).is_err() || u32::try_from(value.len()).is_err() {
+            return Err(io::Error::new(
+                io::ErrorKind::InvalidInput,
+                "kv segment: key or value exceeds 4 GiB",
+            ));
+        }
+        let pending = Pending {
+            kind,
+            key,
+            value,
+            stamp,
+        };
+        let _writer = self.writer.lock().unwrap_or_else(PoisonError::into_inner);
+        let mut view = self.write_view();
+        view.refresh(&self.path)?;
+        if view.header.is_none() || view.is_torn() {
+            // Missing, damaged, or ending in a crashed writer's partial
+            // record: start a fresh segment that already holds this write.
+            return self.compact_locked(&mut view, Some(pending));
+        }
+
+        let record = encode_record(kind, key, value, stamp);
+        OpenOptions::new()
+            .append(true)
+            .open(&self.path)?
+            .write_all(&record)?;
+        view.refresh(&self.path)?;
+        if view.is_torn() {
+            return self.compact_locked(&mut view, Some(pending));
+        }
+        if view.wants_compaction(&self.options) {
+            if let Err(err) = self.compact_locked(&mut view, None) {
+                tracing::warn!(
+                    path = %self.path.display(),
+                    error = %err,
+                    "kv segment: compaction failed; keeping the uncompacted segment"
+                );
+            }
+        }
+        Ok(())
+    }
+
+    fn compact_locked(&self, view: &mut View, pending: Option<Pending<'_>>) -> io::Result<()> {
+        {
+            let mut entries = view.live_entries();
+            if let Some(pending) = pending {
+                pending.apply(&mut entries);
+            }
+            // Most recent first; ties by key so equal inputs write equal files.
+            entries.sort_unstable_by(|a, b| b.stamp.cmp(&a.stamp).then_with(|| a.key.cmp(b.key)));
+            let total: u64 = entries.iter().map(Entry::record_len).sum();
+            if total > self.options.max_bytes {
+                let budget = self.options.max_bytes / 4 * 3;
+                let mut kept = 0u64;
+                let keep = entries
+                    .iter()
+                    .take_while(|entry| {
+                        kept += entry.record_len();
+                        kept <= budget
+                    })
+                    .count();
+                entries.truncate(keep);
+            }
+            write_segment(&self.path, &entries)?;
+        }
+        *view = View::load(&self.path)?;
+        Ok(())
+    }
+}
+
+/// A write that compaction folds into the rewritten segment.
+#[derive(Clone, Copy)]
+struct Pending<'a> {
+    kind: u8,
+    key: &'a [u8],
+    value: &'a [u8],
+    stamp: u64,
+}
+
+impl<'a> Pending<'a> {
+    fn apply(self, entries: &mut Vec<Entry<'a>>) {
+        match self.kind {
+            KIND_TOUCH => {
+                for entry in entries.iter_mut().filter(|entry| entry.key == self.key) {
+                    entry.stamp = entry.stamp.max(self.stamp);
+                }
+            }
+            kind => {
+                entries.retain(|entry| entry.key != self.key);
+                if kind == KIND_PUT {
+                    entries.push(Entry {
+                        key: self.key,
+                        value: self.value,
+                        stamp: self.stamp,
+                    });
+                }
+            }
+        }
+    }
+}
+
+struct Entry<'a> {
+    key: &'a [u8],
+    value: &'a [u8],
+    stamp: u64,
+}
+
+impl Entry<'_> {
+    fn record_len(&self) -> u64 {
+        (RECORD_HEADER_LEN + self.key.len() + self.value.len()) as u64
+    }
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+struct Header {
+    /// Random per file, so a replaced segment is told apart from a grown one.
+    generation: u64,
+    table_offset: u64,
+    table_slots: u64,
+    log_start: u64,
+    entries: u64,
+    live_bytes: u64,
+}
+
+impl Header {
+    fn parse(bytes: &[u8]) -> Option<Self> {
+        if bytes.get(..MAGIC.len())? != MAGIC || u32_at(bytes, 8)? != FORMAT_VERSION {
+            return None;
+        }
+        let header = Self {
+            generation: u64_at(bytes, 16)?,
+            table_offset: u64_at(bytes, 24)?,
+            table_slots: u64_at(bytes, 32)?,
+            log_start: u64_at(bytes, 40)?,
+            entries: u64_at(bytes, 48)?,
+            live_bytes: u64_at(bytes, 56)?,
+        };
+        let table_end = header
+            .table_slots
+            .checked_mul(SLOT_LEN as u64)?
+            .checked_add(header.table_offset)?;
+        let sane = (header.table_slots == 0 || header.table_slots.is_power_of_two())
+            && header.table_offset >= HEADER_LEN as u64
+            && table_end <= header.log_start
+            && header.log_start <= bytes.len() as u64;
+        sane.then_some(header)
+    }
+
+    fn encode(&self) -> [u8; HEADER_LEN] {
+        let mut out = [0u8; HEADER_LEN];
+        out[..8].copy_from_slice(MAGIC);
+        out[8..12].copy_from_slice(&FORMAT_VERSION.to_le_bytes());
+        let fields = [
+            self.generation,
+            self.table_offset,
+            self.table_slots,
+            self.log_start,
+            self.entries,
+            self.live_bytes,
+        ];
+        for (idx, field) in fields.iter().enumerate() {
+            let at = 16 + idx * 8;
+            out[at..at + 8].copy_from_slice(&field.to_le_bytes());
+        }
+        out
+    }
+}
+
+/// One record, borrowed from the segment bytes.
+struct Record<'a> {
+    kind: u8,
+    key: &'a [u8],
+    value: &'a [u8],
+    stamp: u64,
+    len: usize,
+}
+
+/// Parse the record at `at`. Appended records are checksummed on scan;
+/// compacted records were fsynced before the rename that published them.
+fn read_record(data: &[u8], at: usize, verify: bool) -> Option<Record<'_>> {
+    let head = data.get(at..at.checked_add(RECORD_HEADER_LEN)?)?;
+    let kind = head[4];
+    if u32_at(head, 0)? != RECORD_MAGIC || kind > KIND_TOUCH {
+        return None;
+    }
+    let key_start = at + RECORD_HEADER_LEN;
+    let key_end = key_start.checked_add(u32_at(head, 8)? as usize)?;
+    let end = key_end.checked_add(u32_at(head, 12)? as usize)?;
+    let key = data.get(key_start..key_end)?;
+    let value = data.get(key_end..end)?;
+    if verify && record_checksum(&head[..24], key, value) != u64_at(head, 24)? {
+        return None;
+    }
+    Some(Record {
+        kind,
+        key,
+        value,
+        stamp: u64_at(head, 16)?,
+        len: end - at,
+    })
+}
+
+fn encode_record(kind: u8, key: &[u8], value: &[u8], stamp: u64) -> Vec<u8> {
+    let mut out = Vec::with_capacity(RECORD_HEADER_LEN + key.len() + value.len());
+    out.extend_from_slice(&RECORD_MAGIC.to_le_bytes());
+    out.extend_from_slice(&[kind, 0, 0, 0]);
+    out.extend_from_slice(&(key.len() as u32).to_le_bytes());
+    out.extend_from_slice(&(value.len() as u32).to_le_bytes());
+    out.extend_from_slice(&stamp.to_le_bytes());
+    let checksum = record_checksum(&out, key, value);
+    out.extend_from_slice(&checksum.to_le_bytes());
+    out.extend_from_slice(key);
+    out.extend_from_slice(value);
+    out
+}
+
+fn record_checksum(head: &[u8], key: &[u8], value: &[u8]) -> u64 {
+    fnv1a(fnv1a(fnv1a(FNV_OFFSET, head), key), value)
+}
+
+fn fnv1a(mut hash: u64, bytes: &[u8]) -> u64 {
+    for &byte in bytes {
+        hash ^= u64::from(byte);
+        hash = hash.wrapping_mul(FNV_PRIME);
+    }
+    hash
+}
+
+fn key_hash(key: &[u8]) -> u64 {
+    fnv1a(FNV_OFFSET, key)
+}
+
+fn u32_at(bytes: &[u8], at: usize) -> Option<u32> {
+    Some(u32::from_le_bytes(bytes.get(at..at + 4)?.try_into().ok()?))
+}
+
+fn u64_at(bytes: &[u8], at: usize) -> Option<u64> {
+    Some(u64::from_le_bytes(bytes.get(at..at + 8)?.try_into().ok()?))
+}
+
+fn now_secs() -> u64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map_or(0, |d| d.as_secs())
+}
+
+/// Write `entries` as a fresh segment and rename it over `path`.
+fn write_segment(path: &Path, entries: &[Entry<'_>]) -> io::Result<()> {
+    let nonce = SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .unwrap_or_default()
+        .as_nanos();
+    let tmp = path.with_extension(format!("tmp.{}.{}", std::process::id(), nonce));
+    let result = write_segment_file(&tmp, entries, nonce as u64 ^ u64::from(std::process::id()))
+        .and_then(|()| crate::platform::fs::replace_file(&tmp, path));
+    if result.is_err() {
+        let _ = std::fs::remove_file(&tmp);
+    }
+    result
+}
+
+fn write_segment_file(tmp: &Path, entries: &[Entry<'_>], generation: u64) -> io::Result<()> {
+    let mut out = BufWriter::new(File::create(tmp)?);
+    out.write_all(&[0u8; HEADER_LEN])?;
+    let mut offsets = Vec::with_capacity(entries.len());
+    let mut at = HEADER_LEN as u64;
+    for entry in entries {
+        let record = encode_record(KIND_PUT, entry.key, entry.value, entry.stamp);
+        out.write_all(&record)?;
+        offsets.push(at);
+        at += record.len() as u64;
+    }
+
+    let slots = if entries.is_empty() {
+        0
+    } else {
+        (entries.len() * 2).next_power_of_two()
+    };
+    let mut table = vec![0u8; slots * SLOT_LEN];
+    for (entry, offset) in entries.iter().zip(&offsets) {
+        let hash = key_hash(entry.key);
+        let mut slot = hash as usize & (slots - 1);
+        while u64_at(&table, slot * SLOT_LEN + 8) != Some(0) {
+            slot = (slot + 1) & (slots - 1);
+        }
+        let slot_at = slot * SLOT_LEN;
+        table[slot_at..slot_at + 8].copy_from_slice(&hash.to_le_bytes());
+        table[slot_at + 8..slot_at + 16].copy_from_slice(&offset.to_le_bytes());
+    }
+    out.write_all(&table)?;
+
+    let header = Header {
+        generation,
+        table_offset: at,
+        table_slots: slots as u64,
+        log_start: at + table.len() as u64,
+        entries: entries.len() as u64,
+        live_bytes: at - HEADER_LEN as u64,
+    };
+    let mut file = out.into_inner().map_err(io::IntoInnerError::into_error)?;
+    file.seek(SeekFrom::Start(0))?;
+    file.write_all(&header.encode())?;
+    file.sync_all()
+}
+
+/// Bytes of the mapped segment.
+enum Backing {
+    Empty,
+    Mapped(memmap2::Mmap),
+    /// Windows refuses to replace a file that is still mapped, which would
+    /// make every compaction fail while any process has the segment open;
+    /// read it into memory there instead.
+    Owned(Vec<u8>),
+}
+
+impl std::ops::Deref for Backing {
+    type Target = [u8];
+
+    fn deref(&self) -> &[u8] {
+        match self {
+            Self::Empty => &[],
+            Self::Mapped(mmap) => mmap,
+            Self::Owned(bytes) => bytes,
+        }
+    }
+}
+
+impl Backing {
+    /// Cover all of `file`, reusing what `self` already holds of it.
+    fn extend(self, file: &File) -> io::Result<Self> {
+        if file.metadata()?.len() == 0 {
+            return Ok(Self::Empty);
+        }
+        if crate::platform::host::is_windows() {
+            let mut bytes = match self {
+                Self::Owned(bytes) => bytes,
+                _ => Vec::new(),
+            };
+            let mut reader = file;
+            reader.seek(SeekFrom::Start(bytes.len() as u64))?;
+            reader.read_to_end(&mut bytes)?;
+            return Ok(Self::Owned(bytes));
+        }
+        // SAFETY: segments are only ever appended to or replaced by rename,
+        // never truncated or rewritten in place, so every mapped byte stays
+        // valid for the mapping's lifetime.
+        Ok(Self::Mapped(unsafe { memmap2::Mmap::map(file)? }))
+    }
+}
+
+#[derive(Debug, Clone, Copy)]
+enum Loc {
+    /// Still the compacted record the hash table points at.
+    Table,
+    At(usize),
+    Deleted,
+}
+
+#[derive(Debug, Clone, Copy)]
+struct LogEntry {
+    loc: Loc,
+    stamp: u64,
+}
+
+/// One process's parsed view of the segment.
+struct View {
+    data: Backing,
+    header: Option<Header>,
+    /// End of the last valid record.
+    end: usize,
+    /// Keys written or touched after the hash table.
+    log: HashMap<Box<[u8]>, LogEntry>,
+    live: usize,
+    live_bytes: u64,
+}
+
+impl View {
+    fn load(path: &Path) -> io::Result<Self> {
+        match File::open(path) {
+            Ok(file) => Ok(Self::parse(Backing::Empty.extend(&file)?)),
+            Err(err) if err.kind() == io::ErrorKind::NotFound => Ok(Self::parse(Backing::Empty)),
+            Err(err) => Err(err),
+        }
+    }
+
+    fn parse(data: Backing) -> Self {
+        let header = Header::parse(&data);
+        let mut view = Self {
+            header,
+            end: 0,
+            log: HashMap::new(),
+            live: header.map_or(0, |h| h.entries as usize),
+            live_bytes: header.map_or(0, |h| h.live_bytes),
+            data,
+        };
+        if let Some(header) = header {
+            view.scan(header.log_start as usize);
+        }
+        view
+    }
+
+    /// Catch up with `path`: scan what was appended, or reload a replaced
+    /// file.
+    fn refresh(&mut self, path: &Path) -> io::Result<()> {
+        let file = match File::open(path) {
+            Ok(file) => file,
+            Err(err) if err.kind() == io::ErrorKind::NotFound => {
+                *self = Self::parse(Backing::Empty);
+                return Ok(());
+            }
+            Err(err) => return Err(err),
+        };
+        if self.header.is_some() && disk_generation(&file)? == self.generation() {
+            if file.metadata()?.len() > self.data.len() as u64 {
+                let data = std::mem::replace(&mut self.data, Backing::Empty);
+                self.data = data.extend(&file)?;
+                self.scan(self.end);
+            }
+            return Ok(());
+        }
+        *self = Self::parse(Backing::Empty.extend(&file)?);
+        Ok(())
+    }
+
+    fn is_stale(&self, path: &Path) -> io::Result<bool> {
+        match File::open(path) {
+            Ok(file) => Ok(disk_generation(&file)? != self.generation()
+                || file.metadata()?.len() != self.data.len() as u64),
+            Err(err) if err.kind() == io::ErrorKind::NotFound => Ok(self.header.is_some()),
+            Err(err) => Err(err),
+        }
+    }
+
+    fn generation(&self) -> Option<u64> {
+        self.header.map(|h| h.generation)
+    }
+
+    /// Bytes after the last valid record.
+    fn is_torn(&self) -> bool {
+        self.header.is_some() && self.end < self.data.len()
+    }
+
+    fn wants_compaction(&self, options: &KvOptions) -> bool {
+        let file_len = self.data.len() as u64;
+        let overhead = self.header.map_or(0, |h| h.log_start - h.live_bytes);
+        self.live_bytes > options.max_bytes
+            || (file_len >= options.min_compact_bytes && file_len / 2 > self.live_bytes + overhead)
+    }
+
+    fn scan(&mut self, from: usize) {
+        let mut at = from;
+        while let Some(record) = read_record(&self.data, at, true) {
+            let (kind, key, stamp, len) =
+                (record.kind, Box::from(record.key), record.stamp, record.len);
+            self.apply(kind, key, stamp, at, len);
+            at += len;
+        }
+        self.end = at;
+    }
+
+    fn apply(&mut self, kind: u8, key: Box<[u8]>, stamp: u64, at: usize, len: usize) {
+        let previous = self.live_len(&key);
+        if kind == KIND_TOUCH {
+            if previous.is_some() {
+                let entry = self.log.entry(key).or_insert(LogEntry {
+                    loc: Loc::Table,
+                    stamp,
+                });
+                entry.stamp = entry.stamp.max(stamp);
+            }
+            return;
+        }
+        if let Some(previous) = previous {
+            self.live = self.live.saturating_sub(1);
+            self.live_bytes = self.live_bytes.saturating_sub(previous as u64);
+        }
+        let loc = if kind == KIND_PUT {
+            self.live += 1;
+            self.live_bytes += len as u64;
+            Loc::At(at)
+        } else {
+            Loc::Deleted
+        };
+        self.log.insert(key, LogEntry { loc, stamp });
+    }
+
+    fn live_len(&self, key: &[u8]) -> Option<usize> {
+        match self.log.get(key).map(|entry| entry.loc) {
+            Some(Loc::Deleted) => None,
+            Some(Loc::At(at)) => read_record(&self.data, at, false).map(|r| r.len),
+            Some(Loc::Table) | None => self.table_find(key).map(|r| r.len),
+        }
+    }
+
+    /// The live value under `key` and its last-use stamp.
+    fn lookup(&self, key: &[u8]) -> Option<(&[u8], u64)> {
+        let Some(entry) = self.log.get(key) else {
+            return self.table_find(key).map(|r| (r.value, r.stamp));
+        };
+        let record = match entry.loc {
+            Loc::Deleted => return None,
+            Loc::At(at) => read_record(&self.data, at, false)?,
+            Loc::Table => self.table_find(key)?,
+        };
+        Some((record.value, entry.stamp))
+    }
+
+    fn table_find(&self, key: &[u8]) -> Option<Record<'_>> {
+        let header = self.header?;
+        if header.table_slots == 0 {
+            return None;
+        }
+        let hash = key_hash(key);
+        let mask = header.table_slots - 1;
+        let mut slot = hash & mask;
+        for _ in 0..header.table_slots {
+            let at = (header.table_offset + slot * SLOT_LEN as u64) as usize;
+            let offset = u64_at(&self.data, at + 8)? as usize;
+            if offset == 0 {
+                return None;
+            }
+            if u64_at(&self.data, at)? == hash {
+                if let Some(record) = read_record(&self.data, offset, false) {
+                    if record.key == key {
+                        return Some(record);
+                    }
+                }
+            }
+            slot = (slot + 1) & mask;
+        }
+        None
+    }
+
+    fn live_entries(&self) -> Vec<Entry<'_>> {
+        let mut entries = Vec::with_capacity(self.live);
+        if let Some(header) = self.header {
+            for slot in 0..header.table_slots as usize {
+                let at = header.table_offset as usize + slot * SLOT_LEN;
+                let Some(offset) = u64_at(&self.data, at + 8) else {
+                    break;
+                };
+                let record = match offset {
+                    0 => None,
+                    offset => read_record(&self.data, offset as usize, false),
+                };
+                if let Some(record) = record.filter(|r| !self.log.contains_key(r.key)) {
+                    entries.push(Entry {
+                        key: record.key,
+                        value: record.value,
+                        stamp: record.stamp,
+                    });
+                }
+            }
+        }
+        for (key, entry) in &self.log {
+            let record = match entry.loc {
+                Loc::Deleted => None,
+                Loc::At(at) => read_record(&self.data, at, false),
+                Loc::Table => self.table_find(key),
+            };
+            if let Some(record) = record {
+                entries.push(Entry {
+                    key: record.key,
+                    value: record.value,
+                    stamp: entry.stamp,
+                });
+            }
+        }
+        entries
+    }
+}
+
+/// The generation in `file`'s header, `None` when it has no valid header.
+fn disk_generation(file: &File) -> io::Result<Option<u64>> {
+    let mut head = [0u8; HEADER_LEN];
+    let mut reader = file;
+    reader.seek(SeekFrom::Start(0))?;
+    match reader.read_exact(&mut head) {
+        Ok(()) => Ok(MAGIC
+            .eq(&head[..MAGIC.len()])
+            .then(|| u64_at(&head, 16))
+            .flatten()),
+        Err(err) if err.kind() == io::ErrorKind::UnexpectedEof => Ok(None),
+        Err(err) => Err(err),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn tempdir() -> tempfile::TempDir {
+        tempfile::TempDir::new().unwrap()
+    }
+
+    fn options(max_bytes: u64) -> KvOptions {
+        KvOptions {
+            max_bytes,
+            min_compact_bytes: 1 << 20,
+        }
+    }
+
+    #[test]
+    fn round_trip_and_reopen() {
+        let dir = tempdir();
+        let path = dir.path().join("ns.kvs");
+        let kv = KvSegment::open(&path, KvOptions::default()).unwrap();
+        assert!(kv.is_empty());
+        assert_eq!(kv.get(b"a").unwrap(), None);
+
+        kv.put(b"a", b"one").unwrap();
+        kv.put(b"b", b"two").unwrap();
+        kv.put(b"a", b"three").unwrap();
+        kv.remove(b"b").unwrap();
+        assert_eq!(kv.get(b"a").unwrap().as_deref(), Some(&b"three"[..]));
+        assert_eq!(kv.get(b"b").unwrap(), None);
+        assert_eq!(kv.len(), 1);
+
+        let reopened = KvSegment::open(&path, KvOptions::default()).unwrap();
+        assert_eq!(reopened.get(b"a").unwrap().as_deref(), Some(&b"three"[..]));
+        assert_eq!(reopened.len(), 1);
+        assert_eq!(reopened.live_bytes(), kv.live_bytes());
+    }
+
+    #[test]
+    fn other_handles_see_writes_on_miss() {
+        let dir = tempdir();
+        let path = dir.path().join("ns.kvs");
+        let first = KvSegment::open(&path, KvOptions::default()).unwrap();
+        let second = KvSegment::open(&path, KvOptions::default()).unwrap();
+        first.put(b"k", b"v1").unwrap();
+        assert_eq!(second.get(b"k").unwrap().as_deref(), Some(&b"v1"[..]));
+        second.put(b"other", b"x").unwrap();
+        second.compact().unwrap();
+        // The compacted file replaced the one `first` mapped.
+        assert_eq!(first.get(b"other").unwrap().as_deref(), Some(&b"x"[..]));
+        assert_eq!(first.get(b"k").unwrap().as_deref(), Some(&b"v1"[..]));
+    }
+
+    #[test]
+    fn compaction_keeps_live_entries_in_the_hash_table() {
+        let dir = tempdir();
+        let path = dir.path().join("ns.kvs");
+        let kv = KvSegment::open(&path, KvOptions::default()).unwrap();
+        for round in 0..3u32 {
+            for i in 0..200u32 {
+                kv.put(&i.to_le_bytes(), &(i * round).to_le_bytes())
+                    .unwrap();
+            }
+        }
+        for i in (0..200u32).step_by(2) {
+            kv.remove(&i.to_le_bytes()).unwrap();
+        }
+        let before = kv.file_len();
+        kv.compact().unwrap();
+        assert!(kv.file_len() < before);
+        assert_eq!(kv.len(), 100);
+
+        let reopened = KvSegment::open(&path, KvOptions::default()).unwrap();
+        for i in 0..200u32 {
+            let expected = (i % 2 == 1).then(|| (i * 2).to_le_bytes().to_vec());
+            assert_eq!(reopened.get(&i.to_le_bytes()).unwrap(), expected, "key {i}");
+        }
+        // Writes after compaction land in the log and shadow the table.
+        reopened.put(&1u32.to_le_bytes(), b"new").unwrap();
+        reopened.remove(&3u32.to_le_bytes()).unwrap();
+        assert_eq!(
+            reopened.get(&1u32.to_le_bytes()).unwrap().as_deref(),
+            Some(&b"new"[..])
+        );
+        assert_eq!(reopened.get(&3u32.to_le_bytes()).unwrap(), None);
+        assert_eq!(reopened.len(), 99);
+    }
+
+    #[test]
+    fn torn_tail_is_ignored_then_compacted_away() {
+        let dir = tempdir();
+        let path = dir.path().join("ns.kvs");
+        let kv = KvSegment::open(&path, KvOptions::default()).unwrap();
+        kv.put(b"a", b"1").unwrap();
+        kv.put(b"b", b"2").unwrap();
+        // A writer crashed halfway through its record.
+        let partial = encode_record(KIND_PUT, b"c", b"3", 7);
+        OpenOptions::new()
+            .append(true)
+            .open(&path)
+            .unwrap()
+            .write_all(&partial[..partial.len() - 3])
+            .unwrap();
+
+        let reopened = KvSegment::open(&path, KvOptions::default()).unwrap();
+        assert_eq!(reopened.get(b"a").unwrap().as_deref(), Some(&b"1"[..]));
+        assert_eq!(reopened.get(b"c").unwrap(), None);
+        reopened.put(b"d", b"4").unwrap();
+
+        let healed = KvSegment::open(&path, KvOptions::default()).unwrap();
+        assert_eq!(healed.len(), 3);
+        assert_eq!(healed.get(b"b").unwrap().as_deref(), Some(&b"2"[..]));
+        assert_eq!(healed.get(b"d").unwrap().as_deref(), Some(&b"4"[..]));
+        assert_eq!(healed.file_len(), std::fs::metadata(&path).unwrap().len());
+    }
+
+    #[test]
+    fn damaged_header_reads_as_empty() {
+        let dir = tempdir();
+        let path = dir.path().join("ns.kvs");
+        std::fs::write(&path, b"not a segment").unwrap();
+        let kv = KvSegment::open(&path, KvOptions::default()).unwrap();
+        assert_eq!(kv.get(b"a").unwrap(), None);
+        kv.put(b"a", b"1").unwrap();
+        let reopened = KvSegment::open(&path, KvOptions::default()).unwrap();
+        assert_eq!(reopened.get(b"a").unwrap().as_deref(), Some(&b"1"[..]));
+    }
+
+    #[test]
+    fn size_cap_evicts_least_recently_used() {
+        let dir = tempdir();
+        let path = dir.path().join("ns.kvs");
+        let value = [7u8; 100];
+        let record = (RECORD_HEADER_LEN + 4 + value.len()) as u64;
+        // Ten back-dated entries, key 0 the oldest; a hit makes it the newest.
+        let keys: Vec<[u8; 4]> = (0..10u32).map(u32::to_le_bytes).collect();
+        let entries: Vec<Entry<'_>> = keys
+            .iter()
+            .enumerate()
+            .map(|(age, key)| Entry {
+                key,
+                value: &value,
+                stamp: 1_000 + age as u64,
+            })
+            .collect();
+        write_segment(&path, &entries).unwrap();
+        let kv = KvSegment::open(&path, options(record * 10)).unwrap();
+        assert!(kv.get(&0u32.to_le_bytes()).unwrap().is_some());
+
+        // The eleventh entry breaks the cap: compaction keeps 3/4 of it,
+        // dropping the oldest stamps (keys 1, 2, ...) but not key 0.
+        kv.put(&10u32.to_le_bytes(), &value).unwrap();
+        assert!(kv.live_bytes() <= record * 10 / 4 * 3);
+        assert_eq!(kv.len(), 7);
+        assert!(kv.get(&0u32.to_le_bytes()).unwrap().is_some());
+        assert!(kv.get(&10u32.to_le_bytes()).unwrap().is_some());
+        for evicted in 1..=4u32 {
+            assert_eq!(
+                kv.get(&evicted.to_le_bytes()).unwrap(),
+                None,
+                "key {evicted}"
+            );
+        }
+        assert!(kv.get(&9u32.to_le_bytes()).unwrap().is_some());
+    }
+
+    #[test]
+    fn overwrites_trigger_compaction_past_the_floor() {
+        let dir = tempdir();
+        let path = dir.path().join("ns.kvs");
+        let kv = KvSegment::open(
+            &path,
+            KvOptions {
+                max_bytes: 1 << 30,
+                min_compact_bytes: 64 << 10,
+            },
+        )
+        .unwrap();
+        let value = [1u8; 1024];
+        for _ in 0..1000 {
+            kv.put(b"same", &value).unwrap();
+        }
+        assert!(kv.file_len() < 128 << 10, "file_len {}", kv.file_len());
+        assert_eq!(kv.len(), 1);
+    }
+}
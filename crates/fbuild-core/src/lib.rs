@@ -6,6 +6,7 @@
 //! - Subprocess runner with platform-specific flags
 //! - Size info parsing (avr-size / arm-none-eabi-size output)
 
+pub mod archive;
 pub mod build_log;
 pub mod channel;
 pub mod compiler_flags;
@@ -16,6 +17,7 @@ pub mod file_lock;
 pub mod fs;
 pub mod http;
 pub mod install_status;
+pub mod kv_segment;
 pub mod path;
 pub mod platform;
 pub mod response_file;
@@ -261,6 +261,14 @@ pub async fn canonicalize_existing(p: impl AsRef<Path>) -> std::io::Result<Norma
     Ok(NormalizedPath::from(stripped))
 }
 
+/// [`canonicalize_existing`] for sync callers that cannot `.await`
+/// (e.g. the miss path of a sync trait method). Blocks on the
+/// filesystem; never call it from an async context.
+pub fn canonicalize_existing_blocking(p: impl AsRef<Path>) -> std::io::Result<NormalizedPath> {
+    let canon = std::fs::canonicalize(p.as_ref())?;
+    Ok(NormalizedPath::from(strip_unc_prefix(&canon)))
+}
+
 /// Normalize a path by resolving `.` and `..` components without
 /// touching the filesystem (no symlink resolution).
 ///
@@ -740,6 +748,16 @@ mod tests {
         assert_eq!(err.kind(), std::io::ErrorKind::NotFound);
     }
 
+    /// The blocking variant resolves to the same form as the async one.
+    #[tokio::test]
+    async fn canonicalize_existing_blocking_matches_async() {
+        let dir = tempfile::tempdir().unwrap();
+        let blocking = canonicalize_existing_blocking(dir.path()).unwrap();
+        let awaited = canonicalize_existing(dir.path()).await.unwrap();
+        assert_eq!(blocking.key(), awaited.key());
+        assert!(canonicalize_existing_blocking("/no/such/path/__fbuild_test_missing__").is_err());
+    }
+
     // --- compile-CWD relativization (moved from zccache.rs, #952) ---
 
     #[test]
@@ -69,6 +69,26 @@ pub fn set_executable(path: &Path) -> std::io::Result<()> {
     super::selected::fs::set_executable(path)
 }
 
+/// Apply Unix permission bits from an archive entry, as `tar` does: the
+/// low nine bits on Unix, read-only when the owner-write bit is clear on
+/// Windows.
+pub fn set_mode_bits(path: &Path, mode: u32) -> std::io::Result<()> {
+    super::selected::fs::set_mode_bits(path, mode)
+}
+
+/// [`set_mode_bits`] through an open handle, saving a path lookup.
+pub fn set_file_mode_bits(file: &File, mode: u32) -> std::io::Result<()> {
+    super::selected::fs::set_file_mode_bits(file, mode)
+}
+
+/// The permission bits [`set_mode_bits`] would restore for `metadata`: the
+/// low nine bits on Unix, `0o444` or `0o644` by the read-only flag on
+/// Windows.
+#[must_use]
+pub fn mode_bits(metadata: &std::fs::Metadata) -> u32 {
+    super::selected::fs::mode_bits(metadata)
+}
+
 /// Ensure an extracted tool is executable without changing an already-runnable file.
 pub fn ensure_executable(path: &Path) -> std::io::Result<()> {
     super::selected::fs::ensure_executable(path)
@@ -28,6 +28,18 @@ pub(crate) fn set_executable(path: &Path) -> std::io::Result<()> {
     std::fs::set_permissions(path, permissions)
 }
 
+pub(crate) fn set_mode_bits(path: &Path, mode: u32) -> std::io::Result<()> {
+    std::fs::set_permissions(path, std::fs::Permissions::from_mode(mode & 0o777))
+}
+
+pub(crate) fn set_file_mode_bits(file: &std::fs::File, mode: u32) -> std::io::Result<()> {
+    file.set_permissions(std::fs::Permissions::from_mode(mode & 0o777))
+}
+
+pub(crate) fn mode_bits(metadata: &std::fs::Metadata) -> u32 {
+    metadata.permissions().mode() & 0o777
+}
+
 pub(crate) fn ensure_executable(path: &Path) -> std::io::Result<()> {
     let permissions = std::fs::metadata(path)?.permissions();
     if permissions.mode() & 0o111 == 0 {
@@ -42,6 +42,26 @@ pub(crate) fn set_executable(_path: &Path) -> std::io::Result<()> {
     Ok(())
 }
 
+pub(crate) fn set_mode_bits(path: &Path, mode: u32) -> std::io::Result<()> {
+    let mut permissions = std::fs::metadata(path)?.permissions();
+    permissions.set_readonly(mode & 0o200 == 0);
+    std::fs::set_permissions(path, permissions)
+}
+
+pub(crate) fn set_file_mode_bits(file: &std::fs::File, mode: u32) -> std::io::Result<()> {
+    let mut permissions = file.metadata()?.permissions();
+    permissions.set_readonly(mode & 0o200 == 0);
+    file.set_permissions(permissions)
+}
+
+pub(crate) fn mode_bits(metadata: &std::fs::Metadata) -> u32 {
+    if metadata.permissions().readonly() {
+        0o444
+    } else {
+        0o644
+    }
+}
+
 pub(crate) fn ensure_executable(_path: &Path) -> std::io::Result<()> {
     Ok(())
 }
@@ -105,6 +105,35 @@ pub fn watch_set_cache_window_from_env() -> Duration {
     Duration::from_secs(secs)
 }
 
+/// Whether [`crate::watch_set_cache::DaemonWatchSetCache`] invalidates
+/// entries on filesystem events, read from `FBUILD_WATCH_SET_EVENTS` at
+/// daemon startup.
+///
+/// - Unset / anything else → off: every entry follows the
+///   [`watch_set_cache_window_from_env`] window.
+/// - `1`, `true`, `on` → on. Opt-in because `notify` delivers events
+///   asynchronously: a save made just before a deploy can still be in
+///   flight when the deploy looks its watch set up, and would be served
+///   the previous "unchanged" hash.
+pub fn watch_set_cache_events_from_env() -> bool {
+    matches!(
+        std::env::var("FBUILD_WATCH_SET_EVENTS")
+            .map(|s| s.trim().to_ascii_lowercase())
+            .as_deref(),
+        Ok("1" | "true" | "on")
+    )
+}
+
+/// The daemon's [`crate::watch_set_cache::DaemonWatchSetCache`] for the
+/// given event mode and freshness window.
+fn watch_set_cache(events: bool, window: Duration) -> crate::watch_set_cache::DaemonWatchSetCache {
+    if events {
+        crate::watch_set_cache::DaemonWatchSetCache::event_driven(window)
+    } else {
+        crate::watch_set_cache::DaemonWatchSetCache::with_max_age(window)
+    }
+}
+
 /// Fallback idle timeout: daemon shuts down after 12 hours regardless.
 pub const IDLE_TIMEOUT: Duration = Duration::from_secs(43200);
 
@@ -156,6 +185,10 @@ pub struct DaemonContext {
     pub pending_serial_attaches: Arc<AtomicUsize>,
     pub pending_serial_attach_details: DashMap<u64, PendingSerialAttachInfo>,
     pending_serial_attach_next_id: AtomicU64,
+    /// Number of `/api/prefetch` runs still going after their request
+    /// returned (`background: true`). They hold no operation guard, so
+    /// without this counter the daemon would self-evict mid-download.
+    pub background_prefetches: Arc<AtomicUsize>,
     /// Current daemon state (idle, building, deploying, etc.).
     pub daemon_state: Arc<std::sync::RwLock<DaemonState>>,
     /// Description of the current operation (e.g. project dir being built).
@@ -250,6 +283,7 @@ impl DaemonContext {
             pending_serial_attaches: Arc::new(AtomicUsize::new(0)),
             pending_serial_attach_details: DashMap::new(),
             pending_serial_attach_next_id: AtomicU64::new(1),
+            background_prefetches: Arc::new(AtomicUsize::new(0)),
             daemon_state: Arc::new(std::sync::RwLock::new(DaemonState::Idle)),
             current_operation: Arc::new(std::sync::RwLock::new(None)),
             dependency_install: Arc::new(std::sync::RwLock::new(None)),
@@ -267,7 +301,8 @@ impl DaemonContext {
             broadcast_hub,
             avr8js_sessions: DashMap::new(),
             image_hash_memo: DashMap::new(),
-            watch_set_cache: Arc::new(crate::watch_set_cache::DaemonWatchSetCache::with_max_age(
+            watch_set_cache: Arc::new(watch_set_cache(
+                watch_set_cache_events_from_env(),
                 watch_set_cache_window_from_env(),
             )),
             gc_mutex: Arc::new(tokio::sync::Mutex::new(())),
@@ -340,7 +375,7 @@ impl DaemonContext {
     /// `None` if the daemon is idle and eligible for self-eviction.
     ///
     /// Surfaces the specific blocker (operation in progress, open serial
-    /// sessions, pending serial attaches) so the self-eviction loop can log
+    /// sessions, pending serial attaches, background prefetches) so the self-eviction loop can log
     /// it and users can see why the daemon isn't shutting down. See issue
     /// FastLED/fbuild#51.
     pub fn busy_reason(&self) -> Option<String> {
@@ -351,6 +386,9 @@ impl DaemonContext {
         let pending_attaches = self
             .pending_serial_attaches
             .load(std::sync::atomic::Ordering::Relaxed);
+        let prefetches = self
+            .background_prefetches
+            .load(std::sync::atomic::Ordering::Relaxed);
 
         let mut reasons: Vec<String> = Vec::new();
         if op_running {
@@ -370,6 +408,13 @@ impl DaemonContext {
                 if pending_attaches == 1 { "" } else { "es" }
             ));
         }
+        if prefetches > 0 {
+            reasons.push(format!(
+                "{} background prefetch{}",
+                prefetches,
+                if prefetches == 1 { "" } else { "es" }
+            ));
+        }
 
         if reasons.is_empty() {
             None
@@ -655,6 +700,21 @@ mod tests {
         );
     }
 
+    /// A background prefetch outlives its request; the daemon must stay up
+    /// until its downloads finish.
+    #[test]
+    fn busy_reason_reports_background_prefetch() {
+        let ctx = make_ctx();
+        ctx.background_prefetches.fetch_add(1, Ordering::Relaxed);
+        let reason = ctx.busy_reason().expect("expected a busy reason");
+        assert!(
+            reason.contains("1 background prefetch"),
+            "reason should mention the prefetch, got: {}",
+            reason
+        );
+        assert!(!ctx.is_empty());
+    }
+
     /// Multiple concurrent blockers should all appear in the report so the
     /// self-eviction log line describes the full picture.
     #[test]
@@ -733,4 +793,52 @@ mod tests {
             None => unsafe { std::env::remove_var("FBUILD_WATCH_SET_CACHE_SECS") },
         }
     }
+
+    /// `FBUILD_WATCH_SET_EVENTS` opts in to event invalidation; any
+    /// other value (or none) keeps it off.
+    #[test]
+    fn watch_set_cache_events_env_rules() {
+        let prior = std::env::var("FBUILD_WATCH_SET_EVENTS").ok();
+
+        unsafe { std::env::remove_var("FBUILD_WATCH_SET_EVENTS") };
+        assert!(!watch_set_cache_events_from_env());
+        for on in ["1", "true", " ON "] {
+            unsafe { std::env::set_var("FBUILD_WATCH_SET_EVENTS", on) };
+            assert!(watch_set_cache_events_from_env(), "{on:?}");
+        }
+        unsafe { std::env::set_var("FBUILD_WATCH_SET_EVENTS", "0") };
+        assert!(!watch_set_cache_events_from_env());
+
+        match prior {
+            Some(v) => unsafe { std::env::set_var("FBUILD_WATCH_SET_EVENTS", v) },
+            None => unsafe { std::env::remove_var("FBUILD_WATCH_SET_EVENTS") },
+        }
+    }
+
+    /// The cache the daemon builds with no env overrides (events off,
+    /// zero window) must walk again when a source is saved right before
+    /// the next lookup — no waiting for a watcher.
+    #[test]
+    fn default_watch_set_cache_sees_an_edit_made_just_before_the_lookup() {
+        use fbuild_build::build_fingerprint::WatchSetStampCache;
+
+        let tmp = tempfile::TempDir::new().unwrap();
+        let source = tmp.path().join("main.cpp");
+        std::fs::write(&source, "int x;\n").unwrap();
+        let watches = vec![fbuild_build::zccache::FingerprintWatch {
+            cache_file: tmp.path().join(".fbuild").join("cache.json"),
+            root: tmp.path().to_path_buf(),
+            extensions: vec!["cpp".to_string()],
+            excludes: vec![".fbuild".to_string()],
+        }];
+        let cache = watch_set_cache(false, crate::watch_set_cache::DEFAULT_FRESHNESS);
+
+        assert!(cache.get(&watches).is_none());
+        cache.put(&watches, "before-edit".to_string());
+        std::fs::write(&source, "int y;\n").unwrap();
+        assert!(
+            cache.get(&watches).is_none(),
+            "an edit made just before a deploy must never be served the old hash"
+        );
+    }
 }
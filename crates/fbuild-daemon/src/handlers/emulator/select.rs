@@ -322,6 +322,7 @@ pub async fn test_emu(
                 Vec::new()
             },
             watch_set_cache: Some(std::sync::Arc::clone(&ctx.watch_set_cache) as std::sync::Arc<_>),
+            env_session: None,
             bloat_analysis: false,
             caller_path: None,
         };
@@ -148,6 +148,7 @@ async fn run_real_esp32s3_fixture_in_qemu() {
             "-DARDUINO_USB_CDC_ON_BOOT=0".to_string(),
         ],
         watch_set_cache: None,
+        env_session: None,
         bloat_analysis: false,
         caller_path: None,
     };
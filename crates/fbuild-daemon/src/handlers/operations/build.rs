@@ -280,6 +280,7 @@ pub async fn build(
             pio_env: req.pio_env.clone(),
             extra_build_flags: Vec::new(),
             watch_set_cache: Some(Arc::clone(&ctx.watch_set_cache) as Arc<_>),
+            env_session: None,
             bloat_analysis: req.bloat_analysis,
             caller_path: req.caller_path.clone(),
         };
@@ -726,6 +727,7 @@ pub async fn build(
             pio_env: req.pio_env,
             extra_build_flags: Vec::new(),
             watch_set_cache: Some(Arc::clone(&ctx.watch_set_cache) as Arc<_>),
+            env_session: None,
             bloat_analysis: req.bloat_analysis,
             caller_path: req.caller_path,
         };
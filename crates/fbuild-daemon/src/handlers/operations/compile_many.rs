@@ -0,0 +1,100 @@
+//! `POST /api/compile-many` — build one shard of a distributed
+//! `compile-many` and stream its results back as NDJSON.
+//!
+//! The coordinator (`fbuild_build::compile_many_dist`) splits a sketch list
+//! across several daemons; each runs the ordinary two-stage `compile_many`
+//! on its shard here. See that module for the event protocol.
+
+use super::common::OperationGuard;
+use crate::context::DaemonContext;
+use axum::Json;
+use axum::extract::State;
+use fbuild_build::compile_many::OrchestratorBuilder;
+use fbuild_build::compile_many_dist::{ShardEvent, ShardRequest, run_shard};
+use fbuild_core::channel::unbounded;
+use std::collections::BTreeSet;
+use std::sync::Arc;
+
+/// Cache archives this daemon process has already restored.
+static RESTORED_ARCHIVES: tokio::sync::Mutex<BTreeSet<String>> =
+    tokio::sync::Mutex::const_new(BTreeSet::new());
+
+/// Aborts the shard task when the response body is dropped, i.e. when the
+/// coordinator disconnects (FastLED/fbuild#853 for the single-build path).
+/// Aborting a finished task is a no-op, so a normal hang-up is harmless.
+struct AbortOnDrop(tokio::task::AbortHandle);
+
+impl Drop for AbortOnDrop {
+    fn drop(&mut self) {
+        self.0.abort();
+    }
+}
+
+/// POST /api/compile-many
+pub async fn compile_many(
+    State(ctx): State<Arc<DaemonContext>>,
+    Json(req): Json<ShardRequest>,
+) -> axum::response::Response {
+    use axum::response::IntoResponse;
+
+    let (tx, rx) = unbounded::<ShardEvent>();
+    let task = tokio::spawn(async move {
+        let _op_guard = OperationGuard::new(
+            &ctx,
+            fbuild_core::DaemonState::Building,
+            Some(format!(
+                "compile-many shard: {} sketches for {}",
+                req.request.sketches.len(),
+                req.request.board
+            )),
+        );
+        if let Some(archive) = req.cache_archive.as_deref() {
+            if let Err(e) = restore_cache_archive_once(archive).await {
+                let _ = tx.send(ShardEvent::Error {
+                    message: format!("restore cache archive {archive}: {e}"),
+                });
+                return;
+            }
+        }
+        run_shard(req.request, &OrchestratorBuilder, &tx).await;
+    });
+
+    let state = (rx, AbortOnDrop(task.abort_handle()));
+    let stream = futures::stream::unfold(state, |mut state| async move {
+        state.0.recv().await.map(|event| {
+            (
+                Ok::<_, std::convert::Infallible>(bytes::Bytes::from(event.to_line())),
+                state,
+            )
+        })
+    });
+    axum::response::Response::builder()
+        .header("content-type", "application/x-ndjson")
+        .body(axum::body::Body::from_stream(stream))
+        .expect("fbuild-daemon: static NDJSON response builder cannot fail")
+        .into_response()
+}
+
+/// Restore `archive` into this daemon's cache root unless this process has
+/// already done so. Holding the lock across the restore makes concurrent
+/// shards wait for the first one instead of extracting twice.
+async fn restore_cache_archive_once(archive: &str) -> fbuild_core::Result<()> {
+    let mut restored = RESTORED_ARCHIVES.lock().await;
+    if restored.contains(archive) {
+        return Ok(());
+    }
+    let path = std::path::Path::new(archive).to_path_buf();
+    let root = fbuild_paths::get_cache_root();
+    let manifest = tokio::task::spawn_blocking(move || {
+        fbuild_packages::cache_archive::restore(&path, &root, 0)
+    })
+    .await
+    .map_err(|e| fbuild_core::FbuildError::Other(format!("restore task failed: {e}")))??;
+    tracing::info!(
+        "compile-many: restored {} slice(s) from {}",
+        manifest.slices.len(),
+        archive
+    );
+    restored.insert(archive.to_string());
+    Ok(())
+}
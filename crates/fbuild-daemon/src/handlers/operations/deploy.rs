@@ -253,6 +253,7 @@ pub async fn deploy(
                 Vec::new()
             },
             watch_set_cache: Some(Arc::clone(&ctx.watch_set_cache) as Arc<_>),
+            env_session: None,
             bloat_analysis: false,
             caller_path: req.caller_path.clone(),
         };
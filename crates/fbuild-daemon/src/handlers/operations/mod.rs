@@ -2,15 +2,17 @@
 //!
 //! This module is split into per-RPC submodules so each `.rs` file
 //! stays under the 1000-LOC CI gate. The public API is unchanged:
-//! callers still reach `build`, `deploy`, `monitor`, `reset`, and
-//! `install_deps` through `crate::handlers::operations::*`.
+//! callers still reach `build`, `deploy`, `monitor`, `reset`,
+//! `install_deps`, and `prefetch` through `crate::handlers::operations::*`.
 
 mod build;
 mod common;
+mod compile_many;
 mod deploy;
 mod deploy_port;
 mod install_deps;
 mod monitor;
+mod prefetch;
 mod recovery_request;
 mod reset;
 
@@ -20,9 +22,11 @@ mod tests;
 // Public HTTP handlers — these are wired up by `main.rs` and must
 // keep their original paths (`crate::handlers::operations::<name>`).
 pub use build::build;
+pub use compile_many::compile_many;
 pub use deploy::deploy;
 pub use install_deps::install_deps;
 pub use monitor::monitor;
+pub use prefetch::prefetch;
 pub use reset::reset;
 
 // `pub(crate)` re-exports for sibling handler modules
@@ -0,0 +1,148 @@
+//! `POST /api/prefetch` — install the packages of every env in a project
+//! ahead of its builds (see `fbuild_build::prefetch`).
+
+use super::common::OperationGuard;
+use crate::context::DaemonContext;
+use crate::models::{OperationResponse, PrefetchRequest};
+use axum::Json;
+use axum::extract::State;
+use axum::http::StatusCode;
+use fbuild_core::path::NormalizedPath;
+use std::future::Future;
+use std::sync::Arc;
+use std::sync::atomic::Ordering;
+
+/// POST /api/prefetch
+///
+/// Resolves the requested envs (all of them by default) from
+/// `platformio.ini` and installs their toolchains, frameworks and tools
+/// concurrently. With `background`, the response returns as soon as the
+/// prefetch is started and the result goes to the daemon log; builds that
+/// start meanwhile join the in-flight downloads instead of repeating them.
+/// No project lock is taken: installs are serialized by their own package
+/// locks, and nothing under the project's build directory is touched. A
+/// background prefetch counts as busy (see [`spawn_background`]) until it
+/// ends, so the daemon does not self-evict mid-download.
+pub async fn prefetch(
+    State(ctx): State<Arc<DaemonContext>>,
+    Json(req): Json<PrefetchRequest>,
+) -> (StatusCode, Json<OperationResponse>) {
+    let request_id = req
+        .request_id
+        .unwrap_or_else(|| uuid::Uuid::new_v4().to_string());
+    let project_dir = NormalizedPath::new(&req.project_dir);
+
+    if !project_dir.join("platformio.ini").is_file() {
+        return (
+            StatusCode::BAD_REQUEST,
+            Json(OperationResponse::fail(
+                request_id,
+                format!("no platformio.ini in {}", req.project_dir),
+            )),
+        );
+    }
+
+    if req.background {
+        let envs = req.environments;
+        spawn_background(&ctx, async move {
+            match fbuild_build::prefetch::prefetch_project(project_dir.as_path(), &envs).await {
+                Ok(report) => tracing::info!(
+                    "background prefetch for {}: {} env(s) warm, {} failed",
+                    project_dir,
+                    report.prefetched.len(),
+                    report.failed.len(),
+                ),
+                Err(e) => tracing::warn!("background prefetch for {} failed: {}", project_dir, e),
+            }
+        });
+        return (
+            StatusCode::OK,
+            Json(OperationResponse::ok(
+                request_id,
+                format!("Prefetch started for {}", req.project_dir),
+            )),
+        );
+    }
+
+    let _op_guard = OperationGuard::new(
+        &ctx,
+        fbuild_core::DaemonState::Building,
+        Some(format!("Prefetching packages for {}", req.project_dir)),
+    );
+    match fbuild_build::prefetch::prefetch_project(project_dir.as_path(), &req.environments).await {
+        Ok(report) if report.is_success() => (
+            StatusCode::OK,
+            Json(OperationResponse::ok(
+                request_id,
+                format!(
+                    "Packages prefetched for {} env(s): {}",
+                    report.prefetched.len(),
+                    report.prefetched.join(", ")
+                ),
+            )),
+        ),
+        Ok(report) => {
+            let failures: Vec<String> = report
+                .failed
+                .iter()
+                .map(|(env, reason)| format!("{env}: {reason}"))
+                .collect();
+            (
+                StatusCode::INTERNAL_SERVER_ERROR,
+                Json(OperationResponse::fail(
+                    request_id,
+                    format!(
+                        "prefetch failed for {} of {} env(s) — {}",
+                        report.failed.len(),
+                        report.failed.len() + report.prefetched.len(),
+                        failures.join("; ")
+                    ),
+                )),
+            )
+        }
+        Err(e) => (
+            StatusCode::BAD_REQUEST,
+            Json(OperationResponse::fail(
+                request_id,
+                format!("failed to parse platformio.ini: {}", e),
+            )),
+        ),
+    }
+}
+
+/// Run `work` as a background prefetch: counted in
+/// [`DaemonContext::background_prefetches`] from before this returns until
+/// `work` ends, so `busy_reason()` keeps the daemon up meanwhile.
+pub(crate) fn spawn_background(
+    ctx: &Arc<DaemonContext>,
+    work: impl Future<Output = ()> + Send + 'static,
+) -> tokio::task::JoinHandle<()> {
+    let guard = BackgroundPrefetchGuard::new(Arc::clone(ctx));
+    tokio::spawn(async move {
+        let _guard = guard;
+        work.await;
+    })
+}
+
+/// RAII guard that increments `background_prefetches` on construction and
+/// decrements on drop, touching activity both times.
+struct BackgroundPrefetchGuard {
+    ctx: Arc<DaemonContext>,
+}
+
+impl BackgroundPrefetchGuard {
+    fn new(ctx: Arc<DaemonContext>) -> Self {
+        ctx.touch_activity();
+        ctx.background_prefetches.fetch_add(1, Ordering::Relaxed);
+        Self { ctx }
+    }
+}
+
+impl Drop for BackgroundPrefetchGuard {
+    fn drop(&mut self) {
+        self.ctx
+            .background_prefetches
+            .fetch_sub(1, Ordering::Relaxed);
+        self.ctx.touch_activity();
+    }
+}
@@ -194,3 +194,33 @@ mod image_hash_memo_tests {
         );
     }
 }
+
+mod background_prefetch_tests {
+    //! A background prefetch outlives its request, so it has to keep the
+    //! daemon from self-evicting until its downloads are done.
+    use super::super::prefetch::spawn_background;
+    use crate::context::DaemonContext;
+    use std::sync::Arc;
+
+    #[tokio::test]
+    async fn background_prefetch_keeps_the_daemon_busy_until_it_ends() {
+        let (tx, _rx) = tokio::sync::watch::channel(false);
+        let ctx = Arc::new(DaemonContext::new(8765, tx, "unknown".to_string()));
+        let (release_tx, release_rx) = tokio::sync::oneshot::channel::<()>();
+
+        let task = spawn_background(&ctx, async move {
+            let _ = release_rx.await;
+        });
+        // Busy as soon as the handler would return, before the task runs.
+        let reason = ctx
+            .busy_reason()
+            .expect("prefetch should keep the daemon busy");
+        assert!(reason.contains("1 background prefetch"), "got: {reason}");
+        tokio::task::yield_now().await;
+        assert!(!ctx.is_empty());
+
+        let _ = release_tx.send(());
+        task.await.unwrap();
+        assert_eq!(ctx.busy_reason(), None);
+    }
+}
@@ -7,6 +7,7 @@
 //!
 //! Operations:
 //! - POST /api/build
+//! - POST /api/compile-many
 //! - POST /api/deploy
 //! - POST /api/monitor
 //! - POST /api/test-emu
@@ -202,6 +202,7 @@ async fn main() {
         .route("/api/daemon/info", get(health::daemon_info))
         .route("/api/daemon/shutdown", post(health::shutdown))
         .route("/api/build", post(operations::build))
+        .route("/api/compile-many", post(operations::compile_many))
         .route("/api/deploy", post(operations::deploy))
         .route("/api/monitor", post(operations::monitor))
         .route("/api/devices/list", post(devices::list_devices))
@@ -214,6 +215,7 @@ async fn main() {
         .route("/api/cache/stats", get(cache::cache_stats))
         .route("/api/cache/gc", post(cache::run_gc))
         .route("/api/install-deps", post(operations::install_deps))
+        .route("/api/prefetch", post(operations::prefetch))
         .route("/api/reset", post(operations::reset))
         .route("/api/test-emu", post(emulator::test_emu))
         .route(
@@ -441,23 +443,35 @@ async fn main() {
     }
 
     // Run startup reconciliation in a background task — cleans up partial
-    // installs and orphan files left by crashed previous instances.
+    // installs and orphan files left by crashed previous instances, then
+    // sizes installs the index still holds no size for (an earlier daemon
+    // exited before its post-install sizing task ran). Both walk the cache
+    // tree, so they run on the blocking pool.
     {
-        tokio::spawn(async {
-            match fbuild_packages::DiskCache::open() {
-                Ok(dc) => match dc.reconcile() {
-                    Ok(report) => {
-                        if report.orphan_files_removed > 0 || report.orphan_rows_cleaned > 0 {
-                            tracing::info!(
-                                "startup reconciliation: cleaned {} orphan files, {} orphan rows",
-                                report.orphan_files_removed,
-                                report.orphan_rows_cleaned,
-                            );
-                        }
+        tokio::task::spawn_blocking(|| {
+            let dc = match fbuild_packages::DiskCache::open() {
+                Ok(dc) => dc,
+                Err(e) => {
+                    tracing::debug!("could not open cache for reconciliation: {}", e);
+                    return;
+                }
+            };
+            match dc.reconcile() {
+                Ok(report) => {
+                    if report.orphan_files_removed > 0 || report.orphan_rows_cleaned > 0 {
+                        tracing::info!(
+                            "startup reconciliation: cleaned {} orphan files, {} orphan rows",
+                            report.orphan_files_removed,
+                            report.orphan_rows_cleaned,
+                        );
                     }
-                    Err(e) => tracing::warn!("startup reconciliation failed: {}", e),
-                },
-                Err(e) => tracing::debug!("could not open cache for reconciliation: {}", e),
+                }
+                Err(e) => tracing::warn!("startup reconciliation failed: {}", e),
+            }
+            match dc.measure_unsized() {
+                Ok(0) => {}
+                Ok(n) => tracing::info!("startup reconciliation: sized {} installed entries", n),
+                Err(e) => tracing::warn!("startup install sizing failed: {}", e),
             }
         });
     }
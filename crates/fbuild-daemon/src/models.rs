@@ -366,6 +366,21 @@ pub struct InstallDepsRequest {
     pub caller_cwd: Option<String>,
 }
 
+/// POST /api/prefetch request.
+#[derive(Debug, Deserialize)]
+pub struct PrefetchRequest {
+    pub project_dir: String,
+    /// Envs to prefetch; every env in `platformio.ini` when empty.
+    #[serde(default)]
+    pub environments: Vec<String>,
+    /// Return once the prefetch has started instead of when it finishes.
+    #[serde(default)]
+    pub background: bool,
+    pub request_id: Option<String>,
+    pub caller_pid: Option<u32>,
+    pub caller_cwd: Option<String>,
+}
+
 /// POST /api/devices/{port}/lease request.
 #[derive(Debug, Deserialize)]
 pub struct DeviceLeaseRequest {
@@ -1,10 +1,9 @@
-//! Daemon-scoped in-memory cache for `hash_watch_set_stamps` results.
+//! Daemon-scoped in-memory cache for `hash_watch_set_stamps` results
+//! and the persisted `build_fingerprint.json` they are compared against.
 //!
 //! Implements [`fbuild_build::build_fingerprint::WatchSetStampCache`]
 //! over a `DashMap` keyed by a stable hash of the watch set's root
-//! paths. The production default forces a fresh walk for every build:
-//! staging can happen immediately before deployment, and returning a
-//! cached "no changes" answer would flash stale firmware.
+//! paths.
 //!
 //! # Why
 //!
@@ -14,27 +13,59 @@
 //! that walk is the dominant cost on warm rebuilds — see
 //! `docs/PERF_WARM_BUILD.md`.
 //!
+//! # Cycle / staleness model
+//!
+//! - Cache key: stable u64 derived from sorted watch root paths.
+//! - Cache value: the last stored hash, when it was stored, whether
+//!   filesystem watchers cover every root, and a dirty flag.
+//! - Event-driven mode ([`DaemonWatchSetCache::event_driven`], opt-in
+//!   via `FBUILD_WATCH_SET_EVENTS=1`): the first miss for a watch set
+//!   arms a `notify` watcher on each root *before* the orchestrator
+//!   walks it, so an edit racing the walk still marks the entry dirty.
+//!   A watched entry is served until a relevant event (a watched
+//!   extension outside the excluded directories, a directory change, a
+//!   removed root, or a watcher error) marks it dirty; the next `get`
+//!   then misses and the walk runs again. Events are delivered
+//!   asynchronously, so a save made immediately before a lookup can
+//!   still be in flight and the lookup served the previous hash; that
+//!   is why the mode is not the default. Until event delivery can be
+//!   fenced before a lookup, replacing the time window with event-driven
+//!   invalidation is deliberately left out of the default daemon, which
+//!   therefore still walks every watch set on every build.
+//! - Event paths and watch roots are compared in
+//!   [`normalize_for_key`] form, against both the configured root and
+//!   its canonical form, since backends report canonical paths.
+//! - Time-window mode (the daemon default), and roots event-driven
+//!   mode cannot watch (missing with no parent, watcher limit reached,
+//!   platform error): hit only when `entry.set_at.elapsed() <
+//!   max_age`. The default window is zero, so the set is walked for
+//!   every build:
+//!   staging can happen immediately before deployment, and returning a
+//!   cached "no changes" answer would flash stale firmware.
+//!
 //! Operators can explicitly configure a positive freshness window for
 //! controlled performance experiments. It is unsafe for normal deploys:
 //! an immediate source edit or AutoResearch staging step can otherwise reuse
 //! the preceding fingerprint.
 //!
-//! # Cycle / staleness model
-//!
-//! - Cache key: stable u64 derived from sorted watch root paths.
-//! - Cache value: `(hash, set_at: Instant)`.
-//! - Hit when `entry.set_at.elapsed() < max_age`.
-//! - Miss otherwise — the orchestrator falls through to the real walk
-//!   and stores the new result.
+//! The persisted fingerprint memo is keyed by file path and validated
+//! with a stat of the file, so a fingerprint written by another process
+//! (a direct CLI build) replaces the memo on the next lookup. The file
+//! stays the cold-start source of truth.
 
+use std::collections::HashMap;
 use std::collections::hash_map::DefaultHasher;
 use std::hash::{Hash, Hasher};
+use std::path::{Path, PathBuf};
 use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, Mutex, PoisonError};
 use std::time::{Duration, Instant};
 
 use dashmap::DashMap;
-use fbuild_build::build_fingerprint::WatchSetStampCache;
+use fbuild_build::build_fingerprint::{FileStamp, PersistedBuildFingerprint, WatchSetStampCache};
 use fbuild_build::zccache::FingerprintWatch;
+use fbuild_core::path::{NormalizedPath, normalize_for_key};
+use notify::{RecommendedWatcher, RecursiveMode, Watcher};
 
 /// Aggregate counters the daemon exposes on `/api/daemon/info` so
 /// operators can verify the watch-set cache is actually serving
@@ -45,32 +76,97 @@ use fbuild_build::zccache::FingerprintWatch;
 pub struct WatchSetCacheStats {
     /// Freshness window currently in effect (seconds).
     pub max_age_secs: u64,
+    /// Whether entries are invalidated by filesystem events.
+    pub event_driven: bool,
+    /// Paths currently registered with the filesystem watcher.
+    pub watched_paths: u64,
     /// `get` calls that returned a fresh entry.
     pub hits: u64,
     /// `get` calls that found no entry for the key.
     pub misses: u64,
     /// `get` calls that found an entry but it was past `max_age`.
     pub stale_evictions: u64,
+    /// `get` calls that found an entry a filesystem event had
+    /// invalidated.
+    pub invalidations: u64,
     /// `put` calls made (a successful flash-path walk + store).
     pub puts: u64,
+    /// Fingerprint lookups answered from memory.
+    pub fingerprint_hits: u64,
+    /// Fingerprint lookups that fell back to reading the file.
+    pub fingerprint_misses: u64,
 }
 
-/// Default freshness window for cache entries. Zero forces a source walk on
-/// every deploy so an immediate staging step cannot reuse a stale firmware
-/// fingerprint. Override per-instance via [`DaemonWatchSetCache::with_max_age`]
-/// only for controlled performance experiments.
+/// Default freshness window for entries no watcher covers. Zero forces a
+/// source walk on every deploy so an immediate staging step cannot reuse a
+/// stale firmware fingerprint. Override per-instance via
+/// [`DaemonWatchSetCache::with_max_age`] only for controlled performance
+/// experiments.
 pub const DEFAULT_FRESHNESS: Duration = Duration::ZERO;
 
+/// Upper bound on paths registered with the watcher. Each recursive
+/// watch costs one kernel watch per directory on Linux; past this many
+/// roots new watch sets fall back to the freshness window.
+const MAX_WATCHED_PATHS: usize = 256;
+
 /// In-memory cache. Cheap to clone via `Arc` because the only
 /// state is a `DashMap`. Counter fields are `AtomicU64` so the
-/// `get` / `put` calls stay lock-free on the fast path.
+/// `get` / `put` calls stay lock-free on the fast path; the watcher
+/// mutex is only taken on a miss.
 pub struct DaemonWatchSetCache {
-    inner: DashMap<u64, (String, Instant)>,
+    state: Arc<EventState>,
     max_age: Duration,
+    /// `None` when the cache is time-window only.
+    watcher: Option<Mutex<WatcherSlot>>,
+    fingerprints: DashMap<PathBuf, (FileStamp, PersistedBuildFingerprint)>,
     hits: AtomicU64,
     misses: AtomicU64,
     stale_evictions: AtomicU64,
+    invalidations: AtomicU64,
     puts: AtomicU64,
+    fingerprint_hits: AtomicU64,
+    fingerprint_misses: AtomicU64,
+}
+
+/// State shared with the watcher's event callback.
+#[derive(Default)]
+struct EventState {
+    entries: DashMap<u64, Entry>,
+    /// Roots each watched key depends on, consulted per event.
+    roots: DashMap<u64, Vec<WatchedRoot>>,
+}
+
+#[derive(Debug, Clone)]
+struct Entry {
+    /// `None` between the arming miss and the orchestrator's `put`.
+    hash: Option<String>,
+    set_at: Instant,
+    /// Every root of the set is covered by a live watch.
+    watched: bool,
+    /// A relevant filesystem event arrived since the entry was armed.
+    dirty: bool,
+}
+
+/// One watch root plus the filters its walk applies, all in
+/// [`normalize_for_key`] form so event paths compare whatever spelling
+/// the backend reports them in.
+#[derive(Debug, Clone)]
+struct WatchedRoot {
+    /// The root as configured, then its resolved form when that differs;
+    /// some backends report events under it (macOS `/var` vs
+    /// `/private/var`, Windows `\\?\` paths, symlinked project dirs).
+    keys: Vec<String>,
+    extensions: Vec<String>,
+    /// Excluded directory names, folded like the keys.
+    excludes: Vec<String>,
+}
+
+#[derive(Default)]
+struct WatcherSlot {
+    /// Created on first use; stays `None` after a creation failure.
+    watcher: Option<RecommendedWatcher>,
+    failed: bool,
+    armed: HashMap<PathBuf, RecursiveMode>,
 }
 
 impl Default for DaemonWatchSetCache {
@@ -84,27 +180,56 @@ impl DaemonWatchSetCache {
         Self::with_max_age(DEFAULT_FRESHNESS)
     }
 
+    /// Time-window-only cache: every entry expires `max_age` after its
+    /// `put`, whatever happens on disk.
     pub fn with_max_age(max_age: Duration) -> Self {
         Self {
-            inner: DashMap::new(),
+            state: Arc::new(EventState::default()),
             max_age,
+            watcher: None,
+            fingerprints: DashMap::new(),
             hits: AtomicU64::new(0),
             misses: AtomicU64::new(0),
             stale_evictions: AtomicU64::new(0),
+            invalidations: AtomicU64::new(0),
             puts: AtomicU64::new(0),
+            fingerprint_hits: AtomicU64::new(0),
+            fingerprint_misses: AtomicU64::new(0),
+        }
+    }
+
+    /// Cache whose watched entries live until a filesystem event
+    /// invalidates them. `max_age` still applies to entries no watcher
+    /// covers.
+    pub fn event_driven(max_age: Duration) -> Self {
+        Self {
+            watcher: Some(Mutex::new(WatcherSlot::default())),
+            ..Self::with_max_age(max_age)
         }
     }
 
     /// Snapshot the live counters — used by `/api/daemon/info` to
-    /// expose cache observability without holding any lock on the
-    /// hot path (each load is a single atomic read).
+    /// expose cache observability without touching the hot path (each
+    /// counter is a single atomic read; only the watched-path count
+    /// takes the watcher mutex).
     pub fn stats(&self) -> WatchSetCacheStats {
+        let watched_paths = self.watcher.as_ref().map_or(0, |slot| {
+            slot.lock()
+                .unwrap_or_else(PoisonError::into_inner)
+                .armed
+                .len() as u64
+        });
         WatchSetCacheStats {
             max_age_secs: self.max_age.as_secs(),
+            event_driven: self.watcher.is_some(),
+            watched_paths,
             hits: self.hits.load(Ordering::Relaxed),
             misses: self.misses.load(Ordering::Relaxed),
             stale_evictions: self.stale_evictions.load(Ordering::Relaxed),
+            invalidations: self.invalidations.load(Ordering::Relaxed),
             puts: self.puts.load(Ordering::Relaxed),
+            fingerprint_hits: self.fingerprint_hits.load(Ordering::Relaxed),
+            fingerprint_misses: self.fingerprint_misses.load(Ordering::Relaxed),
         }
     }
 
@@ -112,7 +237,7 @@ impl DaemonWatchSetCache {
     /// callers shouldn't care, the cache is opaque.
     #[cfg(test)]
     pub fn len(&self) -> usize {
-        self.inner.len()
+        self.state.entries.len()
     }
 
     /// Whether the cache has any stored entries. Test-only —
@@ -120,14 +245,184 @@ impl DaemonWatchSetCache {
     /// `len_without_is_empty` is satisfied.
     #[cfg(test)]
     pub fn is_empty(&self) -> bool {
-        self.inner.is_empty()
+        self.state.entries.is_empty()
+    }
+
+    /// Register `watches` under `key` and make sure every root is
+    /// watched. Returns whether all of them are covered. Roots are
+    /// registered before the watch is added so an event arriving
+    /// straight after `watch` still finds them.
+    fn arm(&self, key: u64, watches: &[FingerprintWatch]) -> bool {
+        let Some(slot) = &self.watcher else {
+            return false;
+        };
+        self.state.roots.insert(
+            key,
+            watches
+                .iter()
+                .map(|w| {
+                    // Blocking on purpose: this runs on the miss path of a
+                    // sync trait method.
+                    let resolved = fbuild_core::path::canonicalize_existing_blocking(&w.root).ok();
+                    WatchedRoot::new(w, resolved.as_ref().map(NormalizedPath::key))
+                })
+                .collect(),
+        );
+        let mut slot = slot.lock().unwrap_or_else(PoisonError::into_inner);
+        if slot.watcher.is_none() && !slot.failed {
+            let state = Arc::clone(&self.state);
+            match notify::recommended_watcher(move |res: notify::Result<notify::Event>| {
+                state.on_event(res)
+            }) {
+                Ok(watcher) => slot.watcher = Some(watcher),
+                Err(e) => {
+                    slot.failed = true;
+                    tracing::warn!(
+                        target: "fbuild_daemon::watch_set_cache",
+                        "filesystem watcher unavailable, using the freshness window: {e}"
+                    );
+                }
+            }
+        }
+        let WatcherSlot { watcher, armed, .. } = &mut *slot;
+        let Some(watcher) = watcher else {
+            return false;
+        };
+        watches.iter().all(|w| {
+            // A missing root is watched through its parent, so its
+            // creation still invalidates the entry; the next miss
+            // re-arms it recursively.
+            let (path, mode) = if w.root.is_dir() {
+                (w.root.as_path(), RecursiveMode::Recursive)
+            } else {
+                match w.root.parent().filter(|p| p.is_dir()) {
+                    Some(parent) => (parent, RecursiveMode::NonRecursive),
+                    None => return false,
+                }
+            };
+            match armed.get(path) {
+                Some(RecursiveMode::Recursive) => return true,
+                Some(_) if mode == RecursiveMode::NonRecursive => return true,
+                None if armed.len() >= MAX_WATCHED_PATHS => return false,
+                _ => {}
+            }
+            match watcher.watch(path, mode) {
+                Ok(()) => {
+                    armed.insert(path.to_path_buf(), mode);
+                    true
+                }
+                Err(e) => {
+                    tracing::debug!(
+                        target: "fbuild_daemon::watch_set_cache",
+                        path = %path.display(),
+                        "cannot watch root: {e}"
+                    );
+                    false
+                }
+            }
+        })
+    }
+}
+
+impl EventState {
+    fn on_event(&self, res: notify::Result<notify::Event>) {
+        let event = match res {
+            Ok(event) if event.need_rescan() => None,
+            Ok(event) => Some(event),
+            Err(_) => None,
+        };
+        let Some(event) = event else {
+            // Lost events or a watcher error: nothing can be trusted.
+            for mut entry in self.entries.iter_mut() {
+                entry.dirty = true;
+            }
+            return;
+        };
+        if matches!(event.kind, notify::EventKind::Access(_)) {
+            return;
+        }
+        for roots in self.roots.iter() {
+            let hit = roots
+                .iter()
+                .any(|root| event.paths.iter().any(|p| root.affected_by(p)));
+            if hit {
+                if let Some(mut entry) = self.entries.get_mut(roots.key()) {
+                    entry.dirty = true;
+                }
+            }
+        }
+    }
+}
+
+impl WatchedRoot {
+    /// `resolved` is the key of the root's canonical form, if known.
+    fn new(watch: &FingerprintWatch, resolved: Option<&str>) -> Self {
+        let mut keys = vec![normalize_for_key(&watch.root)];
+        if let Some(resolved) = resolved.filter(|r| *r != keys[0]) {
+            keys.push(resolved.to_string());
+        }
+        Self {
+            keys,
+            extensions: watch.extensions.clone(),
+            excludes: watch
+                .excludes
+                .iter()
+                .map(|e| normalize_for_key(Path::new(e)))
+                .collect(),
+        }
+    }
+
+    /// Whether a change at `path` can alter this root's walk: the root
+    /// or an ancestor itself, or a file the walk would hash. Paths with
+    /// an extension outside the watched set and anything inside an
+    /// excluded directory are ignored; extension-less paths (usually
+    /// directories) always count.
+    fn affected_by(&self, path: &Path) -> bool {
+        let path_key = normalize_for_key(path);
+        let mut rel = None;
+        for root in &self.keys {
+            if relative_key(root, &path_key).is_some() {
+                return true;
+            }
+            if let Some(r) = relative_key(&path_key, root) {
+                rel = Some(r);
+                break;
+            }
+        }
+        let Some(rel) = rel else {
+            return false;
+        };
+        let excluded = rel
+            .split('/')
+            .any(|name| self.excludes.iter().any(|e| e == name));
+        if excluded {
+            return false;
+        }
+        match path.extension().and_then(|e| e.to_str()) {
+            Some(ext) if !self.extensions.is_empty() => self
+                .extensions
+                .iter()
+                .any(|candidate| candidate.eq_ignore_ascii_case(ext)),
+            _ => true,
+        }
+    }
+}
+
+/// `path` relative to `base`, both [`normalize_for_key`] strings, when
+/// `base` is `path` or one of its ancestors (`""` for `path` itself).
+fn relative_key<'a>(path: &'a str, base: &str) -> Option<&'a str> {
+    let rest = path.strip_prefix(base)?;
+    if rest.is_empty() || base.ends_with('/') {
+        Some(rest)
+    } else {
+        rest.strip_prefix('/')
     }
 }
 
 impl WatchSetStampCache for DaemonWatchSetCache {
     fn get(&self, watches: &[FingerprintWatch]) -> Option<String> {
         let key = key_for(watches);
-        let Some(entry) = self.inner.get(&key) else {
+        let Some(entry) = self.state.entries.get(&key).map(|e| e.clone()) else {
             self.misses.fetch_add(1, Ordering::Relaxed);
             tracing::debug!(
                 target: "fbuild_daemon::watch_set_cache",
@@ -135,17 +430,33 @@ impl WatchSetStampCache for DaemonWatchSetCache {
                 key,
                 "watch-set cache lookup"
             );
+            self.rearm(key, watches);
             return None;
         };
-        let (hash, set_at) = (entry.0.clone(), entry.1);
-        drop(entry);
-        let age = set_at.elapsed();
-        if age >= self.max_age {
+        let age = entry.set_at.elapsed();
+        if entry.dirty {
+            self.invalidations.fetch_add(1, Ordering::Relaxed);
+            tracing::debug!(
+                target: "fbuild_daemon::watch_set_cache",
+                outcome = "invalidated",
+                key,
+                "watch-set cache lookup"
+            );
+            self.rearm(key, watches);
+            return None;
+        }
+        let Some(hash) = entry.hash else {
+            // Armed by an earlier miss whose walk never stored a result.
+            self.misses.fetch_add(1, Ordering::Relaxed);
+            self.rearm(key, watches);
+            return None;
+        };
+        if !entry.watched && age >= self.max_age {
             // Lazy eviction so a stale entry doesn't keep memory
             // pinned indefinitely; the next put would have replaced
             // it anyway, but explicit removal helps a long-idle
             // daemon.
-            self.inner.remove(&key);
+            self.state.entries.remove(&key);
             self.stale_evictions.fetch_add(1, Ordering::Relaxed);
             tracing::debug!(
                 target: "fbuild_daemon::watch_set_cache",
@@ -155,6 +466,7 @@ impl WatchSetStampCache for DaemonWatchSetCache {
                 max_age_ms = self.max_age.as_millis() as u64,
                 "watch-set cache lookup"
             );
+            self.rearm(key, watches);
             return None;
         }
         self.hits.fetch_add(1, Ordering::Relaxed);
@@ -163,6 +475,7 @@ impl WatchSetStampCache for DaemonWatchSetCache {
             outcome = "hit",
             key,
             age_ms = age.as_millis() as u64,
+            watched = entry.watched,
             "watch-set cache lookup"
         );
         Some(hash)
@@ -170,9 +483,73 @@ impl WatchSetStampCache for DaemonWatchSetCache {
 
     fn put(&self, watches: &[FingerprintWatch], hash: String) {
         let key = key_for(watches);
-        self.inner.insert(key, (hash, Instant::now()));
+        let mut entry = self.state.entries.entry(key).or_insert_with(|| Entry {
+            hash: None,
+            set_at: Instant::now(),
+            watched: false,
+            dirty: false,
+        });
+        // `dirty` is kept: an event during the walk means `hash` may
+        // already be out of date.
+        entry.hash = Some(hash);
+        entry.set_at = Instant::now();
+        drop(entry);
         self.puts.fetch_add(1, Ordering::Relaxed);
     }
+
+    fn get_fingerprint(&self, path: &Path) -> Option<PersistedBuildFingerprint> {
+        let memo = self.fingerprints.get(path).map(|e| e.clone());
+        let current = FileStamp::from_path(path).ok();
+        match (memo, current) {
+            (Some((stamp, fingerprint)), Some(current)) if stamp == current => {
+                self.fingerprint_hits.fetch_add(1, Ordering::Relaxed);
+                Some(fingerprint)
+            }
+            _ => {
+                self.fingerprints.remove(path);
+                self.fingerprint_misses.fetch_add(1, Ordering::Relaxed);
+                None
+            }
+        }
+    }
+
+    fn put_fingerprint(&self, path: &Path, fingerprint: &PersistedBuildFingerprint) {
+        if let Ok(stamp) = FileStamp::from_path(path) {
+            self.fingerprints
+                .insert(path.to_path_buf(), (stamp, fingerprint.clone()));
+        }
+    }
+}
+
+impl DaemonWatchSetCache {
+    /// Start a fresh, clean entry for `key` with watchers armed, ahead
+    /// of the walk the orchestrator runs after this miss. Time-window
+    /// caches keep no placeholder.
+    fn rearm(&self, key: u64, watches: &[FingerprintWatch]) {
+        if self.watcher.is_none() {
+            return;
+        }
+        // Insert before arming so events from the new watch land on
+        // this entry rather than being dropped. A placeholder another
+        // build is still walking keeps its dirty flag: clearing it could
+        // let that walk store a hash an edit has already overtaken.
+        let mut entry = self.state.entries.entry(key).or_insert_with(|| Entry {
+            hash: None,
+            set_at: Instant::now(),
+            watched: false,
+            dirty: false,
+        });
+        if entry.hash.is_some() {
+            entry.hash = None;
+            entry.dirty = false;
+        }
+        entry.set_at = Instant::now();
+        drop(entry);
+        let watched = self.arm(key, watches);
+        if let Some(mut entry) = self.state.entries.get_mut(&key) {
+            entry.watched = watched;
+        }
+    }
 }
 
 /// Stable key derived from the watch set's root paths. We sort
@@ -307,4 +684,113 @@ mod tests {
         let cache = DaemonWatchSetCache::with_max_age(Duration::from_secs(9));
         assert_eq!(cache.stats().max_age_secs, 9);
     }
+
+    fn project_watch(root: &std::path::Path) -> FingerprintWatch {
+        FingerprintWatch {
+            cache_file: root.join(".fbuild").join("cache.json"),
+            root: root.to_path_buf(),
+            extensions: vec!["cpp".to_string(), "h".to_string()],
+            excludes: vec![".fbuild".to_string()],
+        }
+    }
+
+    /// Poll `get` until it misses; events arrive on the watcher thread.
+    fn wait_for_miss(cache: &DaemonWatchSetCache, watches: &[FingerprintWatch]) -> bool {
+        for _ in 0..100 {
+            if cache.get(watches).is_none() {
+                return true;
+            }
+            std::thread::sleep(Duration::from_millis(50));
+        }
+        false
+    }
+
+    /// A watched entry outlives any time window and is dropped by the
+    /// first relevant filesystem event.
+    #[test]
+    fn event_driven_entry_lives_until_a_watched_file_changes() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        std::fs::write(tmp.path().join("main.cpp"), "int x;\n").unwrap();
+        let cache = DaemonWatchSetCache::event_driven(Duration::ZERO);
+        let ws = vec![project_watch(tmp.path())];
+
+        assert!(cache.get(&ws).is_none(), "first lookup arms the watcher");
+        cache.put(&ws, "h1".to_string());
+        assert_eq!(cache.get(&ws).as_deref(), Some("h1"));
+        assert_eq!(cache.stats().watched_paths, 1);
+
+        std::fs::write(tmp.path().join("main.cpp"), "int y;\n").unwrap();
+        assert!(wait_for_miss(&cache, &ws), "edit must invalidate the entry");
+        assert!(cache.stats().invalidations >= 1);
+
+        // Let trailing events from the same write land, then start a
+        // clean cycle; the re-armed entry serves the next walk's hash.
+        std::thread::sleep(Duration::from_millis(300));
+        let _ = cache.get(&ws);
+        cache.put(&ws, "h2".to_string());
+        assert_eq!(cache.get(&ws).as_deref(), Some("h2"));
+    }
+
+    /// Roots no watcher can cover keep the freshness-window behaviour,
+    /// so the zero default still walks every build.
+    #[test]
+    fn unwatchable_root_falls_back_to_the_window() {
+        let cache = DaemonWatchSetCache::event_driven(Duration::ZERO);
+        let ws = vec![watch("/fbuild-missing-parent/missing-root")];
+        assert!(cache.get(&ws).is_none());
+        cache.put(&ws, "h".to_string());
+        assert!(cache.get(&ws).is_none());
+        assert_eq!(cache.stats().stale_evictions, 1);
+    }
+
+    /// Build output under excluded directories and files the walk does
+    /// not hash must not invalidate; sources, directories and the root
+    /// itself must.
+    #[test]
+    fn only_changes_the_walk_sees_are_relevant() {
+        let watch = FingerprintWatch {
+            cache_file: PathBuf::from("/p/.fbuild/cache.json"),
+            root: PathBuf::from("/p"),
+            extensions: vec!["cpp".to_string()],
+            excludes: vec![".fbuild".to_string()],
+        };
+        let root = WatchedRoot::new(&watch, Some("/private/p"));
+        assert!(root.affected_by(std::path::Path::new("/p/src/main.cpp")));
+        assert!(root.affected_by(std::path::Path::new("/p/src/lib")));
+        assert!(root.affected_by(std::path::Path::new("/p")));
+        assert!(root.affected_by(std::path::Path::new("/")));
+        assert!(!root.affected_by(std::path::Path::new("/p/.fbuild/build/main.cpp")));
+        assert!(!root.affected_by(std::path::Path::new("/p/src/main.o")));
+        assert!(!root.affected_by(std::path::Path::new("/q/main.cpp")));
+        assert!(!root.affected_by(std::path::Path::new("/pq/main.cpp")));
+        assert!(root.affected_by(std::path::Path::new("/private/p/main.cpp")));
+        assert!(root.affected_by(std::path::Path::new("/p/lib/../src/main.cpp")));
+        assert!(!root.affected_by(std::path::Path::new("/p/./.fbuild/main.cpp")));
+    }
+
+    /// The fingerprint memo serves the stored copy while the file is
+    /// unchanged and gives way to the file once someone rewrites it.
+    #[test]
+    fn fingerprint_memo_follows_the_file() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let path = tmp.path().join("build_fingerprint.json");
+        let fp = |meta: &str| PersistedBuildFingerprint {
+            version: 1,
+            metadata_hash: meta.to_string(),
+            file_set_hash: None,
+            size_info: None,
+        };
+        let cache = DaemonWatchSetCache::new();
+
+        assert!(cache.get_fingerprint(&path).is_none());
+        std::fs::write(&path, "{}").unwrap();
+        cache.put_fingerprint(&path, &fp("a"));
+        let memo = cache.get_fingerprint(&path).map(|f| f.metadata_hash);
+        assert_eq!(memo.as_deref(), Some("a"));
+
+        std::fs::write(&path, "{\"rewritten\": true}").unwrap();
+        assert!(cache.get_fingerprint(&path).is_none());
+        let s = cache.stats();
+        assert_eq!((s.fingerprint_hits, s.fingerprint_misses), (1, 2));
+    }
 }
@@ -4,6 +4,14 @@
 //! sizes (tiny / medium / large) so future PRs can regress against a
 //! recorded baseline. The aspirational threshold is ≥ 50 MB/s
 //! single-thread; this harness records the number but does not gate CI.
+//!
+//! The `scan_esp_idf` group scans every header and source of a real ESP-IDF
+//! SDK tree (the include tree shipped in the ESP32 Arduino framework's
+//! `esp32-arduino-libs`) and reports decimal GB/s. It takes the tree from
+//! `FBUILD_BENCH_ESP_IDF`, otherwise the first one found in the fbuild
+//! package cache, and is skipped with a printed reason when neither exists.
+
+use std::path::{Path, PathBuf};
 
 use criterion::{Criterion, Throughput, black_box, criterion_group, criterion_main};
 use fbuild_header_scan::scan;
@@ -55,5 +63,101 @@ fn bench_scanner(c: &mut Criterion) {
     group.finish();
 }
 
-criterion_group!(benches, bench_scanner);
+/// Directory depth searched below the package cache for an SDK tree: covers
+/// `platforms/<pkg>/<hash>/<version>/tools/esp32-arduino-libs`.
+const CACHE_SEARCH_DEPTH: usize = 6;
+
+fn find_esp_idf_tree() -> Option<PathBuf> {
+    if let Some(dir) = std::env::var_os("FBUILD_BENCH_ESP_IDF") {
+        return Some(PathBuf::from(dir));
+    }
+    let home = std::env::var_os("USERPROFILE").or_else(|| std::env::var_os("HOME"))?;
+    let platforms = PathBuf::from(home).join(".fbuild/prod/cache/platforms");
+    find_dir_named(&platforms, "esp32-arduino-libs", CACHE_SEARCH_DEPTH)
+}
+
+fn find_dir_named(dir: &Path, name: &str, depth: usize) -> Option<PathBuf> {
+    let mut children: Vec<PathBuf> = std::fs::read_dir(dir)
+        .ok()?
+        .flatten()
+        .map(|e| e.path())
+        .filter(|p| p.is_dir())
+        .collect();
+    children.sort();
+    if let Some(hit) = children
+        .iter()
+        .find(|p| p.file_name() == Some(name.as_ref()))
+    {
+        return Some(hit.clone());
+    }
+    if depth == 0 {
+        return None;
+    }
+    children
+        .iter()
+        .find_map(|child| find_dir_named(child, name, depth - 1))
+}
+
+/// Every UTF-8 C/C++ header or source below `dir`, in path order.
+fn collect_sources(dir: &Path, out: &mut Vec<String>) {
+    let Ok(entries) = std::fs::read_dir(dir) else {
+        return;
+    };
+    let mut paths: Vec<PathBuf> = entries.flatten().map(|e| e.path()).collect();
+    paths.sort();
+    for path in paths {
+        if path.is_dir() {
+            collect_sources(&path, out);
+            continue;
+        }
+        let is_source = path
+            .extension()
+            .and_then(|e| e.to_str())
+            .is_some_and(|e| matches!(e, "h" | "hpp" | "hh" | "c" | "cc" | "cpp" | "inc"));
+        if is_source {
+            if let Ok(text) = std::fs::read_to_string(&path) {
+                out.push(text);
+            }
+        }
+    }
+}
+
+fn bench_esp_idf(c: &mut Criterion) {
+    let Some(root) = find_esp_idf_tree() else {
+        eprintln!(
+            "scan_esp_idf: skipped — set FBUILD_BENCH_ESP_IDF or install an ESP32 \
+             Arduino framework into the fbuild cache"
+        );
+        return;
+    };
+    let mut sources = Vec::new();
+    collect_sources(&root, &mut sources);
+    let total: usize = sources.iter().map(String::len).sum();
+    if total == 0 {
+        eprintln!(
+            "scan_esp_idf: skipped — no sources under {}",
+            root.display()
+        );
+        return;
+    }
+    eprintln!(
+        "scan_esp_idf: {} files, {:.1} MB from {}",
+        sources.len(),
+        total as f64 / 1e6,
+        root.display()
+    );
+    let mut group = c.benchmark_group("scan_esp_idf");
+    group.throughput(Throughput::BytesDecimal(total as u64));
+    group.sample_size(20);
+    group.bench_function("tree", |b| {
+        b.iter(|| {
+            for src in &sources {
+                black_box(scan(black_box(src)));
+            }
+        });
+    });
+    group.finish();
+}
+
+criterion_group!(benches, bench_scanner, bench_esp_idf);
 criterion_main!(benches);
@@ -0,0 +1,304 @@
+//! Active-branch preprocessor evaluation for [`scan_active`](crate::scan_active).
+//!
+//! Works line by line: conditional and macro directives drive a
+//! [`Conditions`] stack and are blanked, every other line is kept or blanked
+//! by whether its branch is active, and the surviving text goes to the
+//! tokenizer. `#if` expressions support `defined`, integer literals, macros
+//! with integer values, `!`, comparisons, `&&` and `||`; anything else
+//! evaluates to `0`.
+
+use std::collections::HashMap;
+
+#[derive(Clone, Copy)]
+struct Conditional {
+    parent_active: bool,
+    branch_taken: bool,
+}
+
+/// A line that [`scan_active`] consumes as a conditional or macro directive
+/// rather than passing to the tokenizer. Such lines are always blanked, so
+/// the text between two of them is either kept or dropped as a whole.
+#[derive(Clone, Copy)]
+pub(crate) enum Control<'a> {
+    If(&'a str),
+    Ifdef(&'a str),
+    Ifndef(&'a str),
+    Elif(&'a str),
+    Else,
+    Endif,
+    Define(&'a str),
+    Undef(&'a str),
+}
+
+pub(crate) fn control_directive(line: &str) -> Option<Control<'_>> {
+    let directive = line.trim_start().strip_prefix('#')?.trim_start();
+    let (name, rest) = split_directive(directive);
+    Some(match name {
+        "if" => Control::If(rest),
+        "ifdef" => Control::Ifdef(rest),
+        "ifndef" => Control::Ifndef(rest),
+        "elif" => Control::Elif(rest),
+        "else" => Control::Else,
+        "endif" => Control::Endif,
+        "define" => Control::Define(rest),
+        "undef" => Control::Undef(rest),
+        _ => return None,
+    })
+}
+
+/// A macro change made by an active `#define` / `#undef`.
+pub(crate) enum MacroEdit<'a> {
+    Define(&'a str, &'a str),
+    Undef(&'a str),
+}
+
+impl MacroEdit<'_> {
+    pub(crate) fn apply_to(self, macros: &mut HashMap<String, String>) {
+        match self {
+            Self::Define(name, value) => {
+                macros.insert(name.to_string(), value.to_string());
+            }
+            Self::Undef(name) => {
+                macros.remove(name);
+            }
+        }
+    }
+}
+
+/// The `#if` nesting state of an active-branch scan.
+pub(crate) struct Conditions {
+    stack: Vec<Conditional>,
+    active: bool,
+}
+
+impl Conditions {
+    pub(crate) fn new() -> Self {
+        Self {
+            stack: Vec::new(),
+            active: true,
+        }
+    }
+
+    /// Whether lines at this point are in an active branch.
+    pub(crate) fn active(&self) -> bool {
+        self.active
+    }
+
+    /// Step past `control`, returning the macro change it makes, if any.
+    pub(crate) fn apply<'a>(
+        &mut self,
+        control: Control<'a>,
+        macros: &HashMap<String, String>,
+    ) -> Option<MacroEdit<'a>> {
+        let active = self.active;
+        let opened = match control {
+            Control::If(rest) => Some(active && eval_condition(rest, macros)),
+            Control::Ifdef(rest) => Some(active && macros.contains_key(first_token(rest))),
+            Control::Ifndef(rest) => Some(active && !macros.contains_key(first_token(rest))),
+            Control::Elif(rest) => {
+                if let Some(current) = self.stack.last_mut() {
+                    self.active = current.parent_active
+                        && !current.branch_taken
+                        && eval_condition(rest, macros);
+                    current.branch_taken |= self.active;
+                }
+                None
+            }
+            Control::Else => {
+                if let Some(current) = self.stack.last_mut() {
+                    self.active = current.parent_active && !current.branch_taken;
+                    current.branch_taken = true;
+                }
+                None
+            }
+            Control::Endif => {
+                if let Some(current) = self.stack.pop() {
+                    self.active = current.parent_active;
+                }
+                None
+            }
+            Control::Define(rest) if active => {
+                let (name, value) = split_directive(rest);
+                if !name.is_empty() && !name.contains('(') {
+                    return Some(MacroEdit::Define(name, first_token(value)));
+                }
+                None
+            }
+            Control::Undef(rest) if active => return Some(MacroEdit::Undef(first_token(rest))),
+            Control::Define(_) | Control::Undef(_) => None,
+        };
+        if let Some(current) = opened {
+            self.stack.push(Conditional {
+                parent_active: active,
+                branch_taken: current,
+            });
+            self.active = current;
+        }
+        None
+    }
+}
+
+pub(crate) fn active_source(src: &str, macros: &mut HashMap<String, String>) -> String {
+    let mut conditions = Conditions::new();
+    let mut output = String::with_capacity(src.len());
+    for line in src.split_inclusive('\n') {
+        let keep = match control_directive(line) {
+            Some(control) => {
+                if let Some(edit) = conditions.apply(control, macros) {
+                    edit.apply_to(macros);
+                }
+                false
+            }
+            None => conditions.active(),
+        };
+        if keep {
+            output.push_str(line);
+        } else if line.ends_with('\n') {
+            output.push('\n');
+        }
+    }
+    output
+}
+
+fn split_directive(input: &str) -> (&str, &str) {
+    let trimmed = input.trim_start();
+    let end = trimmed.find(char::is_whitespace).unwrap_or(trimmed.len());
+    (&trimmed[..end], trimmed[end..].trim_start())
+}
+
+fn first_token(input: &str) -> &str {
+    input
+        .trim_start()
+        .split(|c: char| c.is_whitespace() || matches!(c, '/' | '*'))
+        .next()
+        .unwrap_or("")
+}
+
+fn eval_condition(input: &str, macros: &HashMap<String, String>) -> bool {
+    let mut parser = ConditionParser {
+        input: input.as_bytes(),
+        index: 0,
+        macros,
+    };
+    parser.parse_or() != 0
+}
+
+struct ConditionParser<'a> {
+    input: &'a [u8],
+    index: usize,
+    macros: &'a HashMap<String, String>,
+}
+
+impl<'a> ConditionParser<'a> {
+    fn parse_or(&mut self) -> i64 {
+        let mut value = self.parse_and();
+        while self.consume(b"||") {
+            let rhs = self.parse_and();
+            value = i64::from(value != 0 || rhs != 0);
+        }
+        value
+    }
+
+    fn parse_and(&mut self) -> i64 {
+        let mut value = self.parse_equality();
+        while self.consume(b"&&") {
+            let rhs = self.parse_equality();
+            value = i64::from(value != 0 && rhs != 0);
+        }
+        value
+    }
+
+    fn parse_equality(&mut self) -> i64 {
+        let mut value = self.parse_comparison();
+        loop {
+            if self.consume(b"==") {
+                value = i64::from(value == self.parse_comparison());
+            } else if self.consume(b"!=") {
+                value = i64::from(value != self.parse_comparison());
+            } else {
+                return value;
+            }
+        }
+    }
+
+    fn parse_comparison(&mut self) -> i64 {
+        let mut value = self.parse_unary();
+        loop {
+            if self.consume(b">=") {
+                value = i64::from(value >= self.parse_unary());
+            } else if self.consume(b"<=") {
+                value = i64::from(value <= self.parse_unary());
+            } else if self.consume(b">") {
+                value = i64::from(value > self.parse_unary());
+            } else if self.consume(b"<") {
+                value = i64::from(value < self.parse_unary());
+            } else {
+                return value;
+            }
+        }
+    }
+
+    fn parse_unary(&mut self) -> i64 {
+        if self.consume(b"!") {
+            return i64::from(self.parse_unary() == 0);
+        }
+        if self.consume(b"(") {
+            let value = self.parse_or();
+            self.consume(b")");
+            return value;
+        }
+        let token = self.token();
+        if token == "defined" {
+            self.consume(b"(");
+            let name = self.token();
+            self.consume(b")");
+            return i64::from(self.macros.contains_key(name));
+        }
+        if let Some(value) = parse_number(token) {
+            return value;
+        }
+        self.macros
+            .get(token)
+            .and_then(|value| parse_number(value))
+            .unwrap_or(0)
+    }
+
+    fn consume(&mut self, expected: &[u8]) -> bool {
+        self.skip_ws();
+        if self.input[self.index..].starts_with(expected) {
+            self.index += expected.len();
+            true
+        } else {
+            false
+        }
+    }
+
+    fn token(&mut self) -> &'a str {
+        self.skip_ws();
+        let start = self.index;
+        while self.index < self.input.len()
+            && (self.input[self.index].is_ascii_alphanumeric() || self.input[self.index] == b'_')
+        {
+            self.index += 1;
+        }
+        std::str::from_utf8(&self.input[start..self.index]).unwrap_or("")
+    }
+
+    fn skip_ws(&mut self) {
+        while self.index < self.input.len() && self.input[self.index].is_ascii_whitespace() {
+            self.index += 1;
+        }
+    }
+}
+
+fn parse_number(value: &str) -> Option<i64> {
+    let value = value.trim_end_matches(['u', 'U', 'l', 'L']);
+    if let Some(hex) = value
+        .strip_prefix("0x")
+        .or_else(|| value.strip_prefix("0X"))
+    {
+        i64::from_str_radix(hex, 16).ok()
+    } else {
+        value.parse().ok()
+    }
+}
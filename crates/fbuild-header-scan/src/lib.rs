@@ -4,16 +4,25 @@
 //! The walker takes a seed set of source files and an ordered list of search
 //! paths, resolves each `#include`, and returns the transitive closure of
 //! reached files. Both are independent of fbuild infrastructure so they are
-//! independently testable and reusable.
+//! independently testable and reusable. A [`ScanIndex`] persists scan results
+//! on disk so they survive the process that computed them, and an
+//! [`IncludeSkeleton`] lets active-branch scans be shared across define sets.
 
+mod conditional;
+mod scan_index;
 mod scanner;
+mod skeleton;
 mod walker;
 
+pub use scan_index::{ALL_BRANCHES_MODE, ScanIndex, define_set_mode};
 pub use scanner::{IncludeKind, IncludeRef, Span, active_defines, scan, scan_active};
+pub use skeleton::IncludeSkeleton;
 pub use walker::{
-    WalkResult, WalkState, walk, walk_active, walk_with_state, walk_with_state_active,
+    IncludeEdges, IncludeGraph, WalkResult, WalkState, walk, walk_active, walk_with_state,
+    walk_with_state_active,
 };
 
 /// Bumped whenever the scanner output shape changes. Mixed into cache keys so a
-/// scanner change invalidates memoized library-selection results.
+/// scanner change invalidates memoized library-selection results and every
+/// persisted [`ScanIndex`].
 pub const SCANNER_VERSION: u32 = 1;
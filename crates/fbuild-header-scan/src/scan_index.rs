@@ -0,0 +1,714 @@
+//! Persistent, cross-process `#include` scan index.
+//!
+//! [`WalkState`](crate::WalkState) memoizes scans only for its own lifetime,
+//! so every daemon restart (and every compile-many worker) re-reads and
+//! re-tokenizes the whole framework `libraries/` tree. A [`ScanIndex`] keeps
+//! those scan results on disk, keyed by
+//!
+//! * the canonical path,
+//! * the scan mode — all branches ([`scan`](crate::scan)), or the
+//!   define-independent [`IncludeSkeleton`] the active-branch walk replays
+//!   per environment,
+//! * a `(size, mtime)` stamp, and
+//! * a blake3 content hash,
+//!
+//! under a header that pins [`SCANNER_VERSION`](crate::SCANNER_VERSION).
+//! Because active-branch walks store skeletons rather than per-define-set
+//! include lists, every environment sharing a framework shares its entries.
+//!
+//! Lookup is two-tier. A matching stamp is trusted without reading the file;
+//! a mismatched stamp costs one read + hash, and if the content hash still
+//! matches (a `git checkout` touching files, say) the stored scan is reused
+//! and the stamp refreshed. Files modified within [`RACY_WINDOW`] of being
+//! indexed never get a trusted stamp, so same-second edits that keep the size
+//! unchanged are still caught by the hash.
+//!
+//! The file is memory-mapped on [`ScanIndex::open`] (read into memory on
+//! Windows, which cannot rename over a mapped file); only a small key table is
+//! built up front and payloads are decoded from the mapping on demand.
+//! [`ScanIndex::save`] merges with whatever is on disk at that moment and
+//! replaces the file atomically, so concurrent writers lose at worst each
+//! other's newest entries, never the index. Everything is best-effort: a
+//! missing, truncated or foreign file is an empty index.
+
+use std::borrow::Cow;
+use std::collections::{HashMap, HashSet};
+use std::io;
+use std::path::Path;
+use std::sync::RwLock;
+use std::sync::atomic::{AtomicBool, AtomicUsize, Ordering};
+use std::time::{Duration, SystemTime, UNIX_EPOCH};
+
+use crate::SCANNER_VERSION;
+use crate::scanner::{IncludeKind, IncludeRef, Span};
+use crate::skeleton::{Event, IncludeSkeleton};
+
+const MAGIC: &[u8; 8] = b"FBSCANIX";
+
+/// Bumped when the on-disk record layout changes.
+const FORMAT_VERSION: u32 = 2;
+
+/// Stamps of files modified this recently are not trusted on their own.
+const RACY_WINDOW: Duration = Duration::from_secs(2);
+
+/// Above this many entries, [`ScanIndex::save`] keeps only this process's
+/// entries plus as many older ones as fit.
+const MAX_ENTRIES: usize = 500_000;
+
+/// Scan mode for the all-branches scanner ([`scan`](crate::scan)).
+pub const ALL_BRANCHES_MODE: u64 = 0;
+
+/// Scan mode for [`IncludeSkeleton`]s, shared by every define set.
+pub(crate) const SKELETON_MODE: u64 = u64::MAX;
+
+/// A stable hash of the sorted define set: the scan mode an index keyed by
+/// [`scan_active`](crate::scan_active) results would need. Distinct from
+/// [`ALL_BRANCHES_MODE`] and [`SKELETON_MODE`].
+pub fn define_set_mode(defines: &HashMap<String, String>) -> u64 {
+    let mut pairs: Vec<(&String, &String)> = defines.iter().collect();
+    pairs.sort_unstable();
+    let mut h = blake3::Hasher::new();
+    h.update(b"defines:");
+    for (name, value) in pairs {
+        h.update(&(name.len() as u64).to_le_bytes());
+        h.update(name.as_bytes());
+        h.update(&(value.len() as u64).to_le_bytes());
+        h.update(value.as_bytes());
+    }
+    let bytes = h.finalize();
+    let mode = u64::from_le_bytes(bytes.as_bytes()[..8].try_into().unwrap_or_default());
+    // Never collide with the all-branches or skeleton mode.
+    mode.clamp(1, SKELETON_MODE - 1)
+}
+
+type Key = (u64, String);
+
+/// `(size, mtime_ns)`; [`UNTRUSTED`] forces a content-hash check.
+type Stamp = (u64, u64);
+
+const UNTRUSTED: Stamp = (u64::MAX, u64::MAX);
+
+/// An entry decoded from the mapped file; the payload stays encoded.
+#[derive(Clone, Copy)]
+struct MappedEntry {
+    stamp: Stamp,
+    hash: [u8; 32],
+    /// Byte range of the encoded payload within the mapping.
+    payload: (usize, usize),
+}
+
+struct FreshEntry {
+    stamp: Stamp,
+    hash: [u8; 32],
+    /// Encoded payload.
+    payload: Vec<u8>,
+}
+
+/// What a scan mode stores per file: an include list or a skeleton.
+pub(crate) trait IndexPayload: Sized {
+    fn encode(&self, buf: &mut Vec<u8>);
+    fn decode(bytes: &[u8]) -> Option<Self>;
+}
+
+impl IndexPayload for Vec<IncludeRef> {
+    fn encode(&self, buf: &mut Vec<u8>) {
+        encode_includes(buf, self);
+    }
+
+    fn decode(bytes: &[u8]) -> Option<Self> {
+        decode_includes(&mut Reader { bytes, pos: 0 })
+    }
+}
+
+impl IndexPayload for IncludeSkeleton {
+    fn encode(&self, buf: &mut Vec<u8>) {
+        buf.push(u8::from(self.exact));
+        buf.extend_from_slice(&(self.events.len() as u32).to_le_bytes());
+        for event in &self.events {
+            match event {
+                Event::Control(line) => {
+                    buf.push(0);
+                    buf.extend_from_slice(&(line.len() as u32).to_le_bytes());
+                    buf.extend_from_slice(line.as_bytes());
+                }
+                Event::Includes(includes) => {
+                    buf.push(1);
+                    encode_includes(buf, includes);
+                }
+            }
+        }
+    }
+
+    fn decode(bytes: &[u8]) -> Option<Self> {
+        let mut r = Reader { bytes, pos: 0 };
+        let exact = r.u8()? != 0;
+        let count = r.u32()? as usize;
+        let mut events = Vec::with_capacity(count.min(bytes.len()));
+        for _ in 0..count {
+            events.push(match r.u8()? {
+                0 => Event::Control(r.str()?.into()),
+                _ => Event::Includes(decode_includes(&mut r)?),
+            });
+        }
+        Some(Self { events, exact })
+    }
+}
+
+/// Outcome of [`ScanIndex::scan_file`].
+pub(crate) struct IndexedScan<T> {
+    pub payload: T,
+    /// Whether the file had to be read (stamp mismatch or unknown file).
+    pub read: bool,
+}
+
+/// On-disk scan index shared across processes. See the module docs.
+pub struct ScanIndex {
+    path: Box<Path>,
+    mmap: Option<Backing>,
+    mapped: HashMap<Key, MappedEntry>,
+    fresh: RwLock<HashMap<Key, FreshEntry>>,
+    /// Set when `fresh` gained entries since the last save.
+    dirty: AtomicBool,
+    hits: AtomicUsize,
+    misses: AtomicUsize,
+}
+
+impl std::fmt::Debug for ScanIndex {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        f.debug_struct("ScanIndex")
+            .field("path", &self.path)
+            .field("mapped", &self.mapped.len())
+            .field("fresh", &self.fresh_len())
+            .field("hits", &self.hits())
+            .field("misses", &self.misses())
+            .finish()
+    }
+}
+
+impl ScanIndex {
+    /// Map the index at `path`. A missing or unreadable file yields an empty
+    /// index that will be created by the first [`save`](Self::save).
+    pub fn open(path: impl AsRef<Path>) -> Self {
+        let path: Box<Path> = path.as_ref().into();
+        let (mmap, mapped) = match map_file(&path) {
+            Ok(Some(mmap)) => match parse(&mmap) {
+                Some(mapped) => (Some(mmap), mapped),
+                None => {
+                    tracing::warn!(
+                        path = %path.display(),
+                        "scan index: unreadable or stale format; starting empty"
+                    );
+                    (None, HashMap::new())
+                }
+            },
+            Ok(None) => (None, HashMap::new()),
+            Err(err) => {
+                tracing::warn!(
+                    path = %path.display(),
+                    error = %err,
+                    "scan index: failed to map; starting empty"
+                );
+                (None, HashMap::new())
+            }
+        };
+        tracing::debug!(
+            path = %path.display(),
+            entries = mapped.len(),
+            "scan index: opened"
+        );
+        Self {
+            path,
+            mmap,
+            mapped,
+            fresh: RwLock::new(HashMap::new()),
+            dirty: AtomicBool::new(false),
+            hits: AtomicUsize::new(0),
+            misses: AtomicUsize::new(0),
+        }
+    }
+
+    /// Backing file path.
+    pub fn path(&self) -> &Path {
+        &self.path
+    }
+
+    /// Number of distinct entries currently known (mapped + new).
+    pub fn len(&self) -> usize {
+        let fresh = self.fresh.read().unwrap_or_else(|e| e.into_inner());
+        self.mapped.len()
+            + fresh
+                .keys()
+                .filter(|k| !self.mapped.contains_key(*k))
+                .count()
+    }
+
+    /// `true` when the index holds no entries.
+    pub fn is_empty(&self) -> bool {
+        self.len() == 0
+    }
+
+    /// Lookups answered from the index without re-tokenizing.
+    pub fn hits(&self) -> usize {
+        self.hits.load(Ordering::Relaxed)
+    }
+
+    /// Lookups that had to run the scanner.
+    pub fn misses(&self) -> usize {
+        self.misses.load(Ordering::Relaxed)
+    }
+
+    fn fresh_len(&self) -> usize {
+        self.fresh.read().unwrap_or_else(|e| e.into_inner()).len()
+    }
+
+    /// Scan `path` (a canonical path) in `mode`, reusing the stored result
+    /// when the stamp or content hash still matches. Returns `None` when the
+    /// file cannot be read as UTF-8, mirroring the walker's
+    /// `read_to_string` semantics.
+    pub(crate) fn scan_file<T, F>(
+        &self,
+        path: &Path,
+        mode: u64,
+        scanner: &F,
+    ) -> Option<IndexedScan<T>>
+    where
+        T: IndexPayload,
+        F: Fn(&str) -> T + Sync,
+    {
+        let key: Key = (mode, path.to_string_lossy().into_owned());
+        let meta = std::fs::metadata(path).ok()?;
+        let stamp = file_stamp(&meta);
+        let known = self.lookup(&key);
+        let decoded = known
+            .as_ref()
+            .and_then(|(known_stamp, known_hash, stored)| {
+                Some((*known_stamp, *known_hash, T::decode(stored)?))
+            });
+        let (known_hash, stored) = match decoded {
+            Some((known_stamp, _, payload)) if stamp != UNTRUSTED && known_stamp == stamp => {
+                self.hits.fetch_add(1, Ordering::Relaxed);
+                return Some(IndexedScan {
+                    payload,
+                    read: false,
+                });
+            }
+            Some((_, known_hash, payload)) => (Some(known_hash), Some(payload)),
+            None => (None, None),
+        };
+
+        let bytes = std::fs::read(path).ok()?;
+        let text = std::str::from_utf8(&bytes).ok()?;
+        let hash = *blake3::hash(&bytes).as_bytes();
+        let payload = match stored {
+            Some(payload) if known_hash == Some(hash) => {
+                self.hits.fetch_add(1, Ordering::Relaxed);
+                payload
+            }
+            _ => {
+                self.misses.fetch_add(1, Ordering::Relaxed);
+                scanner(text)
+            }
+        };
+        let mut encoded = Vec::new();
+        payload.encode(&mut encoded);
+        self.fresh
+            .write()
+            .unwrap_or_else(|e| e.into_inner())
+            .insert(
+                key,
+                FreshEntry {
+                    stamp,
+                    hash,
+                    payload: encoded,
+                },
+            );
+        self.dirty.store(true, Ordering::Relaxed);
+        Some(IndexedScan {
+            payload,
+            read: true,
+        })
+    }
+
+    /// `(stamp, hash, encoded payload)` for `key`, new entries first.
+    fn lookup(&self, key: &Key) -> Option<(Stamp, [u8; 32], Cow<'_, [u8]>)> {
+        if let Some(entry) = self
+            .fresh
+            .read()
+            .unwrap_or_else(|e| e.into_inner())
+            .get(key)
+        {
+            return Some((entry.stamp, entry.hash, Cow::Owned(entry.payload.clone())));
+        }
+        let entry = self.mapped.get(key)?;
+        let mmap = self.mmap.as_ref()?;
+        let payload = &mmap[entry.payload.0..entry.payload.1];
+        Some((entry.stamp, entry.hash, Cow::Borrowed(payload)))
+    }
+
+    /// Persist new entries, merged with the current on-disk index, via a
+    /// temp file + atomic rename. No-op when nothing new was scanned since
+    /// the last save.
+    pub fn save(&self) -> io::Result<()> {
+        if !self.dirty.swap(false, Ordering::Relaxed) {
+            return Ok(());
+        }
+        let fresh = self.fresh.read().unwrap_or_else(|e| e.into_inner());
+        // Re-map the file as it is now: another process may have saved since
+        // this index was opened.
+        let current = map_file(&self.path).ok().flatten();
+        let on_disk = current.as_ref().and_then(|m| parse(m)).unwrap_or_default();
+
+        let mut buf =
+            Vec::with_capacity(current.as_ref().map_or(0, |m| m.len()) + fresh.len() * 256);
+        buf.extend_from_slice(MAGIC);
+        buf.extend_from_slice(&FORMAT_VERSION.to_le_bytes());
+        buf.extend_from_slice(&SCANNER_VERSION.to_le_bytes());
+        let count_at = buf.len();
+        buf.extend_from_slice(&0u64.to_le_bytes());
+
+        let mut count = 0u64;
+        for (key, entry) in fresh.iter() {
+            encode_entry(&mut buf, key, entry.stamp, &entry.hash, &entry.payload);
+            count += 1;
+        }
+        let budget = MAX_ENTRIES.saturating_sub(fresh.len());
+        let mut kept = 0usize;
+        let mut seen: HashSet<&Key> = fresh.keys().collect();
+        if let Some(mmap) = current.as_ref() {
+            for (key, entry) in &on_disk {
+                if kept >= budget {
+                    break;
+                }
+                if seen.insert(key) {
+                    let payload = &mmap[entry.payload.0..entry.payload.1];
+                    encode_entry(&mut buf, key, entry.stamp, &entry.hash, payload);
+                    count += 1;
+                    kept += 1;
+                }
+            }
+        }
+        buf[count_at..count_at + 8].copy_from_slice(&count.to_le_bytes());
+
+        if let Some(parent) = self.path.parent() {
+            std::fs::create_dir_all(parent)?;
+        }
+        let nonce = SystemTime::now()
+            .duration_since(UNIX_EPOCH)
+            .unwrap_or_default()
+            .as_nanos();
+        let tmp = self
+            .path
+            .with_extension(format!("tmp.{}.{}", std::process::id(), nonce));
+        std::fs::write(&tmp, &buf)?;
+        drop(current);
+        if let Err(err) = std::fs::rename(&tmp, &self.path) {
+            let _ = std::fs::remove_file(&tmp);
+            self.dirty.store(true, Ordering::Relaxed);
+            return Err(err);
+        }
+        tracing::debug!(
+            path = %self.path.display(),
+            entries = count,
+            bytes = buf.len(),
+            "scan index: saved"
+        );
+        Ok(())
+    }
+}
+
+fn file_stamp(meta: &std::fs::Metadata) -> Stamp {
+    let Some(mtime) = meta.modified().ok() else {
+        return UNTRUSTED;
+    };
+    let settled = SystemTime::now()
+        .duration_since(mtime)
+        .is_ok_and(|age| age >= RACY_WINDOW);
+    if !settled {
+        return UNTRUSTED;
+    }
+    let mtime_ns = mtime
+        .duration_since(UNIX_EPOCH)
+        .map_or(0, |d| d.as_nanos() as u64);
+    (meta.len(), mtime_ns)
+}
+
+/// Bytes of a loaded index file.
+enum Backing {
+    Mapped(memmap2::Mmap),
+    /// Windows refuses to rename over a file that is still mapped, which
+    /// would make every [`ScanIndex::save`] after the first load fail; read
+    /// the file into memory there instead.
+    Owned(Vec<u8>),
+}
+
+impl std::ops::Deref for Backing {
+    type Target = [u8];
+
+    fn deref(&self) -> &[u8] {
+        match self {
+            Self::Mapped(mmap) => mmap,
+            Self::Owned(bytes) => bytes,
+        }
+    }
+}
+
+fn map_file(path: &Path) -> io::Result<Option<Backing>> {
+    let file = match std::fs::File::open(path) {
+        Ok(file) => file,
+        Err(err) if err.kind() == io::ErrorKind::NotFound => return Ok(None),
+        Err(err) => return Err(err),
+    };
+    if file.metadata()?.len() == 0 {
+        return Ok(None);
+    }
+    if cfg!(windows) {
+        use std::io::Read as _;
+        let mut bytes = Vec::new();
+        (&file).read_to_end(&mut bytes)?;
+        return Ok(Some(Backing::Owned(bytes)));
+    }
+    // SAFETY: the index is only ever replaced by rename, never written in
+    // place, so the mapped inode is immutable for the mapping's lifetime.
+    // A foreign truncation would at worst fault the reader, the same
+    // contract every mmap-backed cache accepts.
+    let mmap = unsafe { memmap2::Mmap::map(&file)? };
+    Ok(Some(Backing::Mapped(mmap)))
+}
+
+/// Bounds-checked little-endian reader over the mapping.
+struct Reader<'a> {
+    bytes: &'a [u8],
+    pos: usize,
+}
+
+impl<'a> Reader<'a> {
+    fn take(&mut self, n: usize) -> Option<&'a [u8]> {
+        let end = self.pos.checked_add(n)?;
+        let out = self.bytes.get(self.pos..end)?;
+        self.pos = end;
+        Some(out)
+    }
+
+    fn u8(&mut self) -> Option<u8> {
+        Some(self.take(1)?[0])
+    }
+
+    fn u32(&mut self) -> Option<u32> {
+        Some(u32::from_le_bytes(self.take(4)?.try_into().ok()?))
+    }
+
+    fn u64(&mut self) -> Option<u64> {
+        Some(u64::from_le_bytes(self.take(8)?.try_into().ok()?))
+    }
+
+    fn str(&mut self) -> Option<&'a str> {
+        let len = self.u32()? as usize;
+        std::str::from_utf8(self.take(len)?).ok()
+    }
+
+    /// Skip a length-prefixed payload, returning its byte range.
+    fn skip_payload(&mut self) -> Option<(usize, usize)> {
+        let len = self.u32()? as usize;
+        let start = self.pos;
+        self.take(len)?;
+        Some((start, self.pos))
+    }
+}
+
+fn parse(bytes: &[u8]) -> Option<HashMap<Key, MappedEntry>> {
+    let mut r = Reader { bytes, pos: 0 };
+    if r.take(MAGIC.len())? != MAGIC || r.u32()? != FORMAT_VERSION || r.u32()? != SCANNER_VERSION {
+        return None;
+    }
+    let count = r.u64()? as usize;
+    let mut out = HashMap::with_capacity(count.min(MAX_ENTRIES));
+    for _ in 0..count {
+        let mode = r.u64()?;
+        let path = r.str()?.to_string();
+        let stamp = (r.u64()?, r.u64()?);
+        let hash: [u8; 32] = r.take(32)?.try_into().ok()?;
+        let payload = r.skip_payload()?;
+        out.insert(
+            (mode, path),
+            MappedEntry {
+                stamp,
+                hash,
+                payload,
+            },
+        );
+    }
+    Some(out)
+}
+
+fn decode_includes(r: &mut Reader<'_>) -> Option<Vec<IncludeRef>> {
+    let count = r.u32()? as usize;
+    let mut out = Vec::with_capacity(count.min(r.bytes.len()));
+    for _ in 0..count {
+        let kind = match r.u8()? {
+            0 => IncludeKind::Quoted,
+            _ => IncludeKind::Angled,
+        };
+        let line = r.u32()?;
+        let col = r.u32()?;
+        let path = r.str()?.to_string();
+        out.push(IncludeRef {
+            path,
+            kind,
+            span: Span { line, col },
+        });
+    }
+    Some(out)
+}
+
+fn encode_entry(buf: &mut Vec<u8>, key: &Key, stamp: Stamp, hash: &[u8; 32], payload: &[u8]) {
+    buf.extend_from_slice(&key.0.to_le_bytes());
+    buf.extend_from_slice(&(key.1.len() as u32).to_le_bytes());
+    buf.extend_from_slice(key.1.as_bytes());
+    buf.extend_from_slice(&stamp.0.to_le_bytes());
+    buf.extend_from_slice(&stamp.1.to_le_bytes());
+    buf.extend_from_slice(hash);
+    buf.extend_from_slice(&(payload.len() as u32).to_le_bytes());
+    buf.extend_from_slice(payload);
+}
+
+fn encode_includes(buf: &mut Vec<u8>, includes: &[IncludeRef]) {
+    buf.extend_from_slice(&(includes.len() as u32).to_le_bytes());
+    for inc in includes {
+        buf.push(match inc.kind {
+            IncludeKind::Quoted => 0,
+            IncludeKind::Angled => 1,
+        });
+        buf.extend_from_slice(&inc.span.line.to_le_bytes());
+        buf.extend_from_slice(&inc.span.col.to_le_bytes());
+        buf.extend_from_slice(&(inc.path.len() as u32).to_le_bytes());
+        buf.extend_from_slice(inc.path.as_bytes());
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::scan;
+    use tempfile::TempDir;
+
+    fn tempdir() -> TempDir {
+        TempDir::new_in(fbuild_paths::temp_subdir("fbuild-header-scan-tests")).unwrap()
+    }
+
+    /// Write `contents` with an mtime old enough to be trusted.
+    fn write_old(path: &Path, contents: &str) {
+        std::fs::write(path, contents).unwrap();
+        let old = SystemTime::now() - Duration::from_secs(60);
+        std::fs::File::options()
+            .write(true)
+            .open(path)
+            .unwrap()
+            .set_modified(old)
+            .unwrap();
+    }
+
+    #[test]
+    fn roundtrip_across_instances_skips_read_and_scan() {
+        let tmp = tempdir();
+        let header = tmp.path().join("a.h");
+        write_old(&header, "#include <b.h>\n#include \"c.h\"\n");
+        let index_path = tmp.path().join("index").join("scan-index.bin");
+
+        let first = ScanIndex::open(&index_path);
+        let scanned = first.scan_file(&header, ALL_BRANCHES_MODE, &scan).unwrap();
+        assert!(scanned.read);
+        assert_eq!(first.misses(), 1);
+        first.save().unwrap();
+
+        let second = ScanIndex::open(&index_path);
+        assert_eq!(second.len(), 1);
+        let reused = second
+            .scan_file(&header, ALL_BRANCHES_MODE, &|_: &str| -> Vec<IncludeRef> {
+                panic!("scanner must not run on an index hit")
+            })
+            .unwrap();
+        assert!(!reused.read);
+        assert_eq!(reused.payload, scanned.payload);
+        assert_eq!((second.hits(), second.misses()), (1, 0));
+    }
+
+    #[test]
+    fn content_change_rescans_and_touch_reuses_by_hash() {
+        let tmp = tempdir();
+        let header = tmp.path().join("a.h");
+        let index_path = tmp.path().join("scan-index.bin");
+        write_old(&header, "#include <b.h>\n");
+        let index = ScanIndex::open(&index_path);
+        index.scan_file(&header, ALL_BRANCHES_MODE, &scan).unwrap();
+        index.save().unwrap();
+
+        // Same content, new mtime: read + hash, but no rescan.
+        std::fs::write(&header, "#include <b.h>\n").unwrap();
+        let index = ScanIndex::open(&index_path);
+        let touched = index
+            .scan_file(&header, ALL_BRANCHES_MODE, &|_: &str| -> Vec<IncludeRef> {
+                panic!("content hash matched; scanner must not run")
+            })
+            .unwrap();
+        assert!(touched.read);
+        assert_eq!(touched.payload[0].path, "b.h");
+
+        // Same size, different content: the racy stamp forces a hash check.
+        std::fs::write(&header, "#include <x.h>\n").unwrap();
+        let changed = index.scan_file(&header, ALL_BRANCHES_MODE, &scan).unwrap();
+        assert_eq!(changed.payload[0].path, "x.h");
+        assert_eq!(index.misses(), 1);
+    }
+
+    #[test]
+    fn modes_are_independent() {
+        let tmp = tempdir();
+        let header = tmp.path().join("a.h");
+        write_old(&header, "#ifdef FOO\n#include <foo.h>\n#endif\n");
+        let index = ScanIndex::open(tmp.path().join("scan-index.bin"));
+        let defines = HashMap::from([("FOO".to_string(), "1".to_string())]);
+        let none = HashMap::new();
+        let foo_mode = define_set_mode(&defines);
+        let none_mode = define_set_mode(&none);
+        assert_ne!(foo_mode, none_mode);
+        assert_ne!(none_mode, ALL_BRANCHES_MODE);
+
+        let on = index
+            .scan_file(&header, foo_mode, &|s: &str| {
+                crate::scan_active(s, &defines)
+            })
+            .unwrap();
+        let off = index
+            .scan_file(&header, none_mode, &|s: &str| crate::scan_active(s, &none))
+            .unwrap();
+        assert_eq!(on.payload.len(), 1);
+        assert!(off.payload.is_empty());
+    }
+
+    #[test]
+    fn concurrent_saves_merge() {
+        let tmp = tempdir();
+        let a = tmp.path().join("a.h");
+        let b = tmp.path().join("b.h");
+        write_old(&a, "#include <x.h>\n");
+        write_old(&b, "#include <y.h>\n");
+        let index_path = tmp.path().join("scan-index.bin");
+
+        let one = ScanIndex::open(&index_path);
+        let two = ScanIndex::open(&index_path);
+        one.scan_file(&a, ALL_BRANCHES_MODE, &scan).unwrap();
+        two.scan_file(&b, ALL_BRANCHES_MODE, &scan).unwrap();
+        one.save().unwrap();
+        two.save().unwrap();
+
+        assert_eq!(ScanIndex::open(&index_path).len(), 2);
+    }
+
+    #[test]
+    fn garbage_file_is_an_empty_index() {
+        let tmp = tempdir();
+        let index_path = tmp.path().join("scan-index.bin");
+        std::fs::write(&index_path, b"FBSCANIX\x01\x00\x00\x00truncated").unwrap();
+        assert!(ScanIndex::open(&index_path).is_empty());
+    }
+}
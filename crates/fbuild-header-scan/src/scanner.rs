@@ -1,8 +1,10 @@
 //! Line-oriented C/C++ `#include` scanner.
 //!
-//! Tokenizes source byte-by-byte while tracking whether we are inside a line
-//! comment, block comment, string literal, raw string literal, or character
-//! literal. `#include` directives are recognized only in normal code state.
+//! Tokenizes source while tracking whether we are inside a line comment, block
+//! comment, string literal, raw string literal, or character literal.
+//! `#include` directives are recognized only in normal code state. The
+//! byte-at-a-time state machine only sees the bytes that can matter in the
+//! current state; memchr jumps over the rest of each line.
 //! [`scan`] preserves the legacy behavior and scans every conditional branch;
 //! [`scan_active`] evaluates active branches for LDF selection.
 //! Both branches of `#if` / `#ifdef` are scanned (we do not evaluate
@@ -11,6 +13,8 @@
 
 use std::collections::HashMap;
 
+use crate::conditional::active_source;
+
 /// Whether an include used `<...>` (system / search-path) or `"..."` (quoted /
 /// same-directory-first).
 #[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
@@ -50,6 +54,28 @@ enum State {
 
 /// Extract every `#include` directive from `src`. Pure function; no I/O.
 pub fn scan(src: &str) -> Vec<IncludeRef> {
+    scan_with::<true>(src)
+}
+
+/// The tokenizer behind [`scan`].
+///
+/// With `FAST`, each step first jumps (memchr, bounded by the current line)
+/// over bytes that cannot change the current state, then hands the byte it
+/// lands on to the precise state machine. Raw-string prefixes skipped that
+/// way are recognised from their opening `"` instead. `FAST = false` is the
+/// plain byte-at-a-time machine: the oracle the fast path is fuzzed against.
+fn scan_with<const FAST: bool>(src: &str) -> Vec<IncludeRef> {
+    scan_tracking_state::<FAST>(src).0
+}
+
+/// [`scan`] of a run of whole lines, plus whether the tokenizer ends it in
+/// plain code -- that is, whether text after `src` tokenizes the same as it
+/// would on its own.
+pub(crate) fn scan_segment(src: &str) -> (Vec<IncludeRef>, bool) {
+    scan_tracking_state::<true>(src)
+}
+
+fn scan_tracking_state<const FAST: bool>(src: &str) -> (Vec<IncludeRef>, bool) {
     let bytes = src.as_bytes();
     let mut out = Vec::new();
     let mut state = State::Code;
@@ -58,8 +84,18 @@ pub fn scan(src: &str) -> Vec<IncludeRef> {
     let mut line: u32 = 1;
     let mut line_start: usize = 0;
     let mut at_line_start_in_code = true;
+    let mut line_end = if FAST { next_newline(bytes, 0) } else { 0 };
 
     while i < bytes.len() {
+        if FAST {
+            if line_end < i {
+                line_end = next_newline(bytes, i);
+            }
+            i = skip_inert(bytes, i, line_end, state, at_line_start_in_code);
+            if i >= bytes.len() {
+                break;
+            }
+        }
         let b = bytes[i];
 
         if b == b'\n' {
@@ -133,17 +169,19 @@ pub fn scan(src: &str) -> Vec<IncludeRef> {
                     at_line_start_in_code = false;
                     continue;
                 }
-                let prev_is_ident_continuation =
-                    i > 0 && (bytes[i - 1].is_ascii_alphanumeric() || bytes[i - 1] == b'_');
-                if (b == b'R' || b == b'L' || b == b'u' || b == b'U')
-                    && !prev_is_ident_continuation
-                    && is_raw_string_open(bytes, i)
-                {
-                    let open_quote = bytes[i..]
+                let raw_start = if is_raw_string_start(bytes, i) {
+                    Some(i)
+                } else if FAST && b == b'"' {
+                    raw_string_open_ending_at(bytes, i)
+                } else {
+                    None
+                };
+                if let Some(start) = raw_start {
+                    let open_quote = bytes[start..]
                         .iter()
                         .position(|&c| c == b'"')
                         .expect("fbuild-header-scan: is_raw_string_open guarantees '\"' ahead")
-                        + i;
+                        + start;
                     let paren = bytes[open_quote + 1..]
                         .iter()
                         .position(|&c| c == b'(')
@@ -185,7 +223,7 @@ pub fn scan(src: &str) -> Vec<IncludeRef> {
         }
     }
 
-    out
+    (out, state == State::Code)
 }
 
 /// Extract includes reachable through active preprocessor branches.
@@ -208,239 +246,58 @@ pub fn active_defines(src: &str, defines: &HashMap<String, String>) -> HashMap<S
     macros
 }
 
-#[derive(Clone, Copy)]
-struct Conditional {
-    parent_active: bool,
-    branch_taken: bool,
-}
-
-fn active_source(src: &str, macros: &mut HashMap<String, String>) -> String {
-    let mut stack = Vec::new();
-    let mut active = true;
-    let mut output = String::with_capacity(src.len());
-    for line in src.split_inclusive('\n') {
-        let directive = line.trim_start().strip_prefix('#').map(str::trim_start);
-        let mut keep = active;
-        if let Some(directive) = directive {
-            let (name, rest) = split_directive(directive);
-            match name {
-                "if" => {
-                    let current = active && eval_condition(rest, macros);
-                    stack.push(Conditional {
-                        parent_active: active,
-                        branch_taken: current,
-                    });
-                    active = current;
-                    keep = false;
-                }
-                "ifdef" => {
-                    let current = active && macros.contains_key(first_token(rest));
-                    stack.push(Conditional {
-                        parent_active: active,
-                        branch_taken: current,
-                    });
-                    active = current;
-                    keep = false;
-                }
-                "ifndef" => {
-                    let current = active && !macros.contains_key(first_token(rest));
-                    stack.push(Conditional {
-                        parent_active: active,
-                        branch_taken: current,
-                    });
-                    active = current;
-                    keep = false;
-                }
-                "elif" => {
-                    if let Some(current) = stack.last_mut() {
-                        active = current.parent_active
-                            && !current.branch_taken
-                            && eval_condition(rest, macros);
-                        current.branch_taken |= active;
-                    }
-                    keep = false;
-                }
-                "else" => {
-                    if let Some(current) = stack.last_mut() {
-                        active = current.parent_active && !current.branch_taken;
-                        current.branch_taken = true;
-                    }
-                    keep = false;
-                }
-                "endif" => {
-                    if let Some(current) = stack.pop() {
-                        active = current.parent_active;
-                    }
-                    keep = false;
-                }
-                "define" if active => {
-                    let (name, value) = split_directive(rest);
-                    if !name.is_empty() && !name.contains('(') {
-                        macros.insert(name.to_string(), first_token(value).to_string());
-                    }
-                    keep = false;
-                }
-                "undef" if active => {
-                    macros.remove(first_token(rest));
-                    keep = false;
-                }
-                _ => {}
-            }
-        }
-        if keep {
-            output.push_str(line);
-        } else if line.ends_with('\n') {
-            output.push('\n');
-        }
-    }
-    output
-}
-
-fn split_directive(input: &str) -> (&str, &str) {
-    let trimmed = input.trim_start();
-    let end = trimmed.find(char::is_whitespace).unwrap_or(trimmed.len());
-    (&trimmed[..end], trimmed[end..].trim_start())
+fn is_horizontal_ws(b: u8) -> bool {
+    b == b' ' || b == b'\t' || b == b'\r'
 }
 
-fn first_token(input: &str) -> &str {
-    input
-        .trim_start()
-        .split(|c: char| c.is_whitespace() || matches!(c, '/' | '*'))
-        .next()
-        .unwrap_or("")
+/// Index of the next `\n` at or after `from`, or `bytes.len()`.
+fn next_newline(bytes: &[u8], from: usize) -> usize {
+    memchr::memchr(b'\n', &bytes[from..]).map_or(bytes.len(), |p| from + p)
 }
 
-fn eval_condition(input: &str, macros: &HashMap<String, String>) -> bool {
-    let mut parser = ConditionParser {
-        input: input.as_bytes(),
-        index: 0,
-        macros,
+/// First index in `i..line_end` whose byte can matter to the state machine in
+/// `state`, or `line_end`. Every byte skipped is one the byte-at-a-time loop
+/// would have stepped over with a bare `i += 1`: in code that leaves out `#`
+/// (only meaningful at line start, which is never skipped) and raw-string
+/// prefix letters (caught from the opening quote by
+/// [`raw_string_open_ending_at`]).
+fn skip_inert(
+    bytes: &[u8],
+    i: usize,
+    line_end: usize,
+    state: State,
+    at_line_start_in_code: bool,
+) -> usize {
+    let line = &bytes[i..line_end];
+    let hit = match state {
+        State::Code if at_line_start_in_code => return i,
+        State::Code => memchr::memchr3(b'/', b'"', b'\'', line),
+        State::LineComment => None,
+        State::BlockComment => memchr::memchr(b'*', line),
+        State::StringLit => memchr::memchr2(b'\\', b'"', line),
+        State::CharLit => memchr::memchr2(b'\\', b'\'', line),
+        State::RawString => memchr::memchr(b')', line),
     };
-    parser.parse_or() != 0
-}
-
-struct ConditionParser<'a> {
-    input: &'a [u8],
-    index: usize,
-    macros: &'a HashMap<String, String>,
-}
-
-impl<'a> ConditionParser<'a> {
-    fn parse_or(&mut self) -> i64 {
-        let mut value = self.parse_and();
-        while self.consume(b"||") {
-            let rhs = self.parse_and();
-            value = i64::from(value != 0 || rhs != 0);
-        }
-        value
-    }
-
-    fn parse_and(&mut self) -> i64 {
-        let mut value = self.parse_equality();
-        while self.consume(b"&&") {
-            let rhs = self.parse_equality();
-            value = i64::from(value != 0 && rhs != 0);
-        }
-        value
-    }
-
-    fn parse_equality(&mut self) -> i64 {
-        let mut value = self.parse_comparison();
-        loop {
-            if self.consume(b"==") {
-                value = i64::from(value == self.parse_comparison());
-            } else if self.consume(b"!=") {
-                value = i64::from(value != self.parse_comparison());
-            } else {
-                return value;
-            }
-        }
-    }
-
-    fn parse_comparison(&mut self) -> i64 {
-        let mut value = self.parse_unary();
-        loop {
-            if self.consume(b">=") {
-                value = i64::from(value >= self.parse_unary());
-            } else if self.consume(b"<=") {
-                value = i64::from(value <= self.parse_unary());
-            } else if self.consume(b">") {
-                value = i64::from(value > self.parse_unary());
-            } else if self.consume(b"<") {
-                value = i64::from(value < self.parse_unary());
-            } else {
-                return value;
-            }
-        }
-    }
-
-    fn parse_unary(&mut self) -> i64 {
-        if self.consume(b"!") {
-            return i64::from(self.parse_unary() == 0);
-        }
-        if self.consume(b"(") {
-            let value = self.parse_or();
-            self.consume(b")");
-            return value;
-        }
-        let token = self.token();
-        if token == "defined" {
-            self.consume(b"(");
-            let name = self.token();
-            self.consume(b")");
-            return i64::from(self.macros.contains_key(name));
-        }
-        if let Some(value) = parse_number(token) {
-            return value;
-        }
-        self.macros
-            .get(token)
-            .and_then(|value| parse_number(value))
-            .unwrap_or(0)
-    }
-
-    fn consume(&mut self, expected: &[u8]) -> bool {
-        self.skip_ws();
-        if self.input[self.index..].starts_with(expected) {
-            self.index += expected.len();
-            true
-        } else {
-            false
-        }
-    }
-
-    fn token(&mut self) -> &'a str {
-        self.skip_ws();
-        let start = self.index;
-        while self.index < self.input.len()
-            && (self.input[self.index].is_ascii_alphanumeric() || self.input[self.index] == b'_')
-        {
-            self.index += 1;
-        }
-        std::str::from_utf8(&self.input[start..self.index]).unwrap_or("")
-    }
-
-    fn skip_ws(&mut self) {
-        while self.index < self.input.len() && self.input[self.index].is_ascii_whitespace() {
-            self.index += 1;
-        }
-    }
+    hit.map_or(line_end, |p| i + p)
 }
 
-fn parse_number(value: &str) -> Option<i64> {
-    let value = value.trim_end_matches(['u', 'U', 'l', 'L']);
-    if let Some(hex) = value
-        .strip_prefix("0x")
-        .or_else(|| value.strip_prefix("0X"))
-    {
-        i64::from_str_radix(hex, 16).ok()
-    } else {
-        value.parse().ok()
-    }
+/// Whether the byte-at-a-time loop opens a raw string at code byte `i`.
+fn is_raw_string_start(bytes: &[u8], i: usize) -> bool {
+    let prev_is_ident_continuation =
+        i > 0 && (bytes[i - 1].is_ascii_alphanumeric() || bytes[i - 1] == b'_');
+    matches!(bytes[i], b'R' | b'L' | b'u' | b'U')
+        && !prev_is_ident_continuation
+        && is_raw_string_open(bytes, i)
 }
 
-fn is_horizontal_ws(b: u8) -> bool {
-    b == b' ' || b == b'\t' || b == b'\r'
+/// Start of the raw-string opener (`R"`, `LR"`, `uR"`, `UR"`, `u8R"`) whose
+/// own quote is the one at `quote`, if any. The prefix is at most three bytes
+/// of letters and `8`, none of which can end a comment or literal, so every
+/// candidate start was (or, when skipped, would have been) visited in code
+/// state; the earliest match is the one the byte-at-a-time loop enters.
+fn raw_string_open_ending_at(bytes: &[u8], quote: usize) -> Option<usize> {
+    (quote.saturating_sub(3)..quote)
+        .find(|&start| !bytes[start..quote].contains(&b'"') && is_raw_string_start(bytes, start))
 }
 
 /// Recognise `R"`, `LR"`, `uR"`, `UR"`, `u8R"` raw-string openers. Caller has
@@ -871,3 +728,7 @@ mod tests {
         assert_eq!(refs[0].path, "SPI.h");
     }
 }
+
+#[cfg(test)]
+#[path = "scanner_fuzz_tests.rs"]
+mod fuzz_tests;
@@ -0,0 +1,267 @@
+//! Define-independent include skeletons.
+//!
+//! [`scan_active`](crate::scan_active) depends on the define set, so a scan
+//! cached for one environment is useless to the next: 30 ESP32 envs that
+//! differ in a handful of `-D` flags used to re-read and re-tokenize the
+//! whole framework once each. An [`IncludeSkeleton`] is the part of that
+//! work that does not depend on defines, computed once per file:
+//!
+//! * every conditional / macro directive line, in order, and
+//! * the includes of each run of lines between two such directives.
+//!
+//! Active-branch evaluation only ever keeps or drops those runs as a whole,
+//! so [`IncludeSkeleton::active_includes`] replays the directives against an
+//! environment's defines and concatenates the includes of the runs it keeps
+//! -- no file read, no tokenizing. Spans stay exact because dropped lines
+//! are blanked, never removed.
+//!
+//! Replay assumes each run starts in plain code. A run that ends inside a
+//! block comment or literal (a `/*` whose `*/` sits past an `#endif`, say)
+//! makes the skeleton inexact and callers fall back to `scan_active`.
+
+use std::borrow::Cow;
+use std::collections::HashMap;
+
+use crate::conditional::{Conditions, control_directive};
+use crate::scanner::{IncludeRef, Span, scan_segment};
+
+/// One file's directives and per-run includes. See the module docs.
+#[derive(Debug, Clone, Default, PartialEq, Eq)]
+pub struct IncludeSkeleton {
+    pub(crate) events: Vec<Event>,
+    pub(crate) exact: bool,
+}
+
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub(crate) enum Event {
+    /// A conditional or macro directive line, re-parsed on replay.
+    Control(Box<str>),
+    /// Includes of a run of ordinary lines, with file-absolute spans.
+    Includes(Vec<IncludeRef>),
+}
+
+impl IncludeSkeleton {
+    /// Split `src` into directives and the includes between them.
+    pub fn build(src: &str) -> Self {
+        let mut skeleton = Self {
+            events: Vec::new(),
+            exact: true,
+        };
+        // Byte offset and 1-based line number of the current run's start.
+        let mut run = (0usize, 1u32);
+        let mut offset = 0usize;
+        let mut line_no = 1u32;
+        for line in src.split_inclusive('\n') {
+            if control_directive(line).is_some() {
+                if !skeleton.push_run(&src[run.0..offset], run.1) {
+                    skeleton.exact = false;
+                }
+                skeleton.events.push(Event::Control(line.trim_end().into()));
+                run = (offset + line.len(), line_no + 1);
+            }
+            offset += line.len();
+            line_no += 1;
+        }
+        // Nothing follows the last run, so its end state does not matter.
+        skeleton.push_run(&src[run.0..], run.1);
+        skeleton
+    }
+
+    /// Whether [`Self::active_includes`] reproduces `scan_active` exactly.
+    pub fn is_exact(&self) -> bool {
+        self.exact
+    }
+
+    /// The includes `scan_active` finds under `defines`, or `None` when the
+    /// skeleton is not exact and the source must be scanned instead.
+    pub fn active_includes(&self, defines: &HashMap<String, String>) -> Option<Vec<IncludeRef>> {
+        if !self.exact {
+            return None;
+        }
+        let mut macros = Cow::Borrowed(defines);
+        let mut conditions = Conditions::new();
+        let mut out = Vec::new();
+        for event in &self.events {
+            match event {
+                Event::Control(line) => {
+                    let Some(control) = control_directive(line) else {
+                        continue;
+                    };
+                    if let Some(edit) = conditions.apply(control, &macros) {
+                        edit.apply_to(macros.to_mut());
+                    }
+                }
+                Event::Includes(includes) if conditions.active() => {
+                    out.extend(includes.iter().cloned());
+                }
+                Event::Includes(_) => {}
+            }
+        }
+        Some(out)
+    }
+
+    /// Scan one run starting at `first_line`; returns whether it ends in
+    /// plain code.
+    fn push_run(&mut self, text: &str, first_line: u32) -> bool {
+        if text.is_empty() {
+            return true;
+        }
+        let (mut includes, clean) = scan_segment(text);
+        if !includes.is_empty() {
+            for inc in &mut includes {
+                inc.span = Span {
+                    line: inc.span.line + first_line - 1,
+                    col: inc.span.col,
+                };
+            }
+            self.events.push(Event::Includes(includes));
+        }
+        clean
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::scan_active;
+
+    fn defines(pairs: &[(&str, &str)]) -> HashMap<String, String> {
+        pairs
+            .iter()
+            .map(|(k, v)| (k.to_string(), v.to_string()))
+            .collect()
+    }
+
+    const SOURCE: &str = "\
+#pragma once
+#include <always.h>
+#if defined(ESP32) && CONFIG_IDF_TARGET_ESP32S3
+#include \"s3.h\"
+#elif BOARD_REV >= 2
+#include <rev2.h>
+#else
+  #include <fallback.h> // trailing comment
+#endif
+#ifndef NO_WIFI
+#define HAS_WIFI 1
+#endif
+/* a block comment
+   #include <commented.h>
+*/
+#if HAS_WIFI
+#include <WiFi.h>
+#endif
+#undef HAS_WIFI
+#ifdef HAS_WIFI
+#include <never.h>
+#endif
+const char *s = \"#include <in_string.h>\";
+";
+
+    #[test]
+    fn k01_replay_matches_scan_active_for_every_define_set() {
+        let skeleton = IncludeSkeleton::build(SOURCE);
+        assert!(skeleton.is_exact());
+        for set in [
+            defines(&[]),
+            defines(&[("ESP32", ""), ("CONFIG_IDF_TARGET_ESP32S3", "1")]),
+            defines(&[("ESP32", ""), ("CONFIG_IDF_TARGET_ESP32S3", "0")]),
+            defines(&[("BOARD_REV", "3")]),
+            defines(&[("NO_WIFI", "")]),
+        ] {
+            assert_eq!(
+                skeleton.active_includes(&set).unwrap(),
+                scan_active(SOURCE, &set),
+                "defines {set:?}"
+            );
+        }
+    }
+
+    #[test]
+    fn k02_spans_are_file_absolute() {
+        let skeleton = IncludeSkeleton::build(SOURCE);
+        let includes = skeleton.active_includes(&defines(&[])).unwrap();
+        let fallback = includes.iter().find(|i| i.path == "fallback.h").unwrap();
+        assert_eq!((fallback.span.line, fallback.span.col), (8, 3));
+    }
+
+    #[test]
+    fn k03_comment_spanning_a_directive_is_inexact() {
+        let src = "/* starts here\n#if A\n*/ #include <x.h>\n#endif\n#include <y.h>\n";
+        let skeleton = IncludeSkeleton::build(src);
+        assert!(!skeleton.is_exact());
+        assert_eq!(skeleton.active_includes(&defines(&[])), None);
+    }
+
+    #[test]
+    fn k04_directive_free_files_are_one_run() {
+        let src = "#include <a.h>\n#include \"b.h\"\nint x;\n";
+        let skeleton = IncludeSkeleton::build(src);
+        assert_eq!(skeleton.events.len(), 1);
+        assert_eq!(
+            skeleton.active_includes(&defines(&[])).unwrap(),
+            crate::scan(src)
+        );
+    }
+
+    #[test]
+    fn k05_replay_matches_scan_active_on_random_sources() {
+        const LINES: &[&str] = &[
+            "#if A\n",
+            "#if defined(B) && A > 1\n",
+            "#ifdef B\n",
+            "#ifndef C\n",
+            "#elif A == 2\n",
+            "#else\n",
+            "#endif\n",
+            "#define A 2\n",
+            "#define C\n",
+            "#undef B\n",
+            "  # if !A\n",
+            "#include <a.h>\n",
+            "#include \"b.h\"\n",
+            "  #include <c.h> // note\n",
+            "int x = 1; /* short */\n",
+            "/* open\n",
+            "close */\n",
+            "const char *s = \"#include <s.h>\";\n",
+            "\"unterminated\n",
+            "// #include <commented.h>\n",
+            "\n",
+            "#include <last.h>",
+        ];
+        let sets = [
+            defines(&[]),
+            defines(&[("A", "2")]),
+            defines(&[("A", "3"), ("B", "")]),
+            defines(&[("C", "1"), ("B", "")]),
+        ];
+        let mut rng = 0x2545_f491_4f6c_dd1d_u64;
+        let mut exact = 0;
+        for _ in 0..5_000 {
+            let mut src = String::new();
+            rng ^= rng << 13;
+            rng ^= rng >> 7;
+            rng ^= rng << 17;
+            for _ in 0..(rng % 24) {
+                rng ^= rng << 13;
+                rng ^= rng >> 7;
+                rng ^= rng << 17;
+                src.push_str(LINES[(rng % LINES.len() as u64) as usize]);
+            }
+            let skeleton = IncludeSkeleton::build(&src);
+            if !skeleton.is_exact() {
+                continue;
+            }
+            exact += 1;
+            for set in &sets {
+                assert_eq!(
+                    skeleton.active_includes(set).unwrap(),
+                    scan_active(&src, set),
+                    "source {src:?} defines {set:?}"
+                );
+            }
+        }
+        assert!(exact > 1_000, "only {exact} exact skeletons");
+    }
+}
@@ -15,13 +15,20 @@
 //!   `fbuild-library-select` to avoid re-reading files between LDF passes).
 //!   `WalkResult::reached` is the *delta* of canonical paths newly discovered
 //!   in this call; the union of deltas across calls equals the full set.
+//!
+//! A state created with [`WalkState::recording_graph`] also records the
+//! resolved edges of every file it walks into an [`IncludeGraph`], which can
+//! replay a walk later without touching the filesystem.
 
 use std::collections::{BTreeSet, HashMap, HashSet, VecDeque};
 use std::path::{Path, PathBuf};
+use std::sync::Arc;
 
 use rayon::prelude::*;
 
+use crate::scan_index::{ALL_BRANCHES_MODE, SKELETON_MODE, ScanIndex};
 use crate::scanner::{IncludeKind, IncludeRef, scan, scan_active};
+use crate::skeleton::IncludeSkeleton;
 
 /// Result of a walk. `reached` and `unresolved` are sorted for deterministic
 /// cache keys.
@@ -57,6 +64,12 @@ pub struct WalkState {
     /// lifetime of this state. Each unique file is counted exactly once
     /// because subsequent walks hit `scan_cache` instead.
     files_read: usize,
+    /// Optional persistent index consulted before reading/tokenizing a file.
+    index: Option<Arc<ScanIndex>>,
+    /// Files answered by `index` from their stamp, without a read.
+    index_hits: usize,
+    /// Resolved edges of every walked file, when recording was requested.
+    graph: Option<IncludeGraph>,
 }
 
 impl WalkState {
@@ -70,6 +83,122 @@ impl WalkState {
     pub fn files_read(&self) -> usize {
         self.files_read
     }
+
+    /// Create an empty state backed by a persistent [`ScanIndex`]: files
+    /// whose stamp or content hash matches an indexed entry are not
+    /// re-tokenized (and, on a stamp match, not read at all).
+    pub fn with_index(index: Arc<ScanIndex>) -> Self {
+        Self {
+            index: Some(index),
+            ..Self::default()
+        }
+    }
+
+    /// Number of files the [`ScanIndex`] answered by stamp alone, without
+    /// reading them.
+    pub fn index_hits(&self) -> usize {
+        self.index_hits
+    }
+
+    /// Record the resolved include edges of every file this state walks.
+    /// Retrieve them with [`WalkState::take_graph`].
+    pub fn recording_graph(mut self) -> Self {
+        self.graph = Some(IncludeGraph::default());
+        self
+    }
+
+    /// The edges recorded so far (empty unless [`WalkState::recording_graph`]
+    /// was used). Recording continues into a fresh graph.
+    pub fn take_graph(&mut self) -> IncludeGraph {
+        match self.graph.as_mut() {
+            Some(graph) => std::mem::take(graph),
+            None => IncludeGraph::default(),
+        }
+    }
+}
+
+/// Resolved include edges of walked files, keyed by canonical path.
+///
+/// Replaying a walk over the graph with [`IncludeGraph::closure`] yields the
+/// same `reached` / `unresolved` sets as walking again, without reading or
+/// stat-ing anything, for as long as the recorded files are unchanged.
+#[derive(Debug, Clone, Default, PartialEq, Eq)]
+pub struct IncludeGraph {
+    nodes: HashMap<PathBuf, IncludeEdges>,
+}
+
+/// Outgoing edges of one walked file.
+#[derive(Debug, Clone, Default, PartialEq, Eq)]
+pub struct IncludeEdges {
+    /// Canonical paths its `#include`s resolved to, in directive order.
+    pub resolved: Vec<PathBuf>,
+    /// Include strings that resolved to no file.
+    pub unresolved: Vec<String>,
+}
+
+impl IncludeGraph {
+    pub fn new() -> Self {
+        Self::default()
+    }
+
+    pub fn len(&self) -> usize {
+        self.nodes.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.nodes.is_empty()
+    }
+
+    /// Record (or replace) the edges of canonical path `file`.
+    pub fn insert(&mut self, file: PathBuf, edges: IncludeEdges) {
+        self.nodes.insert(file, edges);
+    }
+
+    pub fn get(&self, file: &Path) -> Option<&IncludeEdges> {
+        self.nodes.get(file)
+    }
+
+    pub fn iter(&self) -> impl Iterator<Item = (&Path, &IncludeEdges)> {
+        self.nodes
+            .iter()
+            .map(|(path, edges)| (path.as_path(), edges))
+    }
+
+    /// Add every node of `other`, replacing edges already recorded for the
+    /// same file.
+    pub fn merge(&mut self, other: IncludeGraph) {
+        self.nodes.extend(other.nodes);
+    }
+
+    /// Replay [`walk`] from `seeds` over the recorded edges. Seeds are
+    /// canonicalized exactly as the walker does; a reached file without a
+    /// node (it could not be read when recorded) contributes no edges.
+    pub fn closure(&self, seeds: &[PathBuf]) -> WalkResult {
+        let mut reached: BTreeSet<PathBuf> = seeds.iter().map(|seed| canon(seed)).collect();
+        let mut unresolved: BTreeSet<String> = BTreeSet::new();
+        let mut frontier: Vec<PathBuf> = reached.iter().cloned().collect();
+        while let Some(file) = frontier.pop() {
+            let Some(edges) = self.nodes.get(&file) else {
+                continue;
+            };
+            unresolved.extend(edges.unresolved.iter().cloned());
+            for child in &edges.resolved {
+                if reached.insert(child.clone()) {
+                    frontier.push(child.clone());
+                }
+            }
+        }
+        WalkResult {
+            reached: reached.into_iter().collect(),
+            unresolved: unresolved.into_iter().collect(),
+        }
+    }
+
+    /// Drop every node not reachable from `seeds`.
+    pub fn retain_reachable(&mut self, seeds: &[PathBuf]) {
+        let live: HashSet<PathBuf> = self.closure(seeds).reached.into_iter().collect();
+        self.nodes.retain(|path, _| live.contains(path));
+    }
 }
 
 /// Walk the include graph starting from `seeds` over `search_paths`.
@@ -120,27 +249,50 @@ pub fn walk_with_state(
     search_paths: &[PathBuf],
     state: &mut WalkState,
 ) -> WalkResult {
-    walk_with_state_scanner(seeds, search_paths, state, &scan)
+    walk_with_state_reader(seeds, search_paths, state, &|path, index| match index {
+        Some(index) => {
+            let hit = index.scan_file(path, ALL_BRANCHES_MODE, &scan)?;
+            Some((hit.payload, hit.read))
+        }
+        None => Some((scan(&std::fs::read_to_string(path).ok()?), true)),
+    })
 }
 
 /// Active-branch counterpart to [`walk_with_state`].
+///
+/// With a [`ScanIndex`] the index stores each file's define-independent
+/// [`IncludeSkeleton`], so walks under different define sets (one per
+/// environment) share every stored scan and only replay the skeletons.
 pub fn walk_with_state_active(
     seeds: &[PathBuf],
     search_paths: &[PathBuf],
     defines: &HashMap<String, String>,
     state: &mut WalkState,
 ) -> WalkResult {
-    walk_with_state_scanner(seeds, search_paths, state, &|src| scan_active(src, defines))
+    walk_with_state_reader(seeds, search_paths, state, &|path, index| {
+        if let Some(index) = index {
+            let hit = index.scan_file(path, SKELETON_MODE, &IncludeSkeleton::build)?;
+            if let Some(includes) = hit.payload.active_includes(defines) {
+                return Some((includes, hit.read));
+            }
+        }
+        Some((
+            scan_active(&std::fs::read_to_string(path).ok()?, defines),
+            true,
+        ))
+    })
 }
 
-fn walk_with_state_scanner<F>(
+/// BFS over the include graph. `reader` produces a file's includes and
+/// whether it had to read the file, or `None` when the file is unreadable.
+fn walk_with_state_reader<R>(
     seeds: &[PathBuf],
     search_paths: &[PathBuf],
     state: &mut WalkState,
-    scanner: &F,
+    reader: &R,
 ) -> WalkResult
 where
-    F: Fn(&str) -> Vec<IncludeRef> + Sync,
+    R: Fn(&Path, Option<&ScanIndex>) -> Option<(Vec<IncludeRef>, bool)> + Sync,
 {
     tracing::debug!(
         seeds = seeds.len(),
@@ -168,17 +320,22 @@ where
             .collect();
 
         if !to_read.is_empty() {
-            let scanned: Vec<(PathBuf, Vec<IncludeRef>)> = to_read
+            let index = state.index.as_deref();
+            let scanned: Vec<(PathBuf, Vec<IncludeRef>, bool)> = to_read
                 .par_iter()
                 .filter_map(|p| {
-                    let text = std::fs::read_to_string(p).ok()?;
-                    Some((p.clone(), scanner(&text)))
+                    let (includes, read) = reader(p, index)?;
+                    Some((p.clone(), includes, read))
                 })
                 .collect();
 
-            for (path, includes) in scanned {
+            for (path, includes, read) in scanned {
                 state.scan_cache.insert(path, includes);
-                state.files_read += 1;
+                if read {
+                    state.files_read += 1;
+                } else {
+                    state.index_hits += 1;
+                }
             }
         }
 
@@ -191,20 +348,30 @@ where
                 // Match the existing behavior: silently skip.
                 continue;
             };
+            let mut edges = state.graph.is_some().then(IncludeEdges::default);
             for inc in &includes {
                 match resolve_include(inc, file, search_paths) {
                     Some(resolved) => {
                         let canon = canon(&resolved);
+                        if let Some(edges) = edges.as_mut() {
+                            edges.resolved.push(canon.clone());
+                        }
                         if state.visited.insert(canon.clone()) {
                             reached.insert(canon.clone());
                             frontier.push_back(canon);
                         }
                     }
                     None => {
+                        if let Some(edges) = edges.as_mut() {
+                            edges.unresolved.push(inc.path.clone());
+                        }
                         unresolved.insert(inc.path.clone());
                     }
                 }
             }
+            if let (Some(graph), Some(edges)) = (state.graph.as_mut(), edges) {
+                graph.insert(file.clone(), edges);
+            }
         }
     }
 
@@ -392,4 +559,87 @@ mod tests {
         let r2 = walk(seeds, &[]);
         assert_eq!(r1, r2);
     }
+
+    #[test]
+    fn w30_recorded_graph_replays_walk() {
+        let tmp = tempdir();
+        let inc = tmp.path().join("inc");
+        write(
+            &inc.join("lib.h"),
+            "#include \"detail.h\"\n#include <gone.h>\n",
+        );
+        write(&inc.join("detail.h"), "#include <lib.h>\n");
+        let main = tmp.path().join("main.cpp");
+        let other = tmp.path().join("other.cpp");
+        write(&main, "#include <lib.h>\n#include \"local.h\"\n");
+        write(&tmp.path().join("local.h"), "");
+        write(&other, "#include <missing.h>\n");
+        let search = [inc];
+        let seeds = [main.clone(), other.clone()];
+
+        let mut state = WalkState::new().recording_graph();
+        let walked = walk_with_state(&seeds, &search, &mut state);
+        let graph = state.take_graph();
+        assert_eq!(graph.len(), 5);
+        assert_eq!(graph.closure(&seeds), walked);
+        assert_eq!(
+            graph.closure(std::slice::from_ref(&other)),
+            walk(std::slice::from_ref(&other), &search)
+        );
+
+        let mut pruned = graph.clone();
+        pruned.retain_reachable(std::slice::from_ref(&other));
+        assert_eq!(pruned.len(), 1);
+    }
+
+    #[test]
+    fn w31_active_walks_share_one_index_across_define_sets() {
+        let tmp = tempdir();
+        let inc = tmp.path().join("inc");
+        write(
+            &inc.join("board.h"),
+            "#if CONFIG_IDF_TARGET_ESP32S3\n#include <s3.h>\n#else\n#include <classic.h>\n#endif\n",
+        );
+        write(&inc.join("s3.h"), "#include <common.h>\n");
+        write(&inc.join("classic.h"), "#include <common.h>\n");
+        write(&inc.join("common.h"), "");
+        let main = tmp.path().join("main.cpp");
+        write(&main, "#include <board.h>\n");
+        // Age every file so its (size, mtime) stamp is trusted.
+        let old = std::time::SystemTime::now() - std::time::Duration::from_secs(60);
+        for entry in files_under(tmp.path()) {
+            let file = std::fs::File::options().write(true).open(&entry).unwrap();
+            file.set_modified(old).unwrap();
+        }
+        let search = [inc];
+        let seeds = [main];
+        let index = Arc::new(ScanIndex::open(tmp.path().join("scan-index.bin")));
+
+        let s3 = HashMap::from([("CONFIG_IDF_TARGET_ESP32S3".to_string(), "1".to_string())]);
+        let classic = HashMap::new();
+        let mut first = WalkState::with_index(index.clone());
+        let s3_walk = walk_with_state_active(&seeds, &search, &s3, &mut first);
+        assert_eq!(s3_walk, walk_active(&seeds, &search, &s3));
+
+        // A second environment replays the stored skeletons: only the file
+        // its branch newly reaches is read.
+        let mut second = WalkState::with_index(index);
+        let classic_walk = walk_with_state_active(&seeds, &search, &classic, &mut second);
+        assert_eq!(classic_walk, walk_active(&seeds, &search, &classic));
+        assert_ne!(classic_walk, s3_walk);
+        assert_eq!((second.files_read(), second.index_hits()), (1, 3));
+    }
+
+    fn files_under(root: &Path) -> Vec<PathBuf> {
+        let mut files = Vec::new();
+        for entry in std::fs::read_dir(root).unwrap() {
+            let path = entry.unwrap().path();
+            if path.is_dir() {
+                files.extend(files_under(&path));
+            } else {
+                files.push(path);
+            }
+        }
+        files
+    }
 }
@@ -0,0 +1,168 @@
+//! Segment-backed vs per-file cache store on 10k entries.
+//!
+//! [`fbuild_library_select::cache::FileKvStore`] used to keep one
+//! `<namespace>/<hex>.pb` file per entry (a protobuf envelope written to a
+//! temp file and renamed into place). It now keeps each namespace in one
+//! [`fbuild_core::kv_segment::KvSegment`]. This bench replays both layouts
+//! with the store's own key shape (32-byte blake3) and a payload the size of
+//! a typical bincoded `Selection`:
+//!
+//! * `put` — write 10k fresh entries,
+//! * `get_warm` — look all of them up through an open store,
+//! * `get_cold` — open the store as a fresh process would, then look them up.
+//!
+//! Run with:
+//!
+//! ```text
+//! soldr cargo bench -p fbuild-library-select --bench kv_store
+//! ```
+
+use std::path::Path;
+
+use criterion::{BatchSize, Criterion, Throughput, black_box, criterion_group, criterion_main};
+use fbuild_core::kv_segment::{KvOptions, KvSegment};
+use prost::Message;
+
+const ENTRIES: usize = 10_000;
+const VALUE_LEN: usize = 2 * 1024;
+
+/// The store's layout before segments: one envelope file per entry.
+struct PerFileStore {
+    root: Box<Path>,
+}
+
+#[derive(Clone, PartialEq, Message)]
+struct CacheEnvelope {
+    #[prost(uint32, tag = "1")]
+    schema_version: u32,
+    #[prost(bytes, tag = "2")]
+    payload: Vec<u8>,
+}
+
+impl PerFileStore {
+    fn open(root: &Path) -> Self {
+        std::fs::create_dir_all(root.join("ns")).expect("kv_store: create per-file root");
+        Self { root: root.into() }
+    }
+
+    fn entry_path(&self, key: &[u8; 32]) -> Box<Path> {
+        let hex: String = key.iter().map(|b| format!("{b:02x}")).collect();
+        self.root.join("ns").join(format!("{hex}.pb")).into()
+    }
+
+    fn put(&self, key: &[u8; 32], value: &[u8]) {
+        let path = self.entry_path(key);
+        let bytes = CacheEnvelope {
+            schema_version: 1,
+            payload: value.to_vec(),
+        }
+        .encode_to_vec();
+        let tmp = path.with_extension("tmp");
+        std::fs::write(&tmp, bytes).expect("kv_store: write per-file entry");
+        std::fs::rename(&tmp, &path).expect("kv_store: rename per-file entry");
+    }
+
+    fn get(&self, key: &[u8; 32]) -> Option<Vec<u8>> {
+        let bytes = std::fs::read(self.entry_path(key)).ok()?;
+        Some(CacheEnvelope::decode(bytes.as_slice()).ok()?.payload)
+    }
+}
+
+fn keys() -> Vec<[u8; 32]> {
+    (0..ENTRIES as u64)
+        .map(|i| *blake3::hash(&i.to_le_bytes()).as_bytes())
+        .collect()
+}
+
+fn value(key: &[u8; 32]) -> Vec<u8> {
+    key.iter().copied().cycle().take(VALUE_LEN).collect()
+}
+
+fn fill_segment(path: &Path, keys: &[[u8; 32]]) -> KvSegment {
+    let kv = KvSegment::open(path, KvOptions::default()).expect("kv_store: open segment");
+    for key in keys {
+        kv.put(key, &value(key)).expect("kv_store: segment put");
+    }
+    kv
+}
+
+fn fill_per_file(root: &Path, keys: &[[u8; 32]]) -> PerFileStore {
+    let store = PerFileStore::open(root);
+    for key in keys {
+        store.put(key, &value(key));
+    }
+    store
+}
+
+fn bench_kv_store(c: &mut Criterion) {
+    let keys = keys();
+    let mut group = c.benchmark_group("kv_store_10k");
+    group.sample_size(10);
+    group.throughput(Throughput::Elements(ENTRIES as u64));
+
+    group.bench_function("put/segment", |b| {
+        b.iter_batched(
+            || tempfile::tempdir().expect("kv_store: tempdir"),
+            |dir| fill_segment(&dir.path().join("ns.kvs"), &keys),
+            BatchSize::PerIteration,
+        );
+    });
+    group.bench_function("put/per_file", |b| {
+        b.iter_batched(
+            || tempfile::tempdir().expect("kv_store: tempdir"),
+            |dir| fill_per_file(dir.path(), &keys),
+            BatchSize::PerIteration,
+        );
+    });
+
+    let segment_dir = tempfile::tempdir().expect("kv_store: tempdir");
+    let segment_path = segment_dir.path().join("ns.kvs");
+    let segment = fill_segment(&segment_path, &keys);
+    // Fold the append log into the hash table, as a long-lived store would.
+    segment.compact().expect("kv_store: compact");
+    let per_file_dir = tempfile::tempdir().expect("kv_store: tempdir");
+    let per_file = fill_per_file(per_file_dir.path(), &keys);
+
+    group.bench_function("get_warm/segment", |b| {
+        b.iter(|| {
+            for key in &keys {
+                let hit = segment.get(black_box(key)).expect("kv_store: segment get");
+                assert!(hit.is_some(), "kv_store: segment miss");
+            }
+        });
+    });
+    group.bench_function("get_warm/per_file", |b| {
+        b.iter(|| {
+            for key in &keys {
+                assert!(
+                    per_file.get(black_box(key)).is_some(),
+                    "kv_store: per-file miss"
+                );
+            }
+        });
+    });
+    group.bench_function("get_cold/segment", |b| {
+        b.iter(|| {
+            let kv = KvSegment::open(&segment_path, KvOptions::default())
+                .expect("kv_store: reopen segment");
+            for key in &keys {
+                assert!(kv.get(black_box(key)).expect("kv_store: get").is_some());
+            }
+        });
+    });
+    group.bench_function("get_cold/per_file", |b| {
+        b.iter(|| {
+            let store = PerFileStore::open(per_file_dir.path());
+            for key in &keys {
+                assert!(
+                    store.get(black_box(key)).is_some(),
+                    "kv_store: per-file miss"
+                );
+            }
+        });
+    });
+    group.finish();
+}
+
+criterion_group!(benches, bench_kv_store);
+criterion_main!(benches);
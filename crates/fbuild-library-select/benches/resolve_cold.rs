@@ -18,10 +18,14 @@
 //!
 //! Future PRs gate against the baseline number this captures.
 
-use std::path::PathBuf;
+use std::collections::HashMap;
+use std::path::{Path, PathBuf};
+use std::sync::Arc;
+use std::time::{Duration, SystemTime};
 
 use criterion::{Criterion, Throughput, black_box, criterion_group, criterion_main};
-use fbuild_library_select::resolve;
+use fbuild_header_scan::ScanIndex;
+use fbuild_library_select::{resolve, resolve_with_scan_index};
 use fbuild_packages::library::FrameworkLibrary;
 use fbuild_packages::library::framework_library::discover_framework_libraries;
 use fbuild_test_support::MiniFramework;
@@ -82,11 +86,53 @@ fn bench_resolve(c: &mut Criterion) {
             black_box(sel);
         });
     });
+
+    // Same walk in a "fresh process" that finds a persisted scan index: each
+    // iteration maps the index anew, so only the index load + stat calls
+    // are paid for unchanged files. Files are aged first so their stamps are
+    // trusted (the index re-hashes anything modified in the last 2 s).
+    age_tree(mf.framework_root());
+    age_tree(mf.project_root());
+    let index_dir = tempfile::tempdir().expect("resolve_cold: failed to create index tempdir");
+    let index_path = index_dir.path().join("scan-index.bin");
+    let defines = HashMap::new();
+    let primed = Arc::new(ScanIndex::open(&index_path));
+    resolve_with_scan_index(&seeds, &search_paths, &libs, &defines, &[], primed.clone());
+    primed
+        .save()
+        .expect("resolve_cold: failed to save scan index");
+    group.bench_function("cold_30_libs_chain_5_scan_index", |b| {
+        b.iter(|| {
+            let index = Arc::new(ScanIndex::open(&index_path));
+            let (sel, stats) = resolve_with_scan_index(
+                black_box(&seeds),
+                black_box(&search_paths),
+                black_box(&libs),
+                &defines,
+                &[],
+                index,
+            );
+            assert_eq!(stats.files_read, 0, "scan index missed: {stats:?}");
+            black_box(sel);
+        });
+    });
     group.finish();
     // Keep `mf` alive until after the bench so the temp dir doesn't get
     // cleaned out from under `resolve()` mid-run.
     drop(mf);
 }
 
+fn age_tree(dir: &Path) {
+    let old = SystemTime::now() - Duration::from_secs(60);
+    for entry in std::fs::read_dir(dir).into_iter().flatten().flatten() {
+        let path = entry.path();
+        if path.is_dir() {
+            age_tree(&path);
+        } else if let Ok(file) = std::fs::File::options().write(true).open(&path) {
+            let _ = file.set_modified(old);
+        }
+    }
+}
+
 criterion_group!(benches, bench_resolve);
 criterion_main!(benches);
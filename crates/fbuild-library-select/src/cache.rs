@@ -24,14 +24,36 @@
 //! entry whose 2-pass resolver semantics may have changed. Both are blunt
 //! and intentional — partial migration of a malformed cache is worse than
 //! a one-time recompute.
+//!
+//! ## Scan index
+//!
+//! A key miss still has to walk the include graph, and in a fresh process
+//! (daemon restart, compile-many worker) that used to mean re-reading and
+//! re-tokenizing every framework header. The store therefore also owns a
+//! persistent [`ScanIndex`] ([`SCAN_INDEX_FILE`] under its root) that
+//! [`resolve_cached`] walks through and saves after each miss.
+//!
+//! ## Incremental re-resolution
+//!
+//! Editing one seed changes the key above, so every miss also stores an
+//! incremental record under [`INCREMENTAL_NAMESPACE`], keyed like the exact
+//! entry but with seeds contributing only their paths. The next miss for the
+//! same project re-walks just the edited seeds and reuses the previous
+//! selection when they still reach the same libraries; see the
+//! `incremental` module for why that is exact.
 
 use std::collections::HashMap;
 use std::path::{Path, PathBuf};
+use std::sync::{Arc, Mutex, OnceLock};
 
+use fbuild_core::kv_segment::{KvOptions, KvSegment};
+use fbuild_header_scan::{
+    IncludeGraph, ScanIndex, WalkState, define_set_mode, walk_with_state_active,
+};
 use fbuild_packages::library::FrameworkLibrary;
-use prost::Message;
 
-use crate::{Selection, canon};
+use crate::incremental::{IncrementalRecord, pass1_libraries};
+use crate::{ResolveStats, Selection, canon};
 
 /// Bump when the scanner's lexical grammar changes in a way that could change
 /// which `#include` directives it emits for the same source.
@@ -44,7 +66,12 @@ pub const LDF_MODE_VERSION: u32 = 4;
 /// Namespace for the library-selection file cache.
 pub const NAMESPACE: &str = "library-selection";
 
-const CACHE_ENVELOPE_VERSION: u32 = 1;
+/// Namespace for the per-project incremental records behind
+/// [`resolve_cached`]'s single-seed-edit fast path.
+pub const INCREMENTAL_NAMESPACE: &str = "library-selection-incremental";
+
+/// File name of the persistent header-scan index under the store root.
+pub const SCAN_INDEX_FILE: &str = "scan-index.bin";
 
 /// Content-addressed cache key for library-selection memoization.
 #[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
@@ -71,82 +98,73 @@ impl CacheKey {
 
 /// Minimal file-backed K/V cache for best-effort memoized resolver output.
 ///
-/// This deliberately avoids a database engine. Values are deterministic and
-/// disposable: corrupt, missing, or stale entries are treated as cache misses.
+/// This deliberately avoids a database engine. Each namespace is one
+/// [`KvSegment`] (`<root>/<namespace>.kvs`): an append-only, memory-mapped
+/// file with an in-file hash index, compacted and size-capped in place of
+/// the per-entry files the store used to leave behind. Values are
+/// deterministic and disposable: corrupt, missing, or stale entries are
+/// treated as cache misses.
 #[derive(Debug, Clone)]
 pub struct FileKvStore {
     root: PathBuf,
+    segments: Arc<Mutex<HashMap<String, Arc<KvSegment>>>>,
+    scan_index: Arc<OnceLock<Arc<ScanIndex>>>,
 }
 
 impl FileKvStore {
     pub fn open<P: AsRef<Path>>(root: P) -> CacheResult<Self> {
         let root = root.as_ref().to_path_buf();
         std::fs::create_dir_all(&root)?;
-        Ok(Self { root })
+        Ok(Self {
+            root,
+            segments: Arc::default(),
+            scan_index: Arc::default(),
+        })
+    }
+
+    /// The store's persistent header-scan index, mapped on first use and
+    /// shared by every clone of this store.
+    pub fn scan_index(&self) -> Arc<ScanIndex> {
+        self.scan_index
+            .get_or_init(|| Arc::new(ScanIndex::open(self.root.join(SCAN_INDEX_FILE))))
+            .clone()
     }
 
     pub fn get(&self, namespace: &str, key: &CacheKey) -> CacheResult<Option<Vec<u8>>> {
-        validate_namespace(namespace)?;
-        let path = self.entry_path(namespace, key);
-        let bytes = match std::fs::read(&path) {
-            Ok(bytes) => bytes,
-            Err(err) if err.kind() == std::io::ErrorKind::NotFound => return Ok(None),
-            Err(err) => return Err(err.into()),
-        };
-        let envelope = match CacheEnvelope::decode(bytes.as_slice()) {
-            Ok(envelope) => envelope,
-            Err(err) => {
-                tracing::warn!(
-                    path = %path.display(),
-                    error = %err,
-                    "library-select cache: corrupt protobuf envelope; treating as miss"
-                );
-                return Ok(None);
-            }
-        };
-        if envelope.schema_version != CACHE_ENVELOPE_VERSION {
-            return Ok(None);
-        }
-        Ok(Some(envelope.payload))
+        Ok(self.segment(namespace)?.get(key.as_bytes())?)
     }
 
     pub fn put(&self, namespace: &str, key: &CacheKey, value: &[u8]) -> CacheResult<usize> {
-        validate_namespace(namespace)?;
-        let path = self.entry_path(namespace, key);
-        if let Some(parent) = path.parent() {
-            std::fs::create_dir_all(parent)?;
-        }
-
-        let envelope = CacheEnvelope {
-            schema_version: CACHE_ENVELOPE_VERSION,
-            payload: value.to_vec(),
-        };
-        let bytes = envelope.encode_to_vec();
-        let nonce = std::time::SystemTime::now()
-            .duration_since(std::time::UNIX_EPOCH)
-            .unwrap_or_default()
-            .as_nanos();
-        let tmp = path.with_extension(format!("tmp.{}.{}", std::process::id(), nonce));
-        std::fs::write(&tmp, bytes)?;
-        fbuild_core::platform::fs::replace_file(&tmp, &path)?;
+        self.segment(namespace)?.put(key.as_bytes(), value)?;
         Ok(value.len())
     }
 
-    fn entry_path(&self, namespace: &str, key: &CacheKey) -> PathBuf {
-        self.root
-            .join(namespace)
-            .join(format!("{}.pb", key.to_hex()))
+    /// The namespace's segment, mapped on first use and shared by every
+    /// clone of this store.
+    fn segment(&self, namespace: &str) -> CacheResult<Arc<KvSegment>> {
+        validate_namespace(namespace)?;
+        let mut segments = self
+            .segments
+            .lock()
+            .unwrap_or_else(std::sync::PoisonError::into_inner);
+        if let Some(segment) = segments.get(namespace) {
+            return Ok(segment.clone());
+        }
+        // Stores before the segment format kept one `<hex>.pb` file per
+        // entry under `<root>/<namespace>/`; nothing reads them any more.
+        let legacy = self.root.join(namespace);
+        if legacy.is_dir() {
+            let _ = std::fs::remove_dir_all(&legacy);
+        }
+        let segment = Arc::new(KvSegment::open(
+            self.root.join(format!("{namespace}.kvs")),
+            KvOptions::default(),
+        )?);
+        segments.insert(namespace.to_string(), segment.clone());
+        Ok(segment)
     }
 }
 
-#[derive(Clone, PartialEq, Message)]
-struct CacheEnvelope {
-    #[prost(uint32, tag = "1")]
-    schema_version: u32,
-    #[prost(bytes, tag = "2")]
-    payload: Vec<u8>,
-}
-
 pub type CacheResult<T> = Result<T, CacheError>;
 
 #[derive(Debug, thiserror::Error)]
@@ -195,12 +213,15 @@ pub struct CacheKeyInputs<'a> {
 }
 
 /// Result of [`resolve_cached`]. `from_cache` distinguishes hit from miss so
-/// the caller can attribute build-time / log accordingly.
+/// the caller can attribute build-time / log accordingly. `stats` describes
+/// the resolve a miss ran (all zero on a hit), including whether the
+/// incremental path reused the previous selection.
 #[derive(Debug, Clone)]
 pub struct CachedSelection {
     pub selection: Selection,
     pub key: CacheKey,
     pub from_cache: bool,
+    pub stats: ResolveStats,
 }
 
 /// Compute the cache key for a (seeds, search_paths, libraries, inputs)
@@ -216,10 +237,36 @@ pub fn cache_key(
     search_paths: &[PathBuf],
     libraries: &[FrameworkLibrary],
     inputs: &CacheKeyInputs<'_>,
+) -> CacheKey {
+    selection_key(seeds, search_paths, libraries, inputs, true)
+}
+
+/// Key of the incremental record for a project: [`cache_key`] with each seed
+/// contributing its canonical path but not its content, so editing a seed
+/// keeps the key.
+pub(crate) fn incremental_key(
+    seeds: &[PathBuf],
+    search_paths: &[PathBuf],
+    libraries: &[FrameworkLibrary],
+    inputs: &CacheKeyInputs<'_>,
+) -> CacheKey {
+    selection_key(seeds, search_paths, libraries, inputs, false)
+}
+
+fn selection_key(
+    seeds: &[PathBuf],
+    search_paths: &[PathBuf],
+    libraries: &[FrameworkLibrary],
+    inputs: &CacheKeyInputs<'_>,
+    seed_content: bool,
 ) -> CacheKey {
     let mut h = blake3::Hasher::new();
 
-    h.update(b"fbuild.library-select.v1\n");
+    h.update(if seed_content {
+        b"fbuild.library-select.v1\n".as_slice()
+    } else {
+        b"fbuild.library-select.incremental.v1\n".as_slice()
+    });
     h.update(&SCANNER_VERSION.to_le_bytes());
     h.update(&LDF_MODE_VERSION.to_le_bytes());
 
@@ -258,15 +305,15 @@ pub fn cache_key(
     }
 
     // Seeds: sorted by path, each contributes (canonical_path, content_hash).
+    // Without `seed_content` the hash is a constant placeholder.
     let mut seed_pairs: Vec<(String, [u8; 32])> = seeds
         .iter()
         .map(|p| {
-            let canonical = canon(p);
-            let bytes = std::fs::read(&canonical).unwrap_or_default();
-            (
-                canonical.to_string_lossy().into_owned(),
-                *blake3::hash(&bytes).as_bytes(),
-            )
+            if seed_content {
+                seed_identity(p)
+            } else {
+                (canon(p).to_string_lossy().into_owned(), [0; 32])
+            }
         })
         .collect();
     seed_pairs.sort_by(|a, b| a.0.cmp(&b.0));
@@ -309,6 +356,17 @@ pub fn cache_key(
     CacheKey::from_hash(h.finalize())
 }
 
+/// `(canonical path, blake3 of content)` for one seed. An unreadable seed
+/// hashes as empty.
+fn seed_identity(seed: &Path) -> (String, [u8; 32]) {
+    let canonical = canon(seed);
+    let bytes = std::fs::read(&canonical).unwrap_or_default();
+    (
+        canonical.to_string_lossy().into_owned(),
+        *blake3::hash(&bytes).as_bytes(),
+    )
+}
+
 fn canonical_header_hash(lib: &FrameworkLibrary) -> [u8; 32] {
     // Try `<include_dir>/<lib_name>.h` for each of the lib's include dirs.
     // First hit wins; falls back to a hash of the empty string if the lib
@@ -327,6 +385,11 @@ fn canonical_header_hash(lib: &FrameworkLibrary) -> [u8; 32] {
 /// returns it with `from_cache = false`. On hit, deserializes the stored
 /// `Selection` and returns it with `from_cache = true`.
 ///
+/// A miss first tries the project's incremental record: when only seed
+/// contents changed, just those seeds are re-walked, and if they reach the
+/// same libraries as before the previous selection is reused
+/// (`stats.incremental_reuses == 1`). Otherwise the full 2-pass resolve runs.
+///
 /// Cache lookups that fail decoding (corrupt entry, schema drift) fall
 /// through to recomputation rather than propagating — a stale cache must
 /// never poison a build. The tainted entry is overwritten by the fresh
@@ -351,6 +414,7 @@ pub fn resolve_cached(
                     selection,
                     key,
                     from_cache: true,
+                    stats: ResolveStats::default(),
                 });
             }
             Err(err) => {
@@ -363,14 +427,27 @@ pub fn resolve_cached(
         }
     }
 
-    let selection = crate::resolve_with_stats_active_declared(
-        seeds,
-        search_paths,
-        libraries,
-        inputs.preprocessor_defines,
-        inputs.declared_deps,
-    )
-    .0;
+    let index = store.scan_index();
+    let record_key = incremental_key(seeds, search_paths, libraries, inputs);
+    let previous = load_record(store, &record_key)?;
+    let (selection, stats, record) =
+        resolve_incremental(seeds, search_paths, libraries, inputs, &index, previous);
+    tracing::debug!(
+        files_read = stats.files_read,
+        index_hits = stats.index_hits,
+        passes = stats.passes,
+        seeds_rescanned = stats.seeds_rescanned,
+        incremental_reuses = stats.incremental_reuses,
+        incremental_fallbacks = stats.incremental_fallbacks,
+        "library-select cache: resolved on miss"
+    );
+    if let Err(err) = index.save() {
+        tracing::warn!(
+            path = %index.path().display(),
+            error = %err,
+            "library-select cache: failed to persist scan index"
+        );
+    }
     // serde's `PathBuf` Serialize impl errors when a path component is not
     // valid UTF-8 (legal on Unix, possible on Windows via canonicalize edge
     // cases). Treat that as a cache write miss — degraded performance is
@@ -388,14 +465,155 @@ pub fn resolve_cached(
             );
         }
     }
+    match bincode::serialize(&record) {
+        Ok(bytes) => {
+            store.put(INCREMENTAL_NAMESPACE, &record_key, &bytes)?;
+        }
+        Err(err) => {
+            tracing::warn!(
+                key = %record_key.to_hex(),
+                error = %err,
+                "library-select cache: failed to serialize incremental record; \
+                 skipping cache write"
+            );
+        }
+    }
 
     Ok(CachedSelection {
         selection,
         key,
         from_cache: false,
+        stats,
     })
 }
 
+fn load_record(store: &FileKvStore, key: &CacheKey) -> CacheResult<Option<IncrementalRecord>> {
+    let Some(bytes) = store.get(INCREMENTAL_NAMESPACE, key)? else {
+        return Ok(None);
+    };
+    match bincode::deserialize::<IncrementalRecord>(&bytes) {
+        Ok(record) if record.is_consistent() => Ok(Some(record)),
+        Ok(_) | Err(_) => {
+            tracing::warn!(
+                key = %key.to_hex(),
+                "library-select cache: corrupt incremental record; resolving in full"
+            );
+            Ok(None)
+        }
+    }
+}
+
+/// Resolve on an exact-key miss, reusing `previous` when the edit allows it.
+/// Returns the selection, its stats and the record to store for next time.
+fn resolve_incremental(
+    seeds: &[PathBuf],
+    search_paths: &[PathBuf],
+    libraries: &[FrameworkLibrary],
+    inputs: &CacheKeyInputs<'_>,
+    index: &Arc<ScanIndex>,
+    previous: Option<IncrementalRecord>,
+) -> (Selection, ResolveStats, IncrementalRecord) {
+    let defines = crate::seed_defines(seeds, inputs.preprocessor_defines);
+    let defines_mode = define_set_mode(&defines);
+    let seed_ids: Vec<(String, [u8; 32])> = seeds.iter().map(|p| seed_identity(p)).collect();
+    let declared = inputs.declared_deps;
+
+    let mut fell_back = false;
+    if let Some(previous) = previous {
+        let changed = if previous.defines() == defines_mode {
+            previous.changed_seeds(&seed_ids)
+        } else {
+            None
+        };
+        if let Some(changed) = changed {
+            let reused = try_reuse(
+                &previous,
+                seeds,
+                &changed,
+                search_paths,
+                libraries,
+                &defines,
+                declared,
+                index,
+            );
+            if let Some((selection, stats, pass1, graph)) = reused {
+                let record = IncrementalRecord::new(
+                    defines_mode,
+                    seed_ids,
+                    pass1,
+                    selection.clone(),
+                    &graph,
+                );
+                return (selection, stats, record);
+            }
+        }
+        fell_back = true;
+    }
+
+    let mut state = WalkState::with_index(index.clone()).recording_graph();
+    let (selection, mut stats) = crate::resolve_with_stats_impl_declared(
+        seeds,
+        search_paths,
+        libraries,
+        Some(&defines),
+        declared,
+        &mut state,
+    );
+    stats.incremental_fallbacks = usize::from(fell_back);
+    let mut graph = state.take_graph();
+    let pass1 = pass1_libraries(&graph.closure(seeds), libraries, declared);
+    let mut roots = seeds.to_vec();
+    roots.extend(selection.source_files.iter().cloned());
+    graph.retain_reachable(&roots);
+    let record = IncrementalRecord::new(defines_mode, seed_ids, pass1, selection.clone(), &graph);
+    (selection, stats, record)
+}
+
+/// Re-walk the `changed` seeds over `previous`'s include graph. Returns the
+/// reused selection, its stats, pass 1's libraries and the pruned graph, or
+/// `None` when the edit changed which libraries pass 1 reaches.
+#[allow(clippy::too_many_arguments)]
+fn try_reuse(
+    previous: &IncrementalRecord,
+    seeds: &[PathBuf],
+    changed: &[usize],
+    search_paths: &[PathBuf],
+    libraries: &[FrameworkLibrary],
+    defines: &HashMap<String, String>,
+    declared: &[String],
+    index: &Arc<ScanIndex>,
+) -> Option<(Selection, ResolveStats, Vec<String>, IncludeGraph)> {
+    let mut state = WalkState::with_index(index.clone()).recording_graph();
+    let mut graph = previous.graph();
+    if !changed.is_empty() {
+        let changed: Vec<PathBuf> = changed.iter().map(|&i| seeds[i].clone()).collect();
+        let full_search_paths = crate::full_search_paths(search_paths, libraries);
+        walk_with_state_active(&changed, &full_search_paths, defines, &mut state);
+        graph.merge(state.take_graph());
+    }
+    let pass1 = pass1_libraries(&graph.closure(seeds), libraries, declared);
+    if pass1 != previous.pass1_libraries() {
+        return None;
+    }
+    let mut roots = seeds.to_vec();
+    roots.extend(previous.selection().source_files.iter().cloned());
+    let replay = graph.closure(&roots);
+    graph.retain_reachable(&roots);
+    let selection = Selection {
+        included_files: replay.reached,
+        unresolved: replay.unresolved,
+        ..previous.selection().clone()
+    };
+    let stats = ResolveStats {
+        files_read: state.files_read(),
+        index_hits: state.index_hits(),
+        seeds_rescanned: changed.len(),
+        incremental_reuses: 1,
+        ..ResolveStats::default()
+    };
+    Some((selection, stats, pass1, graph))
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -472,6 +690,26 @@ mod tests {
         assert_eq!(first.key.as_bytes(), second.key.as_bytes());
     }
 
+    #[test]
+    fn c01b_namespace_is_one_segment_file() {
+        let (tmp, seeds, search_paths, libs) = build_simple_project();
+        let root = tmp.path().join("kv");
+        // A per-entry directory left by the previous store layout.
+        std::fs::create_dir_all(root.join(NAMESPACE)).unwrap();
+        write(&root.join(NAMESPACE).join("00.pb"), "stale");
+
+        let kv = FileKvStore::open(&root).unwrap();
+        let inputs = fixture_inputs(tmp.path());
+        let first = resolve_cached(&seeds, &search_paths, &libs, &inputs, &kv).unwrap();
+        assert!(root.join(format!("{NAMESPACE}.kvs")).is_file());
+        assert!(!root.join(NAMESPACE).exists());
+
+        let reopened = FileKvStore::open(&root).unwrap();
+        let again = resolve_cached(&seeds, &search_paths, &libs, &inputs, &reopened).unwrap();
+        assert!(again.from_cache);
+        assert_eq!(again.selection, first.selection);
+    }
+
     #[test]
     fn c02_seed_content_change_invalidates_key() {
         let (tmp, seeds, search_paths, libs) = build_simple_project();
@@ -656,4 +894,78 @@ mod tests {
         let again = resolve_cached(&seeds, &search_paths, &libs, &inputs, &kv).unwrap();
         assert!(again.from_cache);
     }
+
+    #[test]
+    fn c08_scan_index_survives_store_reopen() {
+        let (tmp, seeds, search_paths, libs) = build_simple_project();
+        // Age every file so its (size, mtime) stamp is trusted.
+        let old = std::time::SystemTime::now() - std::time::Duration::from_secs(60);
+        for path in seeds.iter().chain(&libs[0].source_files) {
+            let file = std::fs::File::options().write(true).open(path).unwrap();
+            file.set_modified(old).unwrap();
+        }
+        let header = libs[0].include_dirs[0].join("SPI.h");
+        let file = std::fs::File::options().write(true).open(&header).unwrap();
+        file.set_modified(old).unwrap();
+
+        let kv = FileKvStore::open(tmp.path().join("kv")).unwrap();
+        let inputs = fixture_inputs(tmp.path());
+        let first = resolve_cached(&seeds, &search_paths, &libs, &inputs, &kv).unwrap();
+        assert!(tmp.path().join("kv").join(SCAN_INDEX_FILE).is_file());
+
+        // A new store (as in a restarted daemon) walks without reading.
+        let reopened = FileKvStore::open(tmp.path().join("kv")).unwrap();
+        let (selection, stats) = crate::resolve_with_scan_index(
+            &seeds,
+            &search_paths,
+            &libs,
+            &EMPTY_DEFINES,
+            &[],
+            reopened.scan_index(),
+        );
+        assert_eq!(selection, first.selection);
+        assert_eq!(stats.files_read, 0, "stats: {stats:?}");
+        assert_eq!(stats.index_hits, 3, "stats: {stats:?}");
+    }
+
+    #[test]
+    fn c09_single_seed_edit_reuses_selection_unless_libraries_change() {
+        let (tmp, mut seeds, search_paths, mut libs) = build_simple_project();
+        let util = search_paths[0].join("util.cpp");
+        write(&util, "int util() { return 1; }\n");
+        seeds.push(util.clone());
+        let wire = lib(tmp.path(), "Wire");
+        write(&wire.include_dirs[0].join("Wire.h"), "");
+        libs.push(wire);
+        let kv = FileKvStore::open(tmp.path().join("kv")).unwrap();
+        let inputs = fixture_inputs(tmp.path());
+        let full =
+            || crate::resolve_with_stats_active(&seeds, &search_paths, &libs, &EMPTY_DEFINES).0;
+
+        let first = resolve_cached(&seeds, &search_paths, &libs, &inputs, &kv).unwrap();
+        assert_eq!(first.stats.incremental_reuses, 0);
+        assert_eq!(first.stats.incremental_fallbacks, 0);
+
+        // Same libraries reached: only util.cpp is re-walked.
+        write(&util, "#include \"missing.h\"\nint util() { return 2; }\n");
+        let edited = resolve_cached(&seeds, &search_paths, &libs, &inputs, &kv).unwrap();
+        assert!(!edited.from_cache);
+        assert_ne!(edited.key, first.key);
+        assert_eq!(edited.stats.incremental_reuses, 1, "{:?}", edited.stats);
+        assert_eq!(edited.stats.seeds_rescanned, 1);
+        assert_eq!(edited.selection, full());
+        assert_eq!(edited.selection.unresolved, vec!["missing.h".to_string()]);
+
+        // The edit now reaches Wire: fall back to the full resolve.
+        write(&util, "#include <Wire.h>\n");
+        let widened = resolve_cached(&seeds, &search_paths, &libs, &inputs, &kv).unwrap();
+        assert_eq!(widened.stats.incremental_reuses, 0);
+        assert_eq!(
+            widened.stats.incremental_fallbacks, 1,
+            "{:?}",
+            widened.stats
+        );
+        assert_eq!(widened.selection, full());
+        assert_eq!(widened.selection.required_libraries, vec!["SPI", "Wire"]);
+    }
 }
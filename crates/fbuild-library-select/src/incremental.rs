@@ -0,0 +1,268 @@
+//! Incremental re-resolution state for [`crate::cache::resolve_cached`].
+//!
+//! The exact cache key covers every seed's content, so editing one line of
+//! one sketch file misses it. Each resolve therefore also leaves an
+//! [`IncrementalRecord`] under a key that covers seed *paths* only: the seed
+//! content hashes, the active define set, the libraries pass 1 selected, the
+//! resulting [`Selection`] and the include graph the walk resolved.
+//!
+//! On the next miss only the edited seeds are re-walked; every other file's
+//! edges come from the recorded graph. Pass 1's library set is a function of
+//! the seeds' include closure, and the reconciliation passes are a function of
+//! pass 1's set, so when the edited seeds still reach the same libraries the
+//! selected libraries, sources and include dirs are reused and only
+//! `included_files` / `unresolved` are replayed from the graph. Otherwise — or
+//! when the edit changed the active defines — the full 2-pass resolve runs and
+//! records a fresh graph.
+
+use std::collections::{BTreeSet, HashMap};
+use std::path::Path;
+
+use fbuild_header_scan::{IncludeEdges, IncludeGraph, WalkResult};
+use fbuild_packages::library::FrameworkLibrary;
+use serde::{Deserialize, Serialize};
+
+use crate::{Selection, canon_lib_dirs, declared_dep_name, path_in_any};
+
+/// What one resolve of a project leaves behind for the next one.
+#[derive(Debug, Clone, PartialEq, Eq, Serialize, Deserialize)]
+pub(crate) struct IncrementalRecord {
+    /// `define_set_mode` of the effective defines: compiler defines plus the
+    /// seeds' own `#define`s.
+    defines: u64,
+    /// `(canonical path, content hash)` per seed, as in the exact cache key.
+    seeds: Vec<(String, [u8; 32])>,
+    /// Sorted names of the libraries selected before reconciliation.
+    pass1_libraries: Vec<String>,
+    selection: Selection,
+    /// Interned canonical paths referenced by `nodes`.
+    files: Vec<Box<Path>>,
+    nodes: Vec<RecordedNode>,
+}
+
+#[derive(Debug, Clone, PartialEq, Eq, Serialize, Deserialize)]
+struct RecordedNode {
+    file: u32,
+    resolved: Vec<u32>,
+    unresolved: Vec<String>,
+}
+
+impl IncrementalRecord {
+    pub(crate) fn new(
+        defines: u64,
+        seeds: Vec<(String, [u8; 32])>,
+        pass1_libraries: Vec<String>,
+        selection: Selection,
+        graph: &IncludeGraph,
+    ) -> Self {
+        // Sorted so equal graphs encode to equal bytes.
+        let mut entries: Vec<(&Path, &IncludeEdges)> = graph.iter().collect();
+        entries.sort_by(|a, b| a.0.cmp(b.0));
+        let mut files: Vec<Box<Path>> = Vec::new();
+        let mut ids: HashMap<&Path, u32> = HashMap::new();
+        let mut nodes = Vec::with_capacity(entries.len());
+        for (file, edges) in entries {
+            let file = intern(&mut files, &mut ids, file);
+            let resolved = edges
+                .resolved
+                .iter()
+                .map(|child| intern(&mut files, &mut ids, child))
+                .collect();
+            nodes.push(RecordedNode {
+                file,
+                resolved,
+                unresolved: edges.unresolved.clone(),
+            });
+        }
+        Self {
+            defines,
+            seeds,
+            pass1_libraries,
+            selection,
+            files,
+            nodes,
+        }
+    }
+
+    pub(crate) fn defines(&self) -> u64 {
+        self.defines
+    }
+
+    pub(crate) fn pass1_libraries(&self) -> &[String] {
+        &self.pass1_libraries
+    }
+
+    pub(crate) fn selection(&self) -> &Selection {
+        &self.selection
+    }
+
+    /// Rebuild the recorded include graph.
+    pub(crate) fn graph(&self) -> IncludeGraph {
+        let path = |id: u32| self.files[id as usize].to_path_buf();
+        let mut graph = IncludeGraph::new();
+        for node in &self.nodes {
+            graph.insert(
+                path(node.file),
+                IncludeEdges {
+                    resolved: node.resolved.iter().map(|&id| path(id)).collect(),
+                    unresolved: node.unresolved.clone(),
+                },
+            );
+        }
+        graph
+    }
+
+    /// Indices into `current` of the seeds whose content changed, or `None`
+    /// when the seed set itself differs (a seed was added or removed) and the
+    /// record cannot be reused.
+    pub(crate) fn changed_seeds(&self, current: &[(String, [u8; 32])]) -> Option<Vec<usize>> {
+        let previous: HashMap<&str, &[u8; 32]> = self
+            .seeds
+            .iter()
+            .map(|(path, hash)| (path.as_str(), hash))
+            .collect();
+        let current_paths: BTreeSet<&str> = current.iter().map(|(path, _)| path.as_str()).collect();
+        if current_paths.len() != previous.len() {
+            return None;
+        }
+        let mut changed = Vec::new();
+        for (idx, (path, hash)) in current.iter().enumerate() {
+            if *previous.get(path.as_str())? != hash {
+                changed.push(idx);
+            }
+        }
+        Some(changed)
+    }
+
+    /// Whether every interned id is in range. A record decoded from a
+    /// damaged file must be discarded rather than panic in [`Self::graph`].
+    pub(crate) fn is_consistent(&self) -> bool {
+        let in_range = |id: &u32| (*id as usize) < self.files.len();
+        self.nodes
+            .iter()
+            .all(|node| in_range(&node.file) && node.resolved.iter().all(in_range))
+    }
+}
+
+fn intern<'a>(files: &mut Vec<Box<Path>>, ids: &mut HashMap<&'a Path, u32>, path: &'a Path) -> u32 {
+    *ids.entry(path).or_insert_with(|| {
+        files.push(path.into());
+        (files.len() - 1) as u32
+    })
+}
+
+/// Sorted names of the libraries the resolver selects before reconciliation:
+/// every declared `lib_deps` match (pass 0) plus every library whose include
+/// dirs contain a file of the seeds' include closure (pass 1).
+pub(crate) fn pass1_libraries(
+    seed_closure: &WalkResult,
+    libraries: &[FrameworkLibrary],
+    declared: &[String],
+) -> Vec<String> {
+    let wanted: BTreeSet<String> = declared
+        .iter()
+        .filter_map(|d| declared_dep_name(d))
+        .collect();
+    let dirs = canon_lib_dirs(libraries);
+    let mut names: BTreeSet<String> = BTreeSet::new();
+    for (lib, lib_dirs) in libraries.iter().zip(&dirs) {
+        if wanted.contains(&lib.name.to_ascii_lowercase())
+            || seed_closure
+                .reached
+                .iter()
+                .any(|p| path_in_any(p, lib_dirs))
+        {
+            names.insert(lib.name.clone());
+        }
+    }
+    names.into_iter().collect()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn graph() -> IncludeGraph {
+        let mut graph = IncludeGraph::new();
+        graph.insert(
+            "/p/main.cpp".into(),
+            IncludeEdges {
+                resolved: vec!["/lib/a.h".into(), "/p/local.h".into()],
+                unresolved: vec!["gone.h".into()],
+            },
+        );
+        graph.insert(
+            "/lib/a.h".into(),
+            IncludeEdges {
+                resolved: vec!["/p/local.h".into()],
+                unresolved: Vec::new(),
+            },
+        );
+        graph.insert("/p/local.h".into(), IncludeEdges::default());
+        graph
+    }
+
+    fn seeds(hashes: &[(&str, u8)]) -> Vec<(String, [u8; 32])> {
+        hashes
+            .iter()
+            .map(|(path, byte)| (path.to_string(), [*byte; 32]))
+            .collect()
+    }
+
+    #[test]
+    fn i01_graph_round_trips_through_record() {
+        let graph = graph();
+        let record =
+            IncrementalRecord::new(1, Vec::new(), Vec::new(), Selection::default(), &graph);
+        assert_eq!(record.files.len(), 3);
+        assert!(record.is_consistent());
+        assert_eq!(record.graph(), graph);
+
+        let bytes = bincode::serialize(&record).unwrap();
+        let decoded: IncrementalRecord = bincode::deserialize(&bytes).unwrap();
+        assert_eq!(decoded, record);
+        assert_eq!(
+            bincode::serialize(&IncrementalRecord::new(
+                1,
+                Vec::new(),
+                Vec::new(),
+                Selection::default(),
+                &graph
+            ))
+            .unwrap(),
+            bytes
+        );
+    }
+
+    #[test]
+    fn i02_changed_seeds_detects_edits_and_set_changes() {
+        let record = IncrementalRecord::new(
+            1,
+            seeds(&[("/p/a.cpp", 1), ("/p/b.cpp", 2)]),
+            Vec::new(),
+            Selection::default(),
+            &IncludeGraph::new(),
+        );
+        assert_eq!(
+            record.changed_seeds(&seeds(&[("/p/b.cpp", 2), ("/p/a.cpp", 1)])),
+            Some(Vec::new())
+        );
+        assert_eq!(
+            record.changed_seeds(&seeds(&[("/p/a.cpp", 1), ("/p/b.cpp", 9)])),
+            Some(vec![1])
+        );
+        assert_eq!(record.changed_seeds(&seeds(&[("/p/a.cpp", 1)])), None);
+        assert_eq!(
+            record.changed_seeds(&seeds(&[("/p/a.cpp", 1), ("/p/c.cpp", 2)])),
+            None
+        );
+    }
+
+    #[test]
+    fn i03_out_of_range_ids_are_inconsistent() {
+        let mut record =
+            IncrementalRecord::new(1, Vec::new(), Vec::new(), Selection::default(), &graph());
+        record.nodes[0].resolved.push(99);
+        assert!(!record.is_consistent());
+    }
+}
@@ -19,12 +19,16 @@
 
 use std::collections::{BTreeMap, BTreeSet, HashMap};
 use std::path::{Path, PathBuf};
+use std::sync::Arc;
 
-use fbuild_header_scan::{WalkState, active_defines, walk_with_state, walk_with_state_active};
+use fbuild_header_scan::{
+    ScanIndex, WalkState, active_defines, walk_with_state, walk_with_state_active,
+};
 use fbuild_packages::library::FrameworkLibrary;
 use serde::{Deserialize, Serialize};
 
 pub mod cache;
+mod incremental;
 
 pub use cache::{CacheKeyInputs, CachedSelection, cache_key, resolve_cached};
 
@@ -33,11 +37,28 @@ pub use cache::{CacheKeyInputs, CachedSelection, cache_key, resolve_cached};
 /// `std::fs::read_to_string` invocations across all LDF passes within a
 /// single `resolve` call; `passes` is the total pass count (Pass 1 plus
 /// every reconciliation iteration that ran, including the final
-/// no-change iteration that proved convergence).
+/// no-change iteration that proved convergence). `index_hits` counts files
+/// whose scan came from a persistent [`ScanIndex`] without being read (see
+/// [`resolve_with_scan_index`]); it is always 0 otherwise.
+///
+/// The `incremental_*` fields and `seeds_rescanned` are only set by
+/// [`cache::resolve_cached`]. Each call reports at most one reuse or one
+/// fallback, so summing stats across calls counts how often the incremental
+/// path fired.
 #[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
 pub struct ResolveStats {
     pub files_read: usize,
     pub passes: usize,
+    pub index_hits: usize,
+    /// Seeds whose include closure was re-walked because their content
+    /// changed since the previous resolve of the same project.
+    pub seeds_rescanned: usize,
+    /// 1 when the previous selection was reused because the edited seeds
+    /// still reach the same libraries, else 0.
+    pub incremental_reuses: usize,
+    /// 1 when a previous resolve existed but the edit changed the active
+    /// defines or the reached libraries, forcing the full 2-pass resolve.
+    pub incremental_fallbacks: usize,
 }
 
 /// Resolved library selection plus the transitive include closure.
@@ -140,6 +161,32 @@ pub fn resolve_with_stats_active_declared(
         libraries,
         Some(&effective_defines),
         declared,
+        &mut WalkState::new(),
+    )
+}
+
+/// [`resolve_with_stats_active_declared`] with scans served from, and
+/// recorded into, a persistent [`ScanIndex`].
+///
+/// Unchanged framework headers are neither read nor re-tokenized, so a cold
+/// process (fresh daemon, compile-many worker) resolves at close to warm
+/// cost. The caller owns persistence: call [`ScanIndex::save`] afterwards.
+pub fn resolve_with_scan_index(
+    seeds: &[PathBuf],
+    project_search_paths: &[PathBuf],
+    libraries: &[FrameworkLibrary],
+    defines: &HashMap<String, String>,
+    declared: &[String],
+    index: Arc<ScanIndex>,
+) -> (Selection, ResolveStats) {
+    let effective_defines = seed_defines(seeds, defines);
+    resolve_with_stats_impl_declared(
+        seeds,
+        project_search_paths,
+        libraries,
+        Some(&effective_defines),
+        declared,
+        &mut WalkState::with_index(index),
     )
 }
 
@@ -219,7 +266,14 @@ fn resolve_with_stats_impl(
     libraries: &[FrameworkLibrary],
     defines: Option<&HashMap<String, String>>,
 ) -> (Selection, ResolveStats) {
-    resolve_with_stats_impl_declared(seeds, project_search_paths, libraries, defines, &[])
+    resolve_with_stats_impl_declared(
+        seeds,
+        project_search_paths,
+        libraries,
+        defines,
+        &[],
+        &mut WalkState::new(),
+    )
 }
 
 fn resolve_with_stats_impl_declared(
@@ -228,31 +282,15 @@ fn resolve_with_stats_impl_declared(
     libraries: &[FrameworkLibrary],
     defines: Option<&HashMap<String, String>>,
     declared: &[String],
+    state: &mut WalkState,
 ) -> (Selection, ResolveStats) {
     let mut selected: BTreeSet<usize> = BTreeSet::new();
     let mut all_included: BTreeSet<PathBuf> = BTreeSet::new();
     let mut all_unresolved: BTreeSet<String> = BTreeSet::new();
-    let mut state = WalkState::new();
     let mut pass_count: usize = 0;
 
-    let canon_lib_dirs: Vec<Vec<PathBuf>> = libraries
-        .iter()
-        .map(|lib| lib.include_dirs.iter().map(|d| canon(d)).collect())
-        .collect();
-
-    // The walker's search paths include the project's include roots first, then
-    // every framework library's include dirs. A reached path is attributed to a
-    // library by prefix match, not by which search-path entry matched it — PIO's
-    // `search_deps_recursive` semantics. Having all lib include dirs present
-    // from the start means pass 1's BFS naturally traverses lib-to-lib edges.
-    let mut full_search_paths: Vec<PathBuf> = project_search_paths.to_vec();
-    for lib in libraries {
-        for d in &lib.include_dirs {
-            if !full_search_paths.contains(d) {
-                full_search_paths.push(d.clone());
-            }
-        }
-    }
+    let canon_lib_dirs = canon_lib_dirs(libraries);
+    let full_search_paths = full_search_paths(project_search_paths, libraries);
 
     // Pass 0: explicit `lib_deps` declarations. Selected before any scanning
     // so the reconciliation loop treats them exactly like a scan-selected
@@ -290,8 +328,8 @@ fn resolve_with_stats_impl_declared(
         pass_count += 1;
         tracing::info!(pass = 1u32, "ldf_pass");
         let res = match defines {
-            Some(defines) => walk_with_state_active(seeds, &full_search_paths, defines, &mut state),
-            None => walk_with_state(seeds, &full_search_paths, &mut state),
+            Some(defines) => walk_with_state_active(seeds, &full_search_paths, defines, state),
+            None => walk_with_state(seeds, &full_search_paths, state),
         };
         for p in &res.reached {
             all_included.insert(p.clone());
@@ -326,9 +364,9 @@ fn resolve_with_stats_impl_declared(
         }
         let res = match defines {
             Some(defines) => {
-                walk_with_state_active(&recon_seeds, &full_search_paths, defines, &mut state)
+                walk_with_state_active(&recon_seeds, &full_search_paths, defines, state)
             }
-            None => walk_with_state(&recon_seeds, &full_search_paths, &mut state),
+            None => walk_with_state(&recon_seeds, &full_search_paths, state),
         };
         for p in &res.reached {
             all_included.insert(p.clone());
@@ -379,10 +417,39 @@ fn resolve_with_stats_impl_declared(
     let stats = ResolveStats {
         files_read: state.files_read(),
         passes: pass_count,
+        index_hits: state.index_hits(),
+        ..ResolveStats::default()
     };
     (selection, stats)
 }
 
+fn canon_lib_dirs(libraries: &[FrameworkLibrary]) -> Vec<Vec<PathBuf>> {
+    libraries
+        .iter()
+        .map(|lib| lib.include_dirs.iter().map(|d| canon(d)).collect())
+        .collect()
+}
+
+/// The walker's search paths: the project's include roots first, then every
+/// framework library's include dirs. A reached path is attributed to a library
+/// by prefix match, not by which search-path entry matched it — PIO's
+/// `search_deps_recursive` semantics. Having all lib include dirs present from
+/// the start means pass 1's BFS naturally traverses lib-to-lib edges.
+fn full_search_paths(
+    project_search_paths: &[PathBuf],
+    libraries: &[FrameworkLibrary],
+) -> Vec<PathBuf> {
+    let mut full: Vec<PathBuf> = project_search_paths.to_vec();
+    for lib in libraries {
+        for d in &lib.include_dirs {
+            if !full.contains(d) {
+                full.push(d.clone());
+            }
+        }
+    }
+    full
+}
+
 fn canon(p: &Path) -> PathBuf {
     // FastLED/fbuild#844 sync-context allowlist: `resolve_with_stats`
     // is sync (called from the daemon's `BuildOrchestrator` chain and
@@ -13,6 +13,8 @@ use fbuild_core::subprocess::run_command;
 use fbuild_core::{FbuildError, Result};
 use sha2::{Digest, Sha256};
 
+use super::unity_build::{self, UnityBuild};
+
 /// C++-only flags that must not be passed to gcc for .c files.
 const CXX_ONLY_PREFIXES: &[&str] = &["-std=gnu++", "-std=c++", "-fno-rtti", "-fuse-cxa-atexit"];
 
@@ -110,6 +112,7 @@ pub async fn compile_library(
         compiler_cache,
         None,
         None,
+        None,
     )
     .await
 }
@@ -139,6 +142,70 @@ pub async fn compile_library_with_jobs(
     // compiles are cached and hit cross-project (FastLED/fbuild#986). `None`
     // keeps the direct-subprocess path for every caller that hasn't opted in.
     backend: Option<std::sync::Arc<dyn LibCompileBackend>>,
+    // When `Some`, compile the sources as jumbo TUs with per-library
+    // fallback (`unity_build = N`, see `unity_build`). `None` compiles one
+    // object per source.
+    unity: Option<UnityBuild>,
+) -> Result<Option<PathBuf>> {
+    let compile = |sources: Vec<PathBuf>| {
+        let (compile_cwd, backend) = (compile_cwd.clone(), backend.clone());
+        async move {
+            compile_library_objects(
+                name,
+                &sources,
+                include_dirs,
+                gcc_path,
+                gxx_path,
+                ar_path,
+                c_flags,
+                cpp_flags,
+                output_dir,
+                verbose,
+                jobs,
+                compiler_cache,
+                compile_cwd,
+                backend,
+            )
+            .await
+        }
+    };
+    let Some(unity) = unity else {
+        return compile(source_files.to_vec()).await;
+    };
+    // Each failed jumbo TU moves at least one member to a standalone compile
+    // for the rest of this build, so this retries at most once per source;
+    // groups that already compiled are up to date on the retry.
+    let mut skip = std::collections::BTreeSet::new();
+    loop {
+        let plan = unity_build::plan_skipping(unity, source_files, output_dir, &skip)?;
+        let sources = plan
+            .sources()
+            .into_iter()
+            .map(NormalizedPath::into_path_buf);
+        match compile(sources.collect()).await {
+            Ok(archive) => return Ok(archive),
+            Err(error) => unity_build::recover(name, &plan, output_dir, error, &mut skip)?,
+        }
+    }
+}
+
+/// Compile `source_files` one object each and archive them.
+#[allow(clippy::too_many_arguments)]
+async fn compile_library_objects(
+    name: &str,
+    source_files: &[PathBuf],
+    include_dirs: &[PathBuf],
+    gcc_path: &Path,
+    gxx_path: &Path,
+    ar_path: &Path,
+    c_flags: &[String],
+    cpp_flags: &[String],
+    output_dir: &Path,
+    verbose: bool,
+    jobs: usize,
+    compiler_cache: Option<&Path>,
+    compile_cwd: Option<PathBuf>,
+    backend: Option<std::sync::Arc<dyn LibCompileBackend>>,
 ) -> Result<Option<PathBuf>> {
     if source_files.is_empty() {
         tracing::debug!("library {} is header-only, skipping compile", name);
@@ -663,44 +730,29 @@ async fn build_include_flags(include_dirs: &[PathBuf], _temp_dir: &Path) -> Resu
     }
 }
 
-/// Create a static archive from object files.
+/// Create or incrementally update a static archive from object files.
+///
+/// Library archives may be copied into caches, so they are never thin.
 async fn archive_objects(ar_path: &Path, objects: &[PathBuf], output: &Path) -> Result<()> {
-    if output.exists() {
-        std::fs::remove_file(output)?;
-    }
-
-    let mut args: Vec<String> = vec![
-        ar_path.to_string_lossy().to_string(),
-        "rcs".to_string(),
-        output.to_string_lossy().to_string(),
-    ];
-
-    for obj in objects {
-        args.push(obj.to_string_lossy().to_string());
-    }
-
-    let args_ref: Vec<&str> = args.iter().map(|s| s.as_str()).collect();
     // FastLED/fbuild#844: explicit 60 s cap. `ar rcs` over a large
     // FastLED object set (hundreds of .o files) finishes in <10 s on
     // every host fbuild supports; anything past a minute is a disk /
     // filesystem fault rather than legitimately slow work, so we cap
     // tightly to surface those failures fast instead of waiting out
     // the 15 min default.
-    let result = run_command(
-        &args_ref,
-        None,
-        None,
-        Some(std::time::Duration::from_secs(60)),
-    )
-    .await?;
-
-    if !result.success() {
-        return Err(FbuildError::BuildFailed(format!(
-            "ar failed: {}",
-            result.stderr
-        )));
-    }
-
+    let options = fbuild_core::archive::ArchiveOptions {
+        label: "ar",
+        timeout: std::time::Duration::from_secs(60),
+        allow_thin: false,
+    };
+    let started = std::time::Instant::now();
+    let update = fbuild_core::archive::update_archive(ar_path, objects, output, &options).await?;
+    tracing::debug!(
+        "archive {}: {:?} in {:.3}s",
+        output.display(),
+        update,
+        started.elapsed().as_secs_f64()
+    );
     Ok(())
 }
 
@@ -93,6 +93,7 @@ pub async fn ensure_libraries(
     verbose: bool,
     jobs: usize,
     compiler_cache: Option<&Path>,
+    unity: Option<super::UnityBuild>,
 ) -> Result<LibraryResult> {
     // 1. Parse specs, filter ignored
     let specs: Vec<LibrarySpec> = lib_specs
@@ -200,6 +201,7 @@ pub async fn ensure_libraries(
             compiler_cache,
             None,
             None,
+            unity,
         )
         .await?
         {
@@ -375,6 +377,7 @@ pub fn ensure_libraries_sync(
         verbose,
         jobs,
         compiler_cache,
+        None,
     );
     if let Ok(handle) = tokio::runtime::Handle::try_current() {
         tokio::task::block_in_place(|| handle.block_on(fut))
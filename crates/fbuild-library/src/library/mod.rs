@@ -30,6 +30,7 @@ pub mod samd_core;
 pub mod silabs_core;
 pub mod stm32_core;
 pub mod teensy_core;
+pub mod unity_build;
 
 pub use apollo3_core::Apollo3Cores;
 pub use arduino_core::ArduinoCore;
@@ -56,3 +57,4 @@ pub use samd_core::SamdCores;
 pub use silabs_core::SilabsCores;
 pub use stm32_core::Stm32Cores;
 pub use teensy_core::TeensyCores;
+pub use unity_build::UnityBuild;
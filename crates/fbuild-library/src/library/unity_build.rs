@@ -0,0 +1,595 @@
+//! Unity (jumbo) builds for library archives (`unity_build = N`).
+//!
+//! Cold builds of large libraries are dominated by per-TU process spawn and
+//! repeated header parsing rather than code generation. With `unity_build`
+//! set, [`plan`] groups a library's C and C++ sources into at most N
+//! generated jumbo TUs per language (`<output_dir>/unity/unity_<lang>_<i>.<ext>`,
+//! each a sorted list of `#include "<member>"` lines), which the library
+//! compiler builds in place of the individual files.
+//!
+//! ## Stable grouping
+//!
+//! A source's bucket is a hash of its path modulo N, so adding or removing a
+//! file only changes the one bucket it lands in and an edit recompiles
+//! exactly one jumbo TU. Unity files
+//! are rewritten only when their member list changes or a member is newer than
+//! the unity file, so toolchains that emit no depfile still rebuild on member
+//! edits while untouched groups keep their objects (and zccache keys).
+//!
+//! ## Fallback
+//!
+//! Some sources break when concatenated — typically file-`static` or
+//! anonymous-namespace names that collide across members, or headers without
+//! include guards. When a jumbo TU fails, [`record_failure`] moves the members
+//! named in the diagnostics (the whole group if none are named) to standalone
+//! compiles and remembers that in `<output_dir>/unity_state.json`, so later
+//! builds don't repeat the failed attempt. A member that also fails standalone
+//! surfaces its real error.
+//!
+//! An exclusion is keyed on the member's content hash at the time of the
+//! failure: once the member is edited (say, the collision or the real error
+//! is fixed) it rejoins its group. Failures that say nothing about the
+//! sources — internal compiler errors, the compiler being killed or running
+//! out of memory — are not remembered; the group compiles standalone for the
+//! current build only and the next build tries it as a jumbo TU again.
+
+use std::collections::{BTreeMap, BTreeSet};
+use std::path::Path;
+
+use fbuild_core::path::NormalizedPath;
+use fbuild_core::{FbuildError, Result};
+use serde::{Deserialize, Serialize};
+use sha2::{Digest, Sha256};
+
+/// Jumbo TUs per language for `unity_build = on`.
+pub const DEFAULT_UNITY_BUCKETS: usize = 8;
+
+/// Per-library fallback state, written beside the library's `obj/` dir.
+pub const UNITY_STATE_FILE: &str = "unity_state.json";
+
+/// Directory under the library output dir holding the generated unity TUs.
+const UNITY_DIR: &str = "unity";
+
+/// Bumped whenever the unity TU layout or the state file format changes.
+const UNITY_FORMAT_VERSION: u32 = 2;
+
+/// Compiler diagnostics that point at the toolchain or the machine rather
+/// than at the sources of a jumbo TU.
+const TRANSIENT_FAILURE_MARKERS: &[&str] = &[
+    "internal compiler error",
+    "Killed signal terminated program",
+    "out of memory",
+    "virtual memory exhausted",
+    "Cannot allocate memory",
+];
+
+/// `unity_build` setting: jumbo TUs per language.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct UnityBuild {
+    buckets: usize,
+}
+
+impl UnityBuild {
+    /// Unity mode with `buckets` jumbo TUs per language; `None` for 0.
+    pub fn new(buckets: usize) -> Option<Self> {
+        (buckets > 0).then_some(Self { buckets })
+    }
+
+    /// Parse a raw `unity_build` value: a bucket count, `on`, or `off`.
+    /// Unknown values disable unity mode with a warning rather than failing
+    /// the build.
+    pub fn parse(value: Option<&str>) -> Option<Self> {
+        let value = value?.trim().to_ascii_lowercase();
+        match value.as_str() {
+            "" | "off" | "no" | "false" => None,
+            "on" | "yes" | "true" | "auto" => Self::new(DEFAULT_UNITY_BUCKETS),
+            other => match other.parse::<usize>() {
+                Ok(buckets) => Self::new(buckets),
+                Err(_) => {
+                    tracing::warn!(unity_build = %other, "unknown unity_build value; unity build disabled");
+                    None
+                }
+            },
+        }
+    }
+
+    /// Resolve the setting for `env_name` from `platformio.ini`.
+    pub fn for_env(config: &fbuild_config::PlatformIOConfig, env_name: &str) -> Option<Self> {
+        Self::parse(config.get_unity_build(env_name).ok().flatten().as_deref())
+    }
+
+    /// Jumbo TUs per language.
+    pub fn buckets(&self) -> usize {
+        self.buckets
+    }
+}
+
+/// Language of a unity group; only sources of the same language are merged.
+#[derive(Debug, Clone, Copy, PartialEq, Eq, PartialOrd, Ord)]
+enum Lang {
+    C,
+    Cxx,
+}
+
+impl Lang {
+    /// Language of a source eligible for unity grouping. Assembly and
+    /// anything else the compiler dispatches specially stay standalone.
+    fn of(source: &Path) -> Option<Self> {
+        match source.extension().and_then(|e| e.to_str()) {
+            Some("c") => Some(Self::C),
+            Some("cpp" | "cc" | "cxx") => Some(Self::Cxx),
+            _ => None,
+        }
+    }
+
+    /// File-name tag, doubling as the unity TU extension.
+    fn tag(self) -> &'static str {
+        match self {
+            Self::C => "c",
+            Self::Cxx => "cpp",
+        }
+    }
+}
+
+/// One generated jumbo TU and the library sources it includes.
+#[derive(Debug, Clone)]
+pub struct UnityGroup {
+    pub tu: NormalizedPath,
+    pub members: Vec<NormalizedPath>,
+}
+
+/// What to compile for one library in unity mode.
+#[derive(Debug, Clone, Default)]
+pub struct UnityPlan {
+    pub groups: Vec<UnityGroup>,
+    /// Sources compiled one object per file: ineligible languages,
+    /// single-member buckets and remembered fallbacks.
+    pub standalone: Vec<NormalizedPath>,
+}
+
+impl UnityPlan {
+    /// Every TU to hand to the compiler: jumbo TUs, then standalone sources.
+    pub fn sources(&self) -> Vec<NormalizedPath> {
+        self.groups
+            .iter()
+            .map(|group| group.tu.clone())
+            .chain(self.standalone.iter().cloned())
+            .collect()
+    }
+
+    /// The group whose jumbo TU is named in a compile `error`, if any.
+    pub fn failed_group(&self, error: &str) -> Option<&UnityGroup> {
+        self.groups
+            .iter()
+            .find(|group| error.contains(&group.tu.to_string()))
+    }
+}
+
+#[derive(Debug, Default, Serialize, Deserialize)]
+struct UnityState {
+    version: u32,
+    /// Sources (slash form) that broke their jumbo TU, with the
+    /// [`content_hash`] they had at the time.
+    excluded: BTreeMap<String, String>,
+}
+
+fn state_path(output_dir: &Path) -> NormalizedPath {
+    NormalizedPath::new(output_dir.join(UNITY_STATE_FILE))
+}
+
+/// Missing, unreadable or outdated state means "nothing excluded yet".
+fn load_state(output_dir: &Path) -> UnityState {
+    std::fs::read_to_string(state_path(output_dir))
+        .ok()
+        .and_then(|text| serde_json::from_str::<UnityState>(&text).ok())
+        .filter(|state| state.version == UNITY_FORMAT_VERSION)
+        .unwrap_or_default()
+}
+
+fn save_state(output_dir: &Path, state: &UnityState) -> Result<()> {
+    std::fs::create_dir_all(output_dir)?;
+    let text = serde_json::to_string_pretty(state)
+        .map_err(|e| FbuildError::BuildFailed(format!("failed to encode unity state: {e}")))?;
+    std::fs::write(state_path(output_dir), text)?;
+    Ok(())
+}
+
+/// Hex SHA-256 of `source`'s contents; `None` when it cannot be read.
+fn content_hash(source: &Path) -> Option<String> {
+    let bytes = std::fs::read(source).ok()?;
+    Some(
+        Sha256::digest(&bytes)
+            .iter()
+            .map(|b| format!("{b:02x}"))
+            .collect(),
+    )
+}
+
+/// Whether the exclusion recorded for `source` still applies: `Some(true)`
+/// while the source is unchanged since it broke its jumbo TU, `Some(false)`
+/// once it was edited, `None` when it was never excluded.
+fn still_excluded(state: &UnityState, source: &NormalizedPath) -> Option<bool> {
+    let recorded = state.excluded.get(&source.display_slash())?;
+    Some(content_hash(source).as_ref() == Some(recorded))
+}
+
+/// Stable bucket for `source`, hashed on its slash-form path.
+fn bucket_index(source: &NormalizedPath, buckets: usize) -> usize {
+    let digest = Sha256::digest(source.display_slash().as_bytes());
+    let mut head = [0u8; 8];
+    head.copy_from_slice(&digest[..8]);
+    (u64::from_le_bytes(head) % buckets as u64) as usize
+}
+
+fn unity_contents(members: &[NormalizedPath]) -> String {
+    let mut text =
+        format!("// Generated by fbuild unity build (v{UNITY_FORMAT_VERSION}); do not edit.\n");
+    for member in members {
+        text.push_str(&format!("#include \"{}\"\n", member.display_slash()));
+    }
+    text
+}
+
+fn modified(path: &Path) -> Option<std::time::SystemTime> {
+    std::fs::metadata(path).and_then(|m| m.modified()).ok()
+}
+
+/// Write the unity TU unless it already lists `members` and is newer than
+/// all of them.
+fn write_unity_tu(tu: &Path, members: &[NormalizedPath]) -> Result<()> {
+    let contents = unity_contents(members);
+    let current = std::fs::read_to_string(tu).ok().as_deref() == Some(contents.as_str());
+    let fresh = current
+        && modified(tu).is_some_and(|tu_time| {
+            members
+                .iter()
+                .all(|member| modified(member).is_none_or(|t| t <= tu_time))
+        });
+    if !fresh {
+        if let Some(parent) = tu.parent() {
+            std::fs::create_dir_all(parent)?;
+        }
+        std::fs::write(tu, contents)?;
+    }
+    Ok(())
+}
+
+/// Group `sources` into jumbo TUs under `output_dir`, writing the unity files.
+pub fn plan(
+    unity: UnityBuild,
+    sources: &[impl AsRef<Path>],
+    output_dir: &Path,
+) -> Result<UnityPlan> {
+    plan_skipping(unity, sources, output_dir, &BTreeSet::new())
+}
+
+/// [`plan`], additionally compiling `skip` standalone (the fallbacks of the
+/// current build, see [`recover`]).
+pub fn plan_skipping(
+    unity: UnityBuild,
+    sources: &[impl AsRef<Path>],
+    output_dir: &Path,
+    skip: &BTreeSet<NormalizedPath>,
+) -> Result<UnityPlan> {
+    let mut state = load_state(output_dir);
+    let sources: Vec<NormalizedPath> = sources.iter().map(NormalizedPath::new).collect();
+
+    let mut plan = UnityPlan::default();
+    let mut buckets: BTreeMap<(Lang, usize), Vec<NormalizedPath>> = BTreeMap::new();
+    let mut edited = Vec::new();
+    for source in sources {
+        let excluded = match still_excluded(&state, &source) {
+            Some(true) => true,
+            Some(false) => {
+                edited.push(source.display_slash());
+                false
+            }
+            None => false,
+        };
+        match Lang::of(&source) {
+            Some(lang) if !excluded && !skip.contains(&source) => {
+                let index = bucket_index(&source, unity.buckets);
+                buckets.entry((lang, index)).or_default().push(source);
+            }
+            _ => plan.standalone.push(source),
+        }
+    }
+    if !edited.is_empty() {
+        tracing::debug!(
+            "unity build: {} edited source(s) rejoin their jumbo TU",
+            edited.len()
+        );
+        for source in &edited {
+            state.excluded.remove(source);
+        }
+        save_state(output_dir, &state)?;
+    }
+
+    let unity_dir = output_dir.join(UNITY_DIR);
+    for ((lang, index), mut members) in buckets {
+        if members.len() < 2 {
+            plan.standalone.extend(members);
+            continue;
+        }
+        members.sort();
+        let tu = unity_dir.join(format!("unity_{}_{index}.{}", lang.tag(), lang.tag()));
+        write_unity_tu(&tu, &members)?;
+        plan.groups.push(UnityGroup {
+            tu: NormalizedPath::new(&tu),
+            members,
+        });
+    }
+    Ok(plan)
+}
+
+/// Remember which members of a failed `group` must compile standalone from
+/// now on: those named in the compile `error`, else the whole group.
+/// Returns the moved members.
+pub fn record_failure(
+    output_dir: &Path,
+    group: &UnityGroup,
+    error: &str,
+) -> Result<Vec<NormalizedPath>> {
+    let named: Vec<NormalizedPath> = group
+        .members
+        .iter()
+        .filter(|member| {
+            error.contains(&member.to_string()) || error.contains(&member.display_slash())
+        })
+        .cloned()
+        .collect();
+    let moved = if named.is_empty() {
+        group.members.clone()
+    } else {
+        named
+    };
+
+    let mut state = load_state(output_dir);
+    state.version = UNITY_FORMAT_VERSION;
+    state.excluded.extend(
+        moved
+            .iter()
+            .filter_map(|member| Some((member.display_slash(), content_hash(member)?))),
+    );
+    save_state(output_dir, &state)?;
+    Ok(moved)
+}
+
+/// `true` when `error` blames the toolchain or the machine (ICE, OOM, a
+/// killed compiler) rather than the sources.
+fn is_transient(error: &str) -> bool {
+    TRANSIENT_FAILURE_MARKERS
+        .iter()
+        .any(|marker| error.contains(marker))
+}
+
+/// Handle a failed unity compile of library `name`: when `error` comes from
+/// one of `plan`'s jumbo TUs, add its fallback to `skip` so the caller can
+/// retry with [`plan_skipping`], and remember it for later builds unless the
+/// failure [looks transient](TRANSIENT_FAILURE_MARKERS); otherwise hand the
+/// error back.
+pub fn recover(
+    name: &str,
+    plan: &UnityPlan,
+    output_dir: &Path,
+    error: FbuildError,
+    skip: &mut BTreeSet<NormalizedPath>,
+) -> Result<()> {
+    let message = error.to_string();
+    let Some(group) = plan.failed_group(&message) else {
+        return Err(error);
+    };
+    if is_transient(&message) {
+        tracing::warn!(
+            "library {}: unity TU {} failed in the toolchain; compiling its {} sources standalone for this build",
+            name,
+            group.tu,
+            group.members.len()
+        );
+        skip.extend(group.members.iter().cloned());
+        return Ok(());
+    }
+    let moved = record_failure(output_dir, group, &message)?;
+    tracing::warn!(
+        "library {}: unity TU {} failed; compiling {} of its {} sources standalone until they change",
+        name,
+        group.tu,
+        moved.len(),
+        group.members.len()
+    );
+    skip.extend(moved);
+    Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn library(dir: &Path, files: &[&str]) -> Vec<NormalizedPath> {
+        files
+            .iter()
+            .map(|file| {
+                let path = dir.join("src").join(file);
+                std::fs::create_dir_all(path.parent().unwrap()).unwrap();
+                std::fs::write(&path, "int x;\n").unwrap();
+                NormalizedPath::new(path)
+            })
+            .collect()
+    }
+
+    fn unity(buckets: usize) -> UnityBuild {
+        UnityBuild::new(buckets).unwrap()
+    }
+
+    #[test]
+    fn parse_unity_build_values() {
+        assert_eq!(UnityBuild::parse(None), None);
+        assert_eq!(UnityBuild::parse(Some("off")), None);
+        assert_eq!(UnityBuild::parse(Some("0")), None);
+        assert_eq!(UnityBuild::parse(Some(" 4 ")), UnityBuild::new(4));
+        assert_eq!(
+            UnityBuild::parse(Some("on")),
+            UnityBuild::new(DEFAULT_UNITY_BUCKETS)
+        );
+        assert_eq!(UnityBuild::parse(Some("bogus")), None);
+    }
+
+    #[test]
+    fn grouping_is_stable_and_adding_a_file_touches_one_group() {
+        let lib = tempfile::TempDir::new().unwrap();
+        let out = tempfile::TempDir::new().unwrap();
+        let names: Vec<String> = (0..24).map(|i| format!("f{i}.cpp")).collect();
+        let refs: Vec<&str> = names.iter().map(String::as_str).collect();
+        let sources = library(lib.path(), &refs);
+
+        let first = plan(unity(4), &sources, out.path()).unwrap();
+        let again = plan(unity(4), &sources, out.path()).unwrap();
+        assert_eq!(first.sources(), again.sources());
+        assert!(first.groups.len() <= 4);
+        let grouped: usize = first.groups.iter().map(|g| g.members.len()).sum();
+        assert_eq!(grouped + first.standalone.len(), sources.len());
+
+        let mut grown = sources.clone();
+        grown.extend(library(lib.path(), &["extra.cpp"]));
+        let after = plan(unity(4), &grown, out.path()).unwrap();
+        let changed = first
+            .groups
+            .iter()
+            .filter(|g| {
+                !after
+                    .groups
+                    .iter()
+                    .any(|a| a.tu == g.tu && a.members == g.members)
+            })
+            .count();
+        assert!(
+            changed <= 1,
+            "{changed} groups changed after adding one file"
+        );
+    }
+
+    #[test]
+    fn languages_are_split_and_asm_stays_standalone() {
+        let lib = tempfile::TempDir::new().unwrap();
+        let out = tempfile::TempDir::new().unwrap();
+        let sources = library(lib.path(), &["a.c", "b.c", "c.cpp", "d.cc", "e.S"]);
+        let result = plan(unity(1), &sources, out.path()).unwrap();
+
+        assert_eq!(result.groups.len(), 2);
+        for group in &result.groups {
+            let ext = group.tu.extension().unwrap().to_str().unwrap().to_string();
+            for member in &group.members {
+                let is_c = member.extension().unwrap() == "c";
+                assert_eq!(is_c, ext == "c");
+            }
+        }
+        assert_eq!(result.standalone.len(), 1);
+        assert!(result.standalone[0].ends_with("e.S"));
+    }
+
+    #[test]
+    fn unity_tu_lists_sorted_members_and_is_not_rewritten() {
+        let lib = tempfile::TempDir::new().unwrap();
+        let out = tempfile::TempDir::new().unwrap();
+        let sources = library(lib.path(), &["z.cpp", "a.cpp"]);
+        let result = plan(unity(1), &sources, out.path()).unwrap();
+        let tu = &result.groups[0].tu;
+        let text = std::fs::read_to_string(tu).unwrap();
+        let includes: Vec<&str> = text.lines().filter(|l| l.starts_with("#include")).collect();
+        assert_eq!(includes.len(), 2);
+        assert!(includes[0].contains("a.cpp") && includes[1].contains("z.cpp"));
+
+        let before = modified(tu).unwrap();
+        std::thread::sleep(std::time::Duration::from_millis(20));
+        plan(unity(1), &sources, out.path()).unwrap();
+        assert_eq!(modified(tu).unwrap(), before);
+
+        std::thread::sleep(std::time::Duration::from_millis(20));
+        std::fs::write(&sources[0], "int y;\n").unwrap();
+        plan(unity(1), &sources, out.path()).unwrap();
+        assert!(
+            modified(tu).unwrap() > before,
+            "member edit must bump the unity TU"
+        );
+    }
+
+    #[test]
+    fn failure_moves_named_members_standalone_and_is_remembered() {
+        let lib = tempfile::TempDir::new().unwrap();
+        let out = tempfile::TempDir::new().unwrap();
+        let sources = library(lib.path(), &["a.cpp", "b.cpp", "c.cpp"]);
+        let first = plan(unity(1), &sources, out.path()).unwrap();
+        let group = &first.groups[0];
+        let error = format!(
+            "failed to compile {} in library demo:\n{}:3:12: error: redefinition of 'int helper'\n",
+            group.tu, sources[1]
+        );
+        assert_eq!(first.failed_group(&error).map(|g| &g.tu), Some(&group.tu));
+
+        let moved = record_failure(out.path(), group, &error).unwrap();
+        assert_eq!(moved, vec![sources[1].clone()]);
+
+        let next = plan(unity(1), &sources, out.path()).unwrap();
+        assert_eq!(next.standalone, vec![sources[1].clone()]);
+        assert_eq!(next.groups[0].members.len(), 2);
+    }
+
+    #[test]
+    fn unattributed_failure_moves_whole_group() {
+        let lib = tempfile::TempDir::new().unwrap();
+        let out = tempfile::TempDir::new().unwrap();
+        let sources = library(lib.path(), &["a.c", "b.c"]);
+        let first = plan(unity(1), &sources, out.path()).unwrap();
+        let moved = record_failure(
+            out.path(),
+            &first.groups[0],
+            "util.h:3:8: error: redefinition of 'struct Pin'",
+        )
+        .unwrap();
+        assert_eq!(moved.len(), 2);
+
+        let next = plan(unity(1), &sources, out.path()).unwrap();
+        assert!(next.groups.is_empty());
+        assert_eq!(next.standalone.len(), 2);
+    }
+
+    #[test]
+    fn editing_an_excluded_member_returns_it_to_unity() {
+        let lib = tempfile::TempDir::new().unwrap();
+        let out = tempfile::TempDir::new().unwrap();
+        let sources = library(lib.path(), &["a.cpp", "b.cpp", "c.cpp"]);
+        let first = plan(unity(1), &sources, out.path()).unwrap();
+        let error = format!("{}:1:5: error: redefinition of 'int x'", sources[0]);
+        record_failure(out.path(), &first.groups[0], &error).unwrap();
+        assert_eq!(
+            plan(unity(1), &sources, out.path()).unwrap().standalone,
+            vec![sources[0].clone()]
+        );
+
+        std::fs::write(&sources[0], "int a_x;\n").unwrap();
+        let fixed = plan(unity(1), &sources, out.path()).unwrap();
+        assert!(fixed.standalone.is_empty());
+        assert_eq!(fixed.groups[0].members.len(), 3);
+        assert!(load_state(out.path()).excluded.is_empty());
+    }
+
+    #[test]
+    fn transient_failures_fall_back_for_this_build_only() {
+        let lib = tempfile::TempDir::new().unwrap();
+        let out = tempfile::TempDir::new().unwrap();
+        let sources = library(lib.path(), &["a.cpp", "b.cpp"]);
+        let first = plan(unity(1), &sources, out.path()).unwrap();
+        let error = FbuildError::BuildFailed(format!(
+            "failed to compile {}:\ncc1plus: internal compiler error: Segmentation fault",
+            first.groups[0].tu
+        ));
+        let mut skip = BTreeSet::new();
+        recover("demo", &first, out.path(), error, &mut skip).unwrap();
+
+        let retry = plan_skipping(unity(1), &sources, out.path(), &skip).unwrap();
+        assert!(retry.groups.is_empty());
+        assert_eq!(retry.standalone.len(), 2);
+        let next_build = plan(unity(1), &sources, out.path()).unwrap();
+        assert_eq!(next_build.groups.len(), 1);
+    }
+}
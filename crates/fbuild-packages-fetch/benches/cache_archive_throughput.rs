@@ -0,0 +1,185 @@
+//! Criterion benchmark for `cache_archive::save` and `restore` throughput.
+//!
+//! The `synthetic` group builds a cache shaped like a CI runner's: a few
+//! toolchain slices of thousands of small headers and objects, plus
+//! multi-megabyte static libraries and downloaded archives. Its size is
+//! `FBUILD_BENCH_CACHE_MB` (default 512); set it to 4096 for the size our
+//! ESP32 CI caches reach. The bytes are pseudo-random source-like text, so
+//! zstd has real work to do. Every case runs with one worker and with one
+//! per core, and criterion reports the uncompressed MB/s of each.
+//!
+//! The `real_cache` group archives the cache at `FBUILD_BENCH_CACHE_DIR`
+//! and is skipped with a printed reason when that is unset.
+
+use std::path::Path;
+
+use criterion::{
+    BatchSize, BenchmarkId, Criterion, Throughput, black_box, criterion_group, criterion_main,
+};
+use fbuild_packages_fetch::cache_archive::{DEFAULT_ZSTD_LEVEL, SliceSelection, restore, save};
+
+const DEFAULT_CACHE_MB: u64 = 512;
+/// Share of the synthetic cache held in small files (headers, objects).
+const SMALL_FILE_PERCENT: u64 = 40;
+const SMALL_FILE_BYTES: usize = 16 * 1024;
+const LARGE_FILE_BYTES: usize = 8 * 1024 * 1024;
+/// Small files per directory, roughly an SDK component's include dir.
+const FILES_PER_DIR: usize = 100;
+
+/// `(label, workers)` pairs; `0` asks for one worker per core.
+const WORKERS: &[(&str, usize)] = &[("workers_1", 1), ("workers_all", 0)];
+
+/// Source-like filler: words from a small vocabulary picked by an LCG, so
+/// the data compresses a few times over, like headers and objects do.
+fn filler(len: usize, seed: u64) -> Vec<u8> {
+    const WORDS: &[&[u8]] = &[
+        b"#define ",
+        b"static ",
+        b"uint32_t ",
+        b"void ",
+        b"return ",
+        b"struct ",
+        b"const ",
+        b"esp_err_t ",
+        b"0x3ff4",
+        b"(",
+        b");\n",
+        b" = ",
+        b"if ",
+        b"{\n",
+        b"}\n",
+        b"REG_",
+        b"_BASE",
+        b"gpio",
+        b"_t ",
+        b"\t",
+    ];
+    let mut state = seed.wrapping_mul(6364136223846793005).wrapping_add(1);
+    let mut out = Vec::with_capacity(len + 16);
+    while out.len() < len {
+        state = state
+            .wrapping_mul(6364136223846793005)
+            .wrapping_add(1442695040888963407);
+        out.extend_from_slice(WORDS[(state >> 59) as usize % WORDS.len()]);
+        if state & 0xff < 16 {
+            out.extend_from_slice(format!("{:08x}", state >> 32).as_bytes());
+        }
+    }
+    out.truncate(len);
+    out
+}
+
+/// Write a `total_mb` cache under `root`; returns its size in bytes.
+fn build_cache(root: &Path, total_mb: u64) -> u64 {
+    let total = total_mb * 1024 * 1024;
+    let small_budget = total * SMALL_FILE_PERCENT / 100;
+    let small_count = (small_budget / SMALL_FILE_BYTES as u64) as usize;
+    let large_count = ((total - small_budget) / LARGE_FILE_BYTES as u64).max(1) as usize;
+
+    let mut written = 0u64;
+    for i in 0..small_count {
+        let slice = if i % 2 == 0 {
+            "toolchains"
+        } else {
+            "platforms"
+        };
+        let dir = root
+            .join(slice)
+            .join(format!("component_{}", i / FILES_PER_DIR));
+        std::fs::create_dir_all(&dir).unwrap();
+        let bytes = filler(SMALL_FILE_BYTES, i as u64);
+        std::fs::write(dir.join(format!("file_{i}.h")), &bytes).unwrap();
+        written += bytes.len() as u64;
+    }
+    for i in 0..large_count {
+        let slice = if i % 2 == 0 {
+            "toolchains/lib"
+        } else {
+            "archives"
+        };
+        let dir = root.join(slice);
+        std::fs::create_dir_all(&dir).unwrap();
+        let bytes = filler(LARGE_FILE_BYTES, 1 << 32 | i as u64);
+        std::fs::write(dir.join(format!("lib_{i}.a")), &bytes).unwrap();
+        written += bytes.len() as u64;
+    }
+    std::fs::write(root.join("index.sqlite"), filler(64 * 1024, 7)).unwrap();
+    written + 64 * 1024
+}
+
+/// Save and restore `cache` once per worker setting under `group_name`.
+fn bench_cache(c: &mut Criterion, group_name: &str, cache: &Path, total: u64) {
+    let scratch = tempfile::TempDir::new().unwrap();
+    let archive = scratch.path().join("cache.tar.zst");
+
+    let mut group = c.benchmark_group(group_name);
+    group.throughput(Throughput::BytesDecimal(total));
+    group.sample_size(10);
+    for &(name, workers) in WORKERS {
+        group.bench_function(BenchmarkId::new("save", name), |b| {
+            b.iter(|| {
+                black_box(
+                    save(
+                        cache,
+                        &archive,
+                        &SliceSelection::Default,
+                        &[],
+                        DEFAULT_ZSTD_LEVEL,
+                        workers,
+                        None,
+                    )
+                    .unwrap(),
+                )
+            });
+        });
+    }
+    let on_disk = std::fs::metadata(&archive).map_or(0, |m| m.len());
+    eprintln!(
+        "{group_name}: {:.1} MB -> {:.1} MB archive",
+        total as f64 / 1e6,
+        on_disk as f64 / 1e6
+    );
+    for &(name, workers) in WORKERS {
+        group.bench_function(BenchmarkId::new("restore", name), |b| {
+            b.iter_batched(
+                || tempfile::TempDir::new_in(scratch.path()).unwrap(),
+                |dst| {
+                    black_box(restore(&archive, dst.path(), workers).unwrap());
+                    // Returned so the tree is deleted outside the timing.
+                    dst
+                },
+                BatchSize::PerIteration,
+            );
+        });
+    }
+    group.finish();
+}
+
+fn bench_synthetic(c: &mut Criterion) {
+    let total_mb = std::env::var("FBUILD_BENCH_CACHE_MB")
+        .ok()
+        .and_then(|v| v.parse().ok())
+        .unwrap_or(DEFAULT_CACHE_MB);
+    let tmp = tempfile::TempDir::new().unwrap();
+    let total = build_cache(tmp.path(), total_mb);
+    bench_cache(c, "synthetic", tmp.path(), total);
+}
+
+fn bench_real_cache(c: &mut Criterion) {
+    let Some(dir) = std::env::var_os("FBUILD_BENCH_CACHE_DIR") else {
+        eprintln!("real_cache: skipped — set FBUILD_BENCH_CACHE_DIR to an fbuild cache root");
+        return;
+    };
+    let cache = Path::new(&dir);
+    let total = walkdir::WalkDir::new(cache)
+        .into_iter()
+        .flatten()
+        .filter(|e| e.file_type().is_file())
+        .filter_map(|e| e.metadata().ok())
+        .map(|m| m.len())
+        .sum();
+    bench_cache(c, "real_cache", cache, total);
+}
+
+criterion_group!(benches, bench_synthetic, bench_real_cache);
+criterion_main!(benches);
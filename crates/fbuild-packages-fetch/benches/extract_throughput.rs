@@ -0,0 +1,176 @@
+//! Criterion benchmark for `extractor::extract_with_workers` on
+//! toolchain-shaped archives.
+//!
+//! The `synthetic` group builds a tarball of `FBUILD_BENCH_EXTRACT_FILES`
+//! files (default 50 000) shaped like an unpacked GCC toolchain: mostly
+//! small headers and sources spread over component directories, some
+//! objects, and a few multi-megabyte static libraries, all with
+//! source-like text so the decompressors have real work to do. It is
+//! written as `.tar.gz` and `.tar.zst`, and each is extracted on the calling
+//! thread and with one writer per core; criterion reports the uncompressed
+//! MB/s of each.
+//!
+//! The `real_archive` group extracts the archive at `FBUILD_BENCH_ARCHIVE`
+//! (any format `extract` takes) and is skipped with a printed reason when
+//! that is unset.
+
+use std::io::Write;
+use std::path::Path;
+
+use criterion::{BatchSize, BenchmarkId, Criterion, Throughput, criterion_group, criterion_main};
+use fbuild_packages_fetch::extractor::extract_with_workers;
+
+const DEFAULT_FILES: usize = 50_000;
+/// Files per directory, roughly a component's include dir.
+const FILES_PER_DIR: usize = 200;
+/// One file in this many is an object, one in `LIBRARY_EVERY` a library.
+const OBJECT_EVERY: usize = 20;
+const LIBRARY_EVERY: usize = 5_000;
+const HEADER_BYTES: usize = 4 * 1024;
+const OBJECT_BYTES: usize = 64 * 1024;
+const LIBRARY_BYTES: usize = 4 * 1024 * 1024;
+
+/// `(label, workers)` pairs; `0` asks for one writer per core.
+const WORKERS: &[(&str, usize)] = &[("workers_1", 1), ("workers_all", 0)];
+
+/// Source-like filler: words from a small vocabulary picked by an LCG, so
+/// the data compresses a few times over, like headers and objects do.
+fn filler(len: usize, seed: u64) -> Vec<u8> {
+    const WORDS: &[&[u8]] = &[
+        b"#define ",
+        b"static ",
+        b"uint32_t ",
+        b"void ",
+        b"return ",
+        b"struct ",
+        b"const ",
+        b"__attribute__",
+        b"(",
+        b");\n",
+        b" = ",
+        b"{\n",
+        b"}\n",
+        b"_t ",
+        b"\t",
+        b"0x",
+    ];
+    let mut state = seed.wrapping_mul(6364136223846793005).wrapping_add(1);
+    let mut out = Vec::with_capacity(len + 16);
+    while out.len() < len {
+        state = state
+            .wrapping_mul(6364136223846793005)
+            .wrapping_add(1442695040888963407);
+        out.extend_from_slice(WORDS[(state >> 60) as usize]);
+        if state & 0xff < 16 {
+            out.extend_from_slice(format!("{:08x}", state >> 32).as_bytes());
+        }
+    }
+    out.truncate(len);
+    out
+}
+
+/// Write the synthetic tarball into `out`; returns its uncompressed
+/// payload size in bytes.
+fn build_tarball<W: Write>(out: W, files: usize) -> u64 {
+    let mut builder = tar::Builder::new(out);
+    let mut total = 0u64;
+    for i in 0..files {
+        let dir = format!("toolchain/component_{}", i / FILES_PER_DIR);
+        let (path, len) = if i % LIBRARY_EVERY == LIBRARY_EVERY - 1 {
+            (format!("{dir}/lib_{i}.a"), LIBRARY_BYTES)
+        } else if i % OBJECT_EVERY == OBJECT_EVERY - 1 {
+            (format!("{dir}/obj_{i}.o"), OBJECT_BYTES)
+        } else {
+            (format!("{dir}/include/header_{i}.h"), HEADER_BYTES)
+        };
+        let bytes = filler(len, i as u64);
+        let mut header = tar::Header::new_gnu();
+        header.set_size(bytes.len() as u64);
+        header.set_mode(0o644);
+        header.set_mtime(1_700_000_000);
+        builder
+            .append_data(&mut header, &path, bytes.as_slice())
+            .unwrap();
+        total += bytes.len() as u64;
+    }
+    // The encoders write their trailers when dropped.
+    builder.into_inner().unwrap().flush().unwrap();
+    total
+}
+
+/// Extract `archive` once per worker setting under `group_name`.
+fn bench_archive(c: &mut Criterion, group_name: &str, name: &str, archive: &Path, total: u64) {
+    let scratch = tempfile::TempDir::new().unwrap();
+    let mut group = c.benchmark_group(group_name);
+    group.throughput(Throughput::BytesDecimal(total));
+    group.sample_size(10);
+    for &(label, workers) in WORKERS {
+        group.bench_function(BenchmarkId::new(name, label), |b| {
+            b.iter_batched(
+                || tempfile::TempDir::new_in(scratch.path()).unwrap(),
+                |dst| {
+                    extract_with_workers(archive, dst.path(), workers).unwrap();
+                    // Returned so the tree is deleted outside the timing.
+                    dst
+                },
+                BatchSize::PerIteration,
+            );
+        });
+    }
+    group.finish();
+}
+
+fn bench_synthetic(c: &mut Criterion) {
+    let files = std::env::var("FBUILD_BENCH_EXTRACT_FILES")
+        .ok()
+        .and_then(|v| v.parse().ok())
+        .unwrap_or(DEFAULT_FILES);
+    let tmp = tempfile::TempDir::new().unwrap();
+
+    let gz = tmp.path().join("toolchain.tar.gz");
+    let encoder = flate2::write::GzEncoder::new(
+        std::fs::File::create(&gz).unwrap(),
+        flate2::Compression::default(),
+    );
+    let total = build_tarball(encoder, files);
+
+    let zst = tmp.path().join("toolchain.tar.zst");
+    let encoder = zstd::Encoder::new(std::fs::File::create(&zst).unwrap(), 9)
+        .unwrap()
+        .auto_finish();
+    build_tarball(encoder, files);
+
+    for archive in [&gz, &zst] {
+        eprintln!(
+            "synthetic: {files} files, {:.1} MB -> {:.1} MB {}",
+            total as f64 / 1e6,
+            std::fs::metadata(archive).map_or(0, |m| m.len()) as f64 / 1e6,
+            archive.display()
+        );
+    }
+    bench_archive(c, "synthetic", "tar_gz", &gz, total);
+    bench_archive(c, "synthetic", "tar_zst", &zst, total);
+}
+
+fn bench_real_archive(c: &mut Criterion) {
+    let Some(archive) = std::env::var_os("FBUILD_BENCH_ARCHIVE") else {
+        eprintln!("real_archive: skipped — set FBUILD_BENCH_ARCHIVE to a toolchain archive");
+        return;
+    };
+    let archive = Path::new(&archive);
+    // One untimed extraction sizes the throughput.
+    let probe = tempfile::TempDir::new().unwrap();
+    extract_with_workers(archive, probe.path(), 0).unwrap();
+    let total = walkdir::WalkDir::new(probe.path())
+        .into_iter()
+        .flatten()
+        .filter(|e| e.file_type().is_file())
+        .filter_map(|e| e.metadata().ok())
+        .map(|m| m.len())
+        .sum();
+    drop(probe);
+    bench_archive(c, "real_archive", "extract", archive, total);
+}
+
+criterion_group!(benches, bench_synthetic, bench_real_archive);
+criterion_main!(benches);
@@ -76,6 +76,12 @@ impl Cache {
         self.cache_root.join("framework-libs")
     }
 
+    /// Precompiled framework headers (`build_pch = auto`), keyed by the
+    /// toolchain + flag signature they were generated with.
+    pub fn pch_artifacts_dir(&self) -> PathBuf {
+        self.cache_root.join("pch")
+    }
+
     // --- Package path resolution (stem/hash) ---
 
     /// Get the cache path for a package URL + version.
@@ -379,6 +385,7 @@ mod tests {
             cache.framework_library_artifacts_dir(),
             cache_root.join("framework-libs")
         );
+        assert_eq!(cache.pch_artifacts_dir(), cache_root.join("pch"));
         assert!(
             cache
                 .get_package_path("https://example.test/pkg.tar.gz", "1.0.0")
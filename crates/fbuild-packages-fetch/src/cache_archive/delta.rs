@@ -0,0 +1,158 @@
+//! Delta archives: `save` against a base snapshot stores only the files
+//! whose sha256 differs from the base manifest, and `restore_chain` applies
+//! the snapshot and its deltas in order.
+//!
+//! A delta's manifest still describes the whole cache — every slice and
+//! every file, with `from_base` set on what the base already holds — so the
+//! next delta can be saved against it, and applying it can remove the files
+//! that went away since the base. Each delta names its base by the sha256 of
+//! the base's encoded manifest, which `restore_chain` checks link by link
+//! before it writes anything.
+
+use std::collections::{HashMap, HashSet};
+use std::path::Path;
+
+use fbuild_core::{FbuildError, Result};
+
+use super::{
+    CacheManifest, DELTA_FORMAT_VERSION, DeltaBase, check_format, entry_dest, find_slice,
+    lacks_file_list, read_manifest_hashed,
+};
+
+/// The manifest of the archive a delta is saved against.
+pub(super) struct Base {
+    manifest: CacheManifest,
+    manifest_hash: String,
+}
+
+impl Base {
+    /// Read `archive`'s manifest; its payload is never touched.
+    pub(super) fn load(archive: &Path) -> Result<Self> {
+        let (manifest, manifest_hash) = read_manifest_hashed(archive)?;
+        check_format(&manifest)?;
+        if let Some(slice) = manifest.slices.iter().find(|s| lacks_file_list(s)) {
+            return Err(FbuildError::PackageError(format!(
+                "base archive {} has no per-file hashes (slice {:?}); save a full snapshot \
+                 with this fbuild and use that as the base",
+                archive.display(),
+                slice.name
+            )));
+        }
+        Ok(Self {
+            manifest,
+            manifest_hash,
+        })
+    }
+
+    /// Turn the full-snapshot `manifest` into a delta against this base:
+    /// files the base holds with the same hash are marked `from_base`, and
+    /// base slices outside the selection carry over unchanged.
+    pub(super) fn rebase(&self, manifest: &mut CacheManifest) {
+        manifest.format_version = DELTA_FORMAT_VERSION;
+        manifest.base = Some(DeltaBase {
+            manifest_hash: self.manifest_hash.clone(),
+        });
+        for info in &mut manifest.slices {
+            let Some(base) = self.manifest.slices.iter().find(|b| b.name == info.name) else {
+                continue;
+            };
+            if base.content_hash == info.content_hash {
+                info.files.iter_mut().for_each(|f| f.from_base = true);
+                continue;
+            }
+            let held: HashMap<&str, &str> = base
+                .files
+                .iter()
+                .map(|f| (f.rel.as_str(), f.sha256.as_str()))
+                .collect();
+            for file in &mut info.files {
+                file.from_base = held.get(file.rel.as_str()) == Some(&file.sha256.as_str());
+            }
+        }
+        for base in &self.manifest.slices {
+            if !manifest.slices.iter().any(|s| s.name == base.name) {
+                let mut carried = base.clone();
+                carried.files.iter_mut().for_each(|f| f.from_base = true);
+                manifest.slices.push(carried);
+            }
+        }
+    }
+}
+
+/// Read the manifests of a restore chain and check its links: the first
+/// archive is a full snapshot and every later one is a delta saved against
+/// the archive before it.
+pub(super) fn chain_manifests(archives: &[&Path]) -> Result<Vec<CacheManifest>> {
+    let mut manifests = Vec::with_capacity(archives.len());
+    let mut previous: Option<(&Path, String)> = None;
+    for &archive in archives {
+        let (manifest, manifest_hash) = read_manifest_hashed(archive)?;
+        check_format(&manifest)?;
+        match (&manifest.base, &previous) {
+            (None, None) => {}
+            (Some(base), Some((_, hash))) if base.manifest_hash == *hash => {}
+            (None, Some(_)) => {
+                return Err(FbuildError::PackageError(format!(
+                    "{} is a full snapshot; only the first archive restored may be one",
+                    archive.display()
+                )));
+            }
+            (Some(_), None) => {
+                return Err(FbuildError::PackageError(format!(
+                    "{} is a delta archive; restore it after its base: \
+                     `fbuild cache restore <base> {}`",
+                    archive.display(),
+                    archive.display()
+                )));
+            }
+            (Some(_), Some((prev, _))) => {
+                return Err(FbuildError::PackageError(format!(
+                    "{} was not saved against {}",
+                    archive.display(),
+                    prev.display()
+                )));
+            }
+        }
+        previous = Some((archive, manifest_hash));
+        manifests.push(manifest);
+    }
+    Ok(manifests)
+}
+
+/// After applying the delta `next`, remove the files `prev` listed that
+/// `next` no longer does.
+pub(super) fn remove_dropped(
+    prev: &CacheManifest,
+    next: &CacheManifest,
+    cache_dir: &Path,
+) -> Result<()> {
+    for before in &prev.slices {
+        let Some(slice) = find_slice(&before.name) else {
+            continue;
+        };
+        let kept: HashSet<&str> = next
+            .slices
+            .iter()
+            .filter(|s| s.name == before.name)
+            .flat_map(|s| s.files.iter().map(|f| f.rel.as_str()))
+            .collect();
+        for file in &before.files {
+            // Same traversal guard as the extractor's.
+            if kept.contains(file.rel.as_str()) || file.rel.contains("..") {
+                continue;
+            }
+            let dest = entry_dest(slice, &file.rel, cache_dir);
+            match std::fs::remove_file(&dest) {
+                Ok(()) => {}
+                Err(e) if e.kind() == std::io::ErrorKind::NotFound => {}
+                Err(e) => {
+                    return Err(FbuildError::PackageError(format!(
+                        "remove {}: {e}",
+                        dest.display()
+                    )));
+                }
+            }
+        }
+    }
+    Ok(())
+}
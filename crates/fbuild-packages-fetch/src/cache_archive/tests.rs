@@ -0,0 +1,537 @@
+//! Unit tests for the parent `cache_archive` module. Extracted to keep the
+//! parent file under the 1000-LOC gate (see ci.yml LOC Gate workflow).
+
+use super::*;
+
+fn write(root: &Path, rel: &str, contents: &str) {
+    let p = root.join(rel);
+    std::fs::create_dir_all(p.parent().unwrap()).unwrap();
+    std::fs::write(p, contents).unwrap();
+}
+
+fn seed_cache(cache: &Path) {
+    write(cache, "toolchains/arm/bin/gcc.txt", "GCC");
+    write(cache, "toolchains/arm/lib/libc.a", "LIBC");
+    write(cache, "platforms/lpc8xx/core.h", "CORE");
+    write(cache, "archives/arm-gcc.tar.gz", "TARBALL");
+    write(cache, "installed/marker", "OK");
+    write(cache, "index.sqlite", "SQLITE-DB");
+}
+
+#[test]
+fn round_trip_default_slices_reproduces_tree() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+
+    let saved = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        0,
+        None,
+    )
+    .unwrap();
+    assert!(
+        saved.total_files() >= 6,
+        "manifest files: {}",
+        saved.total_files()
+    );
+    assert!(archive.is_file());
+
+    // Restore into a fresh cache dir and compare byte-for-byte.
+    let dst = tempfile::tempdir().unwrap();
+    let restored = restore(&archive, dst.path(), 0).unwrap();
+    assert_eq!(restored.total_files(), saved.total_files());
+
+    for rel in [
+        "toolchains/arm/bin/gcc.txt",
+        "toolchains/arm/lib/libc.a",
+        "platforms/lpc8xx/core.h",
+        "archives/arm-gcc.tar.gz",
+        "installed/marker",
+        "index.sqlite",
+    ] {
+        assert_eq!(
+            std::fs::read(src.path().join(rel)).unwrap(),
+            std::fs::read(dst.path().join(rel)).unwrap(),
+            "mismatch restoring {rel}"
+        );
+    }
+}
+
+#[test]
+fn large_files_stream_through_save_verify_and_restore() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    // Several copy buffers plus a ragged tail.
+    let big: Vec<u8> = (0..3 * COPY_BUFFER_BYTES + 12_345)
+        .map(|i| (i % 251) as u8)
+        .collect();
+    std::fs::write(src.path().join("toolchains/arm/lib/libbig.a"), &big).unwrap();
+    let archive = src.path().join("out.tar.zst");
+
+    let saved = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        0,
+        None,
+    )
+    .unwrap();
+    assert_eq!(verify(&archive).unwrap(), saved);
+
+    let dst = tempfile::tempdir().unwrap();
+    restore(&archive, dst.path(), 0).unwrap();
+    assert_eq!(
+        std::fs::read(dst.path().join("toolchains/arm/lib/libbig.a")).unwrap(),
+        big
+    );
+}
+
+#[test]
+fn worker_counts_round_trip_identically() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    // Enough small files to keep a writer pool busy, plus entries on both
+    // sides of the pooled-write cutoff.
+    for i in 0..200 {
+        write(
+            src.path(),
+            &format!("platforms/many/f{i:03}.h"),
+            &format!("#define F{i} {i}\n"),
+        );
+    }
+    let at_cutoff = vec![7u8; POOLED_WRITE_MAX_BYTES as usize];
+    let over_cutoff = vec![9u8; POOLED_WRITE_MAX_BYTES as usize + 1];
+    std::fs::create_dir_all(src.path().join("packages")).unwrap();
+    std::fs::write(src.path().join("packages/at_cutoff.bin"), &at_cutoff).unwrap();
+    std::fs::write(src.path().join("packages/over_cutoff.bin"), &over_cutoff).unwrap();
+
+    for workers in [1, 4] {
+        let archive = src.path().join(format!("out-{workers}.tar.zst"));
+        let saved = save(
+            src.path(),
+            &archive,
+            &SliceSelection::Default,
+            &[],
+            DEFAULT_ZSTD_LEVEL,
+            workers,
+            None,
+        )
+        .unwrap();
+        assert_eq!(verify(&archive).unwrap(), saved, "workers={workers}");
+
+        let dst = tempfile::tempdir().unwrap();
+        let restored = restore(&archive, dst.path(), workers).unwrap();
+        assert_eq!(restored, saved);
+        for i in 0..200 {
+            let rel = format!("platforms/many/f{i:03}.h");
+            assert_eq!(
+                std::fs::read(dst.path().join(&rel)).unwrap(),
+                format!("#define F{i} {i}\n").into_bytes(),
+                "workers={workers} {rel}"
+            );
+        }
+        assert_eq!(
+            std::fs::read(dst.path().join("packages/at_cutoff.bin")).unwrap(),
+            at_cutoff
+        );
+        assert_eq!(
+            std::fs::read(dst.path().join("packages/over_cutoff.bin")).unwrap(),
+            over_cutoff
+        );
+    }
+}
+
+#[test]
+fn pooled_restore_reports_write_failures() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+    save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        2,
+        None,
+    )
+    .unwrap();
+
+    // A regular file where the `toolchains` directory should go makes every
+    // write under it fail.
+    let dst = tempfile::tempdir().unwrap();
+    std::fs::write(dst.path().join("toolchains"), "not a dir").unwrap();
+    let err = restore(&archive, dst.path(), 4).unwrap_err();
+    assert!(err.to_string().contains("toolchains"), "{err}");
+}
+
+#[test]
+fn pooled_restore_stops_when_every_writer_fails() {
+    let src = tempfile::tempdir().unwrap();
+    // Far more pooled entries than the queue holds, all under one slice.
+    for i in 0..(4 * WRITE_QUEUE_PER_WORKER * 8) {
+        write(src.path(), &format!("toolchains/many/f{i:04}.h"), "x");
+    }
+    let archive = src.path().join("out.tar.zst");
+    save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        2,
+        None,
+    )
+    .unwrap();
+
+    let dst = tempfile::tempdir().unwrap();
+    std::fs::write(dst.path().join("toolchains"), "not a dir").unwrap();
+    let err = restore(&archive, dst.path(), 2).unwrap_err();
+    assert!(err.to_string().contains("toolchains"), "{err}");
+}
+
+/// `fbuild cache restore` runs inside the CLI's runtime; the writer pool
+/// must not use tokio's blocking channel calls on a runtime thread.
+#[tokio::test]
+async fn pooled_restore_chain_runs_inside_a_tokio_runtime() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+    let saved = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        2,
+        None,
+    )
+    .unwrap();
+
+    let dst = tempfile::tempdir().unwrap();
+    let restored = restore_chain(&[&archive], dst.path(), 4).unwrap();
+    assert_eq!(restored, saved);
+    assert_eq!(
+        std::fs::read(dst.path().join("platforms/lpc8xx/core.h")).unwrap(),
+        b"CORE"
+    );
+}
+
+#[test]
+fn manifest_is_first_entry_and_hash_covers_relpath_len_bytes() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+    let saved = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Explicit(vec!["toolchains".into()]),
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        0,
+        None,
+    )
+    .unwrap();
+
+    let mut tar = open_tar(&archive).unwrap();
+    let first = tar.entries().unwrap().next().unwrap().unwrap();
+    assert_eq!(first.path().unwrap().to_string_lossy(), MANIFEST_ENTRY);
+
+    // The slice hash format is part of the archive contract: sorted
+    // `(len relpath, relpath, len bytes, bytes)` records.
+    let mut expected = Sha256::new();
+    for (rel, bytes) in [("arm/bin/gcc.txt", "GCC"), ("arm/lib/libc.a", "LIBC")] {
+        expected.update((rel.len() as u64).to_le_bytes());
+        expected.update(rel.as_bytes());
+        expected.update((bytes.len() as u64).to_le_bytes());
+        expected.update(bytes.as_bytes());
+    }
+    assert_eq!(
+        saved.slices[0].content_hash,
+        format!("{:x}", expected.finalize())
+    );
+}
+
+#[test]
+fn verify_passes_for_clean_archive_and_reads_manifest() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+    save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        0,
+        None,
+    )
+    .unwrap();
+
+    let m = verify(&archive).unwrap();
+    assert_eq!(m.format_version, FORMAT_VERSION);
+    // list == read_manifest yields the same slices.
+    let m2 = read_manifest(&archive).unwrap();
+    assert_eq!(m, m2);
+    assert!(
+        m.slices
+            .iter()
+            .any(|s| s.name == "toolchains" && s.file_count == 2)
+    );
+    assert!(
+        m.slices
+            .iter()
+            .any(|s| s.name == "index" && s.file_count == 1)
+    );
+}
+
+#[test]
+fn include_exclude_selects_slices() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+    let saved = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Explicit(vec!["toolchains".into(), "archives".into()]),
+        &["archives".into()],
+        DEFAULT_ZSTD_LEVEL,
+        0,
+        None,
+    )
+    .unwrap();
+    let names: Vec<_> = saved.slices.iter().map(|s| s.name.as_str()).collect();
+    assert_eq!(
+        names,
+        vec!["toolchains"],
+        "only toolchains survives include−exclude"
+    );
+}
+
+#[test]
+fn unknown_slice_name_is_an_error() {
+    let src = tempfile::tempdir().unwrap();
+    let archive = src.path().join("out.tar.zst");
+    let err = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Explicit(vec!["not_a_slice".into()]),
+        &[],
+        DEFAULT_ZSTD_LEVEL,
+        0,
+        None,
+    )
+    .unwrap_err();
+    assert!(format!("{err}").contains("unknown cache slice"));
+}
+
+#[test]
+fn verify_detects_corruption() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+    let m = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        3,
+        0,
+        None,
+    )
+    .unwrap();
+
+    // Tamper: re-save with a mutated file but splice the OLD manifest back
+    // in is complex; instead assert verify() passes here and corruption is
+    // caught by the hash mismatch path via a hand-built bad manifest.
+    let bad = CacheManifest {
+        slices: m
+            .slices
+            .iter()
+            .map(|s| SliceInfo {
+                content_hash: "deadbeef".into(),
+                ..s.clone()
+            })
+            .collect(),
+        ..m.clone()
+    };
+    // A manifest whose hashes don't match the payload must fail verify.
+    // Re-pack with the bad manifest by writing a fresh archive.
+    let archive2 = src.path().join("bad.tar.zst");
+    write_archive_with_manifest(src.path(), &archive2, &bad);
+    let err = verify(&archive2).unwrap_err();
+    assert!(
+        format!("{err}").contains("failed verification"),
+        "got: {err}"
+    );
+}
+
+#[test]
+fn verify_checks_each_stored_file_against_its_manifest_hash() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let archive = src.path().join("out.tar.zst");
+    let mut bad = save(
+        src.path(),
+        &archive,
+        &SliceSelection::Default,
+        &[],
+        3,
+        0,
+        None,
+    )
+    .unwrap();
+    // Slice hashes stay right; only one file's recorded hash is wrong.
+    bad.slices[0].files[0].sha256 = "deadbeef".into();
+
+    let archive2 = src.path().join("bad.tar.zst");
+    write_archive_with_manifest(src.path(), &archive2, &bad);
+    let err = verify(&archive2).unwrap_err().to_string();
+    assert!(
+        err.contains("toolchains/arm/bin/gcc.txt") && err.contains("failed verification"),
+        "got: {err}"
+    );
+}
+
+/// Save a delta of `cache` against `base` into `out`.
+fn save_delta(cache: &Path, out: &Path, base: &Path, selection: &SliceSelection) -> CacheManifest {
+    save(cache, out, selection, &[], 3, 0, Some(base)).unwrap()
+}
+
+#[test]
+fn delta_stores_only_changed_files_and_chain_restores_the_tree() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let out = tempfile::tempdir().unwrap();
+    let base = out.path().join("base.tar.zst");
+    let full = save(src.path(), &base, &SliceSelection::Default, &[], 3, 0, None).unwrap();
+    assert_eq!(
+        full.stored_totals(),
+        (full.total_files(), full.total_bytes())
+    );
+
+    // One edit, one new file, one removal, all in `toolchains`.
+    write(src.path(), "toolchains/arm/bin/gcc.txt", "GCC v2");
+    write(src.path(), "toolchains/arm/bin/g++.txt", "G++");
+    std::fs::remove_file(src.path().join("toolchains/arm/lib/libc.a")).unwrap();
+    let delta = out.path().join("delta.tar.zst");
+    let m = save_delta(src.path(), &delta, &base, &SliceSelection::Default);
+    assert_eq!(m.format_version, DELTA_FORMAT_VERSION);
+    assert!(m.base.is_some());
+    assert_eq!(m.stored_totals(), (2, "GCC v2".len() as u64 + 3));
+    assert_eq!(verify(&delta).unwrap(), m);
+    let archives = m.slices.iter().find(|s| s.name == "archives").unwrap();
+    assert!(archives.files.iter().all(|f| f.from_base));
+
+    // A second delta over the first that saves only `platforms`; the other
+    // slices carry over from its base.
+    write(src.path(), "platforms/lpc8xx/core.h", "CORE v2");
+    let delta2 = out.path().join("delta2.tar.zst");
+    let m2 = save_delta(
+        src.path(),
+        &delta2,
+        &delta,
+        &SliceSelection::Explicit(vec!["platforms".into()]),
+    );
+    assert_eq!(m2.stored_totals(), (1, "CORE v2".len() as u64));
+    assert_eq!(m2.slices.len(), m.slices.len());
+    assert_eq!(m2.total_files(), m.total_files());
+
+    // A delta alone is refused.
+    let err = restore(&delta, out.path().join("alone").as_path(), 0).unwrap_err();
+    assert!(err.to_string().contains("delta archive"), "{err}");
+
+    let dst = tempfile::tempdir().unwrap();
+    let restored = restore_chain(&[&base, &delta, &delta2], dst.path(), 2).unwrap();
+    assert_eq!(restored, m2);
+    for rel in [
+        "toolchains/arm/bin/gcc.txt",
+        "toolchains/arm/bin/g++.txt",
+        "platforms/lpc8xx/core.h",
+        "archives/arm-gcc.tar.gz",
+        "installed/marker",
+        "index.sqlite",
+    ] {
+        assert_eq!(
+            std::fs::read(src.path().join(rel)).unwrap(),
+            std::fs::read(dst.path().join(rel)).unwrap(),
+            "mismatch restoring {rel}"
+        );
+    }
+    assert!(!dst.path().join("toolchains/arm/lib/libc.a").exists());
+}
+
+#[test]
+fn restore_chain_rejects_a_delta_saved_against_another_base() {
+    let src = tempfile::tempdir().unwrap();
+    seed_cache(src.path());
+    let out = tempfile::tempdir().unwrap();
+    let base_a = out.path().join("a.tar.zst");
+    save(
+        src.path(),
+        &base_a,
+        &SliceSelection::Default,
+        &[],
+        3,
+        0,
+        None,
+    )
+    .unwrap();
+    write(src.path(), "installed/marker", "CHANGED");
+    let base_b = out.path().join("b.tar.zst");
+    save(
+        src.path(),
+        &base_b,
+        &SliceSelection::Default,
+        &[],
+        3,
+        0,
+        None,
+    )
+    .unwrap();
+    write(src.path(), "installed/marker", "CHANGED AGAIN");
+    let delta = out.path().join("delta.tar.zst");
+    save_delta(src.path(), &delta, &base_a, &SliceSelection::Default);
+
+    let dst = tempfile::tempdir().unwrap();
+    let err = restore_chain(&[&base_b, &delta], dst.path(), 0).unwrap_err();
+    assert!(err.to_string().contains("was not saved against"), "{err}");
+    // Nothing is written when the chain is broken.
+    assert!(!dst.path().join("installed").exists());
+    restore_chain(&[&base_a, &delta], dst.path(), 0).unwrap();
+    assert_eq!(
+        std::fs::read(dst.path().join("installed/marker")).unwrap(),
+        b"CHANGED AGAIN"
+    );
+}
+
+/// Test helper: pack the default slices but embed a caller-supplied
+/// (possibly wrong) manifest, to exercise the verify() mismatch path.
+fn write_archive_with_manifest(cache_dir: &Path, out: &Path, manifest: &CacheManifest) {
+    let file = File::create(out).unwrap();
+    let encoder = zstd::stream::write::Encoder::new(file, 3)
+        .unwrap()
+        .auto_finish();
+    let mut tar = tar::Builder::new(encoder);
+    tar.mode(tar::HeaderMode::Deterministic);
+    append_bytes(&mut tar, MANIFEST_ENTRY, &manifest.encode_to_vec()).unwrap();
+    for slice in SLICES.iter().filter(|s| s.default) {
+        for (rel, abs) in slice_files(slice, cache_dir).unwrap() {
+            let bytes = std::fs::read(&abs).unwrap();
+            append_bytes(
+                &mut tar,
+                &archive_path(slice.name, &rel, slice.is_file),
+                &bytes,
+            )
+            .unwrap();
+        }
+    }
+    tar.finish().unwrap();
+}
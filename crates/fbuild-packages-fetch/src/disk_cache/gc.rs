@@ -5,9 +5,13 @@
 //! 2. Archive files (LRU-first, skip leased)
 //!
 //! GC stops at LOW_WATERMARK to avoid over-evicting.
+//!
+//! Evicting an installed directory also frees the pooled files that no
+//! other entry links to (see [`super::pool`]).
 
 use super::budget::CacheBudget;
 use super::index::CacheIndex;
+use super::{paths, pool};
 use std::path::{Path, PathBuf};
 
 /// Report of a GC run.
@@ -20,6 +24,8 @@ pub struct GcReport {
     pub leases_reaped: usize,
     pub orphan_files_removed: usize,
     pub orphan_rows_cleaned: usize,
+    /// Pooled files freed; their bytes are included in `installed_bytes_freed`.
+    pub pool_objects_freed: u64,
 }
 
 impl GcReport {
@@ -33,11 +39,12 @@ impl std::fmt::Display for GcReport {
         write!(
             f,
             "GC: freed {} installed ({} bytes), {} archives ({} bytes), \
-             reaped {} leases, {} orphan files, {} orphan rows",
+             {} pooled files, reaped {} leases, {} orphan files, {} orphan rows",
             self.installed_evicted,
             self.installed_bytes_freed,
             self.archives_evicted,
             self.archive_bytes_freed,
+            self.pool_objects_freed,
             self.leases_reaped,
             self.orphan_files_removed,
             self.orphan_rows_cleaned,
@@ -53,6 +60,12 @@ pub fn run_gc(index: &CacheIndex, budget: &CacheBudget) -> rusqlite::Result<GcRe
         ..Default::default()
     };
 
+    // Pooled files no entry links to any more (left behind by reinstalls)
+    // go before anything that is still in use.
+    let stale = index.take_unreferenced_pool_objects()?;
+    report.installed_bytes_freed += pool::remove_objects(index.cache_root(), &stale);
+    report.pool_objects_freed += stale.len() as u64;
+
     // Step 1: evict installed directories if over budget
     let mut installed_bytes = index.total_installed_bytes()?.max(0) as u64;
     let total_bytes = index.total_archive_bytes()?.max(0) as u64 + installed_bytes;
@@ -80,10 +93,10 @@ pub fn run_gc(index: &CacheIndex, budget: &CacheBudget) -> rusqlite::Result<GcRe
                 }
             }
 
-            index.clear_installed(entry.id)?;
-            installed_bytes = installed_bytes.saturating_sub(bytes);
+            let freed = bytes + clear_installed(index, entry.id, &mut report)?;
+            installed_bytes = installed_bytes.saturating_sub(freed);
             report.installed_evicted += 1;
-            report.installed_bytes_freed += bytes;
+            report.installed_bytes_freed += freed;
 
             // If archive was already gone, delete the now-empty row
             if entry.archive_path.is_none() {
@@ -155,7 +168,7 @@ pub fn reconcile(index: &CacheIndex) -> rusqlite::Result<GcReport> {
         if let Some(ref path) = entry.installed_path {
             let full = cache_root.join(path);
             if !full.exists() {
-                index.clear_installed(entry.id)?;
+                clear_installed(index, entry.id, &mut report)?;
                 report.orphan_rows_cleaned += 1;
             } else {
                 // Check for .install_complete sentinel
@@ -163,7 +176,7 @@ pub fn reconcile(index: &CacheIndex) -> rusqlite::Result<GcReport> {
                 if !sentinel.exists() {
                     // Partial install — remove it
                     let _ = std::fs::remove_dir_all(&full);
-                    index.clear_installed(entry.id)?;
+                    clear_installed(index, entry.id, &mut report)?;
                     report.orphan_files_removed += 1;
                 }
             }
@@ -194,9 +207,61 @@ pub fn reconcile(index: &CacheIndex) -> rusqlite::Result<GcReport> {
         remove_orphan_entries(phase_root, &known_paths, &mut report);
     }
 
+    // Phase 3: match the file pool against its index rows
+    reconcile_pool(index, &cache_root, &mut report)?;
+
     Ok(report)
 }
 
+/// Null out an entry's installed columns and free the pooled files only it
+/// linked to. Returns the pooled bytes freed.
+fn clear_installed(
+    index: &CacheIndex,
+    entry_id: i64,
+    report: &mut GcReport,
+) -> rusqlite::Result<u64> {
+    index.clear_installed(entry_id)?;
+    let released = index.release_pool_refs(entry_id)?;
+    report.pool_objects_freed += released.len() as u64;
+    Ok(pool::remove_objects(index.cache_root(), &released))
+}
+
+/// Forget pool rows whose file is gone, delete pool files with no row
+/// (crashes between linking and recording), and free objects that no
+/// entry links to.
+fn reconcile_pool(
+    index: &CacheIndex,
+    cache_root: &Path,
+    report: &mut GcReport,
+) -> rusqlite::Result<()> {
+    let keys: std::collections::HashSet<String> = index.pool_keys()?.into_iter().collect();
+    for key in &keys {
+        if !paths::pool_object_path(cache_root, key).exists() {
+            index.forget_pool_object(key)?;
+            report.orphan_rows_cleaned += 1;
+        }
+    }
+    if let Ok(files) = walkdir_sync(&paths::pool_root(cache_root)) {
+        for path in files {
+            if !path.is_file() {
+                continue;
+            }
+            let known = path
+                .file_name()
+                .and_then(|n| n.to_str())
+                .is_some_and(|n| keys.contains(n));
+            if !known {
+                let _ = std::fs::remove_file(&path);
+                report.orphan_files_removed += 1;
+            }
+        }
+    }
+    let stale = index.take_unreferenced_pool_objects()?;
+    report.installed_bytes_freed += pool::remove_objects(cache_root, &stale);
+    report.pool_objects_freed += stale.len() as u64;
+    Ok(())
+}
+
 /// Remove leaf directories (version-level) that are not tracked by the index.
 fn remove_orphan_entries(
     root: &Path,
@@ -261,6 +326,10 @@ fn walkdir_sync(root: &Path) -> std::io::Result<Vec<std::path::PathBuf>> {
                 Ok(e) => e,
                 Err(_) => continue,
             };
+            // The file pool is reconciled against its own table.
+            if entry.file_name() == paths::POOL_DIR {
+                continue;
+            }
             let path = entry.path();
             // Use symlink_metadata to avoid following symlinks
             let meta = match std::fs::symlink_metadata(&path) {
@@ -461,6 +530,84 @@ mod tests {
         assert!(remaining <= 500, "remaining {} should be <= 500", remaining);
     }
 
+    #[test]
+    fn test_gc_frees_pooled_files_with_their_last_entry() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let idx = CacheIndex::open(tmp.path()).unwrap();
+        let mut shared_key = String::new();
+        for version in ["1.0", "1.1"] {
+            let rel = format!("installed/fw/{version}");
+            let dir = tmp.path().join(&rel);
+            std::fs::create_dir_all(&dir).unwrap();
+            std::fs::write(dir.join("shared.a"), vec![b'x'; 1000]).unwrap();
+            std::fs::write(dir.join("own.h"), version.repeat(100)).unwrap();
+            let pooled = pool::pool_install(tmp.path(), &dir);
+            let entry = idx
+                .record_install(
+                    Kind::Frameworks,
+                    "https://x.com/fw",
+                    version,
+                    &rel,
+                    pooled.private_bytes as i64,
+                )
+                .unwrap();
+            idx.record_pool_refs(entry.id, &pooled.objects).unwrap();
+            shared_key = pooled
+                .objects
+                .iter()
+                .find(|o| o.1 == 1000)
+                .unwrap()
+                .0
+                .clone();
+        }
+        // The shared file counts once: 1000 + 300 + 300.
+        assert_eq!(idx.total_installed_bytes().unwrap(), 1600);
+
+        // Evicting one version frees only what it alone linked to.
+        let report = run_gc(&idx, &make_budget(10000, 1400, 100000)).unwrap();
+        assert_eq!(report.installed_evicted, 1);
+        assert_eq!(report.installed_bytes_freed, 300);
+        assert_eq!(report.pool_objects_freed, 1);
+        assert!(paths::pool_object_path(tmp.path(), &shared_key).exists());
+
+        // The last reference takes the shared object with it.
+        let report = run_gc(&idx, &make_budget(0, 0, 0)).unwrap();
+        assert_eq!(report.installed_evicted, 1);
+        assert_eq!(report.installed_bytes_freed, 1300);
+        assert_eq!(report.pool_objects_freed, 2);
+        assert!(!paths::pool_object_path(tmp.path(), &shared_key).exists());
+        assert_eq!(idx.total_installed_bytes().unwrap(), 0);
+    }
+
+    #[test]
+    fn test_reconcile_matches_pool_against_index() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let idx = CacheIndex::open(tmp.path()).unwrap();
+        let rel = "installed/pkg/1.0";
+        let dir = tmp.path().join(rel);
+        std::fs::create_dir_all(&dir).unwrap();
+        std::fs::write(dir.join("a.txt"), b"alpha").unwrap();
+        std::fs::write(paths::install_complete_sentinel(&dir), b"").unwrap();
+        let pooled = pool::pool_install(tmp.path(), &dir);
+        let entry = idx
+            .record_install(Kind::Packages, "https://x.com/pkg", "1.0", rel, 0)
+            .unwrap();
+        idx.record_pool_refs(entry.id, &pooled.objects).unwrap();
+
+        // A pool file the index never heard of, e.g. from a crash.
+        let stray = paths::pool_object_path(tmp.path(), "ffff-644");
+        std::fs::create_dir_all(stray.parent().unwrap()).unwrap();
+        std::fs::write(&stray, b"stray").unwrap();
+
+        let report = reconcile(&idx).unwrap();
+        assert_eq!(report.orphan_files_removed, 1);
+        assert!(!stray.exists());
+        // The recorded install and its pooled file survive.
+        assert!(dir.exists());
+        assert!(paths::pool_object_path(tmp.path(), &pooled.objects[0].0).exists());
+        assert_eq!(idx.total_pool_bytes().unwrap(), 5);
+    }
+
     #[test]
     fn test_reconcile_removes_partial_dirs() {
         let tmp = tempfile::TempDir::new().unwrap();
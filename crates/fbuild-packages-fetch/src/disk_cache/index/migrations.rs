@@ -24,6 +24,8 @@ pub(super) struct Migration {
 ///   Older databases (pre-#119) had a `leases` table without this column,
 ///   which broke `pin()`/`unpin()`. New databases already get it from
 ///   `m001`, so this migration only mutates old caches.
+/// - `m003_pool_objects` — the content-addressed file pool: one row per
+///   pooled object and one per (entry, object) reference.
 pub(super) const MIGRATIONS: &[Migration] = &[
     Migration {
         id: "m001_initial_schema",
@@ -33,6 +35,10 @@ pub(super) const MIGRATIONS: &[Migration] = &[
         id: "m002_add_leases_refcount",
         up: migrate_m002_add_leases_refcount,
     },
+    Migration {
+        id: "m003_pool_objects",
+        up: migrate_m003_pool_objects,
+    },
 ];
 
 /// m001 — original schema. Creates `cache_meta`, `entries`, the LRU
@@ -102,6 +108,29 @@ fn migrate_m002_add_leases_refcount(conn: &Connection) -> rusqlite::Result<()> {
     Ok(())
 }
 
+/// m003 — tables for the installed-file pool (see `disk_cache::pool`).
+///
+/// `pool_objects` holds each unique file once with its size; `pool_refs`
+/// records which installed entries link to it. An object's refcount is its
+/// number of `pool_refs` rows, which cascade away with their entry.
+fn migrate_m003_pool_objects(conn: &Connection) -> rusqlite::Result<()> {
+    conn.execute_batch(
+        "CREATE TABLE IF NOT EXISTS pool_objects (
+            key   TEXT PRIMARY KEY,
+            bytes INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS pool_refs (
+            entry_id INTEGER NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+            key      TEXT NOT NULL,
+            PRIMARY KEY(entry_id, key)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_pool_refs_key ON pool_refs(key);",
+    )?;
+    Ok(())
+}
+
 /// Returns true iff the `leases` table has a column named `refcount`.
 /// Used by migrations to decide whether an `ALTER TABLE` is needed.
 pub(super) fn leases_has_refcount(conn: &Connection) -> rusqlite::Result<bool> {
@@ -25,6 +25,8 @@
 //!   `open`/`migrate`/`schema_version` lifecycle.
 //! - `queries.rs` — `impl CacheIndex` block with all lookup / mutation /
 //!   lease / LRU / reconciliation methods.
+//! - `pool.rs` — `impl CacheIndex` block for the installed-file pool's
+//!   objects and per-entry references.
 //! - `migrations.rs` — append-only migration list and helpers.
 //! - `pid.rs` — platform-specific PID liveness check.
 //! - `tests.rs` — the index test suite (gated by `#[cfg(test)]`).
@@ -40,6 +42,7 @@ use std::time::{SystemTime, UNIX_EPOCH};
 
 mod migrations;
 mod pid;
+mod pool;
 mod queries;
 
 #[cfg(test)]
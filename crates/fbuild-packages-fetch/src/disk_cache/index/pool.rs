@@ -0,0 +1,135 @@
+//! Bookkeeping for the installed-file pool on [`CacheIndex`].
+//!
+//! `pool_objects` lists every file held in the pool once, with its size;
+//! `pool_refs` records which installed entries link to each object. An
+//! object whose last reference goes away is handed back to the caller to
+//! delete from disk, so its bytes leave the accounting with it.
+
+use rusqlite::{OptionalExtension, params};
+
+use super::CacheIndex;
+
+impl CacheIndex {
+    /// Record that `entry_id`'s installed directory links to `objects`
+    /// (`(key, bytes)` pairs), replacing any references a previous install
+    /// of the same entry left behind.
+    pub fn record_pool_refs(
+        &self,
+        entry_id: i64,
+        objects: &[(String, i64)],
+    ) -> rusqlite::Result<()> {
+        let mut conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        let tx = conn.transaction()?;
+        tx.execute(
+            "DELETE FROM pool_refs WHERE entry_id = ?1",
+            params![entry_id],
+        )?;
+        {
+            let mut object = tx.prepare(
+                "INSERT INTO pool_objects (key, bytes) VALUES (?1, ?2)
+                 ON CONFLICT(key) DO NOTHING",
+            )?;
+            let mut reference =
+                tx.prepare("INSERT OR IGNORE INTO pool_refs (entry_id, key) VALUES (?1, ?2)")?;
+            for (key, bytes) in objects {
+                object.execute(params![key, bytes])?;
+                reference.execute(params![entry_id, key])?;
+            }
+        }
+        tx.commit()
+    }
+
+    /// Drop `entry_id`'s pool references and return the objects no other
+    /// entry still links to. Their rows are deleted here; the caller
+    /// removes the files.
+    pub fn release_pool_refs(&self, entry_id: i64) -> rusqlite::Result<Vec<(String, i64)>> {
+        let mut conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        let tx = conn.transaction()?;
+        let keys: Vec<String> = {
+            let mut stmt = tx.prepare("SELECT key FROM pool_refs WHERE entry_id = ?1")?;
+            let keys = stmt
+                .query_map(params![entry_id], |row| row.get(0))?
+                .collect::<Result<_, _>>()?;
+            keys
+        };
+        tx.execute(
+            "DELETE FROM pool_refs WHERE entry_id = ?1",
+            params![entry_id],
+        )?;
+        let mut released = Vec::new();
+        {
+            let mut unreferenced = tx.prepare(
+                "SELECT bytes FROM pool_objects
+                 WHERE key = ?1 AND NOT EXISTS (SELECT 1 FROM pool_refs WHERE key = ?1)",
+            )?;
+            let mut delete = tx.prepare("DELETE FROM pool_objects WHERE key = ?1")?;
+            for key in keys {
+                let bytes: Option<i64> = unreferenced
+                    .query_row(params![key], |row| row.get(0))
+                    .optional()?;
+                if let Some(bytes) = bytes {
+                    delete.execute(params![key])?;
+                    released.push((key, bytes));
+                }
+            }
+        }
+        tx.commit()?;
+        Ok(released)
+    }
+
+    /// Delete and return every object no entry links to — left behind by
+    /// reinstalls, or by a crash between releasing references and removing
+    /// the files.
+    pub fn take_unreferenced_pool_objects(&self) -> rusqlite::Result<Vec<(String, i64)>> {
+        let mut conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        let tx = conn.transaction()?;
+        let released: Vec<(String, i64)> = {
+            let mut stmt = tx.prepare(
+                "SELECT key, bytes FROM pool_objects o
+                 WHERE NOT EXISTS (SELECT 1 FROM pool_refs r WHERE r.key = o.key)",
+            )?;
+            let released = stmt
+                .query_map([], |row| Ok((row.get(0)?, row.get(1)?)))?
+                .collect::<Result<_, _>>()?;
+            released
+        };
+        tx.execute(
+            "DELETE FROM pool_objects
+             WHERE NOT EXISTS (SELECT 1 FROM pool_refs r WHERE r.key = pool_objects.key)",
+            [],
+        )?;
+        tx.commit()?;
+        Ok(released)
+    }
+
+    /// Keys of every pooled object (for reconciliation).
+    pub fn pool_keys(&self) -> rusqlite::Result<Vec<String>> {
+        let conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        let mut stmt = conn.prepare("SELECT key FROM pool_objects")?;
+        let keys = stmt
+            .query_map([], |row| row.get(0))?
+            .collect::<Result<Vec<_>, _>>()?;
+        Ok(keys)
+    }
+
+    /// Forget a pooled object whose file is gone, along with every
+    /// reference to it. The entries' own links still hold the bytes, now
+    /// unaccounted, until they are evicted or reinstalled.
+    pub fn forget_pool_object(&self, key: &str) -> rusqlite::Result<()> {
+        let mut conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        let tx = conn.transaction()?;
+        tx.execute("DELETE FROM pool_refs WHERE key = ?1", params![key])?;
+        tx.execute("DELETE FROM pool_objects WHERE key = ?1", params![key])?;
+        tx.commit()
+    }
+
+    /// Bytes held by the pool, each object counted once.
+    pub fn total_pool_bytes(&self) -> rusqlite::Result<i64> {
+        let conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        conn.query_row(
+            "SELECT COALESCE(SUM(bytes), 0) FROM pool_objects",
+            [],
+            |row| row.get::<_, i64>(0),
+        )
+    }
+}
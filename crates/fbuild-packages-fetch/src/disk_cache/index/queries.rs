@@ -85,6 +85,30 @@ impl CacheIndex {
         version: &str,
         installed_path: &str,
         installed_bytes: i64,
+    ) -> rusqlite::Result<CacheEntry> {
+        self.upsert_install(kind, url, version, installed_path, Some(installed_bytes))
+    }
+
+    /// Record an install whose size is not known yet. `installed_bytes`
+    /// stays NULL until [`Self::set_installed_bytes`] fills it in; see
+    /// [`Self::unsized_installed_entries`].
+    pub fn record_unsized_install(
+        &self,
+        kind: Kind,
+        url: &str,
+        version: &str,
+        installed_path: &str,
+    ) -> rusqlite::Result<CacheEntry> {
+        self.upsert_install(kind, url, version, installed_path, None)
+    }
+
+    fn upsert_install(
+        &self,
+        kind: Kind,
+        url: &str,
+        version: &str,
+        installed_path: &str,
+        installed_bytes: Option<i64>,
     ) -> rusqlite::Result<CacheEntry> {
         let (stem, hash) = paths::stem_and_hash(url);
         let now = Self::now_epoch();
@@ -117,6 +141,36 @@ impl CacheIndex {
             .map(|opt| opt.expect("entry must exist after insert"))
     }
 
+    /// Installed entries recorded without a size, oldest install first.
+    pub fn unsized_installed_entries(&self) -> rusqlite::Result<Vec<CacheEntry>> {
+        let conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        let mut stmt = conn.prepare(
+            "SELECT id, kind, url, stem, hash, version,
+                    archive_path, archive_bytes, archive_sha256,
+                    installed_path, installed_bytes, installed_at,
+                    archived_at, last_used_at, use_count, pinned
+             FROM entries
+             WHERE installed_path IS NOT NULL AND installed_bytes IS NULL
+             ORDER BY installed_at ASC",
+        )?;
+
+        let entries = stmt
+            .query_map([], Self::row_to_entry)?
+            .collect::<Result<Vec<_>, _>>()?;
+        Ok(entries)
+    }
+
+    /// Store a measured size for an installed entry. A no-op if the entry
+    /// was evicted while it was being measured.
+    pub fn set_installed_bytes(&self, entry_id: i64, installed_bytes: i64) -> rusqlite::Result<()> {
+        let conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
+        conn.execute(
+            "UPDATE entries SET installed_bytes = ?2 WHERE id = ?1 AND installed_path IS NOT NULL",
+            params![entry_id, installed_bytes],
+        )?;
+        Ok(())
+    }
+
     /// Bump LRU timestamp and use count for an entry.
     pub fn touch(&self, entry_id: i64) -> rusqlite::Result<()> {
         let now = Self::now_epoch();
@@ -184,11 +238,13 @@ impl CacheIndex {
         )
     }
 
-    /// Get total bytes for all installed entries.
+    /// Get total bytes for all installed entries. Pooled files count once,
+    /// however many entries link to them.
     pub fn total_installed_bytes(&self) -> rusqlite::Result<i64> {
         let conn = self.conn.lock().unwrap_or_else(|e| e.into_inner());
         conn.query_row(
-            "SELECT COALESCE(SUM(installed_bytes), 0) FROM entries WHERE installed_path IS NOT NULL",
+            "SELECT (SELECT COALESCE(SUM(installed_bytes), 0) FROM entries WHERE installed_path IS NOT NULL)
+                  + (SELECT COALESCE(SUM(bytes), 0) FROM pool_objects)",
             [],
             |row| row.get::<_, i64>(0),
         )
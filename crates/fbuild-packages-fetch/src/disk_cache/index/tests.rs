@@ -305,7 +305,11 @@ fn test_all_migrations_recorded_after_open() {
 /// production databases record them in `schema_migrations`.
 #[test]
 fn test_existing_migration_ids_remain_append_only() {
-    let expected_prefix = ["m001_initial_schema", "m002_add_leases_refcount"];
+    let expected_prefix = [
+        "m001_initial_schema",
+        "m002_add_leases_refcount",
+        "m003_pool_objects",
+    ];
     let ids: Vec<&str> = MIGRATIONS.iter().map(|m| m.id).collect();
 
     assert!(
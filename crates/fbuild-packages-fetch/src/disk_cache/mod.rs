@@ -2,6 +2,8 @@
 //!
 //! Separates downloaded archives from installed (extracted) content.
 //! GC evicts cheap-to-rehydrate installed directories before expensive archives.
+//! Installed files can optionally be shared across versions through a
+//! content-addressed [`pool`].
 //!
 //! # Usage
 //!
@@ -19,6 +21,8 @@ pub mod gc;
 pub mod index;
 pub mod lease;
 pub mod paths;
+pub mod pool;
+pub mod sizing;
 
 pub use budget::CacheBudget;
 pub use gc::GcReport;
@@ -29,7 +33,9 @@ pub use paths::Kind;
 use std::path::{Path, PathBuf};
 use std::sync::Arc;
 
-/// The public facade for the two-phase disk cache.
+/// The public facade for the two-phase disk cache. Cloning is cheap: clones
+/// share one index connection.
+#[derive(Clone)]
 pub struct DiskCache {
     index: Arc<CacheIndex>,
     cache_root: PathBuf,
@@ -108,6 +114,82 @@ impl DiskCache {
             .record_install(kind, url, version, installed_path, installed_bytes.max(0))
     }
 
+    /// Record an install whose size is not known yet; [`Self::measure_unsized`]
+    /// sizes it later.
+    pub fn record_unsized_install(
+        &self,
+        kind: Kind,
+        url: &str,
+        version: &str,
+        installed_path: &str,
+    ) -> rusqlite::Result<CacheEntry> {
+        self.index
+            .record_unsized_install(kind, url, version, installed_path)
+    }
+
+    /// Record a finished install now and size it on a blocking thread, so
+    /// the installer never walks the tree. With the [`pool`] enabled that
+    /// thread links the files into it as well. Outside a tokio runtime the
+    /// entry stays unsized until the next [`Self::measure_unsized`].
+    pub fn record_install_deferred(
+        &self,
+        kind: Kind,
+        url: &str,
+        version: &str,
+        installed_path: &str,
+    ) -> rusqlite::Result<CacheEntry> {
+        let entry = self.record_unsized_install(kind, url, version, installed_path)?;
+        let Ok(runtime) = tokio::runtime::Handle::try_current() else {
+            return Ok(entry);
+        };
+        let cache = self.clone();
+        let recorded = entry.clone();
+        let (url, version) = (url.to_string(), version.to_string());
+        runtime.spawn_blocking(move || {
+            let sized = if pool::enabled() {
+                let path = recorded.installed_path.as_deref().unwrap_or_default();
+                cache
+                    .record_pooled_install(kind, &url, &version, path)
+                    .map(|_| ())
+            } else {
+                sizing::measure_entry(&cache.index, &recorded).map(|_| ())
+            };
+            if let Err(e) = sized {
+                tracing::debug!("failed to size {} {}: {}", url, version, e);
+            }
+        });
+        Ok(entry)
+    }
+
+    /// Size every installed entry recorded without one. Returns how many
+    /// were measured.
+    pub fn measure_unsized(&self) -> rusqlite::Result<usize> {
+        sizing::measure_unsized(&self.index)
+    }
+
+    /// Record an install after linking its files into the content-addressed
+    /// [`pool`]. The entry's `installed_bytes` covers only the files left
+    /// private; pooled files are counted once across all entries.
+    pub fn record_pooled_install(
+        &self,
+        kind: Kind,
+        url: &str,
+        version: &str,
+        installed_path: &str,
+    ) -> rusqlite::Result<CacheEntry> {
+        let install_dir = self.cache_root.join(installed_path);
+        let pooled = pool::pool_install(&self.cache_root, &install_dir);
+        let entry = self.index.record_install(
+            kind,
+            url,
+            version,
+            installed_path,
+            pooled.private_bytes as i64,
+        )?;
+        self.index.record_pool_refs(entry.id, &pooled.objects)?;
+        Ok(entry)
+    }
+
     /// Acquire a lease for the given entry, preventing GC eviction.
     pub fn lease(&self, entry: &CacheEntry) -> rusqlite::Result<Lease> {
         Lease::acquire(Arc::clone(&self.index), entry.id)
@@ -120,8 +202,10 @@ impl DiskCache {
 
     /// Run a full GC pass.
     /// Recomputes budgets from current disk space so long-lived processes
-    /// don't enforce stale watermarks.
+    /// don't enforce stale watermarks, and sizes unsized installs first so
+    /// every install counts toward them.
     pub fn run_gc(&self) -> rusqlite::Result<GcReport> {
+        self.measure_unsized()?;
         let budget = CacheBudget::compute(&self.cache_root);
         gc::run_gc(&self.index, &budget)
     }
@@ -314,6 +398,81 @@ mod tests {
         assert_eq!(entry.pinned, 1);
     }
 
+    #[test]
+    fn test_pooled_installs_count_shared_files_once() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let cache = DiskCache::open_at(tmp.path()).unwrap();
+        let url = "https://example.com/framework.tar.xz";
+        for version in ["3.0.0", "3.0.1"] {
+            let rel = format!("installed/framework/{version}");
+            let dir = tmp.path().join(&rel);
+            std::fs::create_dir_all(&dir).unwrap();
+            std::fs::write(dir.join("core.h"), vec![b'h'; 4000]).unwrap();
+            std::fs::write(dir.join("version.txt"), version).unwrap();
+            cache
+                .record_pooled_install(Kind::Frameworks, url, version, &rel)
+                .unwrap();
+        }
+
+        // One copy of core.h plus each version's 5-byte version.txt.
+        let stats = cache.stats().unwrap();
+        assert_eq!(stats.installed_bytes, 4010);
+        let entry = cache
+            .lookup(Kind::Frameworks, url, "3.0.1")
+            .unwrap()
+            .unwrap();
+        assert_eq!(entry.installed_bytes, Some(0));
+    }
+
+    #[tokio::test(flavor = "multi_thread")]
+    async fn test_deferred_install_is_sized_in_the_background() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let cache = DiskCache::open_at(tmp.path()).unwrap();
+        let url = "https://example.com/toolchain.tar.zst";
+        let rel = "toolchains/gcc/12.2.0";
+        std::fs::create_dir_all(tmp.path().join(rel)).unwrap();
+        std::fs::write(tmp.path().join(rel).join("gcc"), vec![0u8; 2048]).unwrap();
+
+        let entry = cache
+            .record_install_deferred(Kind::Toolchains, url, "12.2.0", rel)
+            .unwrap();
+        assert!(entry.installed_path.is_some());
+
+        let deadline = std::time::Instant::now() + std::time::Duration::from_secs(10);
+        loop {
+            let entry = cache
+                .lookup(Kind::Toolchains, url, "12.2.0")
+                .unwrap()
+                .unwrap();
+            if entry.installed_bytes == Some(2048) {
+                break;
+            }
+            assert!(
+                std::time::Instant::now() < deadline,
+                "install was never sized"
+            );
+            tokio::time::sleep(std::time::Duration::from_millis(10)).await;
+        }
+    }
+
+    #[test]
+    fn test_deferred_install_outside_a_runtime_is_sized_by_gc() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let cache = DiskCache::open_at(tmp.path()).unwrap();
+        let url = "https://example.com/framework.zip";
+        let rel = "platforms/fw/1.0";
+        std::fs::create_dir_all(tmp.path().join(rel)).unwrap();
+        std::fs::write(tmp.path().join(rel).join("core.h"), vec![0u8; 512]).unwrap();
+
+        cache
+            .record_install_deferred(Kind::Platforms, url, "1.0", rel)
+            .unwrap();
+        assert_eq!(cache.stats().unwrap().installed_bytes, 0);
+
+        cache.run_gc().unwrap();
+        assert_eq!(cache.stats().unwrap().installed_bytes, 512);
+    }
+
     #[test]
     fn test_disk_cache_path_helpers() {
         let tmp = tempfile::TempDir::new().unwrap();
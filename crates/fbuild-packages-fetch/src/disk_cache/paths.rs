@@ -128,6 +128,20 @@ pub fn installed_root(cache_root: &Path) -> PathBuf {
     cache_root.join("installed")
 }
 
+/// Directory name of the installed-file pool inside the installed phase.
+pub const POOL_DIR: &str = ".pool";
+
+/// Root of the installed-file pool: `{cache_root}/installed/.pool/`
+pub fn pool_root(cache_root: &Path) -> PathBuf {
+    installed_root(cache_root).join(POOL_DIR)
+}
+
+/// Pooled object path: `{cache_root}/installed/.pool/{key[..2]}/{key}`
+pub fn pool_object_path(cache_root: &Path, key: &str) -> PathBuf {
+    let shard = key.get(..2).unwrap_or("__");
+    pool_root(cache_root).join(shard).join(key)
+}
+
 /// Path to the SQLite index: `{cache_root}/index.sqlite`
 pub fn index_path(cache_root: &Path) -> PathBuf {
     cache_root.join("index.sqlite")
@@ -200,6 +214,15 @@ mod tests {
         assert_eq!(installed_root(root), Path::new("/tmp/cache/installed"));
     }
 
+    #[test]
+    fn test_pool_object_path_shards_by_key_prefix() {
+        let root = Path::new("/tmp/cache");
+        assert_eq!(
+            pool_object_path(root, "ab12cd-644"),
+            Path::new("/tmp/cache/installed/.pool/ab/ab12cd-644")
+        );
+    }
+
     #[test]
     fn test_index_path() {
         let root = Path::new("/tmp/cache");
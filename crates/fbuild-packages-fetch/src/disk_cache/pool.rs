@@ -0,0 +1,232 @@
+//! Content-addressed pool for installed files.
+//!
+//! Consecutive versions of a framework or toolchain share most of their
+//! files, yet each installed version is a full directory. With the pool
+//! enabled (`FBUILD_CACHE_DEDUP=1`), every regular file of a freshly
+//! committed install is hashed with BLAKE3 and hard-linked to
+//! `installed/.pool/{key[..2]}/{key}`: the first install to bring a file
+//! links it into the pool, later ones replace their copy with a link to the
+//! pooled object. The index counts each object's bytes once and tracks
+//! which entries reference it, so GC frees an object when the last entry
+//! linking it is evicted.
+//!
+//! Hard links share one inode, so the key includes the permission bits, and
+//! the pool is opt-in: a tool that edits a file inside an installed package
+//! in place changes it for every version sharing that file. Files that
+//! cannot be linked (pool on another filesystem, no hard-link support) stay
+//! private to their install and are accounted as before.
+
+use std::collections::HashMap;
+use std::io;
+use std::path::Path;
+
+use super::paths;
+
+/// Environment variable that turns the pool on.
+pub const DEDUP_ENV: &str = "FBUILD_CACHE_DEDUP";
+
+/// Whether installs should be deduplicated into the pool.
+pub fn enabled() -> bool {
+    std::env::var(DEDUP_ENV)
+        .map(|v| v == "1" || v.eq_ignore_ascii_case("true"))
+        .unwrap_or(false)
+}
+
+/// What [`pool_install`] did to an installed directory.
+#[derive(Debug, Default)]
+pub struct PooledInstall {
+    /// Bytes of files left private to the install.
+    pub private_bytes: u64,
+    /// `(key, bytes)` of every pooled object the install now links to.
+    pub objects: Vec<(String, i64)>,
+}
+
+/// Link every non-empty regular file under `install_dir` into the pool
+/// under `cache_root`. Best effort: a file that cannot be pooled stays
+/// where it is and counts toward [`PooledInstall::private_bytes`].
+pub fn pool_install(cache_root: &Path, install_dir: &Path) -> PooledInstall {
+    let mut private_bytes = 0;
+    let mut objects = HashMap::new();
+    for entry in walkdir::WalkDir::new(install_dir)
+        .into_iter()
+        .filter_map(|e| e.ok())
+    {
+        // Symlinks are not followed, matching the installed-size walk.
+        if !entry.file_type().is_file() {
+            continue;
+        }
+        let Ok(metadata) = entry.metadata() else {
+            continue;
+        };
+        let len = metadata.len();
+        if len == 0 {
+            continue;
+        }
+        match pool_file(cache_root, entry.path(), &metadata) {
+            Ok(key) => {
+                objects.insert(key, len as i64);
+            }
+            Err(e) => {
+                tracing::debug!("pool: keeping {} private: {}", entry.path().display(), e);
+                private_bytes += len;
+            }
+        }
+    }
+    let mut objects: Vec<_> = objects.into_iter().collect();
+    objects.sort();
+    PooledInstall {
+        private_bytes,
+        objects,
+    }
+}
+
+/// Delete the files of objects the index has released; returns the bytes
+/// freed. A file that cannot be removed is left for `reconcile`.
+pub fn remove_objects(cache_root: &Path, objects: &[(String, i64)]) -> u64 {
+    let mut freed = 0;
+    for (key, bytes) in objects {
+        let path = paths::pool_object_path(cache_root, key);
+        match std::fs::remove_file(&path) {
+            Ok(()) => freed += (*bytes).max(0) as u64,
+            Err(e) if e.kind() == io::ErrorKind::NotFound => freed += (*bytes).max(0) as u64,
+            Err(e) => tracing::warn!("pool: failed to remove {}: {}", path.display(), e),
+        }
+    }
+    freed
+}
+
+/// Pool one file and return its key.
+fn pool_file(cache_root: &Path, path: &Path, metadata: &std::fs::Metadata) -> io::Result<String> {
+    let key = object_key(path, metadata)?;
+    let object = paths::pool_object_path(cache_root, &key);
+    if let Some(shard) = object.parent() {
+        std::fs::create_dir_all(shard)?;
+    }
+    // The first install carrying this content donates its file.
+    match std::fs::hard_link(path, &object) {
+        Ok(()) => return Ok(key),
+        Err(e) if e.kind() == io::ErrorKind::AlreadyExists => {}
+        Err(e) => return Err(e),
+    }
+    if fbuild_core::platform::fs::same_file(path, &object)? {
+        return Ok(key);
+    }
+    // Swap the copy for a link through a sibling name, so readers see
+    // either the old file or the pooled one, never a missing path.
+    let mut name = path.file_name().unwrap_or_default().to_os_string();
+    name.push(".pool-link");
+    let staged = path.with_file_name(name);
+    let _ = std::fs::remove_file(&staged);
+    std::fs::hard_link(&object, &staged)?;
+    if let Err(e) = fbuild_core::platform::fs::replace_file(&staged, path) {
+        let _ = std::fs::remove_file(&staged);
+        return Err(e);
+    }
+    Ok(key)
+}
+
+/// `{blake3 hex}-{mode octal}`: equal content with different permissions
+/// must not share an inode.
+fn object_key(path: &Path, metadata: &std::fs::Metadata) -> io::Result<String> {
+    let mut hasher = blake3::Hasher::new();
+    io::copy(&mut std::fs::File::open(path)?, &mut hasher)?;
+    Ok(format!(
+        "{}-{:o}",
+        hasher.finalize().to_hex(),
+        fbuild_core::platform::fs::mode_bits(metadata)
+    ))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn write(root: &Path, rel: &str, body: &[u8]) {
+        let path = root.join(rel);
+        std::fs::create_dir_all(path.parent().unwrap()).unwrap();
+        std::fs::write(path, body).unwrap();
+    }
+
+    #[test]
+    fn shared_files_link_to_one_object() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let v1 = tmp.path().join("fw/1.0");
+        let v2 = tmp.path().join("fw/1.1");
+        write(&v1, "include/common.h", b"shared header");
+        write(&v1, "lib/only_v1.a", b"old library");
+        write(&v2, "include/common.h", b"shared header");
+        write(&v2, "lib/only_v2.a", b"new library!");
+
+        let first = pool_install(tmp.path(), &v1);
+        let second = pool_install(tmp.path(), &v2);
+        assert_eq!(first.private_bytes, 0);
+        assert_eq!(first.objects.len(), 2);
+        assert_eq!(second.objects.len(), 2);
+
+        let same = fbuild_core::platform::fs::same_file(
+            &v1.join("include/common.h"),
+            &v2.join("include/common.h"),
+        )
+        .unwrap();
+        assert!(same, "identical files should share the pooled inode");
+        assert_eq!(
+            std::fs::read(v2.join("include/common.h")).unwrap(),
+            b"shared header"
+        );
+        let distinct = fbuild_core::platform::fs::same_file(
+            &v1.join("lib/only_v1.a"),
+            &v2.join("lib/only_v2.a"),
+        )
+        .unwrap();
+        assert!(!distinct);
+    }
+
+    #[test]
+    fn pooling_twice_is_a_no_op() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let dir = tmp.path().join("pkg/1.0");
+        write(&dir, "a.txt", b"alpha");
+        write(&dir, "copy/a.txt", b"alpha");
+        write(&dir, ".install_complete", b"");
+
+        let first = pool_install(tmp.path(), &dir);
+        let again = pool_install(tmp.path(), &dir);
+        // Duplicate content inside one install is a single object, and the
+        // empty sentinel is never pooled.
+        assert_eq!(first.objects.len(), 1);
+        assert_eq!(first.objects, again.objects);
+        assert!(!dir.join("a.txt.pool-link").exists());
+    }
+
+    #[test]
+    fn remove_objects_deletes_pool_files() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let dir = tmp.path().join("pkg/1.0");
+        write(&dir, "a.txt", b"alpha");
+        let pooled = pool_install(tmp.path(), &dir);
+        let (key, _) = &pooled.objects[0];
+        assert!(paths::pool_object_path(tmp.path(), key).exists());
+
+        assert_eq!(remove_objects(tmp.path(), &pooled.objects), 5);
+        assert!(!paths::pool_object_path(tmp.path(), key).exists());
+        // The install keeps its own link to the content.
+        assert_eq!(std::fs::read(dir.join("a.txt")).unwrap(), b"alpha");
+    }
+
+    #[cfg(unix)]
+    #[test]
+    fn permission_bits_are_part_of_the_key() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let v1 = tmp.path().join("tool/1.0");
+        let v2 = tmp.path().join("tool/1.1");
+        write(&v1, "bin/run", b"#!/bin/sh\n");
+        write(&v2, "bin/run", b"#!/bin/sh\n");
+        fbuild_core::platform::fs::set_mode_bits(&v2.join("bin/run"), 0o755).unwrap();
+
+        pool_install(tmp.path(), &v1);
+        pool_install(tmp.path(), &v2);
+        let same =
+            fbuild_core::platform::fs::same_file(&v1.join("bin/run"), &v2.join("bin/run")).unwrap();
+        assert!(!same);
+    }
+}
@@ -0,0 +1,129 @@
+//! Installed-size accounting kept off the install path.
+//!
+//! Sizing an installed toolchain means walking every file it unpacked,
+//! about as many syscalls as the extraction itself. Installs are therefore
+//! recorded unsized (`installed_bytes` NULL) and measured once, in the
+//! background: by a blocking task right after the install (see
+//! [`super::DiskCache::record_install_deferred`]), and by
+//! [`measure_unsized`] before each GC pass and after the daemon's startup
+//! reconcile for anything that task missed. Stats and GC then read sizes
+//! from the index: O(rows), never O(files).
+
+use std::path::Path;
+
+use super::index::{CacheEntry, CacheIndex};
+
+/// Total bytes of the files under `path`.
+///
+/// Symlink-safe: uses `symlink_metadata` and skips symlinks to avoid
+/// infinite recursion. Tolerates permission errors by treating
+/// inaccessible entries as zero-size.
+pub fn tree_bytes(path: &Path) -> u64 {
+    let Ok(entries) = std::fs::read_dir(path) else {
+        return 0;
+    };
+    entries
+        .filter_map(|e| e.ok())
+        .filter_map(|e| {
+            let meta = std::fs::symlink_metadata(e.path()).ok()?;
+            if meta.is_symlink() {
+                None // skip symlinks to avoid cycles
+            } else if meta.is_dir() {
+                Some(tree_bytes(&e.path()))
+            } else {
+                Some(meta.len())
+            }
+        })
+        .sum()
+}
+
+/// Measure every installed entry the index holds no size for. Returns how
+/// many were measured; entries whose directory is gone are left for
+/// `reconcile`.
+pub fn measure_unsized(index: &CacheIndex) -> rusqlite::Result<usize> {
+    let mut measured = 0;
+    for entry in index.unsized_installed_entries()? {
+        if measure_entry(index, &entry)? {
+            measured += 1;
+        }
+    }
+    Ok(measured)
+}
+
+/// Walk one entry's installed directory and store its size.
+pub(super) fn measure_entry(index: &CacheIndex, entry: &CacheEntry) -> rusqlite::Result<bool> {
+    let Some(ref path) = entry.installed_path else {
+        return Ok(false);
+    };
+    let dir = index.cache_root().join(path);
+    if !dir.is_dir() {
+        return Ok(false);
+    }
+    index.set_installed_bytes(entry.id, tree_bytes(&dir) as i64)?;
+    Ok(true)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::super::paths::Kind;
+    use super::*;
+
+    #[test]
+    fn test_measure_unsized_fills_missing_sizes_only() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let idx = CacheIndex::open(tmp.path()).unwrap();
+        let dir = tmp.path().join("toolchains/gcc/1.0");
+        std::fs::create_dir_all(dir.join("bin")).unwrap();
+        std::fs::write(dir.join("bin/gcc"), vec![0u8; 700]).unwrap();
+        std::fs::write(dir.join("README"), vec![0u8; 50]).unwrap();
+
+        idx.record_unsized_install(
+            Kind::Toolchains,
+            "https://x.com/gcc",
+            "1.0",
+            "toolchains/gcc/1.0",
+        )
+        .unwrap();
+        idx.record_install(
+            Kind::Toolchains,
+            "https://x.com/ld",
+            "1.0",
+            "toolchains/ld/1.0",
+            99,
+        )
+        .unwrap();
+        // Recorded, but its directory is already gone.
+        idx.record_unsized_install(
+            Kind::Toolchains,
+            "https://x.com/as",
+            "1.0",
+            "toolchains/as/1.0",
+        )
+        .unwrap();
+        assert_eq!(idx.total_installed_bytes().unwrap(), 99);
+
+        assert_eq!(measure_unsized(&idx).unwrap(), 1);
+        assert_eq!(idx.total_installed_bytes().unwrap(), 849);
+        let gcc = idx
+            .lookup(Kind::Toolchains, "https://x.com/gcc", "1.0")
+            .unwrap()
+            .unwrap();
+        assert_eq!(gcc.installed_bytes, Some(750));
+        assert_eq!(idx.unsized_installed_entries().unwrap().len(), 1);
+    }
+
+    #[test]
+    fn test_set_installed_bytes_ignores_evicted_entries() {
+        let idx = CacheIndex::open_in_memory().unwrap();
+        let entry = idx
+            .record_unsized_install(Kind::Packages, "https://x.com/p", "1.0", "p")
+            .unwrap();
+        idx.clear_installed(entry.id).unwrap();
+        idx.set_installed_bytes(entry.id, 123).unwrap();
+        let entry = idx
+            .lookup(Kind::Packages, "https://x.com/p", "1.0")
+            .unwrap()
+            .unwrap();
+        assert_eq!(entry.installed_bytes, None);
+    }
+}
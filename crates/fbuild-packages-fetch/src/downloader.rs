@@ -1,17 +1,46 @@
 //! Async HTTP file downloader with SHA256 checksum verification.
 //!
-//! Uses reqwest async client for parallel downloads. Supports streaming
-//! downloads with progress reporting for large files.
+//! Uses reqwest async client for parallel downloads. Every download streams
+//! its body to a `<file>.part` next to the destination while a running
+//! SHA-256 is fed chunk by chunk, so memory stays flat however large the
+//! archive, and the checksum is known the moment the last byte lands. The
+//! `.part` file is renamed into place only after a complete (and, when a
+//! checksum is given, verified) transfer.
+//!
+//! A retry after a stall or a dropped connection resumes with an HTTP
+//! `Range` request when the server advertised `Accept-Ranges: bytes`,
+//! guarded by `If-Range` so a file that changed upstream restarts from zero
+//! instead of being spliced.
+//!
+//! Tarball installs can also unpack while the body is still arriving; see
+//! [`download_and_extract`].
+//!
+//! Every attempt runs under the process-wide download scheduler, which caps
+//! connections per host and overall and can pace bandwidth, and concurrent
+//! downloads of the same URL share one transfer (see `scheduler`).
+
+mod pipeline;
+mod scheduler;
 
 use std::fmt::{Display, Formatter, Write};
 use std::path::{Path, PathBuf};
+use std::sync::OnceLock;
 use std::time::{Duration, Instant};
 
+use fbuild_core::channel::Sender;
 use fbuild_core::{FbuildError, Result};
+use reqwest::StatusCode;
+use reqwest::header::{
+    ACCEPT_RANGES, CONTENT_RANGE, ETAG, HeaderValue, IF_RANGE, LAST_MODIFIED, RANGE,
+};
 use sha2::{Digest, Sha256};
+use tokio::io::{AsyncReadExt, AsyncWriteExt};
 
 use crate::http;
 
+pub use pipeline::download_and_extract;
+pub(crate) use scheduler::InFlight;
+
 /// Number of complete GET attempts before giving up on a transient failure.
 /// The retry boundary covers both request setup and response-body transfer.
 const MAX_ATTEMPTS: u32 = 5;
@@ -28,6 +57,10 @@ const RETRY_BACKOFFS: &[Duration] = &[
 /// attempt and is retried under the same budget as other transient failures.
 const CHUNK_READ_TIMEOUT: Duration = Duration::from_secs(60);
 
+/// Write buffer between the response stream and the `.part` file, and read
+/// buffer for checksumming files already on disk.
+const IO_BUFFER_BYTES: usize = 1 << 20;
+
 /// The wall-clock durations the retry loop waits on.
 ///
 /// Extracted so tests can drive the *same* retry logic on millisecond
@@ -76,7 +109,14 @@ enum DownloadAttemptError {
     Request(reqwest::Error),
     HttpStatus(reqwest::StatusCode),
     Body(reqwest::Error),
-    BodyStalled { filename: String },
+    BodyStalled {
+        filename: String,
+    },
+    /// The server answered a resume request with a range other than the one
+    /// asked for; the partial file was discarded.
+    ResumeRejected(reqwest::StatusCode),
+    /// Writing the `.part` file failed. Not retried: a full disk stays full.
+    Write(String),
 }
 
 impl DownloadAttemptError {
@@ -84,7 +124,8 @@ impl DownloadAttemptError {
         match self {
             Self::Request(error) | Self::Body(error) => is_transient(error),
             Self::HttpStatus(status) => status.is_server_error(),
-            Self::BodyStalled { .. } => true,
+            Self::BodyStalled { .. } | Self::ResumeRejected(_) => true,
+            Self::Write(_) => false,
         }
     }
 
@@ -104,6 +145,11 @@ impl DownloadAttemptError {
                 CHUNK_READ_TIMEOUT.as_secs(),
                 filename
             )),
+            Self::ResumeRejected(status) => FbuildError::PackageError(format!(
+                "download failed for {}: resume answered with HTTP {}",
+                url, status
+            )),
+            Self::Write(message) => FbuildError::PackageError(message),
         }
     }
 }
@@ -120,27 +166,14 @@ impl Display for DownloadAttemptError {
                 CHUNK_READ_TIMEOUT.as_secs(),
                 filename
             ),
+            Self::ResumeRejected(status) => {
+                write!(f, "resume answered with HTTP {status}, restarting")
+            }
+            Self::Write(message) => f.write_str(message),
         }
     }
 }
 
-async fn open_attempt(
-    client: &reqwest::Client,
-    url: &str,
-) -> std::result::Result<reqwest::Response, DownloadAttemptError> {
-    let response = client
-        .get(url)
-        .send()
-        .await
-        .map_err(DownloadAttemptError::Request)?;
-    let status = response.status();
-    if status.is_success() {
-        Ok(response)
-    } else {
-        Err(DownloadAttemptError::HttpStatus(status))
-    }
-}
-
 async fn wait_before_retry(
     url: &str,
     attempt: u32,
@@ -174,11 +207,16 @@ pub struct DownloadProgress {
     pub downloaded: u64,
     pub total_bytes: Option<u64>,
     pub filename: String,
+    /// The download is waiting for a free slot in the download scheduler.
+    pub queued: bool,
 }
 
 impl DownloadProgress {
     /// Format a human-readable progress message.
     pub fn format_message(&self) -> String {
+        if self.queued {
+            return format!("waiting for a download slot for {}", self.filename);
+        }
         let dl_mb = self.downloaded as f64 / (1024.0 * 1024.0);
         match self.total_bytes {
             Some(total) => {
@@ -202,55 +240,28 @@ impl DownloadProgress {
 
 /// Download a file from a URL into the destination directory (async).
 ///
-/// Returns the path to the downloaded file. Uses buffered download (loads
-/// entire response into memory). For large files with progress reporting,
-/// use [`download_file_with_progress`].
+/// Returns the path to the downloaded file. The body streams to disk; use
+/// [`download_file_with_progress`] to observe progress, or
+/// [`download_file_verified`] to check a SHA-256 on the way.
 pub async fn download_file(url: &str, dest_dir: &Path) -> Result<PathBuf> {
-    let filename = url.rsplit('/').next().unwrap_or("download").to_string();
-    let dest_path = dest_dir.join(&filename);
-
-    let bytes = get_with_retry(url).await?;
-
-    tokio::fs::write(&dest_path, &bytes).await.map_err(|e| {
-        FbuildError::PackageError(format!(
-            "failed to write downloaded file to {}: {}",
-            dest_path.display(),
-            e
-        ))
-    })?;
-
-    tracing::info!("downloaded {} ({} bytes)", filename, bytes.len());
-    Ok(dest_path)
+    download_file_using(http::client(), url, dest_dir).await
 }
 
-/// GET `url` and return the body bytes, retrying transient failures
-/// up to [`MAX_ATTEMPTS`] times with [`RETRY_BACKOFFS`] between
-/// attempts. A non-2xx HTTP status is treated as a hard failure
-/// (only server-side 5xx is retried).
-async fn get_with_retry(url: &str) -> Result<Vec<u8>> {
-    get_with_retry_using(http::client(), url).await
-}
-
-async fn get_with_retry_using(client: &reqwest::Client, url: &str) -> Result<Vec<u8>> {
-    let mut attempt: u32 = 0;
-    loop {
-        attempt += 1;
-        let result = match open_attempt(client, url).await {
-            Ok(response) => response
-                .bytes()
-                .await
-                .map(|bytes| bytes.to_vec())
-                .map_err(DownloadAttemptError::Body),
-            Err(error) => Err(error),
-        };
-        match result {
-            Ok(bytes) => return Ok(bytes),
-            Err(error) if error.is_retryable() && attempt < MAX_ATTEMPTS => {
-                wait_before_retry(url, attempt, &error, RetryTiming::PRODUCTION).await;
-            }
-            Err(error) => return Err(error.into_fbuild_error(url)),
-        }
-    }
+async fn download_file_using(
+    client: &reqwest::Client,
+    url: &str,
+    dest_dir: &Path,
+) -> Result<PathBuf> {
+    let mut no_progress = |_: &DownloadProgress| {};
+    download_to(
+        client,
+        url,
+        dest_dir,
+        None,
+        &mut no_progress,
+        RetryTiming::PRODUCTION,
+    )
+    .await
 }
 
 /// Download a file with streaming progress reporting.
@@ -262,9 +273,27 @@ pub async fn download_file_with_progress(
     dest_dir: &Path,
     on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
 ) -> Result<PathBuf> {
-    download_file_with_progress_using(http::client(), url, dest_dir, on_progress).await?;
-    let filename = url.rsplit('/').next().unwrap_or("download");
-    Ok(dest_dir.join(filename))
+    download_file_with_progress_using(http::client(), url, dest_dir, on_progress).await
+}
+
+/// [`download_file_with_progress`] that also checks the body against
+/// `expected_sha256` as it streams. On a mismatch nothing is left at the
+/// destination, and the file is never read back just to hash it.
+pub async fn download_file_verified(
+    url: &str,
+    dest_dir: &Path,
+    expected_sha256: &str,
+    on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
+) -> Result<PathBuf> {
+    download_to(
+        http::client(),
+        url,
+        dest_dir,
+        Some(expected_sha256),
+        on_progress,
+        RetryTiming::PRODUCTION,
+    )
+    .await
 }
 
 async fn download_file_with_progress_using(
@@ -272,108 +301,427 @@ async fn download_file_with_progress_using(
     url: &str,
     dest_dir: &Path,
     on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
-) -> Result<()> {
-    download_file_with_progress_timed(client, url, dest_dir, on_progress, RetryTiming::PRODUCTION)
-        .await
+) -> Result<PathBuf> {
+    download_to(
+        client,
+        url,
+        dest_dir,
+        None,
+        on_progress,
+        RetryTiming::PRODUCTION,
+    )
+    .await
 }
 
-/// [`download_file_with_progress_using`] with the retry durations injected.
-/// See [`RetryTiming`] for why tests need this instead of paused Tokio time.
-async fn download_file_with_progress_timed(
+/// Downloads in flight, keyed by URL and expected checksum.
+fn in_flight_downloads() -> &'static InFlight<PathBuf> {
+    static DOWNLOADS: OnceLock<InFlight<PathBuf>> = OnceLock::new();
+    DOWNLOADS.get_or_init(InFlight::new)
+}
+
+fn url_file_name(url: &str) -> String {
+    url.rsplit('/').next().unwrap_or("download").to_string()
+}
+
+/// Stream `url` into `dest_dir/<last path segment>` with the retry
+/// durations injected. See [`RetryTiming`] for why tests need this instead
+/// of paused Tokio time.
+///
+/// A call for a URL (and checksum) already downloading elsewhere in the
+/// process waits for that transfer and copies its file instead of fetching
+/// the body again.
+async fn download_to(
     client: &reqwest::Client,
     url: &str,
     dest_dir: &Path,
+    expected_sha256: Option<&str>,
     on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
     timing: RetryTiming,
-) -> Result<()> {
-    let filename = url.rsplit('/').next().unwrap_or("download").to_string();
+) -> Result<PathBuf> {
+    let key = format!(
+        "{url}\n{}",
+        expected_sha256.map(str::to_lowercase).unwrap_or_default()
+    );
+    let dest_path = dest_dir.join(url_file_name(url));
+    let leader_progress = &mut *on_progress;
+    let fetched = in_flight_downloads()
+        .run(
+            &key,
+            || tracing::info!("download {}: joining the transfer already in flight", url),
+            move || async move {
+                download_to_tapped(
+                    client,
+                    url,
+                    dest_dir,
+                    expected_sha256,
+                    leader_progress,
+                    timing,
+                    None,
+                )
+                .await
+                .map(|(path, _)| path)
+            },
+        )
+        .await?;
+    if fetched == dest_path {
+        return Ok(dest_path);
+    }
+    match copy_into_place(&fetched, &dest_path).await {
+        Ok(()) => Ok(dest_path),
+        Err(e) => {
+            // The other caller's copy may already be gone; fetch our own.
+            tracing::warn!(
+                "download {}: could not copy the shared transfer from {}: {}",
+                url,
+                fetched.display(),
+                e
+            );
+            download_to_tapped(
+                client,
+                url,
+                dest_dir,
+                expected_sha256,
+                on_progress,
+                timing,
+                None,
+            )
+            .await
+            .map(|(path, _)| path)
+        }
+    }
+}
+
+/// Copy `from` to `dest` through a `.part` file, so `dest` only ever holds
+/// a complete file.
+async fn copy_into_place(from: &Path, dest: &Path) -> std::io::Result<()> {
+    let mut part = dest.as_os_str().to_owned();
+    part.push(".part");
+    let part = Path::new(&part);
+    let copied = match tokio::fs::copy(from, part).await {
+        Ok(_) => tokio::fs::rename(part, dest).await,
+        Err(e) => Err(e),
+    };
+    if copied.is_err() {
+        let _ = tokio::fs::remove_file(part).await;
+    }
+    copied
+}
+
+/// [`download_to`] that also hands every body chunk, in order, to `tap`
+/// as soon as it is on its way to disk. The tap closes when the download
+/// ends. Returns the path and whether the tap saw the final body: `false`
+/// once a retry restarted the body from zero, after which the tap is
+/// dropped.
+async fn download_to_tapped(
+    client: &reqwest::Client,
+    url: &str,
+    dest_dir: &Path,
+    expected_sha256: Option<&str>,
+    on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
+    timing: RetryTiming,
+    tap: Option<Sender<Vec<u8>>>,
+) -> Result<(PathBuf, bool)> {
+    let filename = url_file_name(url);
     let dest_path = dest_dir.join(&filename);
+    let mut part = PartFile::create(dest_dir.join(format!("{filename}.part")), tap).await?;
+
+    let downloaded = fetch_with_retry(client, url, &filename, &mut part, on_progress, timing).await;
+    let tapped = part.tapped;
+    let committed = match downloaded {
+        Ok(()) => part.commit(&dest_path, expected_sha256).await,
+        Err(error) => Err(error),
+    };
+    if committed.is_err() {
+        let _ = tokio::fs::remove_file(dest_dir.join(format!("{filename}.part"))).await;
+    }
+    let len = committed?;
+    tracing::info!("downloaded {} ({} bytes)", filename, len);
+    Ok((dest_path, tapped))
+}
 
+/// Run attempts until the body is complete in `part`, resuming where the
+/// last one stopped when the server allows it.
+async fn fetch_with_retry(
+    client: &reqwest::Client,
+    url: &str,
+    filename: &str,
+    part: &mut PartFile,
+    on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
+    timing: RetryTiming,
+) -> Result<()> {
+    let mut resume: Option<Resume> = None;
     let mut attempt: u32 = 0;
-    let buf = loop {
+    loop {
         attempt += 1;
-        let result: std::result::Result<Vec<u8>, DownloadAttemptError> = async {
-            let response = open_attempt(client, url).await?;
-            let total_bytes = response.content_length();
-            let mut downloaded: u64 = 0;
-            let mut attempt_buf =
-                Vec::with_capacity(total_bytes.unwrap_or(8 * 1024 * 1024) as usize);
-            let mut last_report = Instant::now();
-            let mut last_pct: u32 = 0;
-            let mut stream = response;
-            // FastLED/fbuild#805 CRITICAL: per-chunk deadline. The shared
-            // `http::client()` already enforces a 300 s total-request timeout,
-            // but defense-in-depth — wrap each `chunk().await` in a 60 s
-            // tokio timeout so a stalled mid-download fails *this* attempt
-            // promptly instead of waiting out the 5 min total. This is what
-            // the audit calls out specifically: streaming body reads have no
-            // per-chunk wake-up signal otherwise.
-            loop {
-                let chunk =
-                    match tokio::time::timeout(timing.chunk_read_timeout, stream.chunk()).await {
-                        Ok(Ok(Some(chunk))) => chunk,
-                        Ok(Ok(None)) => break,
-                        Ok(Err(error)) => return Err(DownloadAttemptError::Body(error)),
-                        Err(_) => {
-                            return Err(DownloadAttemptError::BodyStalled {
-                                filename: filename.clone(),
-                            });
-                        }
-                    };
-                attempt_buf.extend_from_slice(&chunk);
-                downloaded += chunk.len() as u64;
-
-                let elapsed = last_report.elapsed().as_secs();
-                let current_pct = total_bytes
-                    .map(|total| {
-                        if total > 0 {
-                            (downloaded as f64 / total as f64 * 100.0) as u32
-                        } else {
-                            0
-                        }
-                    })
-                    .unwrap_or(0);
-                let pct_jump = current_pct >= last_pct + 10;
-
-                if elapsed >= 15 || pct_jump {
-                    let progress = DownloadProgress {
-                        downloaded,
-                        total_bytes,
-                        filename: filename.clone(),
-                    };
-                    on_progress(&progress);
-                    last_report = Instant::now();
-                    last_pct = current_pct;
-                }
-            }
-            Ok(attempt_buf)
-        }
+        let slot = scheduler::global()
+            .acquire(url, || {
+                on_progress(&DownloadProgress {
+                    downloaded: part.written,
+                    total_bytes: None,
+                    filename: filename.to_string(),
+                    queued: true,
+                });
+            })
+            .await;
+        let result = fetch_attempt(
+            client,
+            url,
+            filename,
+            part,
+            &mut resume,
+            on_progress,
+            timing,
+        )
         .await;
-
+        drop(slot);
         match result {
-            Ok(bytes) => break bytes,
+            Ok(()) => return Ok(()),
             Err(error) if error.is_retryable() && attempt < MAX_ATTEMPTS => {
+                part.settle().await.map_err(|e| {
+                    FbuildError::PackageError(format!("write {}: {e}", part.path.display()))
+                })?;
                 wait_before_retry(url, attempt, &error, timing).await;
             }
             Err(error) => return Err(error.into_fbuild_error(url)),
         }
+    }
+}
+
+/// How to ask the server for the rest of a body, learned from the first
+/// full response.
+struct Resume {
+    /// Strong ETag or Last-Modified, sent as `If-Range` so a changed file
+    /// comes back whole instead of being spliced.
+    validator: Option<HeaderValue>,
+}
+
+impl Resume {
+    /// `Some` when `response` advertises byte ranges.
+    fn from_response(response: &reqwest::Response) -> Option<Self> {
+        let headers = response.headers();
+        let ranges = headers
+            .get(ACCEPT_RANGES)
+            .and_then(|v| v.to_str().ok())
+            .is_some_and(|v| v.eq_ignore_ascii_case("bytes"));
+        if !ranges {
+            return None;
+        }
+        let strong_etag = headers
+            .get(ETAG)
+            .filter(|v| !v.as_bytes().starts_with(b"W/"));
+        Some(Self {
+            validator: strong_etag.or_else(|| headers.get(LAST_MODIFIED)).cloned(),
+        })
+    }
+}
+
+/// First byte and total length from a `Content-Range: bytes a-b/total`
+/// header.
+fn content_range(response: &reqwest::Response) -> Option<(u64, Option<u64>)> {
+    let value = response.headers().get(CONTENT_RANGE)?.to_str().ok()?;
+    let (range, total) = value.strip_prefix("bytes ")?.split_once('/')?;
+    let (first, _) = range.split_once('-')?;
+    Some((first.trim().parse().ok()?, total.trim().parse().ok()))
+}
+
+/// One GET: resume `part` when it holds bytes and the server takes ranges,
+/// otherwise (re)start it, then stream the body into it.
+async fn fetch_attempt(
+    client: &reqwest::Client,
+    url: &str,
+    filename: &str,
+    part: &mut PartFile,
+    resume: &mut Option<Resume>,
+    on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
+    timing: RetryTiming,
+) -> std::result::Result<(), DownloadAttemptError> {
+    let part_path = part.path.clone();
+    let write_error = |e: std::io::Error| {
+        DownloadAttemptError::Write(format!("write {}: {e}", part_path.display()))
     };
+    let offset = part.written;
+    let mut request = client.get(url);
+    if let Some(resume) = resume.as_ref().filter(|_| offset > 0) {
+        request = request.header(RANGE, format!("bytes={offset}-"));
+        if let Some(validator) = &resume.validator {
+            request = request.header(IF_RANGE, validator.clone());
+        }
+    }
+    let mut response = request
+        .send()
+        .await
+        .map_err(DownloadAttemptError::Request)?;
+    let status = response.status();
 
-    tokio::fs::write(&dest_path, &buf).await.map_err(|e| {
-        FbuildError::PackageError(format!(
-            "failed to write downloaded file to {}: {}",
-            dest_path.display(),
-            e
-        ))
-    })?;
+    let total_bytes = if status == StatusCode::PARTIAL_CONTENT && offset > 0 {
+        match content_range(&response) {
+            Some((first, total)) if first == offset => {
+                tracing::info!("download {}: resuming at byte {}", url, offset);
+                total.or_else(|| response.content_length().map(|len| offset + len))
+            }
+            _ => {
+                part.reset().await.map_err(write_error)?;
+                return Err(DownloadAttemptError::ResumeRejected(status));
+            }
+        }
+    } else if status.is_success() {
+        // A fresh body: the first attempt, a server without ranges, or an
+        // `If-Range` miss because the file changed.
+        if offset > 0 {
+            part.reset().await.map_err(write_error)?;
+        }
+        *resume = Resume::from_response(&response);
+        response.content_length()
+    } else if status == StatusCode::RANGE_NOT_SATISFIABLE && offset > 0 {
+        part.reset().await.map_err(write_error)?;
+        return Err(DownloadAttemptError::ResumeRejected(status));
+    } else {
+        return Err(DownloadAttemptError::HttpStatus(status));
+    };
 
-    tracing::info!("downloaded {} ({} bytes)", filename, buf.len());
+    let mut downloaded = part.written;
+    let mut last_report = Instant::now();
+    let mut last_pct: u32 = 0;
+    // FastLED/fbuild#805 CRITICAL: per-chunk deadline. The shared
+    // `http::client()` already enforces a 300 s total-request timeout,
+    // but defense-in-depth — wrap each `chunk().await` in a 60 s
+    // tokio timeout so a stalled mid-download fails *this* attempt
+    // promptly instead of waiting out the 5 min total. This is what
+    // the audit calls out specifically: streaming body reads have no
+    // per-chunk wake-up signal otherwise.
+    loop {
+        let chunk = match tokio::time::timeout(timing.chunk_read_timeout, response.chunk()).await {
+            Ok(Ok(Some(chunk))) => chunk,
+            Ok(Ok(None)) => break,
+            Ok(Err(error)) => return Err(DownloadAttemptError::Body(error)),
+            Err(_) => {
+                return Err(DownloadAttemptError::BodyStalled {
+                    filename: filename.to_string(),
+                });
+            }
+        };
+        part.write(&chunk).await.map_err(write_error)?;
+        downloaded += chunk.len() as u64;
+        scheduler::global().pace(chunk.len()).await;
+
+        let elapsed = last_report.elapsed().as_secs();
+        let current_pct = total_bytes
+            .map(|total| {
+                if total > 0 {
+                    (downloaded as f64 / total as f64 * 100.0) as u32
+                } else {
+                    0
+                }
+            })
+            .unwrap_or(0);
+        let pct_jump = current_pct >= last_pct + 10;
+
+        if elapsed >= 15 || pct_jump {
+            let progress = DownloadProgress {
+                downloaded,
+                total_bytes,
+                filename: filename.to_string(),
+                queued: false,
+            };
+            on_progress(&progress);
+            last_report = Instant::now();
+            last_pct = current_pct;
+        }
+    }
     Ok(())
 }
 
+/// The `.part` file a download streams into, with a running SHA-256 of the
+/// bytes written so far.
+struct PartFile {
+    path: PathBuf,
+    out: tokio::io::BufWriter<tokio::fs::File>,
+    hasher: Sha256,
+    written: u64,
+    /// Receives a copy of each chunk written; dropped when its receiver
+    /// goes away or the body restarts.
+    tap: Option<Sender<Vec<u8>>>,
+    /// Whether the chunks sent to `tap` are still a prefix of the body.
+    tapped: bool,
+}
+
+impl PartFile {
+    /// Create (or truncate) the `.part` file at `path`.
+    async fn create(path: PathBuf, tap: Option<Sender<Vec<u8>>>) -> Result<Self> {
+        let file = tokio::fs::File::create(&path).await.map_err(|e| {
+            FbuildError::PackageError(format!("failed to create {}: {}", path.display(), e))
+        })?;
+        Ok(Self {
+            path,
+            out: tokio::io::BufWriter::with_capacity(IO_BUFFER_BYTES, file),
+            hasher: Sha256::new(),
+            written: 0,
+            tapped: tap.is_some(),
+            tap,
+        })
+    }
+
+    async fn write(&mut self, bytes: &[u8]) -> std::io::Result<()> {
+        self.out.write_all(bytes).await?;
+        self.hasher.update(bytes);
+        self.written += bytes.len() as u64;
+        if let Some(tap) = &self.tap {
+            if tap.send(bytes.to_vec()).await.is_err() {
+                self.tap = None;
+            }
+        }
+        Ok(())
+    }
+
+    /// Before a retry: get every counted byte onto disk so a resume can
+    /// start right after them. If that fails, start over instead.
+    async fn settle(&mut self) -> std::io::Result<()> {
+        if self.out.flush().await.is_err() {
+            self.reset().await?;
+        }
+        Ok(())
+    }
+
+    /// Discard everything written so far.
+    async fn reset(&mut self) -> std::io::Result<()> {
+        // Let any in-flight write finish before truncating under it.
+        let _ = self.out.flush().await;
+        let file = tokio::fs::File::create(&self.path).await?;
+        self.out = tokio::io::BufWriter::with_capacity(IO_BUFFER_BYTES, file);
+        self.hasher = Sha256::new();
+        self.written = 0;
+        // What the tap already consumed belongs to a body that is gone.
+        self.tap = None;
+        self.tapped = false;
+        Ok(())
+    }
+
+    /// Check the finished body against `expected_sha256` and move it to
+    /// `dest`. Returns the body length.
+    async fn commit(mut self, dest: &Path, expected_sha256: Option<&str>) -> Result<u64> {
+        self.out.flush().await.map_err(|e| {
+            FbuildError::PackageError(format!("write {}: {}", self.path.display(), e))
+        })?;
+        drop(self.out);
+        if let Some(expected) = expected_sha256 {
+            check_digest(dest, expected, &hex_encode(&self.hasher.finalize()))?;
+        }
+        tokio::fs::rename(&self.path, dest).await.map_err(|e| {
+            FbuildError::PackageError(format!(
+                "failed to write downloaded file to {}: {}",
+                dest.display(),
+                e
+            ))
+        })?;
+        Ok(self.written)
+    }
+}
+
 /// Download multiple files in parallel (async).
 ///
-/// Returns paths to all downloaded files. Fails fast on first error.
+/// The transfers queue on the download scheduler's connection limits, and
+/// repeated URLs share one transfer. Returns paths to all downloaded files.
+/// Fails fast on first error.
 pub async fn download_all(urls: &[(&str, &Path)]) -> Result<Vec<PathBuf>> {
     let mut handles = Vec::new();
 
@@ -396,487 +744,51 @@ pub async fn download_all(urls: &[(&str, &Path)]) -> Result<Vec<PathBuf>> {
     Ok(results)
 }
 
-/// Verify a file's SHA256 checksum.
+/// Compare a computed hex digest with the expected one (case-insensitive).
+fn check_digest(path: &Path, expected: &str, actual: &str) -> Result<()> {
+    if actual == expected.to_lowercase() {
+        return Ok(());
+    }
+    Err(FbuildError::PackageError(format!(
+        "checksum mismatch for {}: expected {}, got {}",
+        path.display(),
+        expected,
+        actual
+    )))
+}
+
+/// Verify a file's SHA256 checksum. Streams the file; it is never held in
+/// memory whole.
 pub fn verify_checksum(path: &Path, expected: &str) -> Result<()> {
-    let data = std::fs::read(path)?;
+    use std::io::Read;
+
+    let mut file = std::fs::File::open(path)?;
     let mut hasher = Sha256::new();
-    hasher.update(&data);
-    let result = hasher.finalize();
-    let actual = hex_encode(&result);
-
-    if actual != expected.to_lowercase() {
-        return Err(FbuildError::PackageError(format!(
-            "checksum mismatch for {}: expected {}, got {}",
-            path.display(),
-            expected,
-            actual
-        )));
+    let mut buf = vec![0u8; IO_BUFFER_BYTES];
+    loop {
+        let n = file.read(&mut buf)?;
+        if n == 0 {
+            break;
+        }
+        hasher.update(&buf[..n]);
     }
-
-    Ok(())
+    check_digest(path, expected, &hex_encode(&hasher.finalize()))
 }
 
 /// Async version of verify_checksum (reads file with tokio).
 pub async fn verify_checksum_async(path: &Path, expected: &str) -> Result<()> {
-    let data = tokio::fs::read(path).await?;
+    let mut file = tokio::fs::File::open(path).await?;
     let mut hasher = Sha256::new();
-    hasher.update(&data);
-    let result = hasher.finalize();
-    let actual = hex_encode(&result);
-
-    if actual != expected.to_lowercase() {
-        return Err(FbuildError::PackageError(format!(
-            "checksum mismatch for {}: expected {}, got {}",
-            path.display(),
-            expected,
-            actual
-        )));
+    let mut buf = vec![0u8; IO_BUFFER_BYTES];
+    loop {
+        let n = file.read(&mut buf).await?;
+        if n == 0 {
+            break;
+        }
+        hasher.update(&buf[..n]);
     }
-
-    Ok(())
+    check_digest(path, expected, &hex_encode(&hasher.finalize()))
 }
 
 #[cfg(test)]
-mod tests {
-    use super::*;
-    use std::io::Write;
-    use std::sync::atomic::{AtomicUsize, Ordering};
-    use tempfile::NamedTempFile;
-
-    static NETWORK_TEST_LOCK: tokio::sync::Mutex<()> = tokio::sync::Mutex::const_new(());
-
-    async fn network_test_guard() -> tokio::sync::MutexGuard<'static, ()> {
-        NETWORK_TEST_LOCK.lock().await
-    }
-
-    fn named_temp_file() -> NamedTempFile {
-        NamedTempFile::new_in(fbuild_paths::temp_subdir(
-            "fbuild-packages-downloader-tests",
-        ))
-        .unwrap()
-    }
-
-    fn test_client() -> reqwest::Client {
-        fbuild_core::http::client_with_timeout(Duration::from_secs(300))
-    }
-
-    #[test]
-    fn test_verify_checksum_valid() {
-        let mut f = named_temp_file();
-        f.write_all(b"hello world").unwrap();
-        f.flush().unwrap();
-
-        // SHA256 of "hello world"
-        let expected = "b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9";
-        verify_checksum(f.path(), expected).unwrap();
-    }
-
-    #[test]
-    fn test_verify_checksum_invalid() {
-        let mut f = named_temp_file();
-        f.write_all(b"hello world").unwrap();
-        f.flush().unwrap();
-
-        let result = verify_checksum(
-            f.path(),
-            "0000000000000000000000000000000000000000000000000000000000000000",
-        );
-        assert!(result.is_err());
-        assert!(
-            result
-                .unwrap_err()
-                .to_string()
-                .contains("checksum mismatch")
-        );
-    }
-
-    // ---- transient-retry tests ----
-
-    /// Stand up a tiny raw-TCP HTTP server on a loopback port. Reads
-    /// one request, drops the body, writes whatever 4-line HTTP
-    /// response the caller queued for that attempt, and closes the
-    /// connection. The caller pre-queues a Vec of responses, one per
-    /// attempt; the server pops the next one as each connection
-    /// comes in. Keeps the deps to tokio (already required).
-    async fn run_flaky_server(
-        responses: std::sync::Arc<std::sync::Mutex<Vec<&'static str>>>,
-        request_count: std::sync::Arc<AtomicUsize>,
-    ) -> u16 {
-        use tokio::io::{AsyncReadExt, AsyncWriteExt};
-        use tokio::net::TcpListener;
-
-        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
-        let port = listener.local_addr().unwrap().port();
-        let (ready_tx, ready_rx) = tokio::sync::oneshot::channel();
-
-        tokio::spawn(async move {
-            // A bound listener is not necessarily being polled yet.  Make
-            // the caller wait until this task has reached its accept loop so
-            // a retry test cannot burn an attempt during task startup on a
-            // loaded runner.
-            let _ = ready_tx.send(());
-            loop {
-                let (mut stream, _) = match listener.accept().await {
-                    Ok(p) => p,
-                    Err(_) => break,
-                };
-                request_count.fetch_add(1, Ordering::SeqCst);
-                let resp = {
-                    let mut guard = responses.lock().unwrap_or_else(|err| err.into_inner());
-                    if guard.is_empty() {
-                        break;
-                    }
-                    guard.remove(0)
-                };
-                let mut buf = [0u8; 1024];
-                // Read just the request headers — don't care about the
-                // body for these tests.
-                // The client under test always writes a request.  Do not use
-                // a paused-clock timeout here: it races the retry backoff and
-                // can make the mock emit a response before the request task
-                // has been scheduled on macOS.
-                let _ = stream.read(&mut buf).await;
-                let _ = stream.write_all(resp.as_bytes()).await;
-                let _ = stream.shutdown().await;
-            }
-        });
-        ready_rx.await.expect("flaky test server task should start");
-        port
-    }
-
-    /// How long `run_stalling_server` withholds the announced body. Only has
-    /// to comfortably exceed `FAST_RETRY_TIMING.chunk_read_timeout`.
-    const STALL_DURATION: Duration = Duration::from_secs(30);
-
-    async fn run_stalling_server(request_count: std::sync::Arc<AtomicUsize>) -> u16 {
-        use tokio::io::{AsyncReadExt, AsyncWriteExt};
-        use tokio::net::TcpListener;
-
-        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
-        let port = listener.local_addr().unwrap().port();
-        let (ready_tx, ready_rx) = tokio::sync::oneshot::channel();
-
-        tokio::spawn(async move {
-            let _ = ready_tx.send(());
-            loop {
-                let (stream, _) = match listener.accept().await {
-                    Ok(pair) => pair,
-                    Err(_) => break,
-                };
-                request_count.fetch_add(1, Ordering::SeqCst);
-                tokio::spawn(async move {
-                    let mut stream = stream;
-                    let mut request = [0u8; 1024];
-                    // See `run_flaky_server`: this test owns the client, so
-                    // waiting for its request is deterministic.
-                    let _ = stream.read(&mut request).await;
-                    let _ = stream
-                        .write_all(
-                            b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\nConnection: close\r\n\r\n",
-                        )
-                        .await;
-                    // Announce a body, then never send it. Just needs to
-                    // outlast the client's per-chunk deadline; the task is
-                    // dropped at runtime shutdown, so the test doesn't wait
-                    // on it (FastLED/fbuild#1222 — this runs in real time
-                    // now, not paused time).
-                    tokio::time::sleep(STALL_DURATION).await;
-                    let _ = stream.shutdown().await;
-                });
-            }
-        });
-        ready_rx
-            .await
-            .expect("stalling test server task should start");
-        port
-    }
-
-    fn truncated_response() -> &'static str {
-        "HTTP/1.1 200 OK\r\nContent-Length: 10\r\nConnection: close\r\n\r\nshort"
-    }
-
-    fn complete_response() -> &'static str {
-        "HTTP/1.1 200 OK\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello"
-    }
-
-    #[test]
-    fn retry_policy_is_five_attempts_with_exponential_backoff() {
-        assert_eq!(MAX_ATTEMPTS, 5);
-        assert_eq!(
-            RETRY_BACKOFFS,
-            &[
-                Duration::from_secs(1),
-                Duration::from_secs(2),
-                Duration::from_secs(4),
-                Duration::from_secs(8),
-            ]
-        );
-    }
-
-    /// #205 nightly STM32 acceptance gate started flaking on
-    /// `dl.registry.platformio.org` transient errors. A 5xx must
-    /// trigger a retry, and the retry must succeed.
-    #[tokio::test]
-    async fn get_with_retry_retries_on_5xx() {
-        let _guard = network_test_guard().await;
-        let responses = std::sync::Arc::new(std::sync::Mutex::new(vec![
-            "HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            "HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            "HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            "HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            complete_response(),
-        ]));
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_flaky_server(responses.clone(), request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/file");
-        let bytes = get_with_retry_using(&test_client(), &url)
-            .await
-            .expect("retry should succeed");
-        assert_eq!(bytes, b"hello");
-        assert_eq!(request_count.load(Ordering::SeqCst), 5);
-    }
-
-    /// 4xx is deterministic — it must NOT retry. The test queues a
-    /// single 404; if the implementation retried we'd hit the server's
-    /// empty-queue branch and the test would hang or panic.
-    #[tokio::test]
-    async fn get_with_retry_does_not_retry_on_4xx() {
-        let _guard = network_test_guard().await;
-        let responses = std::sync::Arc::new(std::sync::Mutex::new(vec![
-            "HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-        ]));
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_flaky_server(responses.clone(), request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/missing");
-        let err = get_with_retry_using(&test_client(), &url)
-            .await
-            .expect_err("should error");
-        assert!(
-            err.to_string().contains("404"),
-            "expected 404 in error, got: {err}"
-        );
-        assert_eq!(request_count.load(Ordering::SeqCst), 1);
-    }
-
-    /// Repeated 5xx exhausts the budget and surfaces the last
-    /// response.
-    #[tokio::test]
-    async fn get_with_retry_gives_up_after_max_attempts() {
-        let _guard = network_test_guard().await;
-        let responses = std::sync::Arc::new(std::sync::Mutex::new(vec![
-            "HTTP/1.1 500 Internal Server Error\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            "HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            "HTTP/1.1 500 Internal Server Error\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            "HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-            "HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
-        ]));
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_flaky_server(responses.clone(), request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/file");
-        let err = get_with_retry_using(&test_client(), &url)
-            .await
-            .expect_err("should give up");
-        // Last attempt was a 503; that's what gets surfaced.
-        assert!(
-            err.to_string().contains("503"),
-            "expected last-attempt 503 in error, got: {err}"
-        );
-        assert_eq!(request_count.load(Ordering::SeqCst), 5);
-    }
-
-    #[tokio::test]
-    async fn get_with_retry_retries_truncated_bodies_until_attempt_five() {
-        let _guard = network_test_guard().await;
-        let responses = std::sync::Arc::new(std::sync::Mutex::new(vec![
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            complete_response(),
-        ]));
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_flaky_server(responses, request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/file");
-
-        let bytes = get_with_retry_using(&test_client(), &url)
-            .await
-            .expect("the fifth complete response should succeed");
-
-        assert_eq!(bytes, b"hello");
-        assert_eq!(request_count.load(Ordering::SeqCst), 5);
-    }
-
-    #[tokio::test]
-    async fn get_with_retry_stops_after_five_truncated_bodies() {
-        let _guard = network_test_guard().await;
-        let responses = std::sync::Arc::new(std::sync::Mutex::new(vec![
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-        ]));
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_flaky_server(responses, request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/file");
-
-        let _err = get_with_retry_using(&test_client(), &url)
-            .await
-            .expect_err("the fifth truncated response should exhaust retries");
-
-        // The final transient can surface either while reqwest reads the
-        // deliberately short body or while it opens that last connection.
-        // The retry budget, rather than this transport-layer wording, is the
-        // contract under test.
-        assert_eq!(request_count.load(Ordering::SeqCst), 5);
-    }
-
-    #[tokio::test]
-    async fn streaming_download_retries_truncated_bodies_until_attempt_five() {
-        let _guard = network_test_guard().await;
-        let responses = std::sync::Arc::new(std::sync::Mutex::new(vec![
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            complete_response(),
-        ]));
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_flaky_server(responses, request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/file");
-        let temp = tempfile::TempDir::new().unwrap();
-        let mut progress = |_progress: &DownloadProgress| {};
-
-        download_file_with_progress_using(&test_client(), &url, temp.path(), &mut progress)
-            .await
-            .expect("the fifth complete response should succeed");
-
-        assert_eq!(std::fs::read(temp.path().join("file")).unwrap(), b"hello");
-        assert_eq!(request_count.load(Ordering::SeqCst), 5);
-    }
-
-    #[tokio::test]
-    async fn streaming_download_stops_after_five_truncated_bodies_without_output() {
-        let _guard = network_test_guard().await;
-        let responses = std::sync::Arc::new(std::sync::Mutex::new(vec![
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-            truncated_response(),
-        ]));
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_flaky_server(responses, request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/file");
-        let temp = tempfile::TempDir::new().unwrap();
-        let mut progress = |_progress: &DownloadProgress| {};
-
-        let _err =
-            download_file_with_progress_using(&test_client(), &url, temp.path(), &mut progress)
-                .await
-                .expect_err("the fifth truncated response should exhaust retries");
-
-        // See the buffered variant above: both body-read and connection
-        // errors are retryable transport failures, so only exhaustion of the
-        // five-attempt budget is stable across platforms.
-        assert_eq!(request_count.load(Ordering::SeqCst), 5);
-        assert!(!temp.path().join("file").exists());
-    }
-
-    /// Retry timings short enough to run in real time. This test previously
-    /// used `#[tokio::test(start_paused = true)]` against a real
-    /// `TcpListener`, which flaked on loaded macOS runners: paused time
-    /// auto-advances whenever the runtime looks idle, but socket readiness
-    /// comes from the OS reactor, so the clock could jump past a connection
-    /// that was about to reach `accept()` — leaving `request_count` short of
-    /// 5. Real durations remove the race entirely (FastLED/fbuild#1222).
-    const FAST_RETRY_TIMING: RetryTiming = RetryTiming {
-        chunk_read_timeout: Duration::from_millis(150),
-        backoffs: &[
-            Duration::from_millis(10),
-            Duration::from_millis(10),
-            Duration::from_millis(10),
-            Duration::from_millis(10),
-        ],
-    };
-
-    #[tokio::test]
-    async fn streaming_download_retries_chunk_stalls_five_times_without_output() {
-        let _guard = network_test_guard().await;
-        let request_count = std::sync::Arc::new(AtomicUsize::new(0));
-        let port = run_stalling_server(request_count.clone()).await;
-        let url = format!("http://127.0.0.1:{port}/file");
-        let temp = tempfile::TempDir::new().unwrap();
-        let mut progress = |_progress: &DownloadProgress| {};
-
-        let _err = download_file_with_progress_timed(
-            &test_client(),
-            &url,
-            temp.path(),
-            &mut progress,
-            FAST_RETRY_TIMING,
-        )
-        .await
-        .expect_err("five chunk stalls should exhaust retries");
-
-        // A stalled body is retryable, as is a connection error while opening
-        // a retry. The latter can legitimately be the final transient on a
-        // busy platform, so the stable contract is exhausting all five
-        // attempts without publishing an output.
-        assert_eq!(request_count.load(Ordering::SeqCst), 5);
-        assert!(!temp.path().join("file").exists());
-    }
-
-    /// The injected timings are a test seam, not a behavior change: the
-    /// production path must still carry the real constants.
-    #[test]
-    fn production_retry_timing_matches_the_constants() {
-        assert_eq!(
-            RetryTiming::PRODUCTION.chunk_read_timeout,
-            CHUNK_READ_TIMEOUT
-        );
-        assert_eq!(RetryTiming::PRODUCTION.backoffs, RETRY_BACKOFFS);
-        for attempt in 1..MAX_ATTEMPTS {
-            assert_eq!(
-                RetryTiming::PRODUCTION.backoff(attempt),
-                RETRY_BACKOFFS[(attempt - 1) as usize]
-            );
-        }
-    }
-
-    #[test]
-    fn format_download_progress_with_total() {
-        let p = DownloadProgress {
-            downloaded: 50 * 1024 * 1024,
-            total_bytes: Some(150 * 1024 * 1024),
-            filename: "toolchain.tar.gz".into(),
-        };
-        let msg = p.format_message();
-        assert!(msg.contains("50"), "msg: {msg}");
-        assert!(msg.contains("150"), "msg: {msg}");
-        assert!(msg.contains("33%"), "msg: {msg}");
-    }
-
-    #[test]
-    fn format_download_progress_without_total() {
-        let p = DownloadProgress {
-            downloaded: 5 * 1024 * 1024,
-            total_bytes: None,
-            filename: "library.zip".into(),
-        };
-        let msg = p.format_message();
-        assert!(msg.contains("5"), "msg: {msg}");
-        assert!(!msg.contains("%"), "msg: {msg}");
-    }
-
-    #[test]
-    fn format_download_progress_zero() {
-        let p = DownloadProgress {
-            downloaded: 0,
-            total_bytes: Some(100 * 1024 * 1024),
-            filename: "file.bin".into(),
-        };
-        let msg = p.format_message();
-        assert!(msg.contains("0%"), "msg: {msg}");
-    }
-}
+mod tests;
@@ -0,0 +1,139 @@
+//! Pipelined download-and-extract: a tarball is decompressed and unpacked
+//! on a blocking thread while its bytes are still arriving, so installing a
+//! large toolchain takes about as long as downloading it rather than the
+//! download plus a second pass over the archive.
+//!
+//! The body still streams to the `.part` file with its running SHA-256, and
+//! the checksum is still checked once the last byte lands. The extracted
+//! tree is only as trustworthy as that check, so callers extract into a
+//! staging directory and rename it into place on success. When the bytes
+//! the extractor saw are not the final body (a retry restarted it from
+//! zero), or unpacking fails mid-stream, the directory is cleared and the
+//! finished archive is extracted from disk as before.
+
+use std::path::Path;
+
+use fbuild_core::channel::bounded;
+use fbuild_core::{FbuildError, Result};
+
+use super::{DownloadProgress, RetryTiming, download_to, download_to_tapped};
+use crate::extractor::{self, ChunkReader, TarCompression};
+use crate::http;
+
+/// Body chunks buffered between the download and the extractor. When
+/// unpacking falls behind, the download waits here.
+const TAP_QUEUE_CHUNKS: usize = 256;
+
+/// How an archive ended up extracted.
+#[derive(Debug, PartialEq, Eq)]
+pub(super) enum Extraction {
+    /// Unpacked while it downloaded.
+    Streamed,
+    /// Unpacked from the finished archive: a zip, a body that restarted,
+    /// or a streamed extraction that failed.
+    FromArchive,
+}
+
+/// Download `url` into `dest_dir` and extract it there, unpacking tarballs
+/// (.tar.gz, .tgz, .tar.bz2, .tar.xz, .txz, .tar.zst) as the body streams
+/// in. When `expected_sha256` is given the body is verified before this
+/// returns `Ok`; the archive itself is removed afterwards.
+///
+/// On error `dest_dir` may hold a partial tree: extract into a staging
+/// directory and discard it.
+pub async fn download_and_extract(
+    url: &str,
+    dest_dir: &Path,
+    expected_sha256: Option<&str>,
+    on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
+) -> Result<()> {
+    download_and_extract_using(
+        http::client(),
+        url,
+        dest_dir,
+        expected_sha256,
+        on_progress,
+        RetryTiming::PRODUCTION,
+    )
+    .await
+    .map(|_| ())
+}
+
+pub(super) async fn download_and_extract_using(
+    client: &reqwest::Client,
+    url: &str,
+    dest_dir: &Path,
+    expected_sha256: Option<&str>,
+    on_progress: &mut (dyn FnMut(&DownloadProgress) + Send),
+    timing: RetryTiming,
+) -> Result<Extraction> {
+    let filename = url.rsplit('/').next().unwrap_or("download");
+    let Some(compression) = TarCompression::from_file_name(filename) else {
+        let archive =
+            download_to(client, url, dest_dir, expected_sha256, on_progress, timing).await?;
+        extractor::extract(&archive, dest_dir)?;
+        let _ = std::fs::remove_file(&archive);
+        return Ok(Extraction::FromArchive);
+    };
+
+    let (tap, body) = bounded(TAP_QUEUE_CHUNKS);
+    let target = dest_dir.to_path_buf();
+    let label = filename.to_string();
+    let unpacking = tokio::task::spawn_blocking(move || {
+        extractor::extract_tar_stream(ChunkReader::new(body), compression, &target, 0, &label)
+    });
+    let downloaded = download_to_tapped(
+        client,
+        url,
+        dest_dir,
+        expected_sha256,
+        on_progress,
+        timing,
+        Some(tap),
+    )
+    .await;
+    // Join before anything else touches `dest_dir`; the download ending
+    // closed the tap, so the extractor is at most finishing its last entry.
+    let unpacked = unpacking.await;
+    let (archive, tapped) = downloaded?;
+
+    let extraction = match unpacked {
+        Ok(Ok(())) if tapped => Extraction::Streamed,
+        outcome => {
+            let reason = match outcome {
+                Ok(Ok(())) => "the download restarted".to_string(),
+                Ok(Err(e)) => e.to_string(),
+                Err(e) => format!("extraction task failed: {e}"),
+            };
+            tracing::info!(
+                "{}: streamed extraction abandoned ({}); extracting the downloaded archive",
+                filename,
+                reason
+            );
+            clear_except(dest_dir, &archive)?;
+            extractor::extract(&archive, dest_dir)?;
+            Extraction::FromArchive
+        }
+    };
+    let _ = std::fs::remove_file(&archive);
+    Ok(extraction)
+}
+
+/// Remove everything in `dir` except `keep`.
+fn clear_except(dir: &Path, keep: &Path) -> Result<()> {
+    for entry in std::fs::read_dir(dir)? {
+        let path = entry?.path();
+        if path == keep {
+            continue;
+        }
+        let removed = if path.is_dir() {
+            std::fs::remove_dir_all(&path)
+        } else {
+            std::fs::remove_file(&path)
+        };
+        removed.map_err(|e| {
+            FbuildError::PackageError(format!("failed to remove {}: {}", path.display(), e))
+        })?;
+    }
+    Ok(())
+}
@@ -0,0 +1,459 @@
+//! Process-wide download scheduling, shared by every build the daemon runs.
+//!
+//! Each GET attempt takes a slot from [`Scheduler::acquire`]: at most
+//! `per_host` transfers talk to one host and at most `max_concurrent` run
+//! at all, and with a bandwidth cap the body is paced chunk by chunk. A slot
+//! is held for one attempt only, so a download backing off between retries
+//! does not keep others queued.
+//!
+//! [`InFlight`] coalesces work by key: a caller asking for something that
+//! is already being fetched waits for that one run and shares its result
+//! instead of starting a second transfer.
+//!
+//! Limits come from the environment, read once per process:
+//! `FBUILD_DOWNLOAD_CONCURRENCY` (default 8), `FBUILD_DOWNLOAD_PER_HOST`
+//! (default 4) and `FBUILD_DOWNLOAD_BYTES_PER_SEC` (unset: no cap).
+
+use std::collections::HashMap;
+use std::future::Future;
+use std::sync::{Arc, Mutex, OnceLock, PoisonError};
+use std::time::Duration;
+
+use fbuild_core::{FbuildError, Result};
+use tokio::sync::{OnceCell, OwnedSemaphorePermit, Semaphore};
+use tokio::time::Instant;
+
+const DEFAULT_MAX_CONCURRENT: usize = 8;
+const DEFAULT_PER_HOST: usize = 4;
+
+/// The slot semaphores are never closed, so acquiring one cannot fail.
+const CLOSED: &str = "download slot semaphores are never closed";
+
+/// Caps applied to every download in the process.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub(crate) struct DownloadLimits {
+    pub(crate) max_concurrent: usize,
+    pub(crate) per_host: usize,
+    pub(crate) bytes_per_sec: Option<u64>,
+}
+
+impl DownloadLimits {
+    /// Read the limits from the `FBUILD_DOWNLOAD_*` env vars. Unset,
+    /// invalid or zero values fall back to the defaults.
+    fn from_env() -> Self {
+        Self {
+            max_concurrent: env_positive("FBUILD_DOWNLOAD_CONCURRENCY")
+                .map_or(DEFAULT_MAX_CONCURRENT, |n| n as usize),
+            per_host: env_positive("FBUILD_DOWNLOAD_PER_HOST")
+                .map_or(DEFAULT_PER_HOST, |n| n as usize),
+            bytes_per_sec: env_positive("FBUILD_DOWNLOAD_BYTES_PER_SEC"),
+        }
+    }
+}
+
+fn env_positive(name: &str) -> Option<u64> {
+    std::env::var(name)
+        .ok()
+        .and_then(|s| s.trim().parse::<u64>().ok())
+        .filter(|&n| n > 0)
+}
+
+/// The process-wide scheduler, built from [`DownloadLimits::from_env`] on
+/// first use.
+pub(crate) fn global() -> &'static Scheduler {
+    static SCHEDULER: OnceLock<Scheduler> = OnceLock::new();
+    SCHEDULER.get_or_init(|| Scheduler::new(DownloadLimits::from_env()))
+}
+
+/// Connection slots and the bandwidth pacer. See the module docs.
+pub(crate) struct Scheduler {
+    limits: DownloadLimits,
+    global: Arc<Semaphore>,
+    hosts: Mutex<HashMap<String, Arc<Semaphore>>>,
+    /// When the bandwidth budget is next free; `None` without a cap.
+    pacer: Option<Mutex<Instant>>,
+}
+
+/// A held download slot; dropping it frees the slot.
+pub(crate) struct Slot {
+    _host: OwnedSemaphorePermit,
+    _global: OwnedSemaphorePermit,
+}
+
+impl Scheduler {
+    pub(crate) fn new(limits: DownloadLimits) -> Self {
+        let limits = DownloadLimits {
+            max_concurrent: limits.max_concurrent.max(1),
+            per_host: limits.per_host.max(1),
+            ..limits
+        };
+        Self {
+            global: Arc::new(Semaphore::new(limits.max_concurrent)),
+            hosts: Mutex::new(HashMap::new()),
+            pacer: limits.bytes_per_sec.map(|_| Mutex::new(Instant::now())),
+            limits,
+        }
+    }
+
+    /// Take a slot for one attempt at `url`. `on_queued` runs once, before
+    /// waiting, when no slot is free right away.
+    pub(crate) async fn acquire(&self, url: &str, on_queued: impl FnOnce()) -> Slot {
+        let host = self.host_semaphore(url);
+        if let Ok(host_permit) = host.clone().try_acquire_owned() {
+            if let Ok(global_permit) = self.global.clone().try_acquire_owned() {
+                return Slot {
+                    _host: host_permit,
+                    _global: global_permit,
+                };
+            }
+        }
+        on_queued();
+        // Host first: a download stuck behind its own host must not sit on
+        // a global slot another host could use.
+        let host_permit = host.acquire_owned().await.expect(CLOSED);
+        let global_permit = self.global.clone().acquire_owned().await.expect(CLOSED);
+        Slot {
+            _host: host_permit,
+            _global: global_permit,
+        }
+    }
+
+    fn host_semaphore(&self, url: &str) -> Arc<Semaphore> {
+        let mut hosts = self.hosts.lock().unwrap_or_else(PoisonError::into_inner);
+        hosts
+            .entry(host_key(url))
+            .or_insert_with(|| Arc::new(Semaphore::new(self.limits.per_host)))
+            .clone()
+    }
+
+    /// Wait until `len` more bytes fit the bandwidth cap. Returns at once
+    /// without one.
+    pub(crate) async fn pace(&self, len: usize) {
+        let (Some(pacer), Some(rate)) = (&self.pacer, self.limits.bytes_per_sec) else {
+            return;
+        };
+        let start = {
+            let mut next = pacer.lock().unwrap_or_else(PoisonError::into_inner);
+            let start = (*next).max(Instant::now());
+            *next = start + Duration::from_secs_f64(len as f64 / rate as f64);
+            start
+        };
+        // The chunk may go once the bytes before it have had their time;
+        // an idle budget does not bank a burst.
+        tokio::time::sleep_until(start).await;
+    }
+}
+
+/// `host:port` of `url`, the unit the per-host limit counts. Unparseable
+/// URLs share one bucket; their requests fail on their own.
+fn host_key(url: &str) -> String {
+    match reqwest::Url::parse(url) {
+        Ok(parsed) => format!(
+            "{}:{}",
+            parsed.host_str().unwrap_or_default(),
+            parsed.port_or_known_default().unwrap_or_default()
+        ),
+        Err(_) => String::new(),
+    }
+}
+
+type Shared<T> = Arc<OnceCell<std::result::Result<T, String>>>;
+
+/// Coalesces concurrent runs of the same keyed job. An entry exists only
+/// while its job runs, so nothing is memoized past the run: the next call
+/// after it finishes starts afresh.
+pub(crate) struct InFlight<T> {
+    running: Mutex<HashMap<String, Shared<T>>>,
+}
+
+impl<T: Clone> InFlight<T> {
+    pub(crate) fn new() -> Self {
+        Self {
+            running: Mutex::new(HashMap::new()),
+        }
+    }
+
+    /// Run `job` for `key`, or, when a run for `key` is already going,
+    /// call `on_wait` and share that run's outcome. Waiters see the
+    /// leader's error as [`FbuildError::Other`] with the same message. If
+    /// the leader is cancelled, one waiter takes the job over.
+    pub(crate) async fn run<F, Fut>(&self, key: &str, on_wait: impl FnOnce(), job: F) -> Result<T>
+    where
+        F: FnOnce() -> Fut,
+        Fut: Future<Output = Result<T>>,
+    {
+        let (shared, waiting) = {
+            let mut running = self.running.lock().unwrap_or_else(PoisonError::into_inner);
+            match running.get(key) {
+                Some(shared) => (shared.clone(), true),
+                None => {
+                    let shared: Shared<T> = Arc::default();
+                    running.insert(key.to_string(), shared.clone());
+                    (shared, false)
+                }
+            }
+        };
+        if waiting {
+            on_wait();
+        }
+        let _finished = Finished {
+            running: &self.running,
+            key,
+            shared: &shared,
+        };
+        let mut own = None;
+        let own_slot = &mut own;
+        let outcome = shared
+            .get_or_init(move || async move {
+                let result = job().await;
+                let outcome = match &result {
+                    Ok(value) => Ok(value.clone()),
+                    Err(error) => Err(error.to_string()),
+                };
+                *own_slot = Some(result);
+                outcome
+            })
+            .await;
+        match own {
+            Some(result) => result,
+            None => outcome.clone().map_err(FbuildError::Other),
+        }
+    }
+}
+
+/// Removes a run's entry once the run is over: when its outcome is in, or
+/// when the last caller attached to it is cancelled before that. A caller
+/// cancelled while others still wait (or one of them has taken the job
+/// over) leaves the entry, so later callers keep joining that run. An
+/// entry a newer run already replaced is never touched.
+struct Finished<'a, T> {
+    running: &'a Mutex<HashMap<String, Shared<T>>>,
+    key: &'a str,
+    shared: &'a Shared<T>,
+}
+
+impl<T> Drop for Finished<'_, T> {
+    fn drop(&mut self) {
+        let mut running = self.running.lock().unwrap_or_else(PoisonError::into_inner);
+        let ours = running
+            .get(self.key)
+            .is_some_and(|current| Arc::ptr_eq(current, self.shared));
+        // Under the lock no caller can attach, so two references (the map's
+        // and ours) mean nobody else is on this run.
+        let last = Arc::strong_count(self.shared) <= 2;
+        if ours && (self.shared.initialized() || last) {
+            running.remove(self.key);
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::sync::atomic::{AtomicBool, AtomicUsize, Ordering};
+
+    fn limits(max_concurrent: usize, per_host: usize) -> DownloadLimits {
+        DownloadLimits {
+            max_concurrent,
+            per_host,
+            bytes_per_sec: None,
+        }
+    }
+
+    #[test]
+    fn host_key_includes_the_port() {
+        assert_eq!(host_key("https://example.com/a.tar.gz"), "example.com:443");
+        assert_eq!(host_key("http://127.0.0.1:8080/a"), "127.0.0.1:8080");
+        assert_eq!(host_key("not a url"), "");
+    }
+
+    #[tokio::test]
+    async fn per_host_limit_queues_only_that_host() {
+        let scheduler = Scheduler::new(limits(8, 1));
+        let _first = scheduler.acquire("http://a.test/1", || {}).await;
+        // Another host is not held up by `a.test`.
+        let mut queued = false;
+        let _other = scheduler.acquire("http://b.test/1", || queued = true).await;
+        assert!(!queued);
+
+        let second = tokio::time::timeout(
+            Duration::from_millis(50),
+            scheduler.acquire("http://a.test/2", || {}),
+        )
+        .await;
+        assert!(second.is_err(), "a second slot for a.test must wait");
+    }
+
+    #[tokio::test]
+    async fn global_limit_caps_all_hosts_and_frees_on_drop() {
+        let scheduler = Scheduler::new(limits(1, 4));
+        let first = scheduler.acquire("http://a.test/1", || {}).await;
+        let queued = AtomicBool::new(false);
+        let waiting = scheduler.acquire("http://b.test/1", || queued.store(true, Ordering::SeqCst));
+        tokio::pin!(waiting);
+        assert!(
+            tokio::time::timeout(Duration::from_millis(50), &mut waiting)
+                .await
+                .is_err()
+        );
+        drop(first);
+        tokio::time::timeout(Duration::from_secs(5), waiting)
+            .await
+            .expect("the slot is handed over once freed");
+        assert!(queued.load(Ordering::SeqCst));
+    }
+
+    #[tokio::test]
+    async fn bandwidth_cap_paces_chunks() {
+        let scheduler = Scheduler::new(DownloadLimits {
+            bytes_per_sec: Some(1_000_000),
+            ..limits(8, 4)
+        });
+        let started = std::time::Instant::now();
+        // 5 × 100 kB at 1 MB/s: the fifth chunk waits for the first four.
+        for _ in 0..5 {
+            scheduler.pace(100_000).await;
+        }
+        assert!(started.elapsed() >= Duration::from_millis(350));
+    }
+
+    #[tokio::test]
+    async fn in_flight_runs_a_key_once_for_concurrent_callers() {
+        let in_flight = InFlight::<usize>::new();
+        let runs = AtomicUsize::new(0);
+        let waits = AtomicUsize::new(0);
+        let (gate_tx, gate_rx) = tokio::sync::oneshot::channel::<()>();
+        let leader = in_flight.run(
+            "k",
+            || {
+                waits.fetch_add(1, Ordering::SeqCst);
+            },
+            || async {
+                runs.fetch_add(1, Ordering::SeqCst);
+                let _ = gate_rx.await;
+                Ok(7)
+            },
+        );
+        let follower = async {
+            // Let the leader register and start first.
+            tokio::task::yield_now().await;
+            let value = in_flight
+                .run(
+                    "k",
+                    || {
+                        waits.fetch_add(1, Ordering::SeqCst);
+                    },
+                    || async {
+                        runs.fetch_add(1, Ordering::SeqCst);
+                        Ok(8)
+                    },
+                )
+                .await;
+            value
+        };
+        let release = async {
+            tokio::task::yield_now().await;
+            tokio::task::yield_now().await;
+            let _ = gate_tx.send(());
+        };
+        let (a, b, ()) = tokio::join!(leader, follower, release);
+        assert_eq!((a.unwrap(), b.unwrap()), (7, 7));
+        assert_eq!(runs.load(Ordering::SeqCst), 1);
+        assert_eq!(waits.load(Ordering::SeqCst), 1);
+
+        // Finished runs are not memoized.
+        let again = in_flight.run("k", || {}, || async { Ok(9) }).await;
+        assert_eq!(again.unwrap(), 9);
+    }
+
+    #[tokio::test]
+    async fn in_flight_shares_the_leaders_error() {
+        let in_flight = InFlight::<usize>::new();
+        let (gate_tx, gate_rx) = tokio::sync::oneshot::channel::<()>();
+        let leader = in_flight.run(
+            "k",
+            || {},
+            || async {
+                let _ = gate_rx.await;
+                Err(FbuildError::PackageError("HTTP 404".to_string()))
+            },
+        );
+        let follower = async {
+            tokio::task::yield_now().await;
+            in_flight.run("k", || {}, || async { Ok(1) }).await
+        };
+        let release = async {
+            tokio::task::yield_now().await;
+            tokio::task::yield_now().await;
+            let _ = gate_tx.send(());
+        };
+        let (a, b, ()) = tokio::join!(leader, follower, release);
+        let leader_error = a.unwrap_err();
+        assert!(matches!(leader_error, FbuildError::PackageError(_)));
+        assert_eq!(b.unwrap_err().to_string(), leader_error.to_string());
+    }
+
+    #[tokio::test]
+    async fn a_cancelled_waiter_does_not_end_the_leaders_run() {
+        let in_flight = InFlight::<usize>::new();
+        let runs = AtomicUsize::new(0);
+        let (gate_tx, gate_rx) = tokio::sync::oneshot::channel::<()>();
+        let leader = in_flight.run(
+            "k",
+            || {},
+            || async {
+                runs.fetch_add(1, Ordering::SeqCst);
+                let _ = gate_rx.await;
+                Ok(7)
+            },
+        );
+        tokio::pin!(leader);
+        // Start the leader and leave it parked on the gate.
+        assert!(
+            tokio::time::timeout(Duration::from_millis(20), &mut leader)
+                .await
+                .is_err()
+        );
+
+        // A waiter gives up while the leader is still downloading.
+        let cancelled = tokio::time::timeout(
+            Duration::from_millis(20),
+            in_flight.run(
+                "k",
+                || {},
+                || async {
+                    runs.fetch_add(1, Ordering::SeqCst);
+                    Ok(8)
+                },
+            ),
+        )
+        .await;
+        assert!(cancelled.is_err());
+
+        // A third caller still joins the leader's run.
+        let waited = AtomicBool::new(false);
+        let third = in_flight.run(
+            "k",
+            || waited.store(true, Ordering::SeqCst),
+            || async {
+                runs.fetch_add(1, Ordering::SeqCst);
+                Ok(9)
+            },
+        );
+        let release = async {
+            tokio::task::yield_now().await;
+            let _ = gate_tx.send(());
+        };
+        let (a, c, ()) = tokio::join!(leader, third, release);
+        assert_eq!((a.unwrap(), c.unwrap()), (7, 7));
+        assert_eq!(runs.load(Ordering::SeqCst), 1);
+        assert!(waited.load(Ordering::SeqCst));
+        assert!(
+            in_flight
+                .running
+                .lock()
+                .unwrap_or_else(PoisonError::into_inner)
+                .is_empty()
+        );
+    }
+}
@@ -1,29 +1,36 @@
 //! Archive extraction: tar.gz, tar.bz2, tar.xz, tar.zst, zip.
 //!
-//! All extraction is pure Rust — no subprocess calls.
+//! All extraction is pure Rust — no subprocess calls. Tarballs unpack with
+//! a writer pool by default (see the `parallel` module); zip archives
+//! extract on the calling thread.
 
+mod parallel;
+
+use std::io::Read;
 use std::path::Path;
 
 use fbuild_core::{FbuildError, Result};
 
+pub(crate) use parallel::ChunkReader;
+
 /// Extract an archive into the given directory.
 ///
 /// Supported formats: .tar.gz, .tgz, .tar.bz2, .tar.xz, .txz, .tar.zst, .zip
 pub fn extract(archive_path: &Path, dest_dir: &Path) -> Result<()> {
+    extract_with_workers(archive_path, dest_dir, 0)
+}
+
+/// [`extract`] with `workers` threads writing a tarball's files: `0` means
+/// one per core, `1` unpacks everything on the calling thread.
+pub fn extract_with_workers(archive_path: &Path, dest_dir: &Path, workers: usize) -> Result<()> {
     let name = archive_path
         .file_name()
         .unwrap_or_default()
         .to_string_lossy()
         .to_lowercase();
 
-    if name.ends_with(".tar.gz") || name.ends_with(".tgz") {
-        extract_tar_gz(archive_path, dest_dir)
-    } else if name.ends_with(".tar.bz2") {
-        extract_tar_bz2(archive_path, dest_dir)
-    } else if name.ends_with(".tar.xz") || name.ends_with(".txz") {
-        extract_tar_xz(archive_path, dest_dir)
-    } else if name.ends_with(".tar.zst") {
-        extract_tar_zst(archive_path, dest_dir)
+    if let Some(compression) = TarCompression::from_file_name(&name) {
+        extract_tar(archive_path, compression, dest_dir, workers)
     } else if name.ends_with(".zip") {
         extract_zip(archive_path, dest_dir)
     } else {
@@ -34,6 +41,36 @@ pub fn extract(archive_path: &Path, dest_dir: &Path) -> Result<()> {
     }
 }
 
+/// The compression around a tarball. Tarballs can be unpacked front to
+/// back from any reader (see [`extract_tar_stream`]); zip cannot, since
+/// its directory sits at the end of the file.
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+pub enum TarCompression {
+    Gzip,
+    Bzip2,
+    Xz,
+    Zstd,
+}
+
+impl TarCompression {
+    /// The compression an archive's file name implies, or `None` for zip
+    /// and unknown formats. Case-insensitive.
+    pub fn from_file_name(name: &str) -> Option<Self> {
+        let name = name.to_lowercase();
+        if name.ends_with(".tar.gz") || name.ends_with(".tgz") {
+            Some(Self::Gzip)
+        } else if name.ends_with(".tar.bz2") {
+            Some(Self::Bzip2)
+        } else if name.ends_with(".tar.xz") || name.ends_with(".txz") {
+            Some(Self::Xz)
+        } else if name.ends_with(".tar.zst") {
+            Some(Self::Zstd)
+        } else {
+            None
+        }
+    }
+}
+
 /// Extract a `.zip` archive. Public so callers (e.g. lnk materializer)
 /// can dispatch without depending on the source file's extension.
 pub fn extract_zip_public(archive_path: &Path, dest_dir: &Path) -> Result<()> {
@@ -43,68 +80,67 @@ pub fn extract_zip_public(archive_path: &Path, dest_dir: &Path) -> Result<()> {
 /// Extract a `.tar.gz` archive. Public so callers (e.g. lnk materializer)
 /// can dispatch without depending on the source file's extension.
 pub fn extract_tar_gz_public(archive_path: &Path, dest_dir: &Path) -> Result<()> {
-    extract_tar_gz(archive_path, dest_dir)
-}
-
-fn extract_tar_gz(archive_path: &Path, dest_dir: &Path) -> Result<()> {
-    let file = std::fs::File::open(archive_path)?;
-    let decoder = flate2::read::GzDecoder::new(file);
-    let mut archive = tar::Archive::new(decoder);
-    archive.unpack(dest_dir).map_err(|e| {
-        FbuildError::PackageError(format!(
-            "failed to extract {}: {}",
-            archive_path.display(),
-            e
-        ))
-    })?;
-    Ok(())
+    extract_tar(archive_path, TarCompression::Gzip, dest_dir, 0)
 }
 
-fn extract_tar_bz2(archive_path: &Path, dest_dir: &Path) -> Result<()> {
-    let file = std::fs::File::open(archive_path)?;
-    let decoder = bzip2::read::BzDecoder::new(file);
-    let mut archive = tar::Archive::new(decoder);
-    archive.unpack(dest_dir).map_err(|e| {
-        FbuildError::PackageError(format!(
-            "failed to extract {}: {}",
-            archive_path.display(),
-            e
-        ))
-    })?;
-    Ok(())
+/// Decompress and unpack a tarball read front to back from `reader`, e.g.
+/// a download still in flight, with `workers` as for
+/// [`extract_with_workers`]. `label` names the archive in errors.
+pub fn extract_tar_stream<R: Read + Send>(
+    reader: R,
+    compression: TarCompression,
+    dest_dir: &Path,
+    workers: usize,
+    label: &str,
+) -> Result<()> {
+    match compression {
+        TarCompression::Gzip => unpack(
+            flate2::read::GzDecoder::new(reader),
+            dest_dir,
+            workers,
+            label,
+        ),
+        TarCompression::Bzip2 => unpack(
+            bzip2::read::BzDecoder::new(reader),
+            dest_dir,
+            workers,
+            label,
+        ),
+        TarCompression::Xz => unpack(xz2::read::XzDecoder::new(reader), dest_dir, workers, label),
+        TarCompression::Zstd => {
+            let decoder = zstd::Decoder::new(reader).map_err(|e| {
+                FbuildError::PackageError(format!("failed to open zstd {}: {}", label, e))
+            })?;
+            unpack(decoder, dest_dir, workers, label)
+        }
+    }
 }
 
-fn extract_tar_zst(archive_path: &Path, dest_dir: &Path) -> Result<()> {
+fn extract_tar(
+    archive_path: &Path,
+    compression: TarCompression,
+    dest_dir: &Path,
+    workers: usize,
+) -> Result<()> {
     let file = std::fs::File::open(archive_path)?;
-    let decoder = zstd::Decoder::new(file).map_err(|e| {
-        FbuildError::PackageError(format!(
-            "failed to open zstd {}: {}",
-            archive_path.display(),
-            e
-        ))
-    })?;
-    let mut archive = tar::Archive::new(decoder);
-    archive.unpack(dest_dir).map_err(|e| {
-        FbuildError::PackageError(format!(
-            "failed to extract {}: {}",
-            archive_path.display(),
-            e
-        ))
-    })?;
-    Ok(())
+    extract_tar_stream(
+        file,
+        compression,
+        dest_dir,
+        workers,
+        &archive_path.display().to_string(),
+    )
 }
 
-fn extract_tar_xz(archive_path: &Path, dest_dir: &Path) -> Result<()> {
-    let file = std::fs::File::open(archive_path)?;
-    let decoder = xz2::read::XzDecoder::new(file);
+fn unpack<R: Read + Send>(decoder: R, dest_dir: &Path, workers: usize, label: &str) -> Result<()> {
+    let workers = parallel::effective_workers(workers);
+    if workers > 1 {
+        return parallel::unpack(decoder, dest_dir, workers, label);
+    }
     let mut archive = tar::Archive::new(decoder);
-    archive.unpack(dest_dir).map_err(|e| {
-        FbuildError::PackageError(format!(
-            "failed to extract {}: {}",
-            archive_path.display(),
-            e
-        ))
-    })?;
+    archive
+        .unpack(dest_dir)
+        .map_err(|e| FbuildError::PackageError(format!("failed to extract {}: {}", label, e)))?;
     Ok(())
 }
 
@@ -292,6 +328,245 @@ mod tests {
         assert!(result.is_err(), "corrupt zip should return an error");
     }
 
+    #[test]
+    fn test_tar_compression_from_file_name() {
+        assert_eq!(
+            TarCompression::from_file_name("tool.TGZ"),
+            Some(TarCompression::Gzip)
+        );
+        assert_eq!(
+            TarCompression::from_file_name("tool.tar.bz2"),
+            Some(TarCompression::Bzip2)
+        );
+        assert_eq!(
+            TarCompression::from_file_name("tool.txz"),
+            Some(TarCompression::Xz)
+        );
+        assert_eq!(
+            TarCompression::from_file_name("tool.tar.zst"),
+            Some(TarCompression::Zstd)
+        );
+        assert_eq!(TarCompression::from_file_name("tool.zip"), None);
+    }
+
+    /// `extract_tar_stream` needs only a front-to-back reader, not a file.
+    #[test]
+    fn test_extract_tar_zst_stream() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let mut builder = tar::Builder::new(Vec::new());
+        let mut header = tar::Header::new_gnu();
+        header.set_size(17);
+        header.set_mode(0o644);
+        header.set_cksum();
+        builder
+            .append_data(&mut header, "dir/hello.txt", &b"hello from stream"[..])
+            .expect("append entry");
+        let tarball = builder.into_inner().expect("finish tar");
+        let compressed = zstd::encode_all(tarball.as_slice(), 3).expect("compress");
+
+        extract_tar_stream(
+            std::io::Cursor::new(compressed),
+            TarCompression::Zstd,
+            tmp.path(),
+            1,
+            "stream.tar.zst",
+        )
+        .expect("extraction should succeed");
+
+        let bytes = std::fs::read(tmp.path().join("dir/hello.txt")).unwrap();
+        assert_eq!(bytes, b"hello from stream");
+    }
+
+    /// Helper: a gzipped tarball shaped like a toolchain — nested
+    /// directories, many small files, one above the writer pool's limit, an
+    /// executable, a symlink and a hard link — plus a path that appears
+    /// twice and an entry escaping with `..`.
+    fn make_toolchain_tar_gz(dest: &Path) {
+        use flate2::Compression;
+        use flate2::write::GzEncoder;
+
+        type Builder = tar::Builder<GzEncoder<std::fs::File>>;
+
+        fn add(builder: &mut Builder, path: &str, mode: u32, data: &[u8]) {
+            let mut h = header(tar::EntryType::Regular, mode, data.len());
+            builder.append_data(&mut h, path, data).expect("append");
+        }
+
+        fn header(kind: tar::EntryType, mode: u32, size: usize) -> tar::Header {
+            let mut header = tar::Header::new_gnu();
+            header.set_entry_type(kind);
+            header.set_mode(mode);
+            header.set_size(size as u64);
+            header.set_mtime(1_700_000_000);
+            header
+        }
+
+        let file = std::fs::File::create(dest).expect("create tar.gz");
+        let mut builder = tar::Builder::new(GzEncoder::new(file, Compression::fast()));
+        for dir in ["pkg/", "pkg/bin/", "pkg/include/", "pkg/lib/"] {
+            let mut h = header(tar::EntryType::Directory, 0o750, 0);
+            builder
+                .append_data(&mut h, dir, &[][..])
+                .expect("append dir");
+        }
+        for i in 0..300 {
+            add(
+                &mut builder,
+                &format!("pkg/include/sub{}/h{i}.h", i % 7),
+                0o644,
+                format!("#define H{i} {i}\n").as_bytes(),
+            );
+        }
+        let big: Vec<u8> = (0..3 * 1024 * 1024).map(|i| (i % 251) as u8).collect();
+        add(&mut builder, "pkg/lib/libbig.a", 0o644, &big);
+        add(
+            &mut builder,
+            "pkg/bin/tool",
+            0o755,
+            b"#!/bin/sh\necho tool\n",
+        );
+        add(
+            &mut builder,
+            "pkg/include/sub0/h0.h",
+            0o600,
+            b"second copy wins",
+        );
+
+        let mut link = header(tar::EntryType::Link, 0o755, 0);
+        builder
+            .append_link(&mut link, "pkg/bin/tool-alias", "pkg/bin/tool")
+            .expect("append hard link");
+        if cfg!(unix) {
+            let mut symlink = header(tar::EntryType::Symlink, 0o777, 0);
+            builder
+                .append_link(&mut symlink, "pkg/lib/libbig.so", "libbig.a")
+                .expect("append symlink");
+        }
+        // `tar::Builder` refuses `..` paths, so write the name by hand.
+        let mut escape = header(tar::EntryType::Regular, 0o644, 4);
+        let name = b"../escape.txt";
+        escape.as_gnu_mut().unwrap().name[..name.len()].copy_from_slice(name);
+        escape.set_cksum();
+        builder
+            .append(&escape, &b"oops"[..])
+            .expect("append escape");
+
+        builder
+            .into_inner()
+            .expect("finish tar")
+            .finish()
+            .expect("finish encoder");
+    }
+
+    /// Every entry below `root` with its type, contents and (on Unix) mode
+    /// and mtime, in path order.
+    fn describe_tree(root: &Path) -> Vec<(String, String)> {
+        walkdir::WalkDir::new(root)
+            .sort_by_file_name()
+            .min_depth(1)
+            .into_iter()
+            .map(|entry| {
+                let entry = entry.unwrap();
+                let rel = fbuild_core::path::NormalizedPath::new(entry.path())
+                    .relative_to(&fbuild_core::path::NormalizedPath::new(root))
+                    .unwrap();
+                let meta = std::fs::symlink_metadata(entry.path()).unwrap();
+                let mut what = if meta.file_type().is_symlink() {
+                    format!(
+                        "link -> {}",
+                        std::fs::read_link(entry.path()).unwrap().display()
+                    )
+                } else if meta.is_dir() {
+                    "dir".to_string()
+                } else {
+                    let bytes = std::fs::read(entry.path()).unwrap();
+                    format!(
+                        "file {} bytes, sum {}",
+                        bytes.len(),
+                        bytes.iter().map(|&b| b as u64).sum::<u64>()
+                    )
+                };
+                #[cfg(unix)]
+                if !meta.file_type().is_symlink() {
+                    use std::os::unix::fs::PermissionsExt;
+                    what.push_str(&format!(", mode {:o}", meta.permissions().mode() & 0o777));
+                    if meta.is_file() {
+                        let mtime = meta
+                            .modified()
+                            .unwrap()
+                            .duration_since(std::time::UNIX_EPOCH)
+                            .unwrap();
+                        what.push_str(&format!(", mtime {}", mtime.as_secs()));
+                    }
+                }
+                (rel.display_slash(), what)
+            })
+            .collect()
+    }
+
+    /// The writer pool produces the same tree as unpacking on one thread.
+    #[test]
+    fn test_parallel_extract_matches_single_threaded() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let archive = tmp.path().join("toolchain.tar.gz");
+        make_toolchain_tar_gz(&archive);
+
+        let serial = tmp.path().join("serial/out");
+        let parallel = tmp.path().join("parallel/out");
+        extract_with_workers(&archive, &serial, 1).expect("serial extraction");
+        extract_with_workers(&archive, &parallel, 4).expect("parallel extraction");
+
+        let tree = describe_tree(&parallel);
+        assert_eq!(tree, describe_tree(&serial));
+        assert_eq!(
+            std::fs::read(parallel.join("pkg/include/sub0/h0.h")).unwrap(),
+            b"second copy wins"
+        );
+        assert_eq!(
+            std::fs::read(parallel.join("pkg/bin/tool-alias")).unwrap(),
+            b"#!/bin/sh\necho tool\n"
+        );
+        assert_eq!(
+            std::fs::read(parallel.join("pkg/lib/libbig.a"))
+                .unwrap()
+                .len(),
+            3 * 1024 * 1024
+        );
+        assert!(!tmp.path().join("parallel/escape.txt").exists());
+        assert!(tree.len() > 300, "{} entries", tree.len());
+    }
+
+    /// Async callers (the install pipeline's fallback, framework library
+    /// installs) extract on a runtime thread; the pool must not panic there.
+    #[tokio::test]
+    async fn test_parallel_extract_runs_inside_a_tokio_runtime() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let archive = tmp.path().join("toolchain.tar.gz");
+        make_toolchain_tar_gz(&archive);
+
+        let out = tmp.path().join("out");
+        extract_with_workers(&archive, &out, 4).expect("parallel extraction");
+        assert_eq!(
+            std::fs::read(out.join("pkg/bin/tool-alias")).unwrap(),
+            b"#!/bin/sh\necho tool\n"
+        );
+    }
+
+    #[test]
+    fn test_parallel_extract_reports_corrupt_stream() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let archive = tmp.path().join("toolchain.tar.gz");
+        make_toolchain_tar_gz(&archive);
+        let mut bytes = std::fs::read(&archive).unwrap();
+        let middle = bytes.len() / 2;
+        bytes.truncate(middle);
+        std::fs::write(&archive, &bytes).unwrap();
+
+        let err = extract_with_workers(&archive, &tmp.path().join("out"), 4)
+            .expect_err("a truncated archive must fail");
+        assert!(err.to_string().contains("failed to extract"), "{err}");
+    }
+
     /// `.tgz` is an alias for `.tar.gz` and should be handled.
     #[test]
     fn test_extract_tgz_extension() {
@@ -0,0 +1,403 @@
+//! Parallel tarball unpacking: one thread decompresses, another walks the
+//! tar headers, and a pool of writer threads creates the files. The stages
+//! hand off over blocking channel calls, which tokio forbids on a runtime
+//! thread, so the calling thread only waits for them; [`unpack`] is safe to
+//! call from async code.
+//!
+//! Toolchain archives hold tens of thousands of small files, so
+//! `tar::Archive::unpack` spends most of its time in one thread's
+//! `create` + `write` + `chmod` round-trips while decompression waits on
+//! them. Here directories are created as the walk reaches them, regular
+//! files up to [`POOLED_WRITE_MAX_BYTES`] are read into memory and queued
+//! for the writers, and bigger ones stream to disk from the walking thread,
+//! the same split `cache_archive::restore` uses. Decompression runs one
+//! stage ahead on its own thread: gzip, bzip2 and xz streams, and the
+//! single-frame zstd archives toolchains ship as, only decode front to back.
+//!
+//! The tree matches what `tar::Archive::unpack` produces: entries with a
+//! `..` component are skipped, permission bits and mtimes are applied, a
+//! later copy of a path wins, and directory permissions are set last,
+//! deepest first. Symlinks, devices and anything beneath a symlink the
+//! archive created go through tar's own checked `unpack_in`, in archive
+//! order; hard links are made once every file is on disk.
+
+use std::collections::HashSet;
+use std::fs::{File, OpenOptions};
+use std::io::{self, BufWriter, Read, Write};
+use std::path::{Component, Path};
+use std::sync::{Mutex, PoisonError};
+use std::time::{Duration, SystemTime};
+
+use fbuild_core::channel::{Receiver, Sender, bounded};
+use fbuild_core::path::NormalizedPath;
+use fbuild_core::platform::fs::{set_file_mode_bits, set_mode_bits};
+use fbuild_core::{FbuildError, Result};
+
+/// Largest file the walk hands to the writer pool. Bigger files stream
+/// straight from the decoder instead of being buffered for a writer.
+const POOLED_WRITE_MAX_BYTES: u64 = 1 << 20;
+
+/// Write jobs queued per writer thread. With [`POOLED_WRITE_MAX_BYTES`]
+/// this caps the bytes in flight at 4 MiB per writer.
+const WRITE_QUEUE_PER_WORKER: usize = 4;
+
+/// Decompressed bytes per message from the decoder thread.
+const DECODE_CHUNK_BYTES: usize = 256 * 1024;
+
+/// Decoded chunks buffered ahead of the walk.
+const DECODE_QUEUE_CHUNKS: usize = 8;
+
+/// Write buffer for files streamed from the walking thread.
+const COPY_BUFFER_BYTES: usize = 1 << 20;
+
+/// Resolve a `workers` argument: `0` means one per available core.
+pub(super) fn effective_workers(workers: usize) -> usize {
+    if workers == 0 {
+        std::thread::available_parallelism().map_or(1, |n| n.get())
+    } else {
+        workers
+    }
+}
+
+/// Unpack the tar stream `decoder` yields into `dest_dir` with `workers`
+/// writer threads. `label` names the archive in errors.
+pub(super) fn unpack<R: Read + Send>(
+    decoder: R,
+    dest_dir: &Path,
+    workers: usize,
+    label: &str,
+) -> Result<()> {
+    let fail =
+        |e: io::Error| FbuildError::PackageError(format!("failed to extract {}: {}", label, e));
+    std::fs::create_dir_all(dest_dir).map_err(fail)?;
+    let root = NormalizedPath::new(dest_dir);
+
+    let (chunk_tx, chunk_rx) = bounded::<Vec<u8>>(DECODE_QUEUE_CHUNKS);
+    let (job_tx, job_rx) = bounded::<WriteJob>(workers * WRITE_QUEUE_PER_WORKER);
+    let job_rx = Mutex::new(job_rx);
+    std::thread::scope(|scope| {
+        let decoding = scope.spawn(move || decode(decoder, &chunk_tx));
+        let writers: Vec<_> = (0..workers)
+            .map(|_| scope.spawn(|| write_jobs(&job_rx)))
+            .collect();
+        let walking = scope.spawn(move || {
+            let mut archive = tar::Archive::new(ChunkReader::new(chunk_rx));
+            // Consumes `job_tx`; the writers drain the queue and exit once
+            // it closes. Dropping `archive` on return closes the decoder's
+            // queue, so a decoder still producing stops.
+            walk(&mut archive, &root, dest_dir, job_tx)
+        });
+
+        let walked = walking
+            .join()
+            .unwrap_or_else(|_| Err(io::Error::other("walk thread panicked")));
+
+        let mut written = Ok(());
+        for writer in writers {
+            let result = writer
+                .join()
+                .unwrap_or_else(|_| Err(io::Error::other("writer thread panicked")));
+            if written.is_ok() {
+                written = result;
+            }
+        }
+        let decoded = decoding
+            .join()
+            .unwrap_or_else(|_| Err(io::Error::other("decoder thread panicked")));
+        // A writer's or the decoder's own error explains a walk that was
+        // cut short better than the walk's does.
+        let deferred = written.and(decoded).and(walked).map_err(fail)?;
+        deferred.apply().map_err(fail)
+    })
+}
+
+/// Decoder-thread loop: read `decoder` to the end in fixed-size chunks.
+fn decode<R: Read>(mut decoder: R, out: &Sender<Vec<u8>>) -> io::Result<()> {
+    loop {
+        let mut chunk = vec![0u8; DECODE_CHUNK_BYTES];
+        let mut filled = 0;
+        while filled < chunk.len() {
+            match decoder.read(&mut chunk[filled..]) {
+                Ok(0) => break,
+                Ok(n) => filled += n,
+                Err(e) if e.kind() == io::ErrorKind::Interrupted => {}
+                Err(e) => return Err(e),
+            }
+        }
+        if filled == 0 {
+            return Ok(());
+        }
+        chunk.truncate(filled);
+        // A closed queue means the walk is over; its result says why.
+        if out.blocking_send(chunk).is_err() {
+            return Ok(());
+        }
+    }
+}
+
+/// `Read` over a stream that arrives as chunks on a channel, e.g. a
+/// download in flight or another thread's decoder. End of file once every
+/// sender is gone.
+pub(crate) struct ChunkReader {
+    chunks: Receiver<Vec<u8>>,
+    current: Vec<u8>,
+    pos: usize,
+}
+
+impl ChunkReader {
+    pub(crate) fn new(chunks: Receiver<Vec<u8>>) -> Self {
+        Self {
+            chunks,
+            current: Vec::new(),
+            pos: 0,
+        }
+    }
+}
+
+impl Read for ChunkReader {
+    fn read(&mut self, buf: &mut [u8]) -> io::Result<usize> {
+        if buf.is_empty() {
+            return Ok(0);
+        }
+        while self.pos == self.current.len() {
+            match self.chunks.blocking_recv() {
+                Some(chunk) => {
+                    self.current = chunk;
+                    self.pos = 0;
+                }
+                None => return Ok(0),
+            }
+        }
+        let n = buf.len().min(self.current.len() - self.pos);
+        buf[..n].copy_from_slice(&self.current[self.pos..self.pos + n]);
+        self.pos += n;
+        Ok(n)
+    }
+}
+
+/// Header fields applied to every file written.
+#[derive(Clone, Copy)]
+struct FileMeta {
+    mode: Option<u32>,
+    mtime: Option<u64>,
+}
+
+impl FileMeta {
+    fn of(header: &tar::Header) -> Self {
+        Self {
+            mode: header.mode().ok(),
+            mtime: header.mtime().ok(),
+        }
+    }
+
+    fn apply(&self, file: &File) -> io::Result<()> {
+        if let Some(mtime) = self.mtime {
+            // `tar` bumps a zero mtime to one second; some tools reject
+            // files from 1970-01-01T00:00:00.
+            file.set_modified(SystemTime::UNIX_EPOCH + Duration::from_secs(mtime.max(1)))?;
+        }
+        if let Some(mode) = self.mode {
+            set_file_mode_bits(file, mode)?;
+        }
+        Ok(())
+    }
+}
+
+/// A small file read out of the archive, waiting for a writer thread.
+struct WriteJob {
+    dest: NormalizedPath,
+    bytes: Vec<u8>,
+    meta: FileMeta,
+}
+
+impl WriteJob {
+    fn write(&self) -> io::Result<()> {
+        let mut file = create_file(&self.dest)?;
+        file.write_all(&self.bytes)
+            .and_then(|()| self.meta.apply(&file))
+            .map_err(|e| at(&self.dest, e))
+    }
+}
+
+/// Writer-thread loop: write queued files until the queue closes.
+fn write_jobs(rx: &Mutex<Receiver<WriteJob>>) -> io::Result<()> {
+    loop {
+        // The lock is held only while waiting for the next job.
+        let job = rx
+            .lock()
+            .unwrap_or_else(PoisonError::into_inner)
+            .blocking_recv();
+        let Some(job) = job else {
+            return Ok(());
+        };
+        if let Err(e) = job.write() {
+            // Fail the walk's next send rather than leave it waiting on a
+            // queue that nobody may be draining.
+            rx.lock().unwrap_or_else(PoisonError::into_inner).close();
+            return Err(e);
+        }
+    }
+}
+
+/// Work the walk leaves until the writers are done.
+#[derive(Default)]
+struct Deferred {
+    /// Later copies of a path already queued; written last so the last
+    /// entry wins, as with `tar::Archive::unpack`.
+    rewrites: Vec<WriteJob>,
+    /// `(link, target)`: the target may still have been queued.
+    hard_links: Vec<(NormalizedPath, NormalizedPath)>,
+    /// Directory modes, applied last so a read-only directory does not
+    /// block its own contents.
+    dirs: Vec<(NormalizedPath, u32)>,
+}
+
+impl Deferred {
+    fn apply(mut self) -> io::Result<()> {
+        for job in &self.rewrites {
+            job.write()?;
+        }
+        for (link, target) in &self.hard_links {
+            match std::fs::remove_file(link) {
+                Ok(()) => {}
+                Err(e) if e.kind() == io::ErrorKind::NotFound => {}
+                Err(e) => return Err(at(link, e)),
+            }
+            std::fs::hard_link(target, link).map_err(|e| at(link, e))?;
+        }
+        // Deepest first, as `tar` does.
+        self.dirs.sort_by(|a, b| b.0.as_path().cmp(a.0.as_path()));
+        for (dir, mode) in &self.dirs {
+            set_mode_bits(dir, *mode).map_err(|e| at(dir, e))?;
+        }
+        Ok(())
+    }
+}
+
+/// Walk the archive: create directories, queue small files for `pool`,
+/// stream large ones, and collect what has to wait for the writers.
+fn walk<R: Read>(
+    archive: &mut tar::Archive<R>,
+    root: &NormalizedPath,
+    dest_dir: &Path,
+    pool: Sender<WriteJob>,
+) -> io::Result<Deferred> {
+    let mut deferred = Deferred::default();
+    let mut queued: HashSet<NormalizedPath> = HashSet::new();
+    let mut symlinks: HashSet<NormalizedPath> = HashSet::new();
+    for entry in archive.entries()? {
+        let mut entry = entry?;
+        let Some(dest) = contained(root, &entry.path()?) else {
+            continue;
+        };
+        let kind = entry.header().entry_type();
+        let plain = kind.is_file() || kind.is_dir() || kind.is_hard_link();
+        if !plain || beneath_symlink(&dest, root, &symlinks) {
+            if kind.is_symlink() {
+                symlinks.insert(dest);
+            }
+            entry.unpack_in(dest_dir)?;
+            continue;
+        }
+
+        if kind.is_dir() {
+            std::fs::create_dir_all(&dest).map_err(|e| at(&dest, e))?;
+            if let Ok(mode) = entry.header().mode() {
+                deferred.dirs.push((dest, mode));
+            }
+        } else if kind.is_hard_link() {
+            let target = entry
+                .link_name()?
+                .and_then(|target| contained(root, &target))
+                .ok_or_else(|| {
+                    io::Error::other(format!(
+                        "hard link {} points outside the destination",
+                        dest.display()
+                    ))
+                })?;
+            deferred.hard_links.push((dest, target));
+        } else {
+            let meta = FileMeta::of(entry.header());
+            let repeat = !queued.insert(dest.clone());
+            if repeat || entry.size() <= POOLED_WRITE_MAX_BYTES {
+                let mut bytes = Vec::with_capacity(entry.size() as usize);
+                entry.read_to_end(&mut bytes)?;
+                let job = WriteJob { dest, bytes, meta };
+                if repeat {
+                    deferred.rewrites.push(job);
+                } else if pool.blocking_send(job).is_err() {
+                    return Err(io::Error::other("extraction writers stopped early"));
+                }
+            } else {
+                stream_file(&dest, &mut entry, meta)?;
+            }
+        }
+    }
+    Ok(deferred)
+}
+
+/// `root` joined with the entry `path`, or `None` for an entry `tar`
+/// would skip: one with a `..` component, or one naming `root` itself.
+/// Leading `/` and drive prefixes are dropped, as `tar` does.
+fn contained(root: &NormalizedPath, path: &Path) -> Option<NormalizedPath> {
+    let mut dest = root.as_path().to_path_buf();
+    let mut named = false;
+    for component in path.components() {
+        match component {
+            Component::Normal(part) => {
+                dest.push(part);
+                named = true;
+            }
+            Component::Prefix(_) | Component::RootDir | Component::CurDir => {}
+            Component::ParentDir => return None,
+        }
+    }
+    named.then(|| NormalizedPath::new(dest))
+}
+
+/// Whether a symlink this archive created sits between `root` and `dest`.
+fn beneath_symlink(
+    dest: &NormalizedPath,
+    root: &NormalizedPath,
+    symlinks: &HashSet<NormalizedPath>,
+) -> bool {
+    !symlinks.is_empty()
+        && dest
+            .ancestors()
+            .skip(1)
+            .take_while(|a| *a != root.as_path())
+            .any(|a| symlinks.contains(&NormalizedPath::new(a)))
+}
+
+/// Stream an entry too large for the pool to `dest`.
+fn stream_file(dest: &Path, data: &mut impl Read, meta: FileMeta) -> io::Result<()> {
+    let file = create_file(dest)?;
+    let mut out = BufWriter::with_capacity(COPY_BUFFER_BYTES, file);
+    io::copy(data, &mut out)
+        .and_then(|_| out.into_inner().map_err(io::IntoInnerError::into_error))
+        .and_then(|file| meta.apply(&file))
+        .map_err(|e| at(dest, e))
+}
+
+/// Create `dest` as a new file, replacing whatever is there (as `tar`
+/// does, so a read-only earlier copy or a symlink is never written
+/// through) and creating its parent on demand.
+fn create_file(dest: &Path) -> io::Result<File> {
+    let open = || OpenOptions::new().write(true).create_new(true).open(dest);
+    let opened = match open() {
+        Err(e) if e.kind() == io::ErrorKind::NotFound => match dest.parent() {
+            Some(parent) => std::fs::create_dir_all(parent).and_then(|()| open()),
+            None => Err(e),
+        },
+        Err(e) if e.kind() == io::ErrorKind::AlreadyExists => {
+            std::fs::remove_file(dest).and_then(|()| open())
+        }
+        other => other,
+    };
+    opened.map_err(|e| at(dest, e))
+}
+
+/// Prefix an I/O error with the path it happened on.
+fn at(path: &Path, e: io::Error) -> io::Error {
+    io::Error::new(e.kind(), format!("{}: {e}", path.display()))
+}
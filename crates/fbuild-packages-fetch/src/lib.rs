@@ -26,28 +26,10 @@ use fbuild_core::install_status::{self, InstallPhase, InstallRole};
 
 static PACKAGE_TOUCHES: OnceLock<Mutex<HashSet<String>>> = OnceLock::new();
 
-/// Recursively compute the total size of a directory in bytes.
-///
-/// Symlink-safe: uses `symlink_metadata` and skips symlinks to avoid
-/// infinite recursion. Tolerates permission errors by treating
-/// inaccessible entries as zero-size.
-fn dir_size(path: &Path) -> u64 {
-    let Ok(entries) = std::fs::read_dir(path) else {
-        return 0;
-    };
-    entries
-        .filter_map(|e| e.ok())
-        .filter_map(|e| {
-            let meta = std::fs::symlink_metadata(e.path()).ok()?;
-            if meta.is_symlink() {
-                None // skip symlinks to avoid cycles
-            } else if meta.is_dir() {
-                Some(dir_size(&e.path()))
-            } else {
-                Some(meta.len())
-            }
-        })
-        .sum()
+/// Package installs in flight in this process, keyed by install path.
+fn in_flight_installs() -> &'static downloader::InFlight<PathBuf> {
+    static INSTALLS: OnceLock<downloader::InFlight<PathBuf>> = OnceLock::new();
+    INSTALLS.get_or_init(downloader::InFlight::new)
 }
 
 /// Base trait for all installable packages.
@@ -301,15 +283,32 @@ impl PackageBase {
             if !mark_package_touch_needed(touch_key) {
                 return;
             }
-            if let Ok(Some(entry)) = dc.lookup(kind, &self.cache_key, &self.version) {
-                let _ = dc.touch(&entry);
+            match dc.lookup(kind, &self.cache_key, &self.version) {
+                Ok(Some(entry)) => {
+                    let _ = dc.touch(&entry);
+                }
+                // Installed before the index knew it (an older fbuild, a
+                // restored CI cache): index it now, to be sized lazily.
+                Ok(None) => {
+                    let install_path = self.install_path();
+                    if let Ok(rel_path) = install_path.strip_prefix(dc.cache_root()) {
+                        let _ = dc.record_unsized_install(
+                            kind,
+                            &self.cache_key,
+                            &self.version,
+                            &rel_path.to_string_lossy(),
+                        );
+                    }
+                }
+                Err(_) => {}
             }
         }
     }
 
-    /// Best-effort: record a completed install in the DiskCache index.
-    /// Only records if `install_path` is under the DiskCache root — legacy
-    /// Cache paths are skipped to avoid indexing absolute legacy paths.
+    /// Best-effort: record a completed install in the DiskCache index; it
+    /// is sized off this path (see `disk_cache::sizing`). Only records if
+    /// `install_path` is under the DiskCache root — legacy Cache paths are
+    /// skipped to avoid indexing absolute legacy paths.
     fn record_install_in_disk_cache(&self, install_path: &Path) {
         if let Some(ref dc) = self.disk_cache {
             let rel_path = match install_path.strip_prefix(dc.cache_root()) {
@@ -317,13 +316,11 @@ impl PackageBase {
                 Err(_) => return, // legacy path outside DiskCache root
             };
             let kind = self.cache_subdir.into();
-            let installed_bytes = dir_size(install_path) as i64;
-            let _ = dc.record_install(
+            let _ = dc.record_install_deferred(
                 kind,
                 &self.cache_key,
                 &self.version,
                 &rel_path.to_string_lossy(),
-                installed_bytes,
             );
         }
     }
@@ -335,6 +332,11 @@ impl PackageBase {
     /// 3. Extract to staging dir (.tmp suffix)
     /// 4. Validate (caller provides validation fn)
     /// 5. Rename staging to final path (atomic commit)
+    ///
+    /// Concurrent calls for the same package in this process (builds
+    /// sharing the daemon) wait for the one already installing it instead
+    /// of polling its install lock; the lock still guards against other
+    /// processes.
     pub async fn staged_install<F>(&self, validate: F) -> fbuild_core::Result<PathBuf>
     where
         F: FnOnce(&Path) -> fbuild_core::Result<()> + Send,
@@ -349,6 +351,36 @@ impl PackageBase {
             return Ok(install_path);
         }
 
+        let on_wait = || {
+            install_status::publish_install_status(install_status::status(
+                &self.name,
+                Some(&self.version),
+                InstallPhase::WaitingForLock,
+                InstallRole::Waiter,
+                format!(
+                    "waiting for another build to install {} {}",
+                    self.name, self.version
+                ),
+                None::<String>,
+            ));
+        };
+        in_flight_installs()
+            .run(&install_path.to_string_lossy(), on_wait, || {
+                self.install_staged(&install_path, validate)
+            })
+            .await
+    }
+
+    /// The body of [`Self::staged_install`] once no install of this
+    /// package is running in this process.
+    async fn install_staged<F>(
+        &self,
+        install_path: &Path,
+        validate: F,
+    ) -> fbuild_core::Result<PathBuf>
+    where
+        F: FnOnce(&Path) -> fbuild_core::Result<()> + Send,
+    {
         // Ensure parent directory exists
         if let Some(parent) = install_path.parent() {
             std::fs::create_dir_all(parent).map_err(|e| {
@@ -361,7 +393,7 @@ impl PackageBase {
             install_lock::acquire_for_install(&install_path, &self.name, &self.version).await?;
         if install_path.exists() {
             self.touch_disk_cache();
-            return Ok(install_path);
+            return Ok(install_path.to_path_buf());
         }
 
         let staging_path = install_path.with_file_name(format!(
@@ -381,53 +413,33 @@ impl PackageBase {
             fbuild_core::FbuildError::PackageError(format!("failed to create staging dir: {}", e))
         })?;
 
-        // Download with progress reporting
+        // Download and extract in one pass: tarballs unpack into staging
+        // while the body streams in, and the checksum is checked once the
+        // last byte lands. Nothing is committed before both succeed.
         tracing::info!("downloading {} v{}", self.name, self.version);
         let name = self.name.clone();
         let version = self.version.clone();
-        let archive_path = downloader::download_file_with_progress(
-            &self.url,
-            &staging_path,
-            &mut |progress: &downloader::DownloadProgress| {
-                install_status::publish_install_status(install_status::status(
-                    &name,
-                    Some(&version),
-                    InstallPhase::Downloading,
-                    InstallRole::Installer,
-                    progress.format_message(),
-                    None::<String>,
-                ));
-            },
-        )
-        .await?;
-
-        // Verify checksum
-        if let Some(ref expected) = self.checksum {
+        let mut on_progress = |progress: &downloader::DownloadProgress| {
             install_status::publish_install_status(install_status::status(
-                &self.name,
-                Some(&self.version),
-                InstallPhase::Verifying,
+                &name,
+                Some(&version),
+                if progress.queued {
+                    InstallPhase::Queued
+                } else {
+                    InstallPhase::Downloading
+                },
                 InstallRole::Installer,
-                format!("verifying {} {}", self.name, self.version),
+                progress.format_message(),
                 None::<String>,
             ));
-            downloader::verify_checksum(&archive_path, expected)?;
-        }
-
-        // Extract
-        install_status::publish_install_status(install_status::status(
-            &self.name,
-            Some(&self.version),
-            InstallPhase::Extracting,
-            InstallRole::Installer,
-            format!("extracting {} {}", self.name, self.version),
-            None::<String>,
-        ));
-        tracing::info!("extracting {} v{}", self.name, self.version);
-        extractor::extract(&archive_path, &staging_path)?;
-
-        // Remove the archive after extraction
-        let _ = std::fs::remove_file(&archive_path);
+        };
+        downloader::download_and_extract(
+            &self.url,
+            &staging_path,
+            self.checksum.as_deref(),
+            &mut on_progress,
+        )
+        .await?;
 
         // Validate
         validate(&staging_path)?;
@@ -457,7 +469,7 @@ impl PackageBase {
             None::<String>,
         ));
         tracing::info!("installed {} v{}", self.name, self.version);
-        Ok(install_path)
+        Ok(install_path.to_path_buf())
     }
 
     pub fn get_info(&self) -> PackageInfo {
@@ -718,6 +730,40 @@ mod toolchain_gcc_ar_tests {
         assert!(disk_cache::paths::install_complete_sentinel(&installed).exists());
     }
 
+    /// Two builds installing the same package at once share one install:
+    /// the server answers a single request, so a second download would fail.
+    #[tokio::test]
+    async fn concurrent_staged_installs_share_one_download() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let cache_root = tmp.path().join("cache");
+        let cache_key = "coalesced-tool";
+        let url = serve_once(zip_bytes("tool.txt", b"installed once")).await;
+        let base = PackageBase::with_cache_root(
+            "tool",
+            "1.0",
+            &url,
+            cache_key,
+            None,
+            CacheSubdir::Toolchains,
+            tmp.path(),
+            &cache_root,
+        );
+        let validations = std::sync::atomic::AtomicUsize::new(0);
+        let validate = |_: &Path| {
+            validations.fetch_add(1, std::sync::atomic::Ordering::SeqCst);
+            Ok(())
+        };
+
+        let (first, second) =
+            tokio::join!(base.staged_install(validate), base.staged_install(validate));
+
+        let install_path = base.install_path();
+        assert_eq!(first.expect("leader installs"), install_path);
+        assert_eq!(second.expect("waiter shares the install"), install_path);
+        assert_eq!(validations.load(std::sync::atomic::Ordering::SeqCst), 1);
+        assert!(install_path.join("tool.txt").exists());
+    }
+
     /// A warm `staged_install` hit (install dir already exists) must count as
     /// a use in the DiskCache LRU, exactly like `is_cached()` does. The early
     /// return used to skip the touch, so a package restored from an Actions
@@ -800,6 +846,15 @@ mod toolchain_gcc_ar_tests {
         let sentinel = disk_cache::paths::install_complete_sentinel(&install_path);
         std::fs::write(&sentinel, b"").unwrap();
         assert!(base.is_cached(), "directory with sentinel should be cached");
+
+        // The index never saw this install; the hit records it for the
+        // lazy sizing pass.
+        let entry = DiskCache::open_at(&cache_root)
+            .unwrap()
+            .lookup(disk_cache::Kind::Toolchains, cache_key, "1.0")
+            .unwrap()
+            .expect("a cache hit indexes an unrecorded install");
+        assert_eq!(entry.installed_bytes, None);
     }
 }
 